@@ -0,0 +1,171 @@
+"""In-process pub/sub for live agent status and run logs.
+
+Publishers (the run executor and the agent routes) push small events per
+agent; each agent keeps a short ring buffer of recent events so a client
+reconnecting with ``Last-Event-ID`` gets what it missed. Every subscriber
+has a bounded queue: a consumer that falls behind loses its oldest
+buffered events rather than growing memory. Event ids are increasing
+integers within a process; an id the buffer no longer covers makes the
+stream start with a fresh snapshot instead.
+"""
+import asyncio
+import json
+import os
+import threading
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+
+from ..utils.cache import LRUCache
+
+AGENT_EVENT_HISTORY = int(os.getenv("AGENT_EVENT_HISTORY", "256"))
+AGENT_EVENT_QUEUE_SIZE = int(os.getenv("AGENT_EVENT_QUEUE_SIZE", "100"))
+AGENT_EVENT_HEARTBEAT = float(os.getenv("AGENT_EVENT_HEARTBEAT", "15"))
+AGENT_EVENT_AGENTS = int(os.getenv("AGENT_EVENT_AGENTS", "10000"))
+
+
+class Event:
+    __slots__ = ("id", "type", "data")
+
+    def __init__(self, id: int, type: str, data: Dict[str, Any]):
+        self.id = id
+        self.type = type
+        self.data = data
+
+    def to_sse(self) -> str:
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data, default=str)}\n\n"
+
+
+class Subscriber:
+    def __init__(self, agent_id: int, maxsize: int):
+        self.agent_id = agent_id
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def offer(self, event: Event) -> None:
+        if self.queue.full():
+            # drop the oldest buffered event; the client can catch up via Last-Event-ID
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+
+class _History:
+    """Ring buffer of one agent's events; ``floor`` is the newest id no longer held."""
+
+    def __init__(self, size: int, floor: int = 0):
+        self.events: deque = deque()
+        self.size = size
+        self.floor = floor
+
+    def append(self, event: Event) -> None:
+        if len(self.events) >= self.size:
+            self.floor = self.events.popleft().id
+        self.events.append(event)
+
+
+class AgentEventBus:
+    def __init__(self, history: int = AGENT_EVENT_HISTORY, queue_size: int = AGENT_EVENT_QUEUE_SIZE, max_agents: int = AGENT_EVENT_AGENTS):
+        self.history = history
+        self.queue_size = queue_size
+        self._last_id = 0
+        self._lock = threading.Lock()
+        self._buffers = LRUCache(maxsize=max_agents)
+        self._subscribers: Dict[int, Set[Subscriber]] = {}
+
+    def publish(self, agent_id: int, type: str, data: Optional[Dict[str, Any]] = None) -> Event:
+        """Record and fan out an event; safe to call from any thread."""
+        with self._lock:
+            self._last_id += 1
+            event = Event(self._last_id, type, dict(data or {}, agent_id=agent_id))
+            self._buffer(agent_id).append(event)
+            subscribers = list(self._subscribers.get(agent_id, ()))
+        for sub in subscribers:
+            try:
+                on_loop = asyncio.get_running_loop() is sub.loop
+            except RuntimeError:
+                on_loop = False
+            if on_loop:
+                sub.offer(event)
+            elif not sub.loop.is_closed():
+                sub.loop.call_soon_threadsafe(sub.offer, event)
+        return event
+
+    def _buffer(self, agent_id: int) -> "_History":
+        buffer = self._buffers.get(agent_id)
+        if buffer is None:
+            # anything this agent published before is unknown from here on
+            buffer = _History(self.history, floor=self._last_id)
+            self._buffers.set(agent_id, buffer)
+        return buffer
+
+    def subscribe(self, agent_id: int, last_event_id: Optional[int] = None):
+        """Register a subscriber; returns (subscriber, missed events or None if not resumable)."""
+        sub = Subscriber(agent_id, self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(agent_id, set()).add(sub)
+            buffer = self._buffers.get(agent_id)
+            missed: Optional[List[Event]] = None
+            if last_event_id is not None and last_event_id <= self._last_id:
+                if buffer is None:
+                    missed = [] if last_event_id >= self._last_id else None
+                elif last_event_id >= buffer.floor:
+                    missed = [e for e in buffer.events if e.id > last_event_id]
+        return sub, missed
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        with self._lock:
+            subs = self._subscribers.get(sub.agent_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.agent_id]
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    def subscriber_count(self, agent_id: Optional[int] = None) -> int:
+        with self._lock:
+            if agent_id is not None:
+                return len(self._subscribers.get(agent_id, ()))
+            return sum(len(s) for s in self._subscribers.values())
+
+
+async def sse_stream(
+    bus: AgentEventBus,
+    agent_id: int,
+    snapshot: Callable[[], Dict[str, Any]],
+    last_event_id: Optional[int] = None,
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    heartbeat: float = AGENT_EVENT_HEARTBEAT,
+) -> AsyncIterator[str]:
+    """Server-sent events for one agent: replay or snapshot, then live events."""
+    sub, missed = bus.subscribe(agent_id, last_event_id)
+    try:
+        if missed is None:
+            last_sent = bus.last_id
+            state = await asyncio.to_thread(snapshot)
+            yield f"id: {last_sent}\nevent: snapshot\ndata: {json.dumps(state, default=str)}\n\n"
+        else:
+            for event in missed:
+                yield event.to_sse()
+            last_sent = missed[-1].id if missed else last_event_id
+        while True:
+            try:
+                event = await asyncio.wait_for(sub.queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                if is_disconnected is not None and await is_disconnected():
+                    return
+                yield ": heartbeat\n\n"
+                continue
+            if event.id <= last_sent:
+                # already delivered by the replay
+                continue
+            last_sent = event.id
+            yield event.to_sse()
+    finally:
+        bus.unsubscribe(sub)
+
+
+agent_events = AgentEventBus()
@@ -0,0 +1,459 @@
+"""Asyncio executor for agent runs.
+
+A run is a list of steps taken from the agent config (``{"steps": [...]}``)
+or, without one, a single model call on the run input. Step types:
+
+- ``model``: ``{"type": "model", "prompt": "Summarise {input.text}"}``
+- ``tool``: ``{"type": "tool", "tool_id": 3, "input": {...}}``
+- ``memory_read``: ``{"type": "memory_read", "key": "goal", "scope": "global"}``
+- ``memory_write``: ``{"type": "memory_write", "key": "goal", "value": "{last}"}``
+
+``{input.x}``, ``{last}``, ``{memory.key}`` and ``{steps.<name>}`` in strings
+are filled from the run context. Runs are limited by a global and a per-user
+semaphore. After every step the next step index and the outputs so far are
+checkpointed to ``AgentRun.checkpoint``, so pause/resume and a restarted
+worker continue where the run left off. Pause takes effect at the next step
+boundary; stop cancels the step in flight.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy import or_, update
+from sqlmodel import Session, select
+
+from ..models import engine, Agent, AgentRun
+from ..tools.runtime import ToolError, tool_runtime
+from .events import agent_events
+from .memory_store import agent_memory
+from .repository import sql_agents
+
+logger = logging.getLogger("backend.agents.executor")
+
+AGENT_MAX_CONCURRENT_RUNS = int(os.getenv("AGENT_MAX_CONCURRENT_RUNS", "32"))
+AGENT_MAX_RUNS_PER_USER = int(os.getenv("AGENT_MAX_RUNS_PER_USER", "2"))
+AGENT_STEP_TIMEOUT = float(os.getenv("AGENT_STEP_TIMEOUT", "120"))
+AGENT_MAX_STEPS = int(os.getenv("AGENT_MAX_STEPS", "50"))
+# a queued or running run not checkpointed (or heartbeated) for this long is treated as orphaned
+AGENT_RUN_STALE_SECONDS = int(os.getenv("AGENT_RUN_STALE_SECONDS", "300"))
+# queued runs waiting for a slot refresh updated_at this often, so live workers keep them
+AGENT_RUN_HEARTBEAT_SECONDS = float(os.getenv("AGENT_RUN_HEARTBEAT_SECONDS", str(AGENT_RUN_STALE_SECONDS / 3)))
+
+# step outputs longer than this are truncated in live events (not in the checkpoint)
+EVENT_OUTPUT_PREVIEW = 2000
+
+ACTIVE_STATUSES = ("queued", "running")
+FINAL_STATUSES = ("completed", "failed", "stopped")
+
+_PLACEHOLDER_RE = re.compile(r"\{([A-Za-z_][\w.]*)\}")
+
+
+class StepError(Exception):
+    pass
+
+
+def _lookup(ctx: Dict[str, Any], path: str) -> Any:
+    value: Any = ctx
+    for part in path.split("."):
+        if isinstance(value, dict) and part in value:
+            value = value[part]
+        else:
+            return None
+    return value
+
+
+def render(template: Any, ctx: Dict[str, Any]) -> Any:
+    """Fill ``{path}`` placeholders in strings (recursively in dicts and lists)."""
+    if isinstance(template, dict):
+        return {k: render(v, ctx) for k, v in template.items()}
+    if isinstance(template, list):
+        return [render(v, ctx) for v in template]
+    if not isinstance(template, str):
+        return template
+    whole = _PLACEHOLDER_RE.fullmatch(template)
+    if whole:
+        # a lone placeholder keeps the value's type
+        value = _lookup(ctx, whole.group(1))
+        return template if value is None else value
+
+    def sub(m):
+        value = _lookup(ctx, m.group(1))
+        if value is None:
+            return m.group(0)
+        return value if isinstance(value, str) else json.dumps(value)
+
+    return _PLACEHOLDER_RE.sub(sub, template)
+
+
+def plan_steps(config: Optional[str], input_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    cfg = {}
+    if config:
+        try:
+            cfg = json.loads(config) or {}
+        except ValueError:
+            cfg = {}
+    steps = cfg.get("steps") if isinstance(cfg, dict) else None
+    if not steps:
+        prompt = cfg.get("prompt") if isinstance(cfg, dict) else None
+        if not prompt:
+            prompt = "{input.prompt}" if "prompt" in input_data else json.dumps(input_data)
+        steps = [{"type": "model", "prompt": prompt}]
+    return steps[:AGENT_MAX_STEPS]
+
+
+def _preview(output: Any) -> Any:
+    if isinstance(output, str) and len(output) > EVENT_OUTPUT_PREVIEW:
+        return output[:EVENT_OUTPUT_PREVIEW]
+    return output
+
+
+async def run_tool(tool_id: int, user_id: str, input_data: Any) -> Any:
+    """Run a catalog tool for ``user_id`` through the tool runtime (permission check, deadline, usage)."""
+    try:
+        result = await tool_runtime.call(tool_id, user_id, input_data if isinstance(input_data, dict) else {"input": input_data})
+    except ToolError as e:
+        raise StepError(str(e)) from e
+    return result["output"]
+
+
+class RunExecutor:
+    def __init__(self, model=None, max_concurrent: int = AGENT_MAX_CONCURRENT_RUNS, max_per_user: int = AGENT_MAX_RUNS_PER_USER):
+        self._model = model
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.heartbeat = AGENT_RUN_HEARTBEAT_SECONDS
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._controls: Dict[int, str] = {}
+        self._running = 0
+        self._counters = {"completed": 0, "failed": 0, "stopped": 0, "paused": 0, "steps": 0}
+        self._finished_at: deque = deque(maxlen=10000)
+        self._run_seconds: deque = deque(maxlen=1000)
+
+    @property
+    def model(self):
+        if self._model is None:
+            from ..ai.service import ai_service
+
+            self._model = ai_service
+        return self._model
+
+    @model.setter
+    def model(self, value) -> None:
+        self._model = value
+
+    def _bind_loop(self) -> None:
+        # semaphores belong to one event loop; rebuild them if the app runs on a new one
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._global = asyncio.Semaphore(self.max_concurrent)
+            self._per_user: Dict[str, List] = {}
+            self._tasks = {}
+            self._running = 0
+
+    def _user_slot(self, user_id: str) -> asyncio.Semaphore:
+        slot = self._per_user.get(user_id)
+        if slot is None:
+            slot = self._per_user[user_id] = [asyncio.Semaphore(self.max_per_user), 0]
+        slot[1] += 1
+        return slot[0]
+
+    def _release_user_slot(self, user_id: str) -> None:
+        slot = self._per_user.get(user_id)
+        if slot is not None:
+            slot[1] -= 1
+            if slot[1] <= 0:
+                del self._per_user[user_id]
+
+    # public API
+    def submit(self, run_id: int, user_id: str) -> None:
+        """Schedule a run (must be called on the event loop)."""
+        self._bind_loop()
+        if run_id in self._tasks:
+            # a pausing run may still be winding down; it restarts itself once done
+            if self._controls.get(run_id) == "pause":
+                self._controls[run_id] = "resume"
+            return
+        self._controls.pop(run_id, None)
+        task = asyncio.create_task(self._execute(run_id, user_id))
+        self._tasks[run_id] = task
+        task.add_done_callback(self._forget)
+
+    def _forget(self, task: asyncio.Task) -> None:
+        for run_id, t in list(self._tasks.items()):
+            if t is task:
+                del self._tasks[run_id]
+
+    def is_active(self, run_id: int) -> bool:
+        return run_id in self._tasks
+
+    def active_runs(self) -> Set[int]:
+        """Ids of the runs this worker is executing or holding in its queue."""
+        return set(self._tasks)
+
+    def pause(self, run_id: int) -> bool:
+        if run_id not in self._tasks:
+            return False
+        self._controls[run_id] = "pause"
+        return True
+
+    def stop(self, run_id: int) -> bool:
+        task = self._tasks.get(run_id)
+        if task is None:
+            return False
+        self._controls[run_id] = "stop"
+        task.cancel()
+        return True
+
+    async def wait(self, run_id: int, timeout: Optional[float] = None) -> None:
+        task = self._tasks.get(run_id)
+        if task is not None:
+            await asyncio.wait({task}, timeout=timeout)
+
+    async def shutdown(self, timeout: float = 5.0) -> None:
+        """Interrupt in-flight runs; they keep their checkpoint and resume on next start."""
+        tasks = list(self._tasks.items())
+        for run_id, task in tasks:
+            self._controls[run_id] = "shutdown"
+            task.cancel()
+        if tasks:
+            await asyncio.wait([t for _, t in tasks], timeout=timeout)
+
+    def metrics(self) -> Dict[str, Any]:
+        now = time.time()
+        last_minute = sum(1 for t in self._finished_at if now - t <= 60)
+        durations = list(self._run_seconds)
+        return {
+            "running": self._running,
+            "queued": max(0, len(self._tasks) - self._running),
+            "max_concurrent": self.max_concurrent,
+            "max_per_user": self.max_per_user,
+            "runs_finished_last_minute": last_minute,
+            "avg_run_seconds": round(sum(durations) / len(durations), 3) if durations else None,
+            "totals": dict(self._counters),
+        }
+
+    # persistence
+    def _load(self, run_id: int):
+        with Session(engine) as session:
+            run = session.get(AgentRun, run_id)
+            if run is None:
+                return None, None
+            agent = session.get(Agent, run.agent_id)
+            return run, agent
+
+    def _save(self, run_id: int, agent_status: Optional[str] = None, **fields) -> None:
+        """Update the run row; with ``agent_status``, move its agent in the same transaction."""
+        fields["updated_at"] = datetime.utcnow()
+        with Session(engine) as session:
+            session.execute(update(AgentRun).where(AgentRun.id == run_id).values(**fields))
+            run = session.get(AgentRun, run_id) if agent_status else None
+            agent_id = run.agent_id if run is not None else None
+            changed = agent_id is not None and self._apply_agent_status(session, agent_id, agent_status)
+            session.commit()
+        if changed:
+            sql_agents.invalidate(agent_id)
+            agent_events.publish(agent_id, "status", {"status": agent_status})
+
+    def _apply_agent_status(self, session: Session, agent_id: int, status: str) -> bool:
+        agent = session.get(Agent, agent_id)
+        if agent is None or agent.status == status:
+            return False
+        if status != "running":
+            still_active = session.exec(
+                select(AgentRun.id)
+                .where(AgentRun.agent_id == agent_id)
+                .where(AgentRun.status.in_(ACTIVE_STATUSES))
+            ).first()
+            if still_active:
+                return False
+        agent.status = status
+        agent.updated_at = datetime.utcnow()
+        session.add(agent)
+        return True
+
+    def _touch(self, run_id: int) -> None:
+        with Session(engine) as session:
+            session.execute(
+                update(AgentRun)
+                .where(AgentRun.id == run_id)
+                .where(AgentRun.status == "queued")
+                .values(updated_at=datetime.utcnow())
+            )
+            session.commit()
+
+    # execution
+    async def _wait_for_slot(self, run_id: int, slot: asyncio.Semaphore) -> None:
+        """Acquire ``slot``, heartbeating the queued run so no other worker reclaims it meanwhile."""
+        while True:
+            try:
+                await asyncio.wait_for(slot.acquire(), self.heartbeat)
+                return
+            except asyncio.TimeoutError:
+                await asyncio.to_thread(self._touch, run_id)
+
+    async def _execute(self, run_id: int, user_id: str) -> None:
+        started = time.time()
+        user_sem = self._user_slot(user_id)
+        outcome = None
+        try:
+            await self._wait_for_slot(run_id, user_sem)
+            try:
+                await self._wait_for_slot(run_id, self._global)
+                try:
+                    self._running += 1
+                    outcome = await self._run_steps(run_id)
+                finally:
+                    self._running -= 1
+                    self._global.release()
+            finally:
+                user_sem.release()
+        except asyncio.CancelledError:
+            control = self._controls.get(run_id)
+            outcome = "stopped" if control == "stop" else "interrupted"
+            await asyncio.to_thread(self._finish, run_id, outcome, None, "stopped by user" if outcome == "stopped" else None)
+        except Exception as e:
+            logger.exception("agent run %s failed", run_id)
+            outcome = "failed"
+            await asyncio.to_thread(self._finish, run_id, "failed", None, str(e))
+        finally:
+            self._release_user_slot(user_id)
+            control = self._controls.pop(run_id, None)
+            if outcome in self._counters:
+                self._counters[outcome] += 1
+            if outcome in FINAL_STATUSES:
+                self._finished_at.append(time.time())
+                self._run_seconds.append(time.time() - started)
+            if outcome == "paused" and control == "resume":
+                self._tasks.pop(run_id, None)
+                self.submit(run_id, user_id)
+
+    def _finish(self, run_id: int, status: str, output: Any = None, error: Optional[str] = None) -> None:
+        fields: Dict[str, Any] = {"status": status}
+        if status in FINAL_STATUSES:
+            fields["completed_at"] = datetime.utcnow()
+        if output is not None:
+            fields["output_data"] = json.dumps(output)
+        if error is not None:
+            fields["error"] = error
+        run, _ = self._load(run_id)
+        if run is None:
+            return
+        # run and agent status change together so readers never see a finished run under a running agent
+        agent_status = {"completed": "idle", "failed": "error", "interrupted": "running"}.get(status, status)
+        self._save(run_id, agent_status=agent_status, **fields)
+        agent_events.publish(run.agent_id, "run", {"run_id": run_id, "status": status, "error": error, "output": _preview(output)})
+
+    async def _run_steps(self, run_id: int) -> str:
+        run, agent = await asyncio.to_thread(self._load, run_id)
+        if run is None or agent is None:
+            return "failed"
+        if run.status in FINAL_STATUSES:
+            return run.status
+        input_data = json.loads(run.input_data) if run.input_data else {}
+        steps = plan_steps(agent.config, input_data)
+        checkpoint = json.loads(run.checkpoint) if run.checkpoint else {"step": 0, "outputs": [], "memory": {}}
+        await asyncio.to_thread(self._save, run_id, agent_status="running", status="running")
+        agent_events.publish(agent.id, "run", {"run_id": run_id, "status": "running", "step": checkpoint["step"], "steps": len(steps)})
+
+        ctx = {
+            "input": input_data,
+            "memory": checkpoint["memory"],
+            "last": checkpoint["outputs"][-1] if checkpoint["outputs"] else None,
+            "steps": {s["name"]: out for s, out in zip(steps, checkpoint["outputs"]) if s.get("name")},
+        }
+        for index in range(checkpoint["step"], len(steps)):
+            if self._controls.get(run_id) == "pause":
+                await asyncio.to_thread(self._finish, run_id, "paused")
+                return "paused"
+            step = steps[index]
+            output = await asyncio.wait_for(self._run_step(step, ctx, agent, run), AGENT_STEP_TIMEOUT)
+            self._counters["steps"] += 1
+            ctx["last"] = output
+            if step.get("name"):
+                ctx["steps"][step["name"]] = output
+            checkpoint["step"] = index + 1
+            agent_events.publish(agent.id, "step", {
+                "run_id": run_id,
+                "index": index,
+                "type": step.get("type"),
+                "name": step.get("name"),
+                "output": _preview(output),
+            })
+            checkpoint["outputs"].append(output)
+            await asyncio.to_thread(self._save, run_id, status="running", checkpoint=json.dumps(checkpoint))
+
+        result = {"output": ctx["last"], "steps": len(steps)}
+        await asyncio.to_thread(self._finish, run_id, "completed", result)
+        return "completed"
+
+    async def _run_step(self, step: Dict[str, Any], ctx: Dict[str, Any], agent: Agent, run: AgentRun) -> Any:
+        kind = step.get("type")
+        scope = step.get("scope") or agent.memory_scope
+        scope_id = render(step.get("scope_id"), ctx) if step.get("scope_id") is not None else ctx["input"].get("scope_id")
+        if kind == "model":
+            prompt = render(step.get("prompt", "{last}"), ctx)
+            result = await self.model.generate(prompt if isinstance(prompt, str) else json.dumps(prompt), mode=step.get("mode", "agent"))
+            if result.get("status") == "error" or result.get("error"):
+                raise StepError(result.get("output") or result.get("error") or "model call failed")
+            return result.get("output")
+        if kind == "memory_read":
+            memory = await asyncio.to_thread(agent_memory.get, agent.id, step["key"], scope, scope_id)
+            value = memory["value"] if memory else step.get("default")
+            ctx["memory"][step["key"]] = value
+            return value
+        if kind == "memory_write":
+            value = render(step.get("value", "{last}"), ctx)
+            await asyncio.to_thread(agent_memory.set, agent.id, step["key"], value, scope, scope_id)
+            ctx["memory"][step["key"]] = value
+            return value
+        if kind == "tool":
+            return await run_tool(step.get("tool_id"), run.user_id, render(step.get("input", {}), ctx))
+        raise StepError(f"Unknown step type: {kind}")
+
+    # recovery
+    def claim_orphaned_runs(self, stale_seconds: int = AGENT_RUN_STALE_SECONDS) -> List[tuple]:
+        """Claim interrupted runs and queued/running runs whose worker stopped
+        checkpointing or heartbeating (see ``_wait_for_slot``)."""
+        cutoff = datetime.utcnow() - timedelta(seconds=stale_seconds)
+        claimed = []
+        with Session(engine) as session:
+            rows = session.exec(
+                select(AgentRun.id, AgentRun.user_id, AgentRun.status, AgentRun.updated_at)
+                .where(or_(
+                    AgentRun.status == "interrupted",
+                    AgentRun.status.in_(ACTIVE_STATUSES) & (AgentRun.updated_at < cutoff),
+                ))
+                .limit(1000)
+            ).all()
+            for run_id, user_id, status, updated_at in rows:
+                # conditional update so only one worker claims each run
+                result = session.execute(
+                    update(AgentRun)
+                    .where(AgentRun.id == run_id)
+                    .where(AgentRun.status == status)
+                    .where(AgentRun.updated_at == updated_at)
+                    .values(status="queued", updated_at=datetime.utcnow())
+                )
+                if result.rowcount == 1:
+                    claimed.append((run_id, user_id))
+            session.commit()
+        return claimed
+
+    async def resume_orphaned(self) -> int:
+        claimed = await asyncio.to_thread(self.claim_orphaned_runs)
+        for run_id, user_id in claimed:
+            self.submit(run_id, user_id)
+        if claimed:
+            logger.info("resumed %d orphaned agent runs", len(claimed))
+        return len(claimed)
+
+
+run_executor = RunExecutor()
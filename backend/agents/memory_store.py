@@ -0,0 +1,169 @@
+"""Key-value store for agent memory.
+
+One row per (agent_id, scope, scope_id, key), written with an atomic
+INSERT ... ON CONFLICT DO UPDATE. Reads by key or by scope go through a
+bounded LRU with write-through on set, so agent executions read their memory
+in O(1) per key once warm. A short TTL bounds staleness across workers.
+"""
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlmodel import Session, select
+
+from ..models import engine, AgentMemory, AGENT_MEMORY_NO_SCOPE_ID
+from ..utils.cache import LRUCache
+
+AGENT_MEMORY_CACHE_SIZE = int(os.getenv("AGENT_MEMORY_CACHE_SIZE", "50000"))
+AGENT_MEMORY_CACHE_TTL = int(os.getenv("AGENT_MEMORY_CACHE_TTL", "30"))
+
+# cached "no such key" marker so repeated misses don't hit the database
+_ABSENT = {}
+
+
+def encode_value(value: Any) -> str:
+    return json.dumps(value) if isinstance(value, (dict, list)) else str(value)
+
+
+def _scope_id(scope_id: Optional[int]) -> int:
+    return AGENT_MEMORY_NO_SCOPE_ID if scope_id is None else int(scope_id)
+
+
+def _row_dict(row: AgentMemory) -> Dict[str, Any]:
+    d = row.dict()
+    if d.get("scope_id") == AGENT_MEMORY_NO_SCOPE_ID:
+        d["scope_id"] = None
+    return d
+
+
+def _insert():
+    dialect = engine.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+class AgentMemoryStore:
+    def __init__(self, maxsize: int = AGENT_MEMORY_CACHE_SIZE, ttl: int = AGENT_MEMORY_CACHE_TTL):
+        self._cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    # cache keys
+    @staticmethod
+    def _key(agent_id: int, scope: str, scope_id: int, key: str):
+        return ("k", agent_id, scope, scope_id, key)
+
+    @staticmethod
+    def _scope_key(agent_id: int, scope: str, scope_id: int):
+        return ("s", agent_id, scope, scope_id)
+
+    def get(self, agent_id: int, key: str, scope: str, scope_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        return self.get_many(agent_id, [key], scope, scope_id).get(key)
+
+    def get_many(self, agent_id: int, keys: Iterable[str], scope: str, scope_id: Optional[int] = None) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Values for ``keys`` (None when unset); misses are fetched in one query."""
+        sid = _scope_id(scope_id)
+        out: Dict[str, Optional[Dict[str, Any]]] = {}
+        missing = []
+        for key in keys:
+            cached = self._cache.get(self._key(agent_id, scope, sid, key))
+            if cached is None:
+                missing.append(key)
+            else:
+                out[key] = cached or None
+        if missing:
+            with Session(engine) as session:
+                rows = session.exec(
+                    select(AgentMemory)
+                    .where(AgentMemory.agent_id == agent_id)
+                    .where(AgentMemory.scope == scope)
+                    .where(AgentMemory.scope_id == sid)
+                    .where(AgentMemory.key.in_(missing))
+                ).all()
+            found = {r.key: _row_dict(r) for r in rows}
+            for key in missing:
+                row = found.get(key)
+                self._cache.set(self._key(agent_id, scope, sid, key), row or _ABSENT)
+                out[key] = row
+        return out
+
+    def list_scope(self, agent_id: int, scope: str, scope_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        sid = _scope_id(scope_id)
+        cached = self._cache.get(self._scope_key(agent_id, scope, sid))
+        if cached is not None:
+            return cached
+        with Session(engine) as session:
+            rows = session.exec(
+                select(AgentMemory)
+                .where(AgentMemory.agent_id == agent_id)
+                .where(AgentMemory.scope == scope)
+                .where(AgentMemory.scope_id == sid)
+                .order_by(AgentMemory.key)
+            ).all()
+        out = [_row_dict(r) for r in rows]
+        self._cache.set(self._scope_key(agent_id, scope, sid), out)
+        for row in out:
+            self._cache.set(self._key(agent_id, scope, sid, row["key"]), row)
+        return out
+
+    def list_all(self, agent_id: int) -> List[Dict[str, Any]]:
+        with Session(engine) as session:
+            rows = session.exec(
+                select(AgentMemory)
+                .where(AgentMemory.agent_id == agent_id)
+                .order_by(AgentMemory.scope, AgentMemory.scope_id, AgentMemory.key)
+            ).all()
+        return [_row_dict(r) for r in rows]
+
+    def set(self, agent_id: int, key: str, value: Any, scope: str, scope_id: Optional[int] = None) -> Dict[str, Any]:
+        return self.set_many(agent_id, [{"key": key, "value": value, "scope": scope, "scope_id": scope_id}])[0]
+
+    def set_many(self, agent_id: int, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Upsert ``items`` ({key, value, scope, scope_id}) in one statement; write-through to the cache."""
+        now = datetime.utcnow()
+        rows = {}
+        for item in items:
+            sid = _scope_id(item.get("scope_id"))
+            # last write wins for duplicate keys within one batch
+            rows[(item["scope"], sid, item["key"])] = {
+                "agent_id": agent_id,
+                "scope": item["scope"],
+                "scope_id": sid,
+                "key": item["key"],
+                "value": encode_value(item["value"]),
+                "created_at": now,
+                "updated_at": now,
+            }
+        if not rows:
+            return []
+        insert = _insert()
+        stmt = insert(AgentMemory.__table__).values(list(rows.values()))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["agent_id", "scope", "scope_id", "key"],
+            set_={"value": stmt.excluded.value, "updated_at": stmt.excluded.updated_at},
+        )
+        with Session(engine) as session:
+            session.execute(stmt)
+            session.commit()
+            saved = []
+            for scope, sid in {(s, i) for s, i, _ in rows}:
+                keys = [k for s, i, k in rows if (s, i) == (scope, sid)]
+                saved.extend(session.exec(
+                    select(AgentMemory)
+                    .where(AgentMemory.agent_id == agent_id)
+                    .where(AgentMemory.scope == scope)
+                    .where(AgentMemory.scope_id == sid)
+                    .where(AgentMemory.key.in_(keys))
+                ).all())
+        by_key = {}
+        for row in saved:
+            d = _row_dict(row)
+            self._cache.set(self._key(agent_id, row.scope, row.scope_id, row.key), d)
+            self._cache.pop(self._scope_key(agent_id, row.scope, row.scope_id))
+            by_key[(row.scope, row.scope_id, row.key)] = d
+        return [by_key[k] for k in rows if k in by_key]
+
+
+agent_memory = AgentMemoryStore()
@@ -0,0 +1,501 @@
+"""One agent repository over the SQL and Mongo stores.
+
+Both backends read and write the same plain-dict agent document::
+
+    {"id", "owner_id", "name", "description", "config" (dict), "status",
+     "memory_scope", "public", "external_id", "created_at", "updated_at"}
+
+``external_id`` is the agent's id in the other store, set by
+``sync_agents`` so repeated syncs update rather than duplicate. Reads go
+through a shared read-through LRU keyed by (store, id), so an ownership
+check plus the response body cost at most one database round trip; every
+write through the repository refreshes or drops the cached document.
+Code that changes agent rows directly must call ``invalidate``.
+"""
+import asyncio
+import json
+import logging
+import os
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import update
+from sqlmodel import Session, select
+
+from ..models import engine, Agent as SQLAgent
+from ..utils.cache import LRUCache
+
+logger = logging.getLogger("backend.agents.repository")
+
+AGENT_CACHE_SIZE = int(os.getenv("AGENT_CACHE_SIZE", "10000"))
+AGENT_CACHE_TTL = int(os.getenv("AGENT_CACHE_TTL", "30"))
+
+STATUSES = ("idle", "running", "paused", "stopped", "error")
+# fields callers may set; everything else is managed by the repository
+WRITABLE_FIELDS = ("name", "description", "config", "status", "memory_scope", "public")
+
+_CACHE = LRUCache(maxsize=AGENT_CACHE_SIZE, ttl=AGENT_CACHE_TTL)
+
+
+def _decode_config(config: Optional[str]) -> Optional[dict]:
+    if not config:
+        return None
+    try:
+        return json.loads(config)
+    except ValueError:
+        return None
+
+
+def sql_view(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """The /agents response shape: ``user_id`` and a JSON-text ``config``."""
+    out = dict(doc)
+    out["user_id"] = out.pop("owner_id")
+    out["config"] = json.dumps(doc["config"]) if doc.get("config") is not None else None
+    return out
+
+
+class AgentRepository(ABC):
+    """Cached agent access; backends implement the ``_``-prefixed hooks."""
+
+    name = ""
+
+    def _cache_key(self, agent_id) -> tuple:
+        return (self.name, str(agent_id))
+
+    def invalidate(self, agent_id) -> None:
+        _CACHE.pop(self._cache_key(agent_id))
+
+    def _remember(self, doc: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if doc is not None:
+            _CACHE.set(self._cache_key(doc["id"]), doc)
+        return doc
+
+    async def get(self, agent_id) -> Optional[Dict[str, Any]]:
+        doc = _CACHE.get(self._cache_key(agent_id))
+        if doc is None:
+            doc = self._remember(await self._fetch(agent_id))
+        return doc
+
+    async def get_owned(self, agent_id, owner_id: str) -> Dict[str, Any]:
+        doc = await self.get(agent_id)
+        if not doc or doc["owner_id"] != owner_id:
+            raise HTTPException(status_code=404, detail="Agent not found")
+        return doc
+
+    async def list_by_owner(self, owner_id: str) -> List[Dict[str, Any]]:
+        return [self._remember(doc) for doc in await self._list(owner_id)]
+
+    @staticmethod
+    def new_doc(owner_id: str, fields: Dict[str, Any], now: Optional[datetime] = None) -> Dict[str, Any]:
+        """A new agent document with defaults for every field not in ``fields``."""
+        now = now or datetime.utcnow()
+        doc = {
+            "owner_id": owner_id,
+            "description": None,
+            "config": None,
+            "status": "idle",
+            "memory_scope": "conversation",
+            "public": False,
+            "external_id": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        doc.update({k: v for k, v in fields.items() if k in WRITABLE_FIELDS})
+        return doc
+
+    async def create(self, owner_id: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+        return self._remember(await self._insert(self.new_doc(owner_id, fields)))
+
+    async def update(self, agent_id, owner_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Apply ``fields`` to an agent owned by ``owner_id``; None if there is no such agent."""
+        changes = {k: v for k, v in fields.items() if k in WRITABLE_FIELDS}
+        changes["updated_at"] = datetime.utcnow()
+        doc = await self._update(agent_id, owner_id, changes)
+        if doc is None:
+            self.invalidate(agent_id)
+        return self._remember(doc)
+
+    async def delete(self, agent_id, owner_id: str) -> bool:
+        self.invalidate(agent_id)
+        return await self._delete(agent_id, owner_id)
+
+    # bulk access for store-to-store sync
+    async def scan(self, after=None, limit: int = 500) -> List[Dict[str, Any]]:
+        """Agents ordered by id, starting after ``after``."""
+        return await self._scan(after, limit)
+
+    async def upsert_external(self, docs: List[Dict[str, Any]]) -> Dict[str, int]:
+        """Insert or update copies of agents from the other store.
+
+        A source agent matches the target row it was copied from (its own
+        ``external_id``) or the row previously copied from it.
+        """
+        return await self._upsert_external(docs)
+
+    @abstractmethod
+    async def _fetch(self, agent_id):
+        ...
+
+    @abstractmethod
+    async def _list(self, owner_id):
+        ...
+
+    @abstractmethod
+    async def _insert(self, doc):
+        ...
+
+    @abstractmethod
+    async def _update(self, agent_id, owner_id, changes):
+        ...
+
+    @abstractmethod
+    async def _delete(self, agent_id, owner_id):
+        ...
+
+    @abstractmethod
+    async def _scan(self, after, limit):
+        ...
+
+    @abstractmethod
+    async def _upsert_external(self, docs):
+        ...
+
+
+class SQLAgentRepository(AgentRepository):
+    name = "sql"
+
+    @staticmethod
+    def to_doc(agent: SQLAgent) -> Dict[str, Any]:
+        return {
+            "id": agent.id,
+            "owner_id": agent.user_id,
+            "name": agent.name,
+            "description": agent.description,
+            "config": _decode_config(agent.config),
+            "status": agent.status,
+            "memory_scope": agent.memory_scope,
+            "public": agent.public,
+            "external_id": agent.external_id,
+            "created_at": agent.created_at,
+            "updated_at": agent.updated_at,
+        }
+
+    @staticmethod
+    def _columns(doc: Dict[str, Any]) -> Dict[str, Any]:
+        cols = {k: v for k, v in doc.items() if k not in ("id", "owner_id", "config")}
+        if "owner_id" in doc:
+            cols["user_id"] = doc["owner_id"]
+        if "config" in doc:
+            cols["config"] = json.dumps(doc["config"]) if doc["config"] is not None else None
+        return cols
+
+    # sync entry points for sync routes and worker threads
+    def get_sync(self, agent_id: int) -> Optional[Dict[str, Any]]:
+        doc = _CACHE.get(self._cache_key(agent_id))
+        if doc is None:
+            doc = self._remember(self._fetch_sync(agent_id))
+        return doc
+
+    def get_owned_sync(self, agent_id: int, owner_id: str) -> Dict[str, Any]:
+        doc = self.get_sync(agent_id)
+        if not doc or doc["owner_id"] != owner_id:
+            raise HTTPException(status_code=404, detail="Agent not found")
+        return doc
+
+    def _fetch_sync(self, agent_id: int):
+        with Session(engine) as session:
+            agent = session.get(SQLAgent, agent_id)
+            return self.to_doc(agent) if agent else None
+
+    async def _fetch(self, agent_id):
+        try:
+            agent_id = int(agent_id)
+        except (TypeError, ValueError):
+            return None
+        return await asyncio.to_thread(self._fetch_sync, agent_id)
+
+    def _list_sync(self, owner_id: str):
+        with Session(engine) as session:
+            agents = session.exec(select(SQLAgent).where(SQLAgent.user_id == owner_id)).all()
+            return [self.to_doc(a) for a in agents]
+
+    async def _list(self, owner_id):
+        return await asyncio.to_thread(self._list_sync, owner_id)
+
+    def _insert_sync(self, doc):
+        with Session(engine) as session:
+            agent = SQLAgent(**self._columns(doc))
+            session.add(agent)
+            session.commit()
+            session.refresh(agent)
+            return self.to_doc(agent)
+
+    async def _insert(self, doc):
+        return await asyncio.to_thread(self._insert_sync, doc)
+
+    def _update_sync(self, agent_id: int, owner_id: str, changes):
+        with Session(engine) as session:
+            result = session.execute(
+                update(SQLAgent)
+                .where(SQLAgent.id == agent_id)
+                .where(SQLAgent.user_id == owner_id)
+                .values(**self._columns(changes))
+            )
+            session.commit()
+            if result.rowcount != 1:
+                return None
+            return self.to_doc(session.get(SQLAgent, agent_id))
+
+    async def _update(self, agent_id, owner_id, changes):
+        return await asyncio.to_thread(self._update_sync, int(agent_id), owner_id, changes)
+
+    def _delete_sync(self, agent_id: int, owner_id: str) -> bool:
+        with Session(engine) as session:
+            agent = session.get(SQLAgent, agent_id)
+            if not agent or agent.user_id != owner_id:
+                return False
+            session.delete(agent)
+            session.commit()
+            return True
+
+    async def _delete(self, agent_id, owner_id):
+        return await asyncio.to_thread(self._delete_sync, int(agent_id), owner_id)
+
+    def _scan_sync(self, after, limit):
+        with Session(engine) as session:
+            q = select(SQLAgent).order_by(SQLAgent.id).limit(limit)
+            if after is not None:
+                q = q.where(SQLAgent.id > after)
+            return [self.to_doc(a) for a in session.exec(q).all()]
+
+    async def _scan(self, after, limit):
+        return await asyncio.to_thread(self._scan_sync, after, limit)
+
+    def _upsert_external_sync(self, docs):
+        home_ids = [int(d["external_id"]) for d in docs if str(d.get("external_id") or "").isdigit()]
+        with Session(engine) as session:
+            homes = set(session.exec(select(SQLAgent.id).where(SQLAgent.id.in_(home_ids))).all()) if home_ids else set()
+            copies = dict(session.exec(
+                select(SQLAgent.external_id, SQLAgent.id).where(SQLAgent.external_id.in_([str(d["id"]) for d in docs]))
+            ).all())
+            inserts, updates = [], []
+            for doc in docs:
+                cols = self._columns({k: v for k, v in doc.items() if k != "external_id"})
+                cols["external_id"] = str(doc["id"])
+                home = int(doc["external_id"]) if str(doc.get("external_id") or "").isdigit() else None
+                target = home if home in homes else copies.get(str(doc["id"]))
+                if target is not None:
+                    cols["id"] = target
+                    updates.append(cols)
+                else:
+                    inserts.append(cols)
+            if inserts:
+                session.bulk_insert_mappings(SQLAgent, inserts)
+            if updates:
+                session.bulk_update_mappings(SQLAgent, updates)
+            session.commit()
+        for cols in updates:
+            self.invalidate(cols["id"])
+        return {"inserted": len(inserts), "updated": len(updates)}
+
+    async def _upsert_external(self, docs):
+        return await asyncio.to_thread(self._upsert_external_sync, docs)
+
+
+class MongoAgentRepository(AgentRepository):
+    name = "mongo"
+
+    @staticmethod
+    def _model():
+        from ..models_agent import Agent as MongoAgent
+
+        return MongoAgent
+
+    @staticmethod
+    def to_doc(raw: Dict[str, Any]) -> Dict[str, Any]:
+        """Document from a raw collection dict (``_id``) or a Beanie dump (``id``)."""
+        doc = dict(raw)
+        _id = doc.pop("_id", None)
+        doc["id"] = str(doc.get("id") or _id)
+        doc.setdefault("external_id", None)
+        doc.setdefault("public", False)
+        doc.setdefault("description", None)
+        doc.setdefault("config", None)
+        return doc
+
+    @staticmethod
+    def object_id(agent_id):
+        from beanie import PydanticObjectId
+
+        try:
+            return PydanticObjectId(agent_id)
+        except Exception:
+            return None
+
+    def _collection(self):
+        return self._model().get_motor_collection()
+
+    async def _fetch(self, agent_id):
+        oid = self.object_id(agent_id)
+        if oid is None:
+            return None
+        raw = await self._collection().find_one({"_id": oid})
+        return self.to_doc(raw) if raw else None
+
+    async def _list(self, owner_id):
+        cursor = self._collection().find({"owner_id": owner_id}).sort([("_id", 1)])
+        return [self.to_doc(raw) for raw in await cursor.to_list(None)]
+
+    async def list_page(
+        self, owner_id: str, cursor: Optional[str] = None, limit: int = 50, fields: Optional[List[str]] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """One page of an owner's agents in ``_id`` order, served by the (owner_id, _id) index.
+
+        ``cursor`` is the last id of the previous page. With ``fields`` only
+        those fields (plus ``id``) are fetched; projected documents are not
+        cached. Returns (agents, next_cursor).
+        """
+        query: Dict[str, Any] = {"owner_id": owner_id}
+        if cursor:
+            after = self.object_id(cursor)
+            if after is None:
+                raise ValueError("invalid cursor")
+            query["_id"] = {"$gt": after}
+        projection = {f: 1 for f in fields} if fields else None
+        raw_docs = await (
+            self._collection().find(query, projection).sort([("_id", 1)]).limit(limit + 1).to_list(None)
+        )
+        has_more = len(raw_docs) > limit
+        raw_docs = raw_docs[:limit]
+        if projection:
+            docs = [{"id": str(raw.pop("_id")), **raw} for raw in raw_docs]
+        else:
+            docs = [self._remember(self.to_doc(raw)) for raw in raw_docs]
+        return docs, (docs[-1]["id"] if has_more else None)
+
+    async def bulk_create(self, owner_id: str, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        from bson import ObjectId
+        from pymongo import InsertOne
+
+        now = datetime.utcnow()
+        docs = [dict(self.new_doc(owner_id, item, now), _id=ObjectId()) for item in items]
+        if docs:
+            await self._collection().bulk_write([InsertOne(dict(d)) for d in docs], ordered=True)
+        return [self._remember(self.to_doc(d)) for d in docs]
+
+    async def bulk_update(self, owner_id: str, updates: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, int]:
+        """Apply ``$set`` partial updates [(agent_id, fields)] in one bulk_write; no reads."""
+        from pymongo import UpdateOne
+
+        now = datetime.utcnow()
+        ops = []
+        for agent_id, fields in updates:
+            changes = {k: v for k, v in fields.items() if k in WRITABLE_FIELDS}
+            changes["updated_at"] = now
+            ops.append(UpdateOne({"_id": self.object_id(agent_id), "owner_id": owner_id}, {"$set": changes}))
+            self.invalidate(agent_id)
+        if not ops:
+            return {"matched": 0, "modified": 0}
+        result = await self._collection().bulk_write(ops, ordered=False)
+        return {"matched": result.matched_count, "modified": result.modified_count}
+
+    async def bulk_delete(self, owner_id: str, agent_ids: List[str]) -> int:
+        from pymongo import DeleteOne
+
+        ops = [DeleteOne({"_id": self.object_id(agent_id), "owner_id": owner_id}) for agent_id in agent_ids]
+        for agent_id in agent_ids:
+            self.invalidate(agent_id)
+        if not ops:
+            return 0
+        result = await self._collection().bulk_write(ops, ordered=False)
+        return result.deleted_count
+
+    async def _insert(self, doc):
+        agent = self._model()(**doc)
+        await agent.insert()
+        return self.to_doc(agent.dict())
+
+    async def _update(self, agent_id, owner_id, changes):
+        from pymongo import ReturnDocument
+
+        oid = self.object_id(agent_id)
+        if oid is None:
+            return None
+        # ownership check and partial write in one round trip, no prior read
+        raw = await self._collection().find_one_and_update(
+            {"_id": oid, "owner_id": owner_id},
+            {"$set": changes},
+            return_document=ReturnDocument.AFTER,
+        )
+        return self.to_doc(raw) if raw else None
+
+    async def _delete(self, agent_id, owner_id):
+        oid = self.object_id(agent_id)
+        if oid is None:
+            return False
+        result = await self._collection().delete_one({"_id": oid, "owner_id": owner_id})
+        return result.deleted_count == 1
+
+    async def _scan(self, after, limit):
+        query = {}
+        if after is not None:
+            query["_id"] = {"$gt": self.object_id(after)}
+        cursor = self._collection().find(query).sort([("_id", 1)]).limit(limit)
+        return [self.to_doc(raw) for raw in await cursor.to_list(None)]
+
+    async def _upsert_external(self, docs):
+        from pymongo import InsertOne, UpdateOne
+
+        home_ids = [oid for oid in (self.object_id(d.get("external_id")) for d in docs if d.get("external_id")) if oid]
+        homes = {
+            raw["_id"] for raw in await self._collection().find({"_id": {"$in": home_ids}}, {"_id": 1}).to_list(None)
+        } if home_ids else set()
+        copies = {
+            raw["external_id"]: raw["_id"]
+            for raw in await self._collection().find(
+                {"external_id": {"$in": [str(d["id"]) for d in docs]}}, {"external_id": 1}
+            ).to_list(None)
+        }
+        ops, updated = [], []
+        for doc in docs:
+            fields = {k: v for k, v in doc.items() if k not in ("id", "external_id")}
+            fields["external_id"] = str(doc["id"])
+            home = self.object_id(doc["external_id"]) if doc.get("external_id") else None
+            target = home if home in homes else copies.get(str(doc["id"]))
+            if target is not None:
+                ops.append(UpdateOne({"_id": target}, {"$set": fields}))
+                updated.append(target)
+            else:
+                ops.append(InsertOne(fields))
+        if ops:
+            await self._collection().bulk_write(ops, ordered=False)
+        for oid in updated:
+            self.invalidate(oid)
+        return {"inserted": len(ops) - len(updated), "updated": len(updated)}
+
+
+sql_agents = SQLAgentRepository()
+mongo_agents = MongoAgentRepository()
+REPOSITORIES = {"sql": sql_agents, "mongo": mongo_agents}
+
+
+async def sync_agents(source: str, target: str, batch_size: int = 500) -> Dict[str, int]:
+    """Copy every agent from one store to the other in id-ordered batches."""
+    if source == target or source not in REPOSITORIES or target not in REPOSITORIES:
+        raise ValueError("source and target must be different stores: sql or mongo")
+    src, dst = REPOSITORIES[source], REPOSITORIES[target]
+    totals = {"copied": 0, "inserted": 0, "updated": 0}
+    after = None
+    while True:
+        batch = await src.scan(after, batch_size)
+        if not batch:
+            break
+        counts = await dst.upsert_external(batch)
+        totals["copied"] += len(batch)
+        totals["inserted"] += counts["inserted"]
+        totals["updated"] += counts["updated"]
+        after = batch[-1]["id"]
+        logger.info("agent sync %s -> %s: %s", source, target, totals)
+    return totals
@@ -0,0 +1,79 @@
+"""Dashboard statistics with a per-user counter cache.
+
+The dashboard polls /agents/stats and /agents-mongo/stats. Counts are
+computed with aggregate queries on a cache miss and then kept in a small
+per-user cache that create/delete paths adjust in place, so polling is
+O(1) regardless of how many agents or runs a user has accumulated. A TTL
+bounds drift between workers.
+"""
+import os
+from typing import Dict, Optional
+
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from ..models import engine, Agent, AgentRun
+from ..utils.cache import LRUCache
+
+STATS_CACHE_TTL = int(os.getenv("STATS_CACHE_TTL", "60"))
+STATS_CACHE_SIZE = int(os.getenv("STATS_CACHE_SIZE", "10000"))
+
+# Get tool count from tools router (20 is default)
+DEFAULT_TOOL_COUNT = 20
+
+# (store, uid) -> {"agents": int, "runs": int}
+_COUNTERS = LRUCache(maxsize=STATS_CACHE_SIZE, ttl=STATS_CACHE_TTL)
+
+
+def adjust(store: str, uid: str, agents: int = 0, runs: int = 0) -> None:
+    """Apply a delta to a cached counter set; a cold entry is left cold.
+
+    The entry keeps its original expiry, so even a busy user's counters are
+    re-read from the database every STATS_CACHE_TTL.
+    """
+    _COUNTERS.update(
+        (store, uid),
+        lambda counts: {"agents": max(0, counts["agents"] + agents), "runs": max(0, counts["runs"] + runs)},
+    )
+
+
+def invalidate(store: str, uid: str) -> None:
+    _COUNTERS.pop((store, uid))
+
+
+def build_stats(agents: int, runs: int, tools: int = DEFAULT_TOOL_COUNT) -> Dict[str, int]:
+    # Calculate intelligence score based on activity
+    intelligence_score = min(100, 50 + (agents * 5) + (runs * 2))
+    return {
+        "agents": agents,
+        "runs": runs,
+        "tools": tools,
+        "intelligence_score": intelligence_score,
+    }
+
+
+def sql_counts(uid: str) -> Dict[str, int]:
+    """Agent and run counts for ``uid`` from the SQL store (one round trip on a miss)."""
+    counts: Optional[Dict[str, int]] = _COUNTERS.get(("sql", uid))
+    if counts is not None:
+        return counts
+    agents_q = select(func.count(Agent.id)).where(Agent.user_id == uid).scalar_subquery()
+    runs_q = select(func.count(AgentRun.id)).where(AgentRun.user_id == uid).scalar_subquery()
+    with Session(engine) as session:
+        agents, runs = session.execute(select(agents_q, runs_q)).one()
+    counts = {"agents": agents or 0, "runs": runs or 0}
+    _COUNTERS.set(("sql", uid), counts)
+    return counts
+
+
+async def mongo_counts(uid: str) -> Dict[str, int]:
+    """Agent count for ``uid`` from MongoDB; runs are not stored there yet."""
+    from ..models_agent import Agent as MongoAgent
+
+    counts: Optional[Dict[str, int]] = _COUNTERS.get(("mongo", uid))
+    if counts is not None:
+        return counts
+    agents = await MongoAgent.find(MongoAgent.owner_id == uid).count()
+    counts = {"agents": agents, "runs": 0}
+    _COUNTERS.set(("mongo", uid), counts)
+    return counts
@@ -6,6 +6,7 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import logging
+from typing import Optional
 from fastapi import FastAPI, Depends, HTTPException, Request
 import fastapi
 import asyncio
@@ -34,8 +35,11 @@ from .routes.personal import router as personal_router
 from .routes.security import router as security_router
 from .routes.web import router as web_router
 from .routes.admin import router as admin_router
+from .routes.search import router as search_router
+from .routes.tags import router as tags_router
 from sqlmodel import SQLModel, create_engine, Session, select
 from .auth.firebase import verify_firebase_token, firebase_auth_required
+from .auth.firebase_keys import firebase_keys, firebase_project_id
 from .ai.service import ai_service
 from .search.tavily import tavily_search
 from .models import (
@@ -50,15 +54,37 @@ from .models import (
     AuditLog,
 )
 from .routes.export import router as export_router
-from .utils.rate_limit import require_rate_limit
+from . import tags as tag_index
+from .memory.index import memory_index
+from .memory import consolidation  # registers the consolidation job
+from .agents.executor import StepError, run_executor
+from .chains.engine import ChainDefinitionError, chain_engine, parse_definition
+from . import jobs
+from . import maintenance  # registers the housekeeping schedules
+from .scheduler import scheduler
+from .tools import builtin  # registers the tool implementations
+from .tools import catalog as tool_catalog
+from .tools.health import tool_health
+from .tools.runtime import tool_runtime
+from .chat import titles  # registers the title job
+from .routes.jobs import router as jobs_router
+from .chat.persistence import persist_turn, check_conversation, get_owned_conversation, source_urls
+from .utils.rate_limit import RateLimitMiddleware
+from .utils.idempotency import IdempotencyMiddleware
 from .utils.validation import validate_memory_payload, validate_project_payload, validate_task_payload, require_str_field
 
 # MongoDB imports
-from .db_mongo import init_db as init_mongo_db, close_db as close_mongo_db, health_check as mongo_health_check
+from .db_mongo import init_db as init_mongo_db, close_db as close_mongo_db, pool_stats as mongo_pool_stats
+from .utils.health_probe import health_prober
 from .models_agent import Agent as MongoAgent
 from .routes.agents_mongo import router as agents_mongo_router
 
 LOG_LEVEL = os.getenv("LOG_LEVEL", "info").upper()
+MEMORY_GROUNDING_DEFAULT = os.getenv("MEMORY_GROUNDING_DEFAULT", "false").lower() == "true"
+MEMORY_TOP_K = int(os.getenv("MEMORY_TOP_K", "5"))
+MEMORY_BUDGET_MS = float(os.getenv("MEMORY_RETRIEVAL_BUDGET_MS", "5"))
+TITLE_WAIT_SECONDS = float(os.getenv("TITLE_WAIT_SECONDS", "10"))
+CONSOLIDATE_WAIT_SECONDS = float(os.getenv("CONSOLIDATE_WAIT_SECONDS", "20"))
 logging.basicConfig(level=LOG_LEVEL)
 logger = logging.getLogger("backend")
 
@@ -117,6 +143,15 @@ app.include_router(business_router)
 app.include_router(personal_router)
 app.include_router(security_router)
 app.include_router(web_router)
+app.include_router(search_router)
+app.include_router(tags_router)
+app.include_router(jobs_router)
+
+# token-weighted rate limiting on model-backed routes (see utils/rate_limit.py)
+app.add_middleware(RateLimitMiddleware)
+
+# Idempotency-Key replay for retried POSTs; outside the limiter so replays are free
+app.add_middleware(IdempotencyMiddleware)
 
 # security headers
 app.add_middleware(SecurityHeadersMiddleware)
@@ -141,6 +176,11 @@ app.add_middleware(
 async def startup():
     init_db()
     logger.info("SQL DB initialized")
+    if os.getenv("REFDATA_SYNC_ON_STARTUP", "true").lower() in ("1", "true", "yes"):
+        try:
+            tool_catalog.sync_catalog()
+        except Exception:
+            logger.exception("tool catalog sync failed")
     
     # Initialize MongoDB if MONGODB_URI is available
     mongodb_uri = os.getenv("MONGODB_URI")
@@ -154,10 +194,29 @@ async def startup():
     else:
         logger.warning("MONGODB_URI not set - MongoDB features disabled")
 
+    await run_executor.resume_orphaned()
+    await jobs.runner.start()
+    scheduler.start()
+    tool_runtime.usage.start()
+    app.state.tool_health_task = tool_health.start()
+    app.state.health_task = health_prober.start()
+    if firebase_project_id():
+        app.state.firebase_keys_task = firebase_keys.start()
+    app.state.started = True
+
 
 @app.on_event("shutdown")
 async def shutdown():
     """Gracefully close database connections on shutdown."""
+    app.state.started = False
+    for name in ("health_task", "tool_health_task", "firebase_keys_task"):
+        task = getattr(app.state, name, None)
+        if task:
+            task.cancel()
+    await scheduler.stop()
+    await tool_runtime.usage.stop()
+    await jobs.runner.drain()
+    await run_executor.shutdown()
     await close_mongo_db()
     logger.info("Shutdown complete")
 
@@ -173,45 +232,51 @@ def root():
     }
 
 
+def _unhealthy(checks: dict) -> bool:
+    return any(c["status"] not in ("connected", "not_configured") for c in checks.values())
+
+
 @app.get("/health")
 async def health():
     """
-    Health check endpoint that verifies database connectivity.
-    Returns 200 if healthy, 503 if database is unreachable.
+    Health check endpoint that reports database connectivity.
+    Reads the background prober's cached state instead of pinging per request.
+    Returns 200 if healthy, 503 if a configured database is unreachable.
     """
+    checks = await health_prober.state()
     response = {
-        "status": "ok",
-        "sql_db": "connected",
-        "mongo_db": "not_configured"
+        "status": "degraded" if _unhealthy(checks) else "ok",
+        "sql_db": checks["sql_db"]["status"],
+        "mongo_db": checks["mongo_db"]["status"],
+        "checks": checks,
+        "checked_seconds_ago": health_prober.age_seconds(),
     }
-    
-    # Check MongoDB health if configured
-    mongodb_uri = os.getenv("MONGODB_URI")
-    if mongodb_uri:
-        try:
-            mongo_healthy = await mongo_health_check()
-            if mongo_healthy:
-                response["mongo_db"] = "connected"
-            else:
-                response["mongo_db"] = "unreachable"
-                response["status"] = "degraded"
-                logger.error("MongoDB health check failed")
-                return fastapi.responses.JSONResponse(
-                    status_code=503,
-                    content=response
-                )
-        except Exception as e:
-            logger.exception(f"MongoDB health check error: {e}")
-            response["mongo_db"] = "error"
-            response["status"] = "degraded"
-            return fastapi.responses.JSONResponse(
-                status_code=503,
-                content=response
-            )
-    
+    if response["status"] != "ok":
+        return fastapi.responses.JSONResponse(status_code=503, content=response)
     return response
 
 
+@app.get("/health/live")
+async def health_live():
+    """Liveness: the process is up and serving requests (no I/O)."""
+    return {"status": "ok"}
+
+
+@app.get("/health/ready")
+async def health_ready():
+    """Readiness: startup finished and every configured database is reachable."""
+    checks = await health_prober.state()
+    ready = getattr(app.state, "started", False) and not _unhealthy(checks)
+    content = {"status": "ready" if ready else "not_ready", "checks": {k: v["status"] for k, v in checks.items()}}
+    return fastapi.responses.JSONResponse(status_code=200 if ready else 503, content=content)
+
+
+@app.get("/health/metrics")
+async def health_metrics():
+    """Mongo connection pool counters and the latest probe results."""
+    return {"mongo_pool": mongo_pool_stats(), "checks": await health_prober.state()}
+
+
 @app.post("/ai/generate")
 async def generate(payload: dict, response: fastapi.Response, user=Depends(firebase_auth_required)):
     # payload: { mode: str, prompt: str, use_search: bool }
@@ -222,13 +287,9 @@ async def generate(payload: dict, response: fastapi.Response, user=Depends(fireb
     if mode not in ("chat", "think", "study", "build"):
         # allow-list modes and normalize unknowns to chat
         mode = "chat"
-    # rate limit check
-    try:
-        require_rate_limit(request=None, uid=user["uid"])  # request not used in simple limiter
-        response.headers["X-RateLimit-Checked"] = "1"
-    except Exception as e:
-        logger.warning(f"Rate limit check issue: {e}")
-        pass
+    if payload.get("conv_id"):
+        # fail fast before paying for the model call
+        check_conversation(payload["conv_id"], user["uid"])
     
     # optional search
     sources = None
@@ -240,10 +301,19 @@ async def generate(payload: dict, response: fastapi.Response, user=Depends(fireb
             logger.exception(f"Tavily search failed for query '{q}': {e}")
             sources = None
     
+    # optional grounding in the user's own memories (bounded latency, never blocks on the DB)
+    memories = []
+    model_prompt = prompt
+    if payload.get("use_memory", MEMORY_GROUNDING_DEFAULT):
+        memories = memory_index.retrieve_within_budget(user["uid"], prompt, k=MEMORY_TOP_K, budget_ms=MEMORY_BUDGET_MS)
+        if memories:
+            remembered = "\n".join(f"- {text}" for _, _, text in memories)
+            model_prompt = f"Relevant things the user asked you to remember:\n{remembered}\n\n{prompt}"
+
     # call AI core with error handling
     try:
         logger.debug(f"Calling AI service for generation: {ai_service.url}")
-        res = await ai_service.generate(prompt=prompt, mode=mode, sources=sources)
+        res = await ai_service.generate(prompt=model_prompt, mode=mode, sources=sources)
         logger.info("Groq API connection successful (generate)")
         
         # Check if AI service returned an error
@@ -262,37 +332,27 @@ async def generate(payload: dict, response: fastapi.Response, user=Depends(fireb
             detail={"ok": False, "error": "Internal server error", "message": "Failed to generate AI response"}
         )
     
-    # persist conversation metadata; support appending to existing conversation
+    # persist the whole turn (conversation upsert + both messages) in one transaction
     conv_id = payload.get("conv_id")
     try:
-        with Session(engine) as session:
-            if conv_id:
-                conv = session.get(Conversation, conv_id)
-                if not conv or conv.user_id != user["uid"]:
-                    raise HTTPException(status_code=404, detail="conversation not found")
-            else:
-                conv = Conversation(user_id=user["uid"], title=(prompt[:120]))
-                session.add(conv)
-                session.commit()
-                session.refresh(conv)
-            # persist user message
-            user_msg = Message(conversation_id=conv.id, role="user", content=prompt)
-            session.add(user_msg)
-            session.commit()
-            # persist assistant message
-            assistant_msg = Message(conversation_id=conv.id, role="assistant", content=str(res.get("output")))
-            session.add(assistant_msg)
-            session.commit()
+        conv_id = persist_turn(
+            user_id=user["uid"],
+            conv_id=conv_id,
+            user_content=prompt,
+            assistant_content=str(res.get("output")),
+            assistant_meta={"mode": mode, "sources": source_urls(sources)},
+        )
     except HTTPException:
         raise
     except Exception as e:
         logger.exception(f"Failed to persist conversation: {e}")
-    
+        conv_id = None
+
     out = res.copy() if isinstance(res, dict) else {"output": str(res)}
-    try:
-        out["conv_id"] = conv.id
-    except Exception:
-        pass
+    if conv_id:
+        out["conv_id"] = conv_id
+    if memories:
+        out["memory_ids"] = [mem_id for mem_id, _, _ in memories]
     return out
 
 
@@ -340,35 +400,61 @@ async def stream_generate(request: Request, user=Depends(firebase_auth_required)
 
     logger.debug(f"Starting Groq stream from {ai_url}/chat/completions")
 
+    conv_id = payload.get("conv_id")
+    if conv_id:
+        check_conversation(conv_id, user["uid"])
+
     async def event_generator():
+        accum = ""
+        saved = False
+
+        def persist(content, error=None):
+            # user + assistant message (and new conversation) in a single transaction
+            nonlocal saved
+            if saved:
+                return None
+            saved = True
+            user_meta = None
+            meta = {"mode": mode, "sources": source_urls(sources), "streamed": True}
+            if error:
+                # a failed stream keeps the prompt and any partial answer
+                meta["error"] = error
+                if not content:
+                    user_meta, content = {"error": error}, None
+            try:
+                return persist_turn(
+                    user_id=user["uid"],
+                    conv_id=conv_id,
+                    user_content=prompt,
+                    assistant_content=content,
+                    user_meta=user_meta,
+                    assistant_meta=meta,
+                )
+            except Exception:
+                logger.exception("failed to persist streamed conversation")
+                return None
+
+        def failed(code, e):
+            saved_id = persist(accum, error=code)
+            payload = {"error": code, "message": str(e)}
+            if saved_id and not conv_id:
+                payload["conv_id"] = saved_id
+            return f"data: {json.dumps(payload)}\n\n"
+
         try:
-            # create or fetch conversation and persist the user's message immediately
-            with Session(engine) as session:
-                conv_id = payload.get("conv_id")
-                if conv_id:
-                    conv = session.get(Conversation, conv_id)
-                    if not conv or conv.user_id != user["uid"]:
-                        raise HTTPException(status_code=404, detail="conversation not found")
-                else:
-                    conv = Conversation(user_id=user["uid"], title=(prompt[:120]))
-                    session.add(conv)
-                    session.commit()
-                    session.refresh(conv)
-                user_msg = Message(conversation_id=conv.id, role="user", content=prompt)
-                session.add(user_msg)
-                session.commit()
-
-            # inform client of conv id
-            yield f"data: {json.dumps({'conv_id': conv.id})}\n\n"
+            # inform client of conv id up front when appending to an existing conversation
+            if conv_id:
+                yield f"data: {json.dumps({'conv_id': conv_id})}\n\n"
 
             async with httpx.AsyncClient(timeout=None) as client:
                 url = f"{ai_url}/chat/completions"
                 async with client.stream("POST", url, json=body, headers=headers) as resp:
                     resp.raise_for_status()
                     logger.info("Groq stream connection successful")
-                    accum = ""
                     async for line in resp.aiter_lines():
                         if await request.is_disconnected():
+                            # keep what the user saw so far
+                            persist(accum)
                             return
                         if not line or not line.startswith("data: "):
                             continue
@@ -383,29 +469,31 @@ async def stream_generate(request: Request, user=Depends(firebase_auth_required)
                                 yield f"data: {json.dumps({'delta': delta})}\n\n"
                         except Exception:
                             continue
-                    # after stream completes, persist assistant final message
-                    try:
-                        with Session(engine) as session:
-                            msg = Message(conversation_id=conv.id, role="assistant", content=accum)
-                            session.add(msg)
-                            session.commit()
-                    except Exception:
-                        logger.exception("failed to persist streamed conversation")
+                    # after stream completes, persist the whole turn
+                    saved_id = persist(accum)
+                    if saved_id and not conv_id:
+                        yield f"data: {json.dumps({'conv_id': saved_id})}\n\n"
         except httpx.HTTPError as e:
-            err = json.dumps({"error": "model_error", "message": str(e)})
-            yield f"data: {err}\n\n"
+            yield failed("model_error", e)
         except Exception as e:
-            err = json.dumps({"error": "server_error", "message": str(e)})
-            yield f"data: {err}\n\n"
+            yield failed("server_error", e)
         yield f"data: {json.dumps({'done': True})}\n\n"
 
     return fastapi.responses.StreamingResponse(event_generator(), media_type="text/event-stream")
 
 
 @app.get("/conversations")
-def list_conversations(user=Depends(firebase_auth_required)):
+def list_conversations(limit: Optional[int] = None, user=Depends(firebase_auth_required)):
+    # sidebar listing: counters and preview live on the row, most recent first (ix_conversation_user_recent)
     with Session(engine) as session:
-        convs = session.exec(select(Conversation).where(Conversation.user_id == user["uid"]))
+        q = (
+            select(Conversation)
+            .where(Conversation.user_id == user["uid"])
+            .order_by(Conversation.last_message_at.desc(), Conversation.id.desc())
+        )
+        if limit:
+            q = q.limit(min(max(limit, 1), 500))
+        convs = session.exec(q)
         return {"conversations": [c.dict() for c in convs.all()]}
 
 
@@ -421,19 +509,58 @@ def create_memory(body: dict, user=Depends(firebase_auth_required)):
     with Session(engine) as session:
         mem = Memory(user_id=user["uid"], conversation_id=conv_id, content=content, long_term=long_term, tags=",".join(tags) if tags else None)
         session.add(mem)
+        session.flush()
+        if tags:
+            tag_index.set_tags(session, user["uid"], tag_index.MEMORY, mem.id, tags)
         session.commit()
         session.refresh(mem)
+    memory_index.on_upsert(user["uid"], mem.id, mem.content, mem.visible)
     return {"memory": mem.dict()}
 
 
 @app.get("/memories")
 def list_memories(long_term: bool = False, user=Depends(firebase_auth_required)):
     with Session(engine) as session:
-        q = select(Memory).where(Memory.user_id == user["uid"]).where(Memory.long_term == long_term)
+        q = (
+            select(Memory)
+            .where(Memory.user_id == user["uid"])
+            .where(Memory.archived == False)
+            .where(Memory.long_term == long_term)
+        )
         res = session.exec(q).all()
         return {"memories": [r.dict() for r in res]}
 
 
+@app.post("/memories/consolidate")
+async def consolidate_memories(user=Depends(firebase_auth_required)):
+    # on-demand pass for the caller; the scheduled pass covers everyone else.
+    # Both share the job's dedupe key, so one user's passes never overlap.
+    job_id = await asyncio.to_thread(
+        jobs.submit, "memory.consolidate_user", user["uid"], user_id=user["uid"], dedupe_key=f"consolidate:{user['uid']}"
+    )
+    record = await jobs.runner.wait(job_id, CONSOLIDATE_WAIT_SECONDS)
+    if record is not None and record.status == "succeeded":
+        return {"report": json.loads(record.result or "{}"), "job_id": job_id}
+    return fastapi.responses.JSONResponse(
+        status_code=202, content={"ok": True, "job_id": job_id, "status": record.status if record else "queued"}
+    )
+
+
+@app.get("/memories/search")
+def search_memories(q: str, k: int = 5, user=Depends(firebase_auth_required)):
+    if not q or not q.strip():
+        raise HTTPException(status_code=400, detail="q required")
+    hits = memory_index.search(user["uid"], q, k=min(max(k, 1), 50))
+    if not hits:
+        return {"memories": []}
+    scores = {mem_id: score for mem_id, score, _ in hits}
+    with Session(engine) as session:
+        rows = session.exec(select(Memory).where(Memory.id.in_(list(scores)))).all()
+    out = [dict(r.dict(), score=round(scores[r.id], 4)) for r in rows if r.user_id == user["uid"]]
+    out.sort(key=lambda m: m["score"], reverse=True)
+    return {"memories": out}
+
+
 @app.get("/memories/{mem_id}")
 def get_memory(mem_id: int, user=Depends(firebase_auth_required)):
     with Session(engine) as session:
@@ -443,6 +570,17 @@ def get_memory(mem_id: int, user=Depends(firebase_auth_required)):
         return {"memory": mem.dict()}
 
 
+@app.get("/memories/{mem_id}/sources")
+def get_memory_sources(mem_id: int, user=Depends(firebase_auth_required)):
+    # provenance of a consolidated memory: the archived originals it replaced
+    with Session(engine) as session:
+        mem = session.get(Memory, mem_id)
+        if not mem or mem.user_id != user["uid"]:
+            raise HTTPException(status_code=404, detail="not found")
+        res = session.exec(select(Memory).where(Memory.consolidated_into == mem_id)).all()
+        return {"sources": [r.dict() for r in res]}
+
+
 @app.put("/memories/{mem_id}")
 def update_memory(mem_id: int, body: dict, user=Depends(firebase_auth_required)):
     # validate body
@@ -463,9 +601,11 @@ def update_memory(mem_id: int, body: dict, user=Depends(firebase_auth_required))
         if "tags" in body:
             tags = body.get("tags")
             mem.tags = ",".join(tags) if isinstance(tags, list) else tags
+            tag_index.set_tags(session, user["uid"], tag_index.MEMORY, mem.id, tags)
         mem.updated_at = __import__("datetime").datetime.utcnow()
         session.add(mem)
         session.commit()
+        memory_index.on_upsert(user["uid"], mem.id, mem.content, mem.visible)
         return {"memory": mem.dict()}
 
 
@@ -476,11 +616,13 @@ def delete_memory(mem_id: int, user=Depends(firebase_auth_required)):
         if not mem or mem.user_id != user["uid"]:
             raise HTTPException(status_code=404, detail="not found")
         session.delete(mem)
+        tag_index.clear_tags(session, tag_index.MEMORY, [mem_id])
         # audit
         audit = AuditLog(user_id=user["uid"], action="forget_memory", target_type="memory", target_id=mem_id, detail=None)
         session.add(audit)
         session.commit()
-        return {"ok": True}
+    memory_index.on_delete(user["uid"], mem_id)
+    return {"ok": True}
 
 
 # Projects
@@ -531,6 +673,13 @@ def create_chain(body: dict, user=Depends(firebase_auth_required)):
     if not name:
         raise HTTPException(status_code=400, detail="name required")
     definition = body.get("definition")
+    if isinstance(definition, (dict, list)):
+        definition = json.dumps(definition)
+    if definition is not None:
+        try:
+            parse_definition(definition)
+        except ChainDefinitionError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     with Session(engine) as session:
         c = PromptChain(user_id=user["uid"], name=name, definition=definition)
         session.add(c)
@@ -548,12 +697,55 @@ def list_chains(user=Depends(firebase_auth_required)):
 
 @app.post("/chains/{chain_id}/run")
 async def run_chain(chain_id: int, body: dict = {}, user=Depends(firebase_auth_required)):
-    # Minimal runner stub: returns queued response; full runner implementation is out of scope for Phase 1
-    with Session(engine) as session:
-        chain = session.get(PromptChain, chain_id)
-        if not chain or chain.user_id != user["uid"]:
-            raise HTTPException(status_code=404, detail="not found")
-    return {"status": "queued", "chain_id": chain_id}
+    """Run a chain's step DAG; streams step events as SSE unless body.stream is false."""
+    def load_chain():
+        with Session(engine) as session:
+            return session.get(PromptChain, chain_id)
+
+    chain = await asyncio.to_thread(load_chain)
+    if not chain or chain.user_id != user["uid"]:
+        raise HTTPException(status_code=404, detail="not found")
+    try:
+        dag = parse_definition(chain.definition)
+    except ChainDefinitionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    input_data = body.get("input") or {}
+    use_cache = body.get("cache", True)
+
+    if body.get("stream", True) is False:
+        try:
+            result = await chain_engine.run(dag, input_data, user["uid"], use_cache=use_cache)
+        except StepError as e:
+            raise HTTPException(status_code=502, detail={"ok": False, "error": "chain_failed", "message": str(e)})
+        return {"status": "completed", "chain_id": chain_id, **result}
+
+    async def event_generator():
+        events: asyncio.Queue = asyncio.Queue()
+
+        async def run():
+            try:
+                result = await chain_engine.run(dag, input_data, user["uid"], emit=lambda e, d: events.put_nowait((e, d)), use_cache=use_cache)
+                events.put_nowait(("done", {"status": "completed", "chain_id": chain_id, **result}))
+            except StepError as e:
+                events.put_nowait(("error", {"status": "failed", "chain_id": chain_id, "error": str(e)}))
+            except Exception:
+                logger.exception("chain %s failed", chain_id)
+                events.put_nowait(("error", {"status": "failed", "chain_id": chain_id, "error": "internal error"}))
+
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                event, data = await events.get()
+                yield f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+                if event in ("done", "error"):
+                    return
+        finally:
+            # client went away: stop the remaining steps
+            task.cancel()
+
+    return fastapi.responses.StreamingResponse(
+        event_generator(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @app.get("/conversations/{conv_id}")
@@ -568,10 +760,6 @@ def get_conversation(conv_id: int, user=Depends(firebase_auth_required)):
 
 app.include_router(export_router)
 
-# simple retry/dedupe cache
-_REQ_CACHE = {}
-_REQ_TTL = int(os.getenv("REQ_CACHE_TTL", "30"))
-
 
 @app.post("/conversations/{conv_id}/pin")
 def pin_conversation(conv_id: int, body: dict, user=Depends(firebase_auth_required)):
@@ -598,6 +786,7 @@ def set_tags(conv_id: int, body: dict, user=Depends(firebase_auth_required)):
             raise HTTPException(status_code=404, detail="Not found")
         conv.tags = ",".join(tags)
         session.add(conv)
+        tag_index.set_tags(session, user["uid"], tag_index.CONVERSATION, conv_id, tags)
         session.commit()
         return {"ok": True, "tags": tags}
 
@@ -609,20 +798,10 @@ async def ai_retry(body: dict, response: fastapi.Response, user=Depends(firebase
     if not conv_id or not message_id:
         raise HTTPException(status_code=400, detail="conv_id and message_id required")
     with Session(engine) as session:
+        get_owned_conversation(session, conv_id, user["uid"])
         msg = session.get(Message, message_id)
         if not msg or msg.conversation_id != conv_id:
             raise HTTPException(status_code=404, detail="message not found")
-    # dedupe using hash of content
-    import hashlib, time
-
-    key = hashlib.sha256(msg.content.encode()).hexdigest()
-    now = int(time.time())
-    cached = _REQ_CACHE.get(key)
-    if cached and now - cached < _REQ_TTL:
-        # inform client via header and HTTP 409
-        response.headers["X-RateLimit-Reason"] = "duplicate_retry"
-        raise HTTPException(status_code=409, detail="Duplicate retry too soon")
-    _REQ_CACHE[key] = now
     # call AI core
     try:
         res = await ai_service.generate(prompt=msg.content, mode="chat")
@@ -631,10 +810,14 @@ async def ai_retry(body: dict, response: fastapi.Response, user=Depends(firebase
         raise HTTPException(status_code=502, detail="AI service error")
     # persist
     try:
-        with Session(engine) as session:
-            new_msg = Message(conversation_id=conv_id, role="assistant", content=str(res.get("output")))
-            session.add(new_msg)
-            session.commit()
+        persist_turn(
+            user_id=user["uid"],
+            conv_id=conv_id,
+            assistant_content=str(res.get("output")),
+            assistant_meta={"mode": "chat", "retry_of": message_id},
+        )
+    except HTTPException:
+        raise
     except Exception:
         logger.exception("failed to persist retry message")
     return {"result": res}
@@ -646,17 +829,13 @@ async def generate_title(conv_id: int, user=Depends(firebase_auth_required)):
         conv = session.get(Conversation, conv_id)
         if not conv or conv.user_id != user["uid"]:
             raise HTTPException(status_code=404, detail="Not found")
-        msgs = session.exec(select(Message).where(Message.conversation_id == conv_id)).all()
-        aggregated = "\n".join([m.content for m in msgs][:10])
-    prompt = f"Generate a short (under 8 words) meaningful title for this conversation:\n{aggregated}"
-    res = await ai_service.generate(prompt=prompt, mode="study")
-    title = None
-    if isinstance(res.get("output"), str):
-        title = res.get("output").strip().split('\n')[0][:120]
-    if title:
-        with Session(engine) as session:
-            conv = session.get(Conversation, conv_id)
-            conv.title = title
-            session.add(conv)
-            session.commit()
-    return {"title": title}
+    job_id = await asyncio.to_thread(
+        jobs.submit, "conversations.generate_title", conv_id, user_id=user["uid"], dedupe_key=f"title:{conv_id}"
+    )
+    # answer inline when the job is quick; otherwise the client polls /jobs/{id}
+    record = await jobs.runner.wait(job_id, TITLE_WAIT_SECONDS)
+    if record is not None and record.status == "succeeded":
+        return {"title": json.loads(record.result or "{}").get("title"), "job_id": job_id}
+    return fastapi.responses.JSONResponse(
+        status_code=202, content={"ok": True, "job_id": job_id, "status": record.status if record else "queued"}
+    )
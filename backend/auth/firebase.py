@@ -1,8 +1,12 @@
 import os
 from typing import Optional, Dict, Any
-from fastapi import HTTPException, Request
+from fastapi import Depends, HTTPException, Request
 import jwt
 
+from ..utils.cache import LRUCache
+from .firebase_keys import FirebaseKeysUnavailable, firebase_keys, firebase_project_id, verify_id_token
+from .principal import Principal, principals, token_hash
+
 try:
     import firebase_admin
     from firebase_admin import auth as firebase_auth, credentials
@@ -13,9 +17,8 @@ except Exception:  # pragma: no cover - external dependency may be missing in te
 
 # Initialize firebase admin lazily
 _initialized = False
-# simple in-memory cache for verified tokens: token -> (decoded, ts)
-_TOKEN_CACHE: Dict[str, Dict[str, Any]] = {}
-_TOKEN_TTL = int(os.getenv("FIREBASE_TOKEN_CACHE_TTL", "60"))
+# verified tokens keyed by sha256(token); each entry expires at the token's exp
+_TOKEN_CACHE = LRUCache(maxsize=int(os.getenv("FIREBASE_TOKEN_CACHE_SIZE", "10000")))
 
 # JWT settings for simple auth
 SECRET_KEY = os.getenv("JWT_SECRET_KEY", "dev-secret-key-change-in-production")
@@ -44,58 +47,87 @@ def init_firebase():
         _initialized = False
 
 
+def _unavailable() -> HTTPException:
+    return HTTPException(
+        status_code=500,
+        detail={"ok": False, "error": "Authentication service not available", "message": "Firebase authentication is not configured"}
+    )
+
+
 def verify_firebase_token(id_token: str) -> Dict[str, Any]:
-    """Verify ID token using firebase-admin with a short in-memory cache.
+    """Verify a Firebase ID token, caching the result until the token's exp.
 
+    Tokens are checked locally against Google's published signing keys when
+    the Firebase project id is known, otherwise through firebase-admin.
     Raises HTTPException(401) on failure without leaking internals.
     """
-    init_firebase()
-    if firebase_auth is None:
-        raise HTTPException(
-            status_code=500,
-            detail={"ok": False, "error": "Authentication service not available", "message": "Firebase authentication is not configured"}
-        )
-
-    # cache lookup
-    import time
+    cache_key = token_hash(id_token)
+    decoded = _TOKEN_CACHE.get(cache_key)
+    if decoded is not None:
+        return decoded
 
-    entry = _TOKEN_CACHE.get(id_token)
-    now = int(time.time())
-    if entry and now - entry.get("ts", 0) < _TOKEN_TTL:
-        return entry.get("decoded")
+    project_id = firebase_project_id()
+    if not project_id:
+        init_firebase()
+        if firebase_auth is None:
+            raise _unavailable()
 
     try:
-        decoded = firebase_auth.verify_id_token(id_token)
+        if project_id:
+            decoded = verify_id_token(id_token, project_id, firebase_keys)
+        else:
+            decoded = firebase_auth.verify_id_token(id_token)
+    except FirebaseKeysUnavailable:
+        raise _unavailable()
     except Exception:
         raise HTTPException(
             status_code=401,
             detail={"ok": False, "error": "Invalid or expired authentication token", "message": "Your session has expired. Please log in again."}
         )
 
-    # cache decoded token
-    try:
-        _TOKEN_CACHE[id_token] = {"decoded": decoded, "ts": now}
-    except Exception:
-        pass
+    exp = decoded.get("exp")
+    if exp:
+        _TOKEN_CACHE.set(cache_key, decoded, expires_at=float(exp))
     return decoded
 
 
-def firebase_auth_required(request: Request):
-    """Unified auth dependency that supports both Firebase and JWT tokens"""
+def authenticate(token: str) -> Principal:
+    """Resolve a bearer token to its (cached) Principal; raises HTTPException(401)."""
+    cache_key = token_hash(token)
+    principal = principals.get(cache_key)
+    if principal is not None:
+        return principal
+
+    # First try JWT (simple auth)
+    try:
+        decoded = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.InvalidTokenError:
+        # Try Firebase token
+        decoded = verify_firebase_token(token)
+    return principals.remember(cache_key, decoded)
+
+
+def firebase_auth_required(request: Request) -> Principal:
+    """Unified auth dependency that supports both Firebase and JWT tokens.
+
+    Returns the cached Principal for the token; it reads like the decoded
+    claims and carries the caller's account snapshot. A principal already
+    resolved by the middlewares for this request is reused.
+    """
     auth = request.headers.get("Authorization")
     if not auth or not auth.startswith("Bearer "):
         raise HTTPException(
             status_code=401,
             detail={"ok": False, "error": "Authorization header missing or invalid", "message": "Please provide a valid Bearer token"}
         )
-    token = auth.split(" ", 1)[1]
-    
-    # First try JWT (simple auth)
-    try:
-        decoded = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return decoded
-    except jwt.InvalidTokenError:
-        pass  # Try Firebase next
-    
-    # Try Firebase token
-    return verify_firebase_token(token)
+    principal = getattr(request.state, "principal", None)
+    if principal is not None:
+        return principal
+    return authenticate(auth.split(" ", 1)[1])
+
+
+def admin_required(user: Principal = Depends(firebase_auth_required)) -> Principal:
+    """``firebase_auth_required`` for callers whose Account has the admin role; 403 otherwise."""
+    if user.role != "admin":
+        raise HTTPException(status_code=403, detail="Admin role required")
+    return user
@@ -0,0 +1,186 @@
+"""Local verification of Firebase ID tokens.
+
+Firebase signs ID tokens with rotating RS256 keys that Google publishes as
+x509 certificates. FirebaseKeyStore fetches them once, keeps them for the
+Cache-Control max-age Google sends with them, and a background task
+refetches them FIREBASE_KEYS_REFRESH_MARGIN seconds before they expire, so
+verifying a token is a local signature check instead of a network call.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import httpx
+import jwt
+from cryptography.x509 import load_pem_x509_certificate
+
+logger = logging.getLogger("backend.auth.firebase_keys")
+
+FIREBASE_CERTS_URL = os.getenv(
+    "FIREBASE_CERTS_URL",
+    "https://www.googleapis.com/robot/v1/metadata/x509/securetoken@system.gserviceaccount.com",
+)
+FIREBASE_ISSUER_PREFIX = "https://securetoken.google.com/"
+# used when the response carries no usable max-age
+FIREBASE_KEYS_DEFAULT_TTL = float(os.getenv("FIREBASE_KEYS_DEFAULT_TTL", "3600"))
+FIREBASE_KEYS_REFRESH_MARGIN = float(os.getenv("FIREBASE_KEYS_REFRESH_MARGIN", "300"))
+# floor between refetches, both for the background loop and for unknown key ids
+FIREBASE_KEYS_MIN_INTERVAL = float(os.getenv("FIREBASE_KEYS_MIN_INTERVAL", "60"))
+FIREBASE_KEYS_RETRY = float(os.getenv("FIREBASE_KEYS_RETRY", "30"))
+FIREBASE_KEYS_TIMEOUT = float(os.getenv("FIREBASE_KEYS_TIMEOUT", "5"))
+FIREBASE_TOKEN_LEEWAY = float(os.getenv("FIREBASE_TOKEN_LEEWAY", "10"))
+
+_MAX_AGE = re.compile(r"max-age=(\d+)")
+
+# returns ({kid: pem certificate}, max-age seconds or None)
+Fetch = Callable[[], Tuple[Dict[str, str], Optional[float]]]
+
+
+class FirebaseKeysUnavailable(RuntimeError):
+    """The signing keys could not be fetched and none are cached."""
+
+
+def max_age(cache_control: Optional[str]) -> Optional[float]:
+    if not cache_control or "no-store" in cache_control or "no-cache" in cache_control:
+        return None
+    match = _MAX_AGE.search(cache_control)
+    return float(match.group(1)) if match else None
+
+
+def parse_certs(certs: Dict[str, str]) -> Dict[str, Any]:
+    return {kid: load_pem_x509_certificate(pem.encode()).public_key() for kid, pem in certs.items()}
+
+
+def fetch_certs(url: str = FIREBASE_CERTS_URL) -> Tuple[Dict[str, str], Optional[float]]:
+    resp = httpx.get(url, timeout=FIREBASE_KEYS_TIMEOUT)
+    resp.raise_for_status()
+    return resp.json(), max_age(resp.headers.get("cache-control"))
+
+
+def firebase_project_id() -> Optional[str]:
+    """FIREBASE_PROJECT_ID, else the project of the service account file, else GOOGLE_CLOUD_PROJECT."""
+    project_id = os.getenv("FIREBASE_PROJECT_ID")
+    if project_id:
+        return project_id
+    cred_path = os.getenv("FIREBASE_CREDENTIALS_JSON")
+    if cred_path:
+        try:
+            with open(cred_path) as f:
+                project_id = json.load(f).get("project_id")
+        except (OSError, ValueError):
+            project_id = None
+        if project_id:
+            return project_id
+    return os.getenv("GOOGLE_CLOUD_PROJECT") or None
+
+
+class FirebaseKeyStore:
+    def __init__(self, fetch: Optional[Fetch] = None, refresh_margin: float = FIREBASE_KEYS_REFRESH_MARGIN):
+        self._fetch = fetch or fetch_certs
+        self.refresh_margin = refresh_margin
+        self._keys: Dict[str, Any] = {}
+        self._expires_at = 0.0
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self.fetches = 0
+
+    def refresh(self) -> None:
+        """Fetch the current certificates and replace the cached keys."""
+        with self._lock:
+            self._refresh_locked()
+
+    def _refresh_locked(self) -> None:
+        self._fetched_at = time.time()
+        certs, ttl = self._fetch()
+        self.fetches += 1
+        self._keys = parse_certs(certs)
+        self._expires_at = self._fetched_at + (ttl if ttl is not None else FIREBASE_KEYS_DEFAULT_TTL)
+        logger.info("firebase keys refreshed: %d keys, expire in %.0fs", len(self._keys), self._expires_at - self._fetched_at)
+
+    def _ensure_fresh(self) -> None:
+        if time.time() < self._expires_at:
+            return
+        with self._lock:
+            # another thread may have refreshed it while we waited
+            if time.time() < self._expires_at:
+                return
+            try:
+                self._refresh_locked()
+            except Exception as e:
+                if not self._keys:
+                    raise FirebaseKeysUnavailable(str(e)) from e
+                # keep serving the expired keys rather than failing every login
+                logger.warning("firebase keys refresh failed, using stale keys: %s", e)
+
+    def get_key(self, kid: Optional[str]) -> Any:
+        """Public key for ``kid``; None if Firebase does not publish it."""
+        self._ensure_fresh()
+        key = self._keys.get(kid) if kid else None
+        if key is None and kid and time.time() - self._fetched_at >= FIREBASE_KEYS_MIN_INTERVAL:
+            # keys rotated before our copy expired
+            with self._lock:
+                if kid not in self._keys and time.time() - self._fetched_at >= FIREBASE_KEYS_MIN_INTERVAL:
+                    try:
+                        self._refresh_locked()
+                    except Exception as e:
+                        logger.warning("firebase keys refresh for unknown kid failed: %s", e)
+                key = self._keys.get(kid)
+        return key
+
+    def refresh_in(self) -> float:
+        """Seconds until the background task should refetch."""
+        return max(self._expires_at - time.time() - self.refresh_margin, FIREBASE_KEYS_MIN_INTERVAL)
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.refresh)
+                delay = self.refresh_in()
+            except Exception as e:
+                logger.warning("firebase keys refresh failed: %s", e)
+                delay = FIREBASE_KEYS_RETRY
+            await asyncio.sleep(delay)
+
+    def start(self) -> asyncio.Task:
+        return asyncio.create_task(self._loop())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "keys": len(self._keys),
+            "fetches": self.fetches,
+            "expires_in": round(self._expires_at - time.time(), 1) if self._expires_at else None,
+        }
+
+
+def verify_id_token(id_token: str, project_id: str, keys: FirebaseKeyStore) -> Dict[str, Any]:
+    """Check signature and claims of a Firebase ID token; raises jwt.InvalidTokenError."""
+    header = jwt.get_unverified_header(id_token)
+    if header.get("alg") != "RS256":
+        raise jwt.InvalidAlgorithmError("Firebase ID tokens are signed with RS256")
+    key = keys.get_key(header.get("kid"))
+    if key is None:
+        raise jwt.InvalidTokenError("unknown signing key")
+    claims = jwt.decode(
+        id_token,
+        key,
+        algorithms=["RS256"],
+        audience=project_id,
+        issuer=FIREBASE_ISSUER_PREFIX + project_id,
+        leeway=FIREBASE_TOKEN_LEEWAY,
+        options={"require": ["exp", "iat", "sub"]},
+    )
+    sub = claims["sub"]
+    if not isinstance(sub, str) or not sub or len(sub) > 128:
+        raise jwt.InvalidTokenError("invalid subject")
+    if claims.get("auth_time", 0) > time.time() + FIREBASE_TOKEN_LEEWAY:
+        raise jwt.ImmatureSignatureError("auth_time is in the future")
+    claims["uid"] = sub
+    return claims
+
+
+firebase_keys = FirebaseKeyStore()
@@ -0,0 +1,126 @@
+"""The authenticated caller, resolved once and cached.
+
+``firebase_auth_required`` returns a Principal: the verified token claims
+plus the caller's Account snapshot (role, credits, org). Principals are
+cached by sha256(token) until the token's exp or AUTH_PRINCIPAL_TTL,
+whichever comes first; account snapshots are cached by user id for
+AUTH_ACCOUNT_TTL and must be dropped with ``invalidate_account`` whenever
+an Account row changes. A Principal still reads like the claims dict
+(``user["uid"]``, ``user.get("email")``) so existing routes keep working.
+"""
+import hashlib
+import os
+import time
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Optional
+
+from sqlmodel import Session, select
+
+from ..models import Account, engine
+from ..utils.cache import LRUCache
+
+AUTH_PRINCIPAL_TTL = float(os.getenv("AUTH_PRINCIPAL_TTL", "300"))
+AUTH_ACCOUNT_TTL = float(os.getenv("AUTH_ACCOUNT_TTL", "30"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+
+# cached marker for "no Account row for this user"
+_NO_ACCOUNT: Dict[str, Any] = {}
+
+
+def token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class Principal(Mapping):
+    __slots__ = ("uid", "claims", "_cache")
+
+    def __init__(self, claims: Dict[str, Any], cache: "PrincipalCache"):
+        self.claims = claims
+        self.uid = claims.get("uid") or claims.get("sub")
+        self._cache = cache
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "uid":
+            return self.uid
+        return self.claims[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.claims)
+
+    def __len__(self) -> int:
+        return len(self.claims)
+
+    @property
+    def account(self) -> Optional[Dict[str, Any]]:
+        """Snapshot of the caller's Account, or None if they have none yet."""
+        return self._cache.account(self.uid)
+
+    def ensure_account(self) -> Dict[str, Any]:
+        """Snapshot of the caller's Account, creating a member account on first use."""
+        return self._cache.account(self.uid, create_with={"credits": 0.0, "role": "member"})
+
+    @property
+    def role(self) -> Optional[str]:
+        account = self.account
+        return account["role"] if account else None
+
+    @property
+    def credits(self) -> float:
+        account = self.account
+        return account["credits"] if account else 0.0
+
+    @property
+    def org_id(self) -> Optional[int]:
+        account = self.account
+        return account["org_id"] if account else None
+
+
+class PrincipalCache:
+    def __init__(self, maxsize: int = AUTH_CACHE_SIZE, principal_ttl: float = AUTH_PRINCIPAL_TTL, account_ttl: float = AUTH_ACCOUNT_TTL):
+        self.principal_ttl = principal_ttl
+        self._principals = LRUCache(maxsize=maxsize)
+        self._accounts = LRUCache(maxsize=maxsize, ttl=account_ttl)
+
+    def get(self, token_key: str) -> Optional[Principal]:
+        return self._principals.get(token_key)
+
+    def remember(self, token_key: str, claims: Dict[str, Any]) -> Principal:
+        principal = Principal(claims, self)
+        expires_at = time.time() + self.principal_ttl
+        exp = claims.get("exp")
+        if exp:
+            expires_at = min(expires_at, float(exp))
+        self._principals.set(token_key, principal, expires_at=expires_at)
+        return principal
+
+    def account(self, user_id: str, create_with: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """Account snapshot for ``user_id``; creates one from ``create_with`` if missing."""
+        snapshot = self._accounts.get(user_id)
+        if snapshot is None or (snapshot is _NO_ACCOUNT and create_with is not None):
+            snapshot = self._load(user_id, create_with)
+            self._accounts.set(user_id, snapshot)
+        return dict(snapshot) if snapshot is not _NO_ACCOUNT else None
+
+    @staticmethod
+    def _load(user_id: str, create_with: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        with Session(engine) as session:
+            acct = session.exec(select(Account).where(Account.user_id == user_id).limit(1)).first()
+            if acct is None and create_with is not None:
+                acct = Account(user_id=user_id, **create_with)
+                session.add(acct)
+                session.commit()
+                session.refresh(acct)
+            return acct.dict() if acct is not None else _NO_ACCOUNT
+
+    def invalidate_account(self, user_id: str) -> None:
+        self._accounts.pop(user_id)
+
+    def clear(self) -> None:
+        self._principals.clear()
+        self._accounts.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"principals": self._principals.stats(), "accounts": self._accounts.stats()}
+
+
+principals = PrincipalCache()
@@ -0,0 +1,320 @@
+"""Prompt chains as a DAG of steps.
+
+``PromptChain.definition`` is JSON::
+
+    {"steps": [
+        {"id": "facts", "type": "search", "query": "{input.topic}"},
+        {"id": "angle", "type": "model", "prompt": "One surprising angle on {input.topic}"},
+        {"id": "draft", "type": "model", "inputs": ["facts", "angle"],
+         "prompt": "Write about {input.topic} from {steps.angle} using {steps.facts}"},
+        {"id": "title", "type": "transform", "op": "template", "inputs": ["draft"],
+         "template": "# {input.topic}\\n\\n{steps.draft}"}
+     ],
+     "output": "title"}
+
+Step types are ``model`` (prompt, mode), ``search`` (query), ``tool``
+(tool_id, input) and ``transform`` (op: template, pick, join or json). A
+step may only reference ``{steps.<id>}`` of steps it lists in ``inputs``. A
+definition that is not JSON is treated as a single model prompt.
+
+Every step starts as soon as its inputs are done, at most
+CHAIN_MAX_PARALLEL_STEPS at a time, so wall time follows the critical path
+rather than the sum of the steps. Each result is memoized under a hash of
+the step's rendered content (type, parameters with inputs filled in, and
+user), so a re-run skips steps whose content did not change; outputs that
+carry an ``error`` are not memoized. Progress is reported through an
+``emit`` callback as step_started / step_finished / step_failed events.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from ..agents.executor import StepError, render, run_tool
+from ..utils.cache import LRUCache
+
+CHAIN_MAX_PARALLEL_STEPS = int(os.getenv("CHAIN_MAX_PARALLEL_STEPS", "4"))
+CHAIN_MAX_STEPS = int(os.getenv("CHAIN_MAX_STEPS", "50"))
+CHAIN_STEP_TIMEOUT = float(os.getenv("CHAIN_STEP_TIMEOUT", "120"))
+CHAIN_CACHE_SIZE = int(os.getenv("CHAIN_CACHE_SIZE", "2048"))
+CHAIN_CACHE_TTL = float(os.getenv("CHAIN_CACHE_TTL", "3600"))
+
+STEP_TYPES = ("model", "search", "tool", "transform")
+TRANSFORM_OPS = ("template", "pick", "join", "json")
+# step outputs longer than this are truncated in events (not in the result)
+EVENT_OUTPUT_PREVIEW = 2000
+
+Emit = Callable[[str, Dict[str, Any]], Optional[Awaitable[None]]]
+
+
+class ChainDefinitionError(ValueError):
+    pass
+
+
+class ChainStep:
+    __slots__ = ("id", "type", "inputs", "params", "cache")
+
+    def __init__(self, raw: Dict[str, Any]):
+        self.id = str(raw["id"])
+        self.type = raw["type"]
+        self.inputs: List[str] = [str(i) for i in raw.get("inputs") or []]
+        self.cache = raw.get("cache", True)
+        self.params = {k: v for k, v in raw.items() if k not in ("id", "type", "inputs", "cache")}
+
+
+class ChainDAG:
+    def __init__(self, steps: List[ChainStep], output: str):
+        self.steps = {s.id: s for s in steps}
+        self.output = output
+        self.dependents: Dict[str, List[str]] = {s.id: [] for s in steps}
+        for step in steps:
+            for dep in step.inputs:
+                self.dependents[dep].append(step.id)
+
+
+def _referenced_steps(value: Any) -> set:
+    if isinstance(value, dict):
+        return set().union(*(_referenced_steps(v) for v in value.values())) if value else set()
+    if isinstance(value, list):
+        return set().union(*(_referenced_steps(v) for v in value)) if value else set()
+    if isinstance(value, str):
+        refs = set()
+        start = value.find("{steps.")
+        while start != -1:
+            end = value.find("}", start)
+            if end == -1:
+                break
+            refs.add(value[start + 7:end].split(".")[0])
+            start = value.find("{steps.", end)
+        return refs
+    return set()
+
+
+def parse_definition(definition: Optional[str]) -> ChainDAG:
+    """Parse and validate a chain definition; raises ChainDefinitionError."""
+    if not definition or not definition.strip():
+        raise ChainDefinitionError("chain has no definition")
+    try:
+        spec = json.loads(definition)
+    except ValueError:
+        # free-form text: one prompt over the run input
+        spec = {"steps": [{"id": "prompt", "type": "model", "prompt": definition}]}
+    if not isinstance(spec, dict) or not isinstance(spec.get("steps"), list) or not spec["steps"]:
+        raise ChainDefinitionError("definition must be an object with a non-empty steps list")
+    if len(spec["steps"]) > CHAIN_MAX_STEPS:
+        raise ChainDefinitionError(f"at most {CHAIN_MAX_STEPS} steps")
+
+    steps: List[ChainStep] = []
+    for raw in spec["steps"]:
+        if not isinstance(raw, dict) or not raw.get("id") or raw.get("type") not in STEP_TYPES:
+            raise ChainDefinitionError(f"each step needs an id and a type in {STEP_TYPES}")
+        step = ChainStep(raw)
+        if step.type == "transform" and step.params.get("op") not in TRANSFORM_OPS:
+            raise ChainDefinitionError(f"step {step.id}: op must be one of {TRANSFORM_OPS}")
+        if step.type == "tool" and not isinstance(step.params.get("tool_id"), int):
+            raise ChainDefinitionError(f"step {step.id}: tool_id required")
+        undeclared = _referenced_steps(step.params) - set(step.inputs)
+        if undeclared:
+            raise ChainDefinitionError(f"step {step.id} references undeclared inputs: {sorted(undeclared)}")
+        steps.append(step)
+
+    ids = [s.id for s in steps]
+    if len(set(ids)) != len(ids):
+        raise ChainDefinitionError("step ids must be unique")
+    for step in steps:
+        missing = [d for d in step.inputs if d not in ids]
+        if missing:
+            raise ChainDefinitionError(f"step {step.id} depends on unknown steps: {missing}")
+
+    # Kahn's algorithm: anything left over sits on a cycle
+    pending = {s.id: len(set(s.inputs)) for s in steps}
+    ready = [i for i, n in pending.items() if n == 0]
+    dag = ChainDAG(steps, spec.get("output") or ids[-1])
+    seen = 0
+    while ready:
+        current = ready.pop()
+        seen += 1
+        for dependent in set(dag.dependents[current]):
+            pending[dependent] -= 1
+            if pending[dependent] == 0:
+                ready.append(dependent)
+    if seen != len(steps):
+        raise ChainDefinitionError("steps form a cycle")
+    if dag.output not in dag.steps:
+        raise ChainDefinitionError(f"output step {dag.output!r} does not exist")
+    return dag
+
+
+def _transform(params: Dict[str, Any], ctx: Dict[str, Any]) -> Any:
+    op = params["op"]
+    if op == "template":
+        return render(params.get("template", ""), ctx)
+    if op == "pick":
+        value = render(params.get("from", ""), ctx)
+        for part in str(params.get("path", "")).split("."):
+            if part == "":
+                continue
+            if isinstance(value, dict):
+                value = value.get(part)
+            elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+                value = value[int(part)]
+            else:
+                return None
+        return value
+    if op == "join":
+        values = render(params.get("values", []), ctx)
+        return str(params.get("separator", "\n")).join(v if isinstance(v, str) else json.dumps(v) for v in values)
+    value = render(params.get("from", ""), ctx)
+    try:
+        return json.loads(value) if isinstance(value, str) else value
+    except ValueError:
+        raise StepError("transform json: input is not valid JSON")
+
+
+def _preview(output: Any) -> Any:
+    if isinstance(output, str) and len(output) > EVENT_OUTPUT_PREVIEW:
+        return output[:EVENT_OUTPUT_PREVIEW]
+    return output
+
+
+class ChainEngine:
+    def __init__(self, model=None, search=None, max_parallel: int = CHAIN_MAX_PARALLEL_STEPS):
+        self._model = model
+        self._search = search
+        self.max_parallel = max_parallel
+        self._cache = LRUCache(maxsize=CHAIN_CACHE_SIZE, ttl=CHAIN_CACHE_TTL)
+
+    @property
+    def model(self):
+        if self._model is None:
+            from ..ai.service import ai_service
+
+            self._model = ai_service
+        return self._model
+
+    @model.setter
+    def model(self, value) -> None:
+        self._model = value
+
+    @property
+    def search(self):
+        if self._search is None:
+            from ..search.tavily import tavily_search
+
+            self._search = tavily_search
+        return self._search
+
+    @search.setter
+    def search(self, value) -> None:
+        self._search = value
+
+    @staticmethod
+    def step_key(step: ChainStep, rendered: Dict[str, Any], user_id: str) -> str:
+        content = json.dumps({"type": step.type, "params": rendered, "user": user_id}, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    async def _execute(self, step: ChainStep, rendered: Dict[str, Any], ctx: Dict[str, Any], user_id: str) -> Any:
+        if step.type == "model":
+            prompt = rendered.get("prompt", "")
+            result = await self.model.generate(prompt if isinstance(prompt, str) else json.dumps(prompt), mode=rendered.get("mode", "chain"))
+            if result.get("status") == "error" or result.get("error"):
+                raise StepError(result.get("output") or result.get("error") or "model call failed")
+            return result.get("output")
+        if step.type == "search":
+            return await self.search(str(rendered.get("query", "")))
+        if step.type == "tool":
+            return await run_tool(rendered["tool_id"], user_id, rendered.get("input", {}))
+        return _transform(step.params, ctx)
+
+    async def run(self, dag: ChainDAG, input_data: Dict[str, Any], user_id: str, emit: Optional[Emit] = None, use_cache: bool = True) -> Dict[str, Any]:
+        """Run every step as soon as its inputs are ready; returns the output and per-step timings."""
+        async def notify(event: str, data: Dict[str, Any]) -> None:
+            if emit is not None:
+                maybe = emit(event, data)
+                if asyncio.iscoroutine(maybe):
+                    await maybe
+
+        outputs: Dict[str, Any] = {}
+        timings: Dict[str, Dict[str, Any]] = {}
+        waiting = {sid: len(set(s.inputs)) for sid, s in dag.steps.items()}
+        slots = asyncio.Semaphore(self.max_parallel)
+        started = time.perf_counter()
+
+        async def run_step(step: ChainStep) -> Any:
+            async with slots:
+                ctx = {"input": input_data, "steps": {d: outputs[d] for d in step.inputs}}
+                rendered = render(step.params, ctx)
+                key = self.step_key(step, rendered, user_id)
+                t0 = time.perf_counter()
+                await notify("step_started", {"step": step.id, "type": step.type, "at_ms": round((t0 - started) * 1000, 1)})
+                cached = self._cache.get(key) if use_cache and step.cache else None
+                if cached is not None:
+                    output = cached[0]
+                else:
+                    output = await asyncio.wait_for(self._execute(step, rendered, ctx, user_id), CHAIN_STEP_TIMEOUT)
+                    # a degraded result (e.g. a search that could not reach its
+                    # provider) is passed on but not memoized, so a re-run retries it
+                    if step.cache and not (isinstance(output, dict) and output.get("error")):
+                        self._cache.set(key, (output,))
+                elapsed = round((time.perf_counter() - t0) * 1000, 1)
+                timings[step.id] = {"ms": elapsed, "cached": cached is not None, "inputs": step.inputs}
+                await notify("step_finished", {"step": step.id, "ms": elapsed, "cached": cached is not None, "output": _preview(output)})
+                return output
+
+        tasks: Dict[asyncio.Task, str] = {}
+
+        def schedule(step_id: str) -> None:
+            tasks[asyncio.create_task(run_step(dag.steps[step_id]))] = step_id
+
+        for sid, count in waiting.items():
+            if count == 0:
+                schedule(sid)
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(list(tasks), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    sid = tasks.pop(task)
+                    try:
+                        outputs[sid] = task.result()
+                    except Exception as e:
+                        error = "timeout" if isinstance(e, asyncio.TimeoutError) else str(e) or type(e).__name__
+                        await notify("step_failed", {"step": sid, "error": error})
+                        raise StepError(f"step {sid} failed: {error}") from e
+                    for dependent in set(dag.dependents[sid]):
+                        waiting[dependent] -= 1
+                        if waiting[dependent] == 0:
+                            schedule(dependent)
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        return {
+            "output": outputs[dag.output],
+            "steps": timings,
+            "wall_ms": round((time.perf_counter() - started) * 1000, 1),
+            "sum_ms": round(sum(t["ms"] for t in timings.values()), 1),
+            "critical_path_ms": critical_path_ms(dag, timings),
+        }
+
+    def clear_cache(self) -> None:
+        self._cache.clear()
+
+
+def critical_path_ms(dag: ChainDAG, timings: Dict[str, Dict[str, Any]]) -> float:
+    """Longest chain of dependent step durations: the lower bound on wall time."""
+    finish: Dict[str, float] = {}
+
+    def longest(sid: str) -> float:
+        if sid not in finish:
+            step = dag.steps[sid]
+            finish[sid] = timings.get(sid, {}).get("ms", 0.0) + max((longest(d) for d in step.inputs), default=0.0)
+        return finish[sid]
+
+    return round(max((longest(sid) for sid in dag.steps), default=0.0), 1)
+
+
+chain_engine = ChainEngine()
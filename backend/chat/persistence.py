@@ -0,0 +1,154 @@
+"""Conversation persistence for chat turns.
+
+A chat turn (conversation upsert, user message, assistant message and their
+metadata) is written in a single transaction so SQLite pays for one commit
+per turn instead of one per row. Shared by /ai/generate, /ai/stream and
+/ai/retry.
+"""
+import json
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import func, update
+from sqlmodel import Session, select
+
+from ..models import engine, Conversation, Message
+
+logger = logging.getLogger("backend.chat.persistence")
+
+TITLE_MAX_LEN = 120
+PREVIEW_MAX_LEN = 200
+
+
+def make_preview(content: Optional[str]) -> Optional[str]:
+    """Single-line preview of a message for the sidebar."""
+    if content is None:
+        return None
+    return " ".join(content.split())[:PREVIEW_MAX_LEN]
+
+
+def get_owned_conversation(session: Session, conv_id: int, user_id: str) -> Conversation:
+    """Return the conversation if it belongs to ``user_id``, else raise 404."""
+    conv = session.get(Conversation, conv_id)
+    if not conv or conv.user_id != user_id:
+        raise HTTPException(status_code=404, detail="conversation not found")
+    return conv
+
+
+def check_conversation(conv_id: int, user_id: str) -> None:
+    """Read-only ownership check used before starting expensive model calls."""
+    with Session(engine) as session:
+        get_owned_conversation(session, conv_id, user_id)
+
+
+def _encode_meta(meta: Optional[Dict[str, Any]]) -> Optional[str]:
+    if not meta:
+        return None
+    try:
+        return json.dumps(meta, default=str)
+    except Exception:
+        logger.warning("message metadata not serializable; dropping it")
+        return None
+
+
+def persist_turn(
+    user_id: str,
+    conv_id: Optional[int] = None,
+    user_content: Optional[str] = None,
+    assistant_content: Optional[str] = None,
+    title: Optional[str] = None,
+    user_meta: Optional[Dict[str, Any]] = None,
+    assistant_meta: Optional[Dict[str, Any]] = None,
+) -> int:
+    """Persist one chat turn in one transaction and return the conversation id.
+
+    When ``conv_id`` is None a new conversation is created (titled from
+    ``title`` or the user message). Messages are written with a single bulk
+    insert; either side of the turn may be omitted (e.g. retries only add an
+    assistant message).
+    """
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        if conv_id:
+            conv = get_owned_conversation(session, conv_id, user_id)
+        else:
+            conv = Conversation(user_id=user_id, title=(title or user_content or "")[:TITLE_MAX_LEN], created_at=now, last_message_at=now)
+            session.add(conv)
+            # flush assigns the primary key without committing
+            session.flush()
+
+        rows = []
+        if user_content is not None:
+            rows.append({"conversation_id": conv.id, "role": "user", "content": user_content, "meta": _encode_meta(user_meta), "created_at": now})
+        if assistant_content is not None:
+            rows.append({"conversation_id": conv.id, "role": "assistant", "content": assistant_content, "meta": _encode_meta(assistant_meta), "created_at": now})
+        if rows:
+            session.bulk_insert_mappings(Message, rows)
+            # keep the denormalized sidebar summary in step, atomically
+            session.execute(
+                update(Conversation)
+                .where(Conversation.id == conv.id)
+                .values(
+                    message_count=Conversation.message_count + len(rows),
+                    last_message_at=now,
+                    last_message_preview=make_preview(rows[-1]["content"]),
+                )
+                .execution_options(synchronize_session=False)
+            )
+
+        conv_id = conv.id
+        session.commit()
+    return conv_id
+
+
+def source_urls(sources: Any) -> list:
+    """Compact list of source URLs for message metadata."""
+    if not isinstance(sources, dict):
+        return []
+    return [s.get("url") for s in sources.get("items", []) if isinstance(s, dict) and s.get("url")]
+
+
+def backfill_conversation_summaries(batch_size: int = 500) -> int:
+    """Recompute message_count / last_message_* for every conversation.
+
+    Used once after upgrading an existing database; returns the number of
+    conversations updated.
+    """
+    updated = 0
+    last_id = 0
+    with Session(engine) as session:
+        while True:
+            ids = session.exec(
+                select(Conversation.id).where(Conversation.id > last_id).order_by(Conversation.id).limit(batch_size)
+            ).all()
+            if not ids:
+                break
+            stats = session.exec(
+                select(Message.conversation_id, func.count(Message.id), func.max(Message.id))
+                .where(Message.conversation_id.in_(ids))
+                .group_by(Message.conversation_id)
+            ).all()
+            by_conv = {conv_id: (count, max_id) for conv_id, count, max_id in stats}
+            latest = {}
+            if by_conv:
+                for m in session.exec(select(Message).where(Message.id.in_([v[1] for v in by_conv.values()]))).all():
+                    latest[m.conversation_id] = m
+            for conv_id in ids:
+                count, _ = by_conv.get(conv_id, (0, None))
+                last = latest.get(conv_id)
+                session.execute(
+                    update(Conversation)
+                    .where(Conversation.id == conv_id)
+                    .values(
+                        message_count=count,
+                        last_message_at=last.created_at if last else Conversation.created_at,
+                        last_message_preview=make_preview(last.content) if last else None,
+                    )
+                    .execution_options(synchronize_session=False)
+                )
+            session.commit()
+            updated += len(ids)
+            last_id = ids[-1]
+    return updated
@@ -0,0 +1,167 @@
+"""Full-text search over conversation messages.
+
+SQLite uses an FTS5 table (``message_fts``, rowid = message.id) kept in sync by
+triggers on message/conversation, so every insert path (including bulk
+inserts) is indexed without application code. Each row carries an ``owner``
+token derived from the conversation's user so per-user filtering happens
+inside the FTS index instead of after the match. Postgres uses GIN
+``tsvector`` expression indexes with ``websearch_to_tsquery``.
+"""
+import logging
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import DateTime, bindparam, inspect, text
+
+from ..models import engine
+
+logger = logging.getLogger("backend.chat.search")
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+MAX_QUERY_TERMS = 16
+
+_SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS message_fts
+       USING fts5(content, title, owner, tokenize='porter unicode61')""",
+    """CREATE TRIGGER IF NOT EXISTS message_fts_ai AFTER INSERT ON message BEGIN
+         INSERT INTO message_fts(rowid, content, title, owner)
+         SELECT new.id, new.content, c.title, 'u' || hex(c.user_id)
+         FROM conversation c WHERE c.id = new.conversation_id;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS message_fts_ad AFTER DELETE ON message BEGIN
+         DELETE FROM message_fts WHERE rowid = old.id;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS message_fts_au AFTER UPDATE OF content ON message BEGIN
+         UPDATE message_fts SET content = new.content WHERE rowid = new.id;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS conversation_fts_au AFTER UPDATE OF title ON conversation BEGIN
+         UPDATE message_fts SET title = new.title
+         WHERE rowid IN (SELECT id FROM message WHERE conversation_id = new.id);
+       END""",
+]
+
+_SQLITE_BACKFILL = """
+    INSERT INTO message_fts(rowid, content, title, owner)
+    SELECT m.id, m.content, c.title, 'u' || hex(c.user_id)
+    FROM message m JOIN conversation c ON c.id = m.conversation_id
+"""
+
+_POSTGRES_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_message_content_tsv ON message USING gin (to_tsvector('english', content))",
+    "CREATE INDEX IF NOT EXISTS ix_conversation_title_tsv ON conversation USING gin (to_tsvector('english', coalesce(title, '')))",
+]
+
+
+def ensure_search_index(conn) -> None:
+    """Create the full-text index (and backfill it on first creation)."""
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        created = "message_fts" not in inspect(conn).get_table_names()
+        for ddl in _SQLITE_DDL:
+            conn.execute(text(ddl))
+        if created:
+            conn.execute(text(_SQLITE_BACKFILL))
+            logger.info("message_fts created and backfilled")
+    elif dialect == "postgresql":
+        for ddl in _POSTGRES_DDL:
+            conn.execute(text(ddl))
+    else:
+        logger.warning("full-text search not supported on %s", dialect)
+
+
+def owner_token(user_id: str) -> str:
+    return "u" + user_id.encode().hex().upper()
+
+
+def to_fts_query(q: str) -> Optional[str]:
+    """Turn free text into a safe FTS5 query: quoted terms, implicitly ANDed.
+
+    No prefix wildcards: the porter tokenizer already folds word forms and
+    prefix scans are several times slower on large indexes.
+    """
+    terms = _WORD_RE.findall(q or "")[:MAX_QUERY_TERMS]
+    if not terms:
+        return None
+    return " ".join(f'"{t}"' for t in terms)
+
+
+def search_messages(
+    user_id: str,
+    q: str,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    tag: Optional[str] = None,
+    conversation_id: Optional[int] = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> Dict[str, Any]:
+    """Ranked, highlighted, paginated message search scoped to ``user_id``."""
+    params: Dict[str, Any] = {"uid": user_id, "limit": limit + 1, "offset": offset}
+    filters: List[str] = []
+    if date_from:
+        filters.append("m.created_at >= :date_from")
+        params["date_from"] = date_from
+    if date_to:
+        filters.append("m.created_at <= :date_to")
+        params["date_to"] = date_to
+    if conversation_id:
+        filters.append("m.conversation_id = :conv_id")
+        params["conv_id"] = conversation_id
+    if tag:
+        filters.append(
+            "EXISTS (SELECT 1 FROM taglink tl JOIN tag t ON t.id = tl.tag_id"
+            " WHERE tl.target_type = 'conversation' AND tl.target_id = c.id"
+            " AND t.user_id = :uid AND t.tag = :tag)"
+        )
+        params["tag"] = tag.strip().lower()
+    extra = "".join(f" AND {f}" for f in filters)
+
+    if engine.dialect.name == "postgresql":
+        params["q"] = q
+        sql = f"""
+            SELECT m.id AS message_id, m.conversation_id, m.role, m.created_at,
+                   c.title AS conversation_title,
+                   ts_headline('english', m.content, query, 'StartSel=<mark>, StopSel=</mark>, MaxFragments=1') AS snippet,
+                   ts_rank(to_tsvector('english', m.content), query)
+                     + 2 * ts_rank(to_tsvector('english', coalesce(c.title, '')), query) AS score
+            FROM message m
+            JOIN conversation c ON c.id = m.conversation_id,
+                 websearch_to_tsquery('english', :q) query
+            WHERE c.user_id = :uid
+              AND (to_tsvector('english', m.content) @@ query
+                   OR to_tsvector('english', coalesce(c.title, '')) @@ query){extra}
+            ORDER BY score DESC, m.id DESC
+            LIMIT :limit OFFSET :offset
+        """
+    else:
+        match = to_fts_query(q)
+        if not match:
+            return {"results": [], "limit": limit, "offset": offset, "has_more": False}
+        params["match"] = f"owner:{owner_token(user_id)} AND {{content title}}: ({match})"
+        # bm25 is lower-is-better; title matches weigh double, owner not at all
+        sql = f"""
+            SELECT m.id AS message_id, m.conversation_id, m.role, m.created_at,
+                   highlight(message_fts, 1, '<mark>', '</mark>') AS conversation_title,
+                   snippet(message_fts, 0, '<mark>', '</mark>', '…', 16) AS snippet,
+                   -bm25(message_fts, 1.0, 2.0, 0.0) AS score
+            FROM message_fts
+            JOIN message m ON m.id = message_fts.rowid
+            JOIN conversation c ON c.id = m.conversation_id
+            WHERE message_fts MATCH :match AND c.user_id = :uid{extra}
+            ORDER BY bm25(message_fts, 1.0, 2.0, 0.0), m.id DESC
+            LIMIT :limit OFFSET :offset
+        """
+
+    stmt = text(sql)
+    for name in ("date_from", "date_to"):
+        if name in params:
+            stmt = stmt.bindparams(bindparam(name, type_=DateTime()))
+    with engine.connect() as conn:
+        rows = conn.execute(stmt, params).mappings().all()
+
+    results = [dict(r) for r in rows[:limit]]
+    for r in results:
+        if isinstance(r.get("created_at"), datetime):
+            r["created_at"] = r["created_at"].isoformat()
+    return {"results": results, "limit": limit, "offset": offset, "has_more": len(rows) > limit}
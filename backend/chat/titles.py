@@ -0,0 +1,48 @@
+"""Conversation title generation, run as a background job."""
+import asyncio
+from typing import Any, Dict, Optional
+
+from sqlmodel import Session, select
+
+from ..ai.service import ai_service
+from ..jobs import job
+from ..models import engine, Conversation, Message
+from .persistence import TITLE_MAX_LEN
+
+TITLE_CONTEXT_MESSAGES = 10
+
+
+def _conversation_text(conv_id: int) -> str:
+    with Session(engine) as session:
+        msgs = session.exec(
+            select(Message.content)
+            .where(Message.conversation_id == conv_id)
+            .order_by(Message.id)
+            .limit(TITLE_CONTEXT_MESSAGES)
+        ).all()
+    return "\n".join(msgs)
+
+
+def _save_title(conv_id: int, title: str) -> None:
+    with Session(engine) as session:
+        conv = session.get(Conversation, conv_id)
+        if conv is not None:
+            conv.title = title
+            session.add(conv)
+            session.commit()
+
+
+@job("conversations.generate_title", queue="ai")
+async def generate_title(conv_id: int) -> Dict[str, Any]:
+    aggregated = await asyncio.to_thread(_conversation_text, conv_id)
+    prompt = f"Generate a short (under 8 words) meaningful title for this conversation:\n{aggregated}"
+    res = await ai_service.generate(prompt=prompt, mode="study")
+    if res.get("status") == "error":
+        # raise so the job is retried with backoff
+        raise RuntimeError(res.get("error") or "ai_service_error")
+    title: Optional[str] = None
+    if isinstance(res.get("output"), str):
+        title = res.get("output").strip().split("\n")[0][:TITLE_MAX_LEN]
+    if title:
+        await asyncio.to_thread(_save_title, conv_id, title)
+    return {"title": title}
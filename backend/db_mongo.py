@@ -1,16 +1,123 @@
 """MongoDB database initialization using Motor and Beanie for async operations."""
 import os
 import logging
+import threading
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
-from typing import List
+from pymongo import monitoring
+from typing import Any, Dict, List
 
 logger = logging.getLogger("backend.db_mongo")
 
+# Connection pool and timeout settings (milliseconds where suffixed _MS)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "300000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "10000"))
+
 # Global MongoDB client
 _mongo_client: AsyncIOMotorClient = None
 
 
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Counts connection pool events reported by the driver."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.counters = {
+            "connections_created": 0,
+            "connections_closed": 0,
+            "checkouts": 0,
+            "checkout_failures": 0,
+            "pool_cleared": 0,
+        }
+        self.in_use = 0
+        self.max_in_use = 0
+
+    def _inc(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def connection_created(self, event):
+        self._inc("connections_created")
+
+    def connection_closed(self, event):
+        self._inc("connections_closed")
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.counters["checkouts"] += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+
+    def connection_check_out_failed(self, event):
+        self._inc("checkout_failures")
+
+    def pool_cleared(self, event):
+        self._inc("pool_cleared")
+
+    # remaining events are not tracked
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+            in_use, max_in_use = self.in_use, self.max_in_use
+        return {
+            **counters,
+            "open_connections": counters["connections_created"] - counters["connections_closed"],
+            "in_use": in_use,
+            "max_in_use": max_in_use,
+        }
+
+
+pool_metrics = PoolMetrics()
+
+
+def client_options() -> Dict[str, Any]:
+    return {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+    }
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Pool configuration and driver pool counters."""
+    return {
+        "configured": _mongo_client is not None,
+        "settings": {k: v for k, v in client_options().items() if "Pool" in k or k in ("maxIdleTimeMS", "waitQueueTimeoutMS")},
+        **pool_metrics.snapshot(),
+    }
+
+
 async def init_db(document_models: List):
     """
     Initialize MongoDB connection using Motor and Beanie.
@@ -28,12 +135,12 @@ async def init_db(document_models: List):
         raise ValueError("MONGODB_URI environment variable is required")
     
     try:
-        # Create Motor client with connection timeout
+        # Create Motor client with configurable pool size and timeouts
+        pool_metrics.reset()
         _mongo_client = AsyncIOMotorClient(
             mongodb_uri,
-            serverSelectionTimeoutMS=5000,  # 5 second timeout for initial connection
-            connectTimeoutMS=10000,
-            socketTimeoutMS=10000,
+            event_listeners=[pool_metrics],
+            **client_options(),
         )
         
         # Get database - use get_default_database() for URI-specified database
@@ -64,6 +171,7 @@ async def close_db():
     
     if _mongo_client:
         _mongo_client.close()
+        _mongo_client = None
         logger.info("MongoDB connection closed")
 
 
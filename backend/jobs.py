@@ -1,23 +1,440 @@
-import threading
-import queue
-import time
+"""Background jobs.
 
-_JOB_QUEUE = queue.Queue()
+Named jobs are registered with ``@job(name, queue=...)`` and submitted with
+``submit(name, *args)``. Every submission is a row in the Job table, so
+work survives restarts. JobRunner, started with the app, runs one
+dispatcher per queue on the event loop. A dispatcher claims due rows with a
+conditional UPDATE, which is safe with several workers on one database, and
+runs at most that queue's concurrency at a time: coroutine functions on the
+loop, plain functions in a thread, and ``cpu=True`` jobs in a process pool.
 
+Failures are retried with exponential backoff up to ``max_attempts``;
+a job raises JobFailed for errors a retry cannot fix. A timed-out
+coroutine job is cancelled and retried, but a thread or process cannot be
+stopped, so a plain or ``cpu=True`` job that times out is failed without a
+retry rather than run again alongside its first attempt. A
+running job holds a lease, so if its worker dies the job is handed to
+another worker once the lease expires. On shutdown ``drain`` stops
+claiming, waits for in-flight jobs and requeues any that did not finish.
 
-def worker():
-    while True:
-        func, args = _JOB_QUEUE.get()
+``enqueue(func, *args)`` still runs an arbitrary callable in the background
+without persisting it, for cheap work such as cache warming.
+"""
+import asyncio
+import functools
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from sqlalchemy import and_, delete, or_, update
+from sqlmodel import Session, select
+
+from .models import Job, engine
+
+logger = logging.getLogger("backend.jobs")
+
+# queue=concurrency pairs
+JOB_QUEUES = os.getenv("JOB_QUEUES", "default=4,ai=4,exports=2,maintenance=1")
+JOB_PROCESS_WORKERS = int(os.getenv("JOB_PROCESS_WORKERS", "2"))
+JOB_TRANSIENT_WORKERS = int(os.getenv("JOB_TRANSIENT_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "600"))
+JOB_RETRY_BASE = float(os.getenv("JOB_RETRY_BASE", "2"))
+JOB_RETRY_MAX = float(os.getenv("JOB_RETRY_MAX", "300"))
+JOB_DRAIN_TIMEOUT = float(os.getenv("JOB_DRAIN_TIMEOUT", "20"))
+JOB_RETENTION_DAYS = int(os.getenv("JOB_RETENTION_DAYS", "7"))
+
+ACTIVE_STATUSES = ("queued", "running")
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+
+class JobFailed(Exception):
+    """Permanent failure: the job is marked failed without further attempts."""
+
+
+def parse_queues(spec: str) -> Dict[str, int]:
+    queues = {}
+    for part in spec.split(","):
+        name, _, size = part.strip().partition("=")
+        if name:
+            queues[name] = max(int(size or 1), 1)
+    queues.setdefault("default", 1)
+    return queues
+
+
+def backoff(attempt: int) -> float:
+    """Delay before retry number ``attempt`` (1-based)."""
+    return min(JOB_RETRY_BASE * 2 ** (attempt - 1), JOB_RETRY_MAX)
+
+
+class JobSpec:
+    __slots__ = ("name", "func", "queue", "max_attempts", "cpu", "timeout")
+
+    def __init__(self, name: str, func: Callable, queue: str, max_attempts: int, cpu: bool, timeout: float):
+        self.name = name
+        self.func = func
+        self.queue = queue
+        self.max_attempts = max_attempts
+        self.cpu = cpu
+        self.timeout = timeout
+
+
+_REGISTRY: Dict[str, JobSpec] = {}
+
+
+def job(name: str, queue: str = "default", max_attempts: int = 3, cpu: bool = False, timeout: float = JOB_TIMEOUT):
+    """Register ``func`` as job ``name``; arguments must be JSON-serialisable."""
+
+    def register(func: Callable) -> Callable:
+        _REGISTRY[name] = JobSpec(name, func, queue, max_attempts, cpu, timeout)
+        return func
+
+    return register
+
+
+def job_view(record: Job) -> Dict[str, Any]:
+    return {
+        "id": record.id,
+        "name": record.name,
+        "queue": record.queue,
+        "status": record.status,
+        "attempts": record.attempts,
+        "max_attempts": record.max_attempts,
+        "error": record.error,
+        "result": json.loads(record.result) if record.result else None,
+        "created_at": record.created_at,
+        "started_at": record.started_at,
+        "finished_at": record.finished_at,
+    }
+
+
+def _log_failure(future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("background task failed", exc_info=future.exception())
+
+
+class JobRunner:
+    def __init__(self, queues: Optional[Dict[str, int]] = None, poll_interval: float = JOB_POLL_INTERVAL, process_workers: int = JOB_PROCESS_WORKERS):
+        self.queues = queues or parse_queues(JOB_QUEUES)
+        self.poll_interval = poll_interval
+        self.process_workers = process_workers
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Dict[str, asyncio.Event] = {}
+        self._dispatchers: List[asyncio.Task] = []
+        self._running: Dict[int, asyncio.Task] = {}
+        self._done: Dict[int, asyncio.Event] = {}
+        self._draining = False
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._threads = ThreadPoolExecutor(JOB_TRANSIENT_WORKERS, thread_name_prefix="jobs")
+        self.counts = {"succeeded": 0, "failed": 0, "retried": 0}
+
+    # -- submitting -------------------------------------------------------
+
+    def submit(self, name: str, *args, user_id: Optional[str] = None, delay: float = 0.0, dedupe_key: Optional[str] = None, **kwargs) -> int:
+        """Persist a job and wake its queue; returns the job id.
+
+        With ``dedupe_key``, an already queued or running job with the same
+        key is returned instead of creating another.
+        """
+        spec = _REGISTRY.get(name)
+        if spec is None:
+            raise KeyError(f"unknown job {name!r}")
+        with Session(engine) as session:
+            if dedupe_key:
+                existing = session.exec(
+                    select(Job.id).where(Job.dedupe_key == dedupe_key).where(Job.status.in_(ACTIVE_STATUSES)).limit(1)
+                ).first()
+                if existing is not None:
+                    return existing
+            record = Job(
+                queue=spec.queue if spec.queue in self.queues else "default",
+                name=name,
+                args=json.dumps({"args": list(args), "kwargs": kwargs}, default=str),
+                user_id=user_id,
+                dedupe_key=dedupe_key,
+                max_attempts=spec.max_attempts,
+                run_after=datetime.utcnow() + timedelta(seconds=delay),
+            )
+            session.add(record)
+            session.commit()
+            session.refresh(record)
+        self._notify(record.queue)
+        return record.id
+
+    def _notify(self, queue: str) -> None:
+        loop, event = self._loop, self._wake.get(queue)
+        if loop is None or event is None or loop.is_closed():
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            event.set()
+        else:
+            loop.call_soon_threadsafe(event.set)
+
+    def enqueue(self, func: Callable, *args) -> None:
+        """Run ``func(*args)`` in the background without persisting it."""
+        if asyncio.iscoroutinefunction(func):
+            loop = self._loop
+            if loop is not None and not loop.is_closed():
+                asyncio.run_coroutine_threadsafe(func(*args), loop).add_done_callback(_log_failure)
+                return
+            func = functools.partial(asyncio.run, func(*args))
+            args = ()
+        self._threads.submit(func, *args).add_done_callback(_log_failure)
+
+    async def run_cpu(self, func: Callable, *args) -> Any:
+        """Run a picklable function in the process pool (a thread if disabled)."""
+        if self.process_workers <= 0:
+            return await asyncio.to_thread(func, *args)
+        if self._processes is None:
+            self._processes = ProcessPoolExecutor(self.process_workers)
+        return await asyncio.get_running_loop().run_in_executor(self._processes, functools.partial(func, *args))
+
+    # -- reading ----------------------------------------------------------
+
+    def get(self, job_id: int) -> Optional[Job]:
+        with Session(engine) as session:
+            return session.get(Job, job_id)
+
+    def list_for_user(self, user_id: str, limit: int = 50) -> List[Job]:
+        with Session(engine) as session:
+            return session.exec(
+                select(Job).where(Job.user_id == user_id).order_by(Job.id.desc()).limit(limit)
+            ).all()
+
+    async def wait(self, job_id: int, timeout: float) -> Optional[Job]:
+        """Wait up to ``timeout`` seconds for a job to finish; returns its latest record."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            record = await asyncio.to_thread(self.get, job_id)
+            remaining = deadline - loop.time()
+            if record is None or record.status in FINISHED_STATUSES or remaining <= 0:
+                self._done.pop(job_id, None)
+                return record
+            # woken when this process finishes it; polled in case another worker does
+            event = self._done.setdefault(job_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(event.wait(), min(remaining, self.poll_interval))
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with Session(engine) as session:
+            rows = session.exec(
+                select(Job.queue, Job.status, Job.id).where(Job.status.in_(ACTIVE_STATUSES))
+            ).all()
+        depth: Dict[str, Dict[str, int]] = {}
+        for queue, status, _ in rows:
+            depth.setdefault(queue, {"queued": 0, "running": 0})[status] += 1
+        return {"queues": self.queues, "depth": depth, "in_flight": len(self._running), **self.counts}
+
+    # -- claiming and running ----------------------------------------------
+
+    def claim(self, queue: str, limit: int) -> List[Job]:
+        """Mark up to ``limit`` due jobs (or jobs whose lease expired) as running."""
+        now = datetime.utcnow()
+        claimed = []
+        with Session(engine) as session:
+            candidates = session.exec(
+                select(Job.id, Job.name, Job.status, Job.attempts)
+                .where(Job.queue == queue)
+                .where(or_(
+                    and_(Job.status == "queued", Job.run_after <= now),
+                    and_(Job.status == "running", Job.lease_expires_at < now),
+                ))
+                .order_by(Job.run_after, Job.id)
+                .limit(limit)
+            ).all()
+            for job_id, name, status, attempts in candidates:
+                spec = _REGISTRY.get(name)
+                lease = timedelta(seconds=(spec.timeout if spec else JOB_TIMEOUT) + self.poll_interval * 5)
+                # conditional update so only one worker claims each job
+                result = session.execute(
+                    update(Job)
+                    .where(Job.id == job_id)
+                    .where(Job.status == status)
+                    .where(Job.attempts == attempts)
+                    .values(status="running", attempts=attempts + 1, started_at=now, lease_expires_at=now + lease)
+                )
+                if result.rowcount == 1:
+                    claimed.append(job_id)
+            session.commit()
+            if not claimed:
+                return []
+            return session.exec(select(Job).where(Job.id.in_(claimed)).order_by(Job.id)).all()
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._draining = False
         try:
-            func(*args)
+            await asyncio.to_thread(self.purge)
         except Exception:
-            pass
-        _JOB_QUEUE.task_done()
+            logger.exception("job purge failed")
+        for queue, concurrency in self.queues.items():
+            self._wake[queue] = asyncio.Event()
+            self._dispatchers.append(asyncio.create_task(self._dispatch(queue, concurrency)))
+
+    async def _dispatch(self, queue: str, concurrency: int) -> None:
+        wake = self._wake[queue]
+        active: Set[asyncio.Task] = set()
+
+        def done(task: asyncio.Task, job_id: int) -> None:
+            active.discard(task)
+            self._running.pop(job_id, None)
+            wake.set()
+
+        while not self._draining:
+            wake.clear()
+            free = concurrency - len(active)
+            claimed: List[Job] = []
+            if free > 0:
+                try:
+                    claimed = await asyncio.to_thread(self.claim, queue, free)
+                except Exception:
+                    logger.exception("claiming jobs on %s failed", queue)
+                for record in claimed:
+                    task = asyncio.create_task(self._execute(record))
+                    active.add(task)
+                    self._running[record.id] = task
+                    task.add_done_callback(functools.partial(done, job_id=record.id))
+            if claimed and len(claimed) == free:
+                # there may be more due jobs; claim again once a slot frees up
+                continue
+            try:
+                await asyncio.wait_for(wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _execute(self, record: Job) -> None:
+        spec = _REGISTRY.get(record.name)
+        if spec is None:
+            await asyncio.to_thread(self._finish, record.id, "failed", None, f"unknown job {record.name!r}")
+            return
+        if record.attempts > record.max_attempts:
+            # its worker died on the final attempt
+            await asyncio.to_thread(self._finish, record.id, "failed", None, "lease expired")
+            return
+        payload = json.loads(record.args or "{}")
+        try:
+            result = await asyncio.wait_for(self._call(spec, payload.get("args", []), payload.get("kwargs", {})), spec.timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = "timeout" if isinstance(e, asyncio.TimeoutError) else f"{type(e).__name__}: {e}"
+            # a timed-out thread/process job may still be running, so never start a second copy
+            abandoned = isinstance(e, asyncio.TimeoutError) and not asyncio.iscoroutinefunction(spec.func)
+            if record.attempts < record.max_attempts and not isinstance(e, JobFailed) and not abandoned:
+                delay = backoff(record.attempts)
+                logger.warning("job %s (%s) attempt %d failed, retrying in %.0fs: %s", record.id, record.name, record.attempts, delay, error)
+                self.counts["retried"] += 1
+                await asyncio.to_thread(self._retry, record.id, delay, error)
+                self._notify_later(record.queue, delay)
+            else:
+                logger.error("job %s (%s) failed after %d attempts: %s", record.id, record.name, record.attempts, error)
+                self.counts["failed"] += 1
+                await asyncio.to_thread(self._finish, record.id, "failed", None, error)
+            return
+        self.counts["succeeded"] += 1
+        await asyncio.to_thread(self._finish, record.id, "succeeded", result, None)
+
+    async def _call(self, spec: JobSpec, args: list, kwargs: dict) -> Any:
+        if asyncio.iscoroutinefunction(spec.func):
+            return await spec.func(*args, **kwargs)
+        if spec.cpu:
+            return await self.run_cpu(functools.partial(spec.func, *args, **kwargs))
+        return await asyncio.to_thread(spec.func, *args, **kwargs)
+
+    def _notify_later(self, queue: str, delay: float) -> None:
+        if self._loop is not None:
+            self._loop.call_later(delay, self._notify, queue)
+
+    def _retry(self, job_id: int, delay: float, error: str) -> None:
+        with Session(engine) as session:
+            session.execute(
+                update(Job)
+                .where(Job.id == job_id)
+                .where(Job.status == "running")
+                .values(status="queued", error=error, lease_expires_at=None, run_after=datetime.utcnow() + timedelta(seconds=delay))
+            )
+            session.commit()
+
+    def _finish(self, job_id: int, status: str, result: Any, error: Optional[str]) -> None:
+        with Session(engine) as session:
+            session.execute(
+                update(Job)
+                .where(Job.id == job_id)
+                .where(Job.status == "running")
+                .values(
+                    status=status,
+                    result=json.dumps(result, default=str) if result is not None else None,
+                    error=error,
+                    lease_expires_at=None,
+                    finished_at=datetime.utcnow(),
+                )
+            )
+            session.commit()
+        if self._loop is not None:
+            event = self._done.pop(job_id, None)
+            if event is not None:
+                self._loop.call_soon_threadsafe(event.set)
+
+    def _requeue(self, job_ids: List[int]) -> None:
+        """Hand unfinished jobs back without charging them an attempt."""
+        with Session(engine) as session:
+            session.execute(
+                update(Job)
+                .where(Job.id.in_(job_ids))
+                .where(Job.status == "running")
+                .values(status="queued", attempts=Job.attempts - 1, lease_expires_at=None, run_after=datetime.utcnow())
+            )
+            session.commit()
+
+    def purge(self, older_than_days: int = JOB_RETENTION_DAYS) -> int:
+        """Delete finished jobs older than the retention window."""
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        with Session(engine) as session:
+            result = session.execute(
+                delete(Job).where(Job.status.in_(FINISHED_STATUSES)).where(Job.finished_at < cutoff)
+            )
+            session.commit()
+        return result.rowcount
+
+    async def drain(self, timeout: float = JOB_DRAIN_TIMEOUT) -> int:
+        """Stop claiming, let in-flight jobs finish for ``timeout`` seconds and requeue the rest."""
+        self._draining = True
+        for task in self._dispatchers:
+            task.cancel()
+        await asyncio.gather(*self._dispatchers, return_exceptions=True)
+        self._dispatchers = []
+        running = dict(self._running)
+        unfinished: List[int] = []
+        if running:
+            _, pending = await asyncio.wait(list(running.values()), timeout=timeout)
+            unfinished = [job_id for job_id, task in running.items() if task in pending]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            if unfinished:
+                logger.warning("requeueing %d unfinished jobs on shutdown", len(unfinished))
+                await asyncio.to_thread(self._requeue, unfinished)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+            self._processes = None
+        self._wake = {}
+        self._loop = None
+        return len(unfinished)
 
 
-_THREAD = threading.Thread(target=worker, daemon=True)
-_THREAD.start()
+runner = JobRunner()
+submit = runner.submit
 
 
-def enqueue(func, *args):
-    _JOB_QUEUE.put((func, args))
+def enqueue(func: Callable, *args) -> None:
+    runner.enqueue(func, *args)
@@ -0,0 +1,45 @@
+"""Housekeeping schedules: table pruning and cache warming."""
+import logging
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete
+from sqlmodel import Session
+
+from . import jobs
+from .models import AuditLog, engine
+from .scheduler import scheduled, scheduler
+from .tools import catalog as tool_catalog
+
+logger = logging.getLogger("backend.maintenance")
+
+AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", "180"))
+
+
+@scheduled("audit.prune", os.getenv("AUDIT_PRUNE_CRON", "30 3 * * *"), jitter=120)
+def prune_audit_log(older_than_days: int = AUDIT_RETENTION_DAYS) -> int:
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    with Session(engine) as session:
+        result = session.execute(delete(AuditLog).where(AuditLog.created_at < cutoff))
+        session.commit()
+    if result.rowcount:
+        logger.info("pruned %d audit log rows older than %d days", result.rowcount, older_than_days)
+    return result.rowcount
+
+
+@scheduled("jobs.purge", "45 3 * * *", jitter=120)
+def purge_jobs() -> int:
+    return jobs.runner.purge()
+
+
+@scheduled("scheduler.prune_history", "0 4 * * *", jitter=120)
+def prune_schedule_history() -> int:
+    return scheduler.prune_history()
+
+
+@scheduled("tools.warm_catalog", f"*/{min(max(tool_catalog.TOOL_CATALOG_TTL // 60 - 1, 1), 59)} * * * *", jitter=20, misfire="skip")
+def warm_tool_catalog() -> int:
+    """Reload the tool catalog just before its TTL lapses so requests never pay for the query."""
+    tool_catalog.invalidate_catalog()
+    catalog, _ = tool_catalog.load()
+    return len(catalog)
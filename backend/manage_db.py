@@ -3,15 +3,18 @@
 Usage:
   python backend/manage_db.py init   # initialize DB (creates tables)
   python backend/manage_db.py inspect # print list of tables
+  python backend/manage_db.py backfill-conversations # recompute conversation sidebar summaries
+  python backend/manage_db.py backfill-tags # re-sync every row's tag links (init only indexes rows that have none)
+  python backend/manage_db.py sync-agents sql mongo [batch_size] # copy agents between the SQL and Mongo stores
 """
 import sys
 from sqlmodel import SQLModel, create_engine
-from .models import engine
+from .models import engine, init_db
 
 
 def init():
     print("Initializing database and creating tables...")
-    SQLModel.metadata.create_all(engine)
+    init_db()
     print("Done.")
 
 
@@ -28,6 +31,44 @@ def inspect():
         print("Inspect failed:", e)
 
 
+def backfill_conversations():
+    from .chat.persistence import backfill_conversation_summaries
+
+    init_db()
+    print("Backfilling conversation summaries...")
+    n = backfill_conversation_summaries()
+    print(f"Done. {n} conversations updated.")
+
+
+def backfill_tags():
+    from .tags import backfill_tags as run_backfill
+
+    init_db()
+    print("Backfilling tag index...")
+    counts = run_backfill()
+    print(f"Done. {counts}")
+
+
+def sync_agents(source, target, batch_size=500):
+    import asyncio
+    from .agents.repository import sync_agents as run_sync
+    from .db_mongo import init_db as init_mongo_db, close_db as close_mongo_db
+    from .models_agent import Agent as MongoAgent
+
+    init_db()
+
+    async def run():
+        await init_mongo_db(document_models=[MongoAgent])
+        try:
+            return await run_sync(source, target, batch_size)
+        finally:
+            await close_mongo_db()
+
+    print(f"Syncing agents {source} -> {target} in batches of {batch_size}...")
+    counts = asyncio.run(run())
+    print(f"Done. {counts}")
+
+
 if __name__ == '__main__':
     if len(sys.argv) < 2:
         print(__doc__)
@@ -37,6 +78,15 @@ if __name__ == '__main__':
         init()
     elif cmd == 'inspect':
         inspect()
+    elif cmd == 'backfill-conversations':
+        backfill_conversations()
+    elif cmd == 'backfill-tags':
+        backfill_tags()
+    elif cmd == 'sync-agents':
+        if len(sys.argv) < 4:
+            print(__doc__)
+            sys.exit(1)
+        sync_agents(sys.argv[2], sys.argv[3], int(sys.argv[4]) if len(sys.argv) > 4 else 500)
     else:
         print('Unknown command')
         sys.exit(2)
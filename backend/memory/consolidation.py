@@ -0,0 +1,197 @@
+"""Consolidation of short-term memories into compact long-term entries.
+
+Related short-term memories of a user (same conversation, a shared tag, or
+embedding similarity above a threshold) are grouped with union-find and
+merged into one long-term Memory. The originals are archived with
+``consolidated_into`` pointing at the merged entry, which keeps provenance
+queryable. Runs on a cron schedule with per-user budgets, one background job per
+user; /memories/consolidate submits the same job, and its dedupe key keeps
+one user's passes from overlapping. Each run reports the user's active
+memory count before and after.
+"""
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import numpy as np
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from ..jobs import job, submit
+from ..models import engine, Memory
+from ..scheduler import scheduler
+from .. import tags as tag_index
+from .embedding import embed
+from .index import memory_index
+
+logger = logging.getLogger("backend.memory.consolidation")
+
+CONSOLIDATION_CRON = os.getenv("MEMORY_CONSOLIDATION_CRON", "0 * * * *")  # empty disables
+MIN_AGE_SECONDS = int(os.getenv("MEMORY_CONSOLIDATION_MIN_AGE", "3600"))
+MAX_MEMORIES_PER_USER = int(os.getenv("MEMORY_CONSOLIDATION_MAX_PER_USER", "200"))
+MAX_GROUPS_PER_USER = int(os.getenv("MEMORY_CONSOLIDATION_MAX_GROUPS", "20"))
+MAX_USERS_PER_RUN = int(os.getenv("MEMORY_CONSOLIDATION_USERS_PER_RUN", "100"))
+SIMILARITY_THRESHOLD = float(os.getenv("MEMORY_CONSOLIDATION_SIMILARITY", "0.5"))
+# near-identical lines are dropped from the merged text
+DUPLICATE_THRESHOLD = 0.95
+
+
+def active_count(session: Session, user_id: str) -> int:
+    return session.exec(
+        select(func.count(Memory.id))
+        .where(Memory.user_id == user_id)
+        .where(Memory.archived == False)
+    ).one()
+
+
+def _find(parent: List[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def group_memories(memories: List[Memory], threshold: float = SIMILARITY_THRESHOLD) -> List[List[int]]:
+    """Return groups (as index lists into ``memories``) of two or more related memories."""
+    n = len(memories)
+    parent = list(range(n))
+
+    def union(a: int, b: int) -> None:
+        ra, rb = _find(parent, a), _find(parent, b)
+        if ra != rb:
+            parent[rb] = ra
+
+    by_key: Dict[tuple, int] = {}
+    for i, mem in enumerate(memories):
+        keys = [("tag", t) for t in tag_index.split_tags(mem.tags)]
+        if mem.conversation_id:
+            keys.append(("conv", mem.conversation_id))
+        for key in keys:
+            if key in by_key:
+                union(by_key[key], i)
+            else:
+                by_key[key] = i
+
+    if n > 1:
+        vectors = np.stack([embed(m.content) for m in memories])
+        sims = vectors @ vectors.T
+        rows, cols = np.where(np.triu(sims, k=1) >= threshold)
+        for a, b in zip(rows.tolist(), cols.tolist()):
+            union(a, b)
+
+    groups: Dict[int, List[int]] = {}
+    for i in range(n):
+        groups.setdefault(_find(parent, i), []).append(i)
+    return [g for g in groups.values() if len(g) > 1]
+
+
+def merge_contents(contents: List[str]) -> str:
+    """Compact bullet list of the distinct statements in ``contents``."""
+    kept: List[str] = []
+    kept_vecs: List[np.ndarray] = []
+    for text in contents:
+        text = " ".join(text.split())
+        if not text:
+            continue
+        vec = embed(text)
+        if any(float(vec @ other) >= DUPLICATE_THRESHOLD for other in kept_vecs):
+            continue
+        kept.append(text)
+        kept_vecs.append(vec)
+    return "\n".join(f"- {t}" for t in kept)
+
+
+@job("memory.consolidate_user", queue="maintenance")
+def consolidate_user(user_id: str, min_age_seconds: int = MIN_AGE_SECONDS, max_memories: int = MAX_MEMORIES_PER_USER, max_groups: int = MAX_GROUPS_PER_USER) -> Dict:
+    """Consolidate one user's short-term memories; returns a size report."""
+    cutoff = datetime.utcnow() - timedelta(seconds=min_age_seconds)
+    created: List[Memory] = []
+    archived_ids: List[int] = []
+    with Session(engine) as session:
+        before = active_count(session, user_id)
+        memories = session.exec(
+            select(Memory)
+            .where(Memory.user_id == user_id)
+            .where(Memory.archived == False)
+            .where(Memory.long_term == False)
+            .where(Memory.visible == True)
+            .where(Memory.created_at <= cutoff)
+            .order_by(Memory.created_at)
+            .limit(max_memories)
+        ).all()
+        groups = group_memories(memories)[:max_groups]
+        now = datetime.utcnow()
+        for group in groups:
+            members = [memories[i] for i in group]
+            conv_ids = {m.conversation_id for m in members}
+            tags = sorted({t for m in members for t in tag_index.split_tags(m.tags)})
+            merged = Memory(
+                user_id=user_id,
+                conversation_id=conv_ids.pop() if len(conv_ids) == 1 else None,
+                content=merge_contents([m.content for m in members]),
+                long_term=True,
+                tags=",".join(tags) if tags else None,
+                created_at=now,
+                updated_at=now,
+            )
+            session.add(merged)
+            session.flush()
+            if tags:
+                tag_index.set_tags(session, user_id, tag_index.MEMORY, merged.id, tags)
+            tag_index.clear_tags(session, tag_index.MEMORY, [m.id for m in members])
+            for m in members:
+                m.archived = True
+                m.consolidated_into = merged.id
+                m.updated_at = now
+                session.add(m)
+                archived_ids.append(m.id)
+            created.append(merged)
+        session.commit()
+        after = active_count(session, user_id)
+        for merged in created:
+            session.refresh(merged)
+            memory_index.on_upsert(user_id, merged.id, merged.content, merged.visible)
+    for mem_id in archived_ids:
+        memory_index.on_delete(user_id, mem_id)
+
+    report = {
+        "user_id": user_id,
+        "active_before": before,
+        "active_after": after,
+        "groups_merged": len(created),
+        "archived": len(archived_ids),
+        "consolidated_ids": [m.id for m in created],
+    }
+    logger.info("memory consolidation: %s", report)
+    return report
+
+
+def candidate_users(limit: int = MAX_USERS_PER_RUN, min_age_seconds: int = MIN_AGE_SECONDS) -> List[str]:
+    """Users with at least two consolidatable short-term memories, most backlog first."""
+    cutoff = datetime.utcnow() - timedelta(seconds=min_age_seconds)
+    with Session(engine) as session:
+        rows = session.exec(
+            select(Memory.user_id, func.count(Memory.id))
+            .where(Memory.archived == False)
+            .where(Memory.long_term == False)
+            .where(Memory.visible == True)
+            .where(Memory.created_at <= cutoff)
+            .group_by(Memory.user_id)
+            .having(func.count(Memory.id) > 1)
+            .order_by(func.count(Memory.id).desc())
+            .limit(limit)
+        ).all()
+    return [uid for uid, _ in rows]
+
+
+def schedule_consolidation() -> List[int]:
+    """Queue a consolidation job per candidate user (skipping users already queued)."""
+    return [
+        submit("memory.consolidate_user", user_id, user_id=user_id, dedupe_key=f"consolidate:{user_id}")
+        for user_id in candidate_users()
+    ]
+
+
+if CONSOLIDATION_CRON:
+    scheduler.register("memory.consolidation", CONSOLIDATION_CRON, schedule_consolidation, jitter=60)
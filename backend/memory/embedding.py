@@ -0,0 +1,38 @@
+"""Local CPU text embedding for memory retrieval.
+
+A signed feature-hashing embedding over word unigrams and bigrams: no model
+download, no network, deterministic across processes and a few microseconds
+per short text. Good enough to rank a user's own memories by lexical overlap.
+"""
+import os
+import re
+import zlib
+
+import numpy as np
+
+EMBED_DIM = int(os.getenv("MEMORY_EMBED_DIM", "256"))
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i in is it its me my of on or so that the this to was we were what when which who will with you your".split()
+)
+
+
+def tokens(text: str):
+    words = [w for w in _WORD_RE.findall((text or "").lower()) if w not in _STOPWORDS]
+    feats = list(words)
+    feats.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+    return feats
+
+
+def embed(text: str, dim: int = EMBED_DIM) -> np.ndarray:
+    """Return an L2-normalised float32 vector for ``text`` (all zeros if empty)."""
+    vec = np.zeros(dim, dtype=np.float32)
+    for feat in tokens(text):
+        h = zlib.crc32(feat.encode())
+        # low bits pick the bucket, the top bit picks the sign
+        vec[h % dim] += -1.0 if h & 0x80000000 else 1.0
+    norm = float(np.linalg.norm(vec))
+    if norm:
+        vec /= norm
+    return vec
@@ -0,0 +1,187 @@
+"""Per-user vector index over Memory rows.
+
+Each user's visible memories are kept as a contiguous float32 matrix plus a
+parallel id array, so a top-k lookup is one matrix-vector product and an
+argpartition. Indexes are loaded lazily from the database, updated in place
+on create/update/delete, and reloaded after MEMORY_INDEX_TTL seconds so
+writes handled by other workers are eventually picked up.
+"""
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlmodel import Session, select
+
+from ..models import engine, Memory
+from ..utils.cache import LRUCache
+from .embedding import EMBED_DIM, embed
+
+logger = logging.getLogger("backend.memory.index")
+
+MEMORY_INDEX_TTL = int(os.getenv("MEMORY_INDEX_TTL", "300"))
+MEMORY_INDEX_USERS = int(os.getenv("MEMORY_INDEX_USERS", "2000"))
+
+
+class UserMemoryIndex:
+    """Dense vectors for one user's memories; not thread-safe on its own."""
+
+    def __init__(self, dim: int = EMBED_DIM, capacity: int = 16):
+        self.dim = dim
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.texts: List[str] = []
+        self.rows: Dict[int, int] = {}
+        self.size = 0
+        self.loaded_at = time.time()
+
+    def _grow(self) -> None:
+        capacity = max(16, len(self.ids) * 2)
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        ids = np.zeros(capacity, dtype=np.int64)
+        vectors[: self.size] = self.vectors[: self.size]
+        ids[: self.size] = self.ids[: self.size]
+        self.vectors, self.ids = vectors, ids
+
+    def upsert(self, mem_id: int, text: str, vector: Optional[np.ndarray] = None) -> None:
+        vector = embed(text, self.dim) if vector is None else vector
+        row = self.rows.get(mem_id)
+        if row is None:
+            if self.size == len(self.ids):
+                self._grow()
+            row = self.size
+            self.size += 1
+            self.rows[mem_id] = row
+            self.ids[row] = mem_id
+            self.texts.append(text)
+        else:
+            self.texts[row] = text
+        self.vectors[row] = vector
+
+    def remove(self, mem_id: int) -> None:
+        row = self.rows.pop(mem_id, None)
+        if row is None:
+            return
+        last = self.size - 1
+        if row != last:
+            # move the last row into the hole to stay contiguous
+            moved_id = int(self.ids[last])
+            self.vectors[row] = self.vectors[last]
+            self.ids[row] = moved_id
+            self.texts[row] = self.texts[last]
+            self.rows[moved_id] = row
+        self.texts.pop()
+        self.size = last
+
+    def search(self, query_vec: np.ndarray, k: int = 5, min_score: float = 0.0) -> List[Tuple[int, float, str]]:
+        if not self.size or not query_vec.any():
+            return []
+        scores = self.vectors[: self.size] @ query_vec
+        k = min(k, self.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.ids[i]), float(scores[i]), self.texts[i]) for i in top if scores[i] > min_score]
+
+
+class MemoryIndexStore:
+    """Process-wide registry of per-user indexes (bounded LRU of users)."""
+
+    def __init__(self, max_users: int = MEMORY_INDEX_USERS, ttl: int = MEMORY_INDEX_TTL):
+        self._indexes = LRUCache(maxsize=max_users)
+        self._lock = threading.Lock()
+        self._loading = set()
+        self.ttl = ttl
+
+    def _load(self, user_id: str) -> UserMemoryIndex:
+        index = UserMemoryIndex()
+        with Session(engine) as session:
+            rows = session.exec(
+                select(Memory.id, Memory.content)
+                .where(Memory.user_id == user_id)
+                .where(Memory.visible == True)
+                .where(Memory.archived == False)
+            ).all()
+        for mem_id, content in rows:
+            index.upsert(mem_id, content)
+        return index
+
+    def warm(self, user_id: str) -> UserMemoryIndex:
+        """Load (or reload) a user's index from the database."""
+        try:
+            index = self._load(user_id)
+            with self._lock:
+                self._indexes.set(user_id, index)
+            return index
+        finally:
+            with self._lock:
+                self._loading.discard(user_id)
+
+    def get(self, user_id: str, load: bool = True) -> Optional[UserMemoryIndex]:
+        index = self._indexes.get(user_id)
+        if index is not None and time.time() - index.loaded_at < self.ttl:
+            return index
+        if not load:
+            return index
+        return self.warm(user_id)
+
+    def warm_in_background(self, user_id: str) -> None:
+        with self._lock:
+            if user_id in self._loading:
+                return
+            self._loading.add(user_id)
+        from .. import jobs
+
+        jobs.enqueue(self.warm, user_id)
+
+    def on_upsert(self, user_id: str, mem_id: int, content: str, visible: bool = True) -> None:
+        index = self._indexes.get(user_id)
+        if index is None:
+            return
+        with self._lock:
+            if visible:
+                index.upsert(mem_id, content)
+            else:
+                index.remove(mem_id)
+
+    def on_delete(self, user_id: str, mem_id: int) -> None:
+        index = self._indexes.get(user_id)
+        if index is None:
+            return
+        with self._lock:
+            index.remove(mem_id)
+
+    def search(self, user_id: str, query: str, k: int = 5) -> List[Tuple[int, float, str]]:
+        index = self.get(user_id)
+        query_vec = embed(query, index.dim)
+        with self._lock:
+            return index.search(query_vec, k)
+
+    def retrieve_within_budget(self, user_id: str, query: str, k: int, budget_ms: float) -> List[Tuple[int, float, str]]:
+        """Top-k for prompt grounding without ever blocking on the database.
+
+        A cold or stale index is loaded in the background and this call
+        returns what is available now (possibly nothing).
+        """
+        start = time.perf_counter()
+        index = self.get(user_id, load=False)
+        if index is None or time.time() - index.loaded_at >= self.ttl:
+            self.warm_in_background(user_id)
+            if index is None:
+                return []
+        query_vec = embed(query, index.dim)
+        # never queue behind a writer or a reload swap for longer than the budget
+        if not self._lock.acquire(timeout=budget_ms / 1000.0):
+            return []
+        try:
+            hits = index.search(query_vec, k)
+        finally:
+            self._lock.release()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms > budget_ms:
+            logger.warning("memory retrieval took %.2fms (budget %.2fms) for %d memories", elapsed_ms, budget_ms, index.size)
+        return hits
+
+
+memory_index = MemoryIndexStore()
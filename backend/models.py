@@ -1,24 +1,34 @@
 from sqlmodel import SQLModel, Field, create_engine
+from sqlalchemy import Index, inspect, literal, text
 from typing import Optional
 from datetime import datetime
+import logging
 import os
 
+logger = logging.getLogger("backend.models")
+
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./backend_data.db")
 engine = create_engine(DATABASE_URL, echo=False)
 
 
 class Conversation(SQLModel, table=True):
+    __table_args__ = (Index("ix_conversation_user_recent", "user_id", "last_message_at"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: str
     title: Optional[str] = None
     pinned: bool = False
     tags: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    # denormalized sidebar summary, maintained on every message insert
+    message_count: int = 0
+    last_message_at: Optional[datetime] = Field(default_factory=datetime.utcnow)  # created_at until the first message
+    last_message_preview: Optional[str] = None
 
 
 class Message(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    conversation_id: int
+    conversation_id: int = Field(index=True)
     role: str
     content: str
     meta: Optional[str] = None
@@ -26,6 +36,8 @@ class Message(SQLModel, table=True):
 
 
 class Memory(SQLModel, table=True):
+    __table_args__ = (Index("ix_memory_user_active", "user_id", "archived", "long_term"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: str
     conversation_id: Optional[int] = None
@@ -33,10 +45,35 @@ class Memory(SQLModel, table=True):
     long_term: bool = False
     tags: Optional[str] = None
     visible: bool = True
+    # consolidation: originals are archived and point at the merged long-term entry
+    archived: bool = False
+    consolidated_into: Optional[int] = Field(default=None, index=True)
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 
+class Tag(SQLModel, table=True):
+    """Normalized per-user tag; linked to memories/conversations via TagLink."""
+    __table_args__ = (Index("ux_tag_user_tag", "user_id", "tag", unique=True),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    user_id: str
+    tag: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class TagLink(SQLModel, table=True):
+    __table_args__ = (
+        Index("ux_taglink_tag_target", "tag_id", "target_type", "target_id", unique=True),
+        Index("ix_taglink_target", "target_type", "target_id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    tag_id: int
+    target_type: str  # memory, conversation
+    target_id: int
+
+
 class Project(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: str
@@ -101,36 +138,47 @@ class CreditTransaction(SQLModel, table=True):
 # Agent system models
 class Agent(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    user_id: str
+    user_id: str = Field(index=True)
     name: str
     description: Optional[str] = None
     config: Optional[str] = None  # JSON config
     status: str = "idle"  # idle, running, paused, stopped, error
     memory_scope: str = "conversation"  # conversation, project, global
+    public: bool = False
+    external_id: Optional[str] = Field(default=None, index=True)  # id in the Mongo store, set by sync-agents
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 
 class AgentRun(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
-    agent_id: int
-    user_id: str
-    status: str = "running"  # running, completed, failed, paused
+    agent_id: int = Field(index=True)
+    user_id: str = Field(index=True)
+    status: str = "running"  # queued, running, paused, interrupted, completed, failed, stopped
     input_data: Optional[str] = None
     output_data: Optional[str] = None
     error: Optional[str] = None
+    checkpoint: Optional[str] = None  # JSON: next step index and step outputs so far
     started_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: Optional[datetime] = Field(default_factory=datetime.utcnow)
     completed_at: Optional[datetime] = None
 
 
+# scope_id used for unscoped entries so the unique key never contains NULL
+AGENT_MEMORY_NO_SCOPE_ID = 0
+
+
 class AgentMemory(SQLModel, table=True):
+    __table_args__ = (Index("ux_agentmemory_key", "agent_id", "scope", "scope_id", "key", unique=True),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     agent_id: int
     scope: str  # conversation, project, global
-    scope_id: Optional[int] = None
+    scope_id: int = AGENT_MEMORY_NO_SCOPE_ID
     key: str
     value: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
 
 
 # Tool system models
@@ -145,6 +193,8 @@ class Tool(SQLModel, table=True):
 
 
 class ToolPermission(SQLModel, table=True):
+    __table_args__ = (Index("ix_toolpermission_user_tool", "user_id", "tool_id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     user_id: str
     tool_id: int
@@ -161,6 +211,8 @@ class ToolUsage(SQLModel, table=True):
     input_data: Optional[str] = None
     output_data: Optional[str] = None
     error: Optional[str] = None
+    # rows are written in batches, so callers get this key (as usage_id) rather than the row id
+    usage_key: Optional[str] = Field(default=None, index=True)
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
@@ -195,6 +247,15 @@ class CredibilityScore(SQLModel, table=True):
     last_checked: datetime = Field(default_factory=datetime.utcnow)
 
 
+class NewsCoverage(SQLModel, table=True):
+    """Search coverage per heatmap topic, kept fresh by the news refresh schedule."""
+    topic: str = Field(primary_key=True)  # normalised (stripped, lower-case)
+    result_count: int = 0
+    sources: Optional[str] = None  # JSON list of the top sources
+    fetched_at: datetime = Field(default_factory=datetime.utcnow)
+    requested_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+
 # Research and analysis models
 class ResearchSession(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
@@ -339,5 +400,143 @@ class SecurityIncident(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 
+class Job(SQLModel, table=True):
+    """Background job record; see backend/jobs.py."""
+    __table_args__ = (Index("ix_job_claim", "queue", "status", "run_after"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    queue: str = "default"
+    name: str
+    args: Optional[str] = None  # JSON: {"args": [...], "kwargs": {...}}
+    user_id: Optional[str] = Field(default=None, index=True)
+    dedupe_key: Optional[str] = Field(default=None, index=True)
+    status: str = "queued"  # queued, running, succeeded, failed, cancelled
+    attempts: int = 0
+    max_attempts: int = 3
+    run_after: datetime = Field(default_factory=datetime.utcnow)
+    lease_expires_at: Optional[datetime] = None
+    result: Optional[str] = None  # JSON
+    error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class SchedulerLease(SQLModel, table=True):
+    """One row per scheduled job: its next due time and the worker holding the run lease."""
+    name: str = Field(primary_key=True)
+    cron: str
+    next_run_at: datetime
+    owner: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    last_run_at: Optional[datetime] = None
+    last_status: Optional[str] = None
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class ScheduledRun(SQLModel, table=True):
+    __table_args__ = (Index("ix_scheduledrun_name_started", "name", "started_at"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    name: str
+    owner: str
+    scheduled_for: datetime
+    started_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+    status: str = "running"  # running, succeeded, failed, skipped
+    missed: int = 0
+    error: Optional[str] = None
+
+
+class RefDataVersion(SQLModel, table=True):
+    """The last reference data file applied per dataset (see utils/refdata.py)."""
+    name: str = Field(primary_key=True)
+    version: int
+    sha256: str
+    row_count: int = 0
+    applied_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+def _default_sql(value, type_, dialect) -> str:
+    """A scalar column default as a SQL literal in ``dialect`` (TRUE/1, quoted strings)."""
+    return str(literal(value, type_).compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+
+
+def _add_missing_columns(conn):
+    """Additive schema migration: create_all() does not alter existing tables,
+    so add any model columns missing from an older database."""
+    insp = inspect(conn)
+    existing_tables = set(insp.get_table_names())
+    for table in SQLModel.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {c["name"] for c in insp.get_columns(table.name)}
+        for col in table.columns:
+            if col.name in present:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col.type.compile(dialect=conn.dialect)}"
+            default = col.default.arg if col.default is not None and col.default.is_scalar else None
+            if default is not None:
+                ddl += f" DEFAULT {_default_sql(default, col.type, conn.dialect)}"
+            logger.info("schema migration: %s", ddl)
+            conn.execute(text(ddl))
+
+
+def _dedupe_agent_memory(conn):
+    """AgentMemory used to append a row per write; keep only the latest row per
+    key so the unique index can be created on databases from before it existed."""
+    insp = inspect(conn)
+    if "agentmemory" not in insp.get_table_names():
+        return
+    if any(ix["name"] == "ux_agentmemory_key" for ix in insp.get_indexes("agentmemory")):
+        return
+    conn.execute(text(f"UPDATE agentmemory SET scope_id = {AGENT_MEMORY_NO_SCOPE_ID} WHERE scope_id IS NULL"))
+    conn.execute(text(
+        "DELETE FROM agentmemory WHERE id NOT IN "
+        "(SELECT MAX(id) FROM agentmemory GROUP BY agent_id, scope, scope_id, key)"
+    ))
+    conn.execute(text("UPDATE agentmemory SET updated_at = created_at WHERE updated_at IS NULL"))
+
+
+def _backfill_last_message_at(conn):
+    """Conversations from before the sidebar summary columns have a NULL
+    last_message_at, which Postgres sorts first in the DESC sidebar listing;
+    fall back to created_at (manage_db's summary backfill refines it)."""
+    if "conversation" not in inspect(conn).get_table_names():
+        return
+    conn.execute(text("UPDATE conversation SET last_message_at = created_at WHERE last_message_at IS NULL"))
+
+
+def _retire_legacy_agent_runs(conn):
+    """Runs created before the executor existed were left "running" forever and
+    get a NULL updated_at from the additive migration. Fail the ones with no
+    checkpoint (there is nothing to resume from) and backfill updated_at, so
+    startup never re-executes them as orphans."""
+    if "agentrun" not in inspect(conn).get_table_names():
+        return
+    conn.execute(text(
+        "UPDATE agentrun SET status = 'failed', error = 'interrupted_legacy', completed_at = started_at "
+        "WHERE status IN ('running', 'queued') AND checkpoint IS NULL AND updated_at IS NULL"
+    ))
+    conn.execute(text("UPDATE agentrun SET updated_at = started_at WHERE updated_at IS NULL"))
+
+
+def _create_missing_indexes(conn):
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=conn, checkfirst=True)
+
+
 def init_db():
+    from .chat.search import ensure_search_index
+    from .tags import backfill_tags
+
     SQLModel.metadata.create_all(engine)
+    with engine.begin() as conn:
+        _add_missing_columns(conn)
+        _dedupe_agent_memory(conn)
+        _backfill_last_message_at(conn)
+        _retire_legacy_agent_runs(conn)
+        _create_missing_indexes(conn)
+        ensure_search_index(conn)
+    backfill_tags(only_missing=True)
@@ -15,6 +15,7 @@ class Agent(Document):
     status: str = Field(default="idle", description="Agent status: idle, running, paused, stopped, error")
     memory_scope: str = Field(default="conversation", description="Memory scope: conversation, project, global")
     public: bool = Field(default=False, description="Whether the agent is publicly accessible")
+    external_id: Optional[str] = Field(None, description="ID of this agent in the SQL store, set by sync-agents")
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     
@@ -23,6 +24,8 @@ class Agent(Document):
         indexes = [
             "owner_id",  # Single field index on owner_id
             [("owner_id", 1), ("name", 1)],  # Compound index on owner + name
+            [("owner_id", 1), ("_id", 1)],  # Cursor pagination of an owner's agents
+            "external_id",  # Lookup of agents copied from the SQL store
         ]
     
     class Config:
@@ -1,95 +1,51 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session
+from ..auth.firebase import admin_required
 from ..models import engine, Tool
+from ..scheduler import scheduler
+from ..tools import catalog as tool_catalog
 import json
+from typing import Optional
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
 
 @router.post("/seed/tools")
-def seed_tools():
-    """Seed initial tool definitions"""
-    tools_data = [
-        # Web & Research
-        {"name": "Web Search", "category": "web", "description": "Search the web and return relevant results with citations", "enabled": True},
-        {"name": "Web Summarizer", "category": "web", "description": "Summarize web pages and articles", "enabled": True},
-        {"name": "Credibility Checker", "category": "web", "description": "Check credibility of sources and detect bias", "enabled": True},
-        {"name": "Fact Checker", "category": "web", "description": "Fact-check claims using authoritative sources", "enabled": True},
-        
-        # Finance & Markets
-        {"name": "Stock Analyzer", "category": "finance", "description": "Analyze stock performance and provide insights", "enabled": True},
-        {"name": "Earnings Reporter", "category": "finance", "description": "Summarize and analyze earnings reports", "enabled": True},
-        {"name": "Portfolio Analyzer", "category": "finance", "description": "Analyze portfolio risk and optimization", "enabled": True},
-        {"name": "Macro Simulator", "category": "finance", "description": "Simulate macroeconomic scenarios", "enabled": True},
-        
-        # Crypto
-        {"name": "Crypto Risk Scanner", "category": "crypto", "description": "Scan cryptocurrencies for scams and risks", "enabled": True},
-        {"name": "DeFi Analyzer", "category": "crypto", "description": "Analyze DeFi protocols and opportunities", "enabled": True},
-        
-        # Health & Wellness
-        {"name": "Wellness Tracker", "category": "health", "description": "Track and analyze wellness metrics", "enabled": True},
-        {"name": "Nutrition Analyzer", "category": "health", "description": "Analyze nutrition and provide recommendations", "enabled": True},
-        {"name": "Fitness Planner", "category": "health", "description": "Create personalized fitness plans", "enabled": True},
-        {"name": "Longevity Optimizer", "category": "health", "description": "Analyze and optimize longevity factors", "enabled": True},
-        
-        # Education & Learning
-        {"name": "Learning Gap Detector", "category": "education", "description": "Detect learning gaps and provide roadmaps", "enabled": True},
-        {"name": "Study Assistant", "category": "education", "description": "Help with studying and comprehension", "enabled": True},
-        {"name": "Research Simplifier", "category": "education", "description": "Simplify research papers and academic content", "enabled": True},
-        
-        # Career
-        {"name": "Resume Analyzer", "category": "career", "description": "Analyze resumes with ATS scoring", "enabled": True},
-        {"name": "Salary Calculator", "category": "career", "description": "Calculate market salary rates", "enabled": True},
-        {"name": "Career Path Planner", "category": "career", "description": "Plan career transitions and growth", "enabled": True},
-        {"name": "Interview Prep", "category": "career", "description": "Prepare for interviews", "enabled": True},
-        
-        # Business & Strategy
-        {"name": "Market Sizer", "category": "business", "description": "Calculate market size (TAM/SAM/SOM)", "enabled": True},
-        {"name": "Moat Analyzer", "category": "business", "description": "Analyze competitive moats", "enabled": True},
-        {"name": "Pricing Simulator", "category": "business", "description": "Simulate pricing strategies", "enabled": True},
-        {"name": "GTM Planner", "category": "business", "description": "Create go-to-market plans", "enabled": True},
-        {"name": "SWOT Analyzer", "category": "business", "description": "Perform SWOT analysis", "enabled": True},
-        
-        # Creativity & Media
-        {"name": "Nano Banana", "category": "creativity", "description": "Generate images with AI", "enabled": True},
-        {"name": "Veo 3.1", "category": "creativity", "description": "Generate videos with AI", "enabled": True},
-        {"name": "Content Writer", "category": "creativity", "description": "Generate creative content", "enabled": True},
-        
-        # Productivity
-        {"name": "Task Manager", "category": "productivity", "description": "Manage tasks and projects", "enabled": True},
-        {"name": "Document Generator", "category": "productivity", "description": "Generate documents from templates", "enabled": True},
-        {"name": "Workflow Automator", "category": "productivity", "description": "Automate workflows and processes", "enabled": True},
-        
-        # Intelligence & Analysis
-        {"name": "Intent Detector", "category": "intelligence", "description": "Detect user intent with confidence scoring", "enabled": True},
-        {"name": "Bias Detector", "category": "intelligence", "description": "Detect cognitive biases", "enabled": True},
-        {"name": "Decision Analyzer", "category": "intelligence", "description": "Analyze decisions for blind spots", "enabled": True},
-        {"name": "Contradiction Checker", "category": "intelligence", "description": "Detect contradictions in statements", "enabled": True},
-        
-        # Personal OS
-        {"name": "Goal Tracker", "category": "productivity", "description": "Track and decompose goals", "enabled": True},
-        {"name": "Consequence Modeler", "category": "productivity", "description": "Model long-term consequences", "enabled": True},
-        {"name": "Regret Minimizer", "category": "productivity", "description": "Apply regret minimization framework", "enabled": True},
-        {"name": "Life Simulator", "category": "productivity", "description": "Simulate life trajectories", "enabled": True},
-        
-        # Security
-        {"name": "Injection Detector", "category": "security", "description": "Detect prompt injection attempts", "enabled": True},
-        {"name": "Trust Scorer", "category": "security", "description": "Calculate session trust scores", "enabled": True},
-        {"name": "Privacy Explainer", "category": "security", "description": "Explain privacy implications", "enabled": True},
-        {"name": "Compliance Checker", "category": "security", "description": "Check regulatory compliance", "enabled": True},
-    ]
-    
+def seed_tools(force: bool = False):
+    """Sync tool definitions from backend/refdata/tools.json"""
+    result = tool_catalog.sync_catalog(force=force)
+    return {"status": "ok", "message": f"Seeded {result.inserted} tools", **result._asdict()}
+
+
+@router.post("/tools/{tool_id}/enabled")
+def set_tool_enabled(tool_id: int, body: dict, user=Depends(admin_required)):
+    """Enable or disable a tool"""
     with Session(engine) as session:
-        for tool_data in tools_data:
-            # Check if tool already exists
-            existing = session.query(Tool).filter(Tool.name == tool_data["name"]).first()
-            if not existing:
-                tool = Tool(**tool_data)
-                session.add(tool)
-        
+        tool = session.get(Tool, tool_id)
+        if not tool:
+            raise HTTPException(status_code=404, detail="Tool not found")
+        tool.enabled = bool(body.get("enabled", True))
+        session.add(tool)
         session.commit()
-    
-    return {"status": "ok", "message": f"Seeded {len(tools_data)} tools"}
+        enabled = tool.enabled
+    tool_catalog.invalidate_catalog()
+    return {"ok": True, "tool_id": tool_id, "enabled": enabled}
+
+
+@router.get("/schedules")
+def list_schedules(history: int = 20, name: Optional[str] = None, user=Depends(admin_required)):
+    """Recurring jobs with their next due time, lease holder and recent runs"""
+    history = max(0, min(history, 500))
+    runs = scheduler.history(name, history) if history else []
+    return {"schedules": scheduler.status(), "runs": [r.dict() for r in runs]}
+
+
+@router.post("/schedules/{name}/run")
+def run_schedule(name: str, user=Depends(admin_required)):
+    """Make a schedule due now; the next scheduler tick on any worker runs it"""
+    if not scheduler.trigger(name):
+        raise HTTPException(status_code=404, detail="Schedule not found")
+    return {"ok": True, "name": name}
 
 
 @router.get("/features/list")
@@ -1,43 +1,35 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header, Request
+from fastapi.responses import StreamingResponse
 from sqlmodel import Session, select
 from pydantic import BaseModel
-from typing import Optional
+from typing import Any, List, Optional, Set
 from datetime import datetime
-from ..models import engine, Agent, AgentRun, AgentMemory
+from ..models import engine, Agent, AgentRun
 from ..auth.firebase import firebase_auth_required
+from ..agents import stats as agent_stats
+from ..agents.memory_store import agent_memory
+from ..agents.executor import run_executor, ACTIVE_STATUSES
+from ..agents.events import agent_events, sse_stream
+from ..agents.repository import sql_agents, sql_view, STATUSES
+import asyncio
 import json
 
 router = APIRouter(prefix="/agents", tags=["agents"])
 
+MAX_MEMORY_BATCH = 500
+
 
 @router.get("/stats")
 def get_stats(user=Depends(firebase_auth_required)):
     """Get dashboard statistics for the current user"""
-    with Session(engine) as session:
-        # Count agents
-        agents_count = session.exec(
-            select(Agent).where(Agent.user_id == user["uid"])
-        ).all()
-        agents = len(agents_count)
-        
-        # Count runs
-        runs_count = session.exec(
-            select(AgentRun).where(AgentRun.user_id == user["uid"])
-        ).all()
-        runs = len(runs_count)
-        
-        # Get tool count from tools router (20 is default)
-        tools = 20
-        
-        # Calculate intelligence score based on activity
-        intelligence_score = min(100, 50 + (agents * 5) + (runs * 2))
-        
-        return {
-            "agents": agents,
-            "runs": runs,
-            "tools": tools,
-            "intelligence_score": intelligence_score
-        }
+    counts = agent_stats.sql_counts(user["uid"])
+    return agent_stats.build_stats(counts["agents"], counts["runs"])
+
+
+@router.get("/executor/metrics")
+def get_executor_metrics(user=Depends(firebase_auth_required)):
+    """Run throughput, queue depth and concurrency limits of this worker"""
+    return run_executor.metrics()
 
 
 class AgentCreate(BaseModel):
@@ -60,173 +52,267 @@ class AgentRunRequest(BaseModel):
 
 
 @router.post("/")
-def create_agent(body: AgentCreate, user=Depends(firebase_auth_required)):
+async def create_agent(body: AgentCreate, user=Depends(firebase_auth_required)):
     """Create a new agent"""
-    with Session(engine) as session:
-        agent = Agent(
-            user_id=user["uid"],
-            name=body.name,
-            description=body.description,
-            config=json.dumps(body.config) if body.config else None,
-            memory_scope=body.memory_scope,
-            status="idle"
-        )
-        session.add(agent)
-        session.commit()
-        session.refresh(agent)
-        return {"agent": agent.dict()}
+    doc = await sql_agents.create(user["uid"], {
+        "name": body.name,
+        "description": body.description,
+        "config": body.config or None,
+        "memory_scope": body.memory_scope,
+    })
+    agent_stats.adjust("sql", user["uid"], agents=1)
+    return {"agent": sql_view(doc)}
 
 
 @router.get("/")
-def list_agents(user=Depends(firebase_auth_required)):
+async def list_agents(user=Depends(firebase_auth_required)):
     """List all agents for the current user"""
-    with Session(engine) as session:
-        agents = session.exec(
-            select(Agent).where(Agent.user_id == user["uid"])
-        ).all()
-        return {"agents": [a.dict() for a in agents]}
+    return {"agents": [sql_view(doc) for doc in await sql_agents.list_by_owner(user["uid"])]}
 
 
 @router.get("/{agent_id}")
-def get_agent(agent_id: int, user=Depends(firebase_auth_required)):
+async def get_agent(agent_id: int, user=Depends(firebase_auth_required)):
     """Get a specific agent"""
-    with Session(engine) as session:
-        agent = session.get(Agent, agent_id)
-        if not agent or agent.user_id != user["uid"]:
-            raise HTTPException(status_code=404, detail="Agent not found")
-        return {"agent": agent.dict()}
+    return {"agent": sql_view(await sql_agents.get_owned(agent_id, user["uid"]))}
 
 
 @router.put("/{agent_id}")
-def update_agent(agent_id: int, body: AgentUpdate, user=Depends(firebase_auth_required)):
+async def update_agent(agent_id: int, body: AgentUpdate, user=Depends(firebase_auth_required)):
     """Update an agent"""
-    with Session(engine) as session:
-        agent = session.get(Agent, agent_id)
-        if not agent or agent.user_id != user["uid"]:
-            raise HTTPException(status_code=404, detail="Agent not found")
-        
-        if body.name is not None:
-            agent.name = body.name
-        if body.description is not None:
-            agent.description = body.description
-        if body.config is not None:
-            agent.config = json.dumps(body.config)
-        if body.memory_scope is not None:
-            agent.memory_scope = body.memory_scope
-        if body.status is not None:
-            if body.status not in ["idle", "running", "paused", "stopped", "error"]:
-                raise HTTPException(status_code=400, detail="Invalid status")
-            agent.status = body.status
-        
-        agent.updated_at = datetime.utcnow()
-        session.add(agent)
-        session.commit()
-        session.refresh(agent)
-        return {"agent": agent.dict()}
+    current = await sql_agents.get_owned(agent_id, user["uid"])
+    if body.status is not None and body.status not in STATUSES:
+        raise HTTPException(status_code=400, detail="Invalid status")
+
+    doc = await sql_agents.update(agent_id, user["uid"], body.dict(exclude_none=True))
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    if doc["status"] != current["status"]:
+        agent_events.publish(agent_id, "status", {"status": doc["status"]})
+    return {"agent": sql_view(doc)}
 
 
 @router.delete("/{agent_id}")
-def delete_agent(agent_id: int, user=Depends(firebase_auth_required)):
+async def delete_agent(agent_id: int, user=Depends(firebase_auth_required)):
     """Delete an agent"""
-    with Session(engine) as session:
-        agent = session.get(Agent, agent_id)
-        if not agent or agent.user_id != user["uid"]:
-            raise HTTPException(status_code=404, detail="Agent not found")
-        
-        session.delete(agent)
-        session.commit()
-        return {"ok": True}
+    if not await sql_agents.delete(agent_id, user["uid"]):
+        raise HTTPException(status_code=404, detail="Agent not found")
+    agent_stats.adjust("sql", user["uid"], agents=-1)
+    agent_events.publish(agent_id, "deleted")
+    return {"ok": True}
 
 
 @router.post("/{agent_id}/run")
-def run_agent(agent_id: int, body: AgentRunRequest, user=Depends(firebase_auth_required)):
+async def run_agent(agent_id: int, body: AgentRunRequest, user=Depends(firebase_auth_required)):
     """Start an agent run"""
-    with Session(engine) as session:
-        agent = session.get(Agent, agent_id)
-        if not agent or agent.user_id != user["uid"]:
-            raise HTTPException(status_code=404, detail="Agent not found")
-        
-        # Create a run record
-        run = AgentRun(
-            agent_id=agent_id,
-            user_id=user["uid"],
-            status="running",
-            input_data=json.dumps(body.input_data)
-        )
-        session.add(run)
-        
-        # Update agent status
-        agent.status = "running"
-        agent.updated_at = datetime.utcnow()
-        session.add(agent)
-        
-        session.commit()
-        session.refresh(run)
-        
-        return {"run": run.dict(), "message": "Agent run started"}
 
+    def create_run() -> AgentRun:
+        with Session(engine) as session:
+            agent = session.get(Agent, agent_id)
+            if not agent or agent.user_id != user["uid"]:
+                raise HTTPException(status_code=404, detail="Agent not found")
 
-@router.post("/{agent_id}/pause")
-def pause_agent(agent_id: int, user=Depends(firebase_auth_required)):
-    """Pause a running agent"""
+            # Create a run record; the executor picks it up when a slot is free
+            run = AgentRun(
+                agent_id=agent_id,
+                user_id=user["uid"],
+                status="queued",
+                input_data=json.dumps(body.input_data)
+            )
+            session.add(run)
+
+            # Update agent status
+            agent.status = "running"
+            agent.updated_at = datetime.utcnow()
+            session.add(agent)
+
+            session.commit()
+            session.refresh(run)
+            return run
+
+    # DB work runs in a thread; the executor itself lives on the event loop
+    run = await asyncio.to_thread(create_run)
+    sql_agents.invalidate(agent_id)
+    agent_stats.adjust("sql", user["uid"], runs=1)
+
+    agent_events.publish(agent_id, "run", {"run_id": run.id, "status": "queued"})
+    agent_events.publish(agent_id, "status", {"status": "running"})
+    run_executor.submit(run.id, user["uid"])
+    return {"run": run.dict(), "message": "Agent run started"}
+
+
+def _runs_with_status(session: Session, agent_id: int, statuses) -> list:
+    return session.exec(
+        select(AgentRun).where(AgentRun.agent_id == agent_id).where(AgentRun.status.in_(statuses))
+    ).all()
+
+
+def _set_runs_status(agent_id: int, uid: str, statuses, status: str, agent_status: str,
+                     held: Set[int], require_running: bool = False) -> List[int]:
+    """Move the agent and those of its runs in ``statuses`` that this worker
+    does not hold to ``status``; returns the held runs, which the executor
+    winds down itself."""
     with Session(engine) as session:
         agent = session.get(Agent, agent_id)
-        if not agent or agent.user_id != user["uid"]:
+        if not agent or agent.user_id != uid:
             raise HTTPException(status_code=404, detail="Agent not found")
-        
-        if agent.status != "running":
+        if require_running and agent.status != "running":
             raise HTTPException(status_code=400, detail="Agent is not running")
-        
-        agent.status = "paused"
-        agent.updated_at = datetime.utcnow()
+
+        in_flight = []
+        now = datetime.utcnow()
+        for run in _runs_with_status(session, agent_id, statuses):
+            if run.id in held:
+                in_flight.append(run.id)
+                continue
+            run.status = status
+            run.updated_at = now
+            if status == "stopped":
+                run.completed_at = now
+            session.add(run)
+
+        agent.status = agent_status
+        agent.updated_at = now
         session.add(agent)
         session.commit()
-        
-        return {"ok": True, "status": "paused"}
+        return in_flight
+
+
+@router.post("/{agent_id}/pause")
+async def pause_agent(agent_id: int, user=Depends(firebase_auth_required)):
+    """Pause a running agent (takes effect at the next step boundary)"""
+    in_flight = await asyncio.to_thread(
+        _set_runs_status, agent_id, user["uid"], ACTIVE_STATUSES, "paused", "paused",
+        run_executor.active_runs(), require_running=True,
+    )
+    for run_id in in_flight:
+        run_executor.pause(run_id)
+    sql_agents.invalidate(agent_id)
+
+    agent_events.publish(agent_id, "status", {"status": "paused"})
+    return {"ok": True, "status": "paused"}
+
+
+@router.post("/{agent_id}/resume")
+async def resume_agent(agent_id: int, user=Depends(firebase_auth_required)):
+    """Resume paused runs from their last checkpoint"""
+
+    def requeue() -> List[int]:
+        with Session(engine) as session:
+            agent = session.get(Agent, agent_id)
+            if not agent or agent.user_id != user["uid"]:
+                raise HTTPException(status_code=404, detail="Agent not found")
+
+            runs = _runs_with_status(session, agent_id, ("paused",))
+            if not runs:
+                raise HTTPException(status_code=400, detail="Agent has no paused runs")
+
+            for run in runs:
+                run.status = "queued"
+                run.updated_at = datetime.utcnow()
+                session.add(run)
+            agent.status = "running"
+            agent.updated_at = datetime.utcnow()
+            session.add(agent)
+            session.commit()
+            return [r.id for r in runs]
+
+    run_ids = await asyncio.to_thread(requeue)
+    sql_agents.invalidate(agent_id)
+
+    agent_events.publish(agent_id, "status", {"status": "running"})
+    for run_id in run_ids:
+        run_executor.submit(run_id, user["uid"])
+    return {"ok": True, "status": "running", "resumed": run_ids}
 
 
 @router.post("/{agent_id}/stop")
-def stop_agent(agent_id: int, user=Depends(firebase_auth_required)):
-    """Stop a running agent"""
-    with Session(engine) as session:
-        agent = session.get(Agent, agent_id)
-        if not agent or agent.user_id != user["uid"]:
-            raise HTTPException(status_code=404, detail="Agent not found")
-        
-        agent.status = "stopped"
-        agent.updated_at = datetime.utcnow()
-        session.add(agent)
-        session.commit()
-        
-        return {"ok": True, "status": "stopped"}
+async def stop_agent(agent_id: int, user=Depends(firebase_auth_required)):
+    """Stop a running agent, cancelling the step in flight"""
+    in_flight = await asyncio.to_thread(
+        _set_runs_status, agent_id, user["uid"], ACTIVE_STATUSES + ("paused",), "stopped", "stopped",
+        run_executor.active_runs(),
+    )
+    for run_id in in_flight:
+        run_executor.stop(run_id)
+    sql_agents.invalidate(agent_id)
+
+    agent_events.publish(agent_id, "status", {"status": "stopped"})
+    return {"ok": True, "status": "stopped"}
 
 
 @router.get("/{agent_id}/runs")
 def list_runs(agent_id: int, user=Depends(firebase_auth_required)):
     """List all runs for an agent"""
+    sql_agents.get_owned_sync(agent_id, user["uid"])
     with Session(engine) as session:
-        agent = session.get(Agent, agent_id)
-        if not agent or agent.user_id != user["uid"]:
-            raise HTTPException(status_code=404, detail="Agent not found")
-        
         runs = session.exec(
             select(AgentRun).where(AgentRun.agent_id == agent_id)
         ).all()
         return {"runs": [r.dict() for r in runs]}
 
 
-@router.get("/{agent_id}/memory")
-def get_agent_memory(agent_id: int, user=Depends(firebase_auth_required)):
-    """Get agent memory"""
+def _memory_scope(agent_id: int, uid: str) -> str:
+    """Default memory scope of an agent owned by ``uid`` (404 otherwise)."""
+    return sql_agents.get_owned_sync(agent_id, uid)["memory_scope"]
+
+
+def _agent_snapshot(agent_id: int) -> dict:
     with Session(engine) as session:
         agent = session.get(Agent, agent_id)
-        if not agent or agent.user_id != user["uid"]:
-            raise HTTPException(status_code=404, detail="Agent not found")
-        
-        memories = session.exec(
-            select(AgentMemory).where(AgentMemory.agent_id == agent_id)
+        runs = session.exec(
+            select(AgentRun)
+            .where(AgentRun.agent_id == agent_id)
+            .where(AgentRun.status.in_(ACTIVE_STATUSES + ("paused",)))
         ).all()
-        return {"memories": [m.dict() for m in memories]}
+        return {
+            "agent_id": agent_id,
+            "status": agent.status if agent else "deleted",
+            "runs": [{"run_id": r.id, "status": r.status, "started_at": r.started_at} for r in runs],
+        }
+
+
+@router.get("/{agent_id}/events")
+async def agent_event_stream(
+    agent_id: int,
+    request: Request,
+    last_event_id: Optional[int] = None,
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+    user=Depends(firebase_auth_required)
+):
+    """Live status changes, step logs and run outputs for an agent (SSE)"""
+    await sql_agents.get_owned(agent_id, user["uid"])
+
+    if last_event_id is None and last_event_id_header and last_event_id_header.isdigit():
+        last_event_id = int(last_event_id_header)
+    stream = sse_stream(
+        agent_events,
+        agent_id,
+        lambda: _agent_snapshot(agent_id),
+        last_event_id=last_event_id,
+        is_disconnected=request.is_disconnected,
+    )
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(stream, media_type="text/event-stream", headers=headers)
+
+
+@router.get("/{agent_id}/memory")
+def get_agent_memory(
+    agent_id: int,
+    key: Optional[str] = None,
+    scope: Optional[str] = None,
+    scope_id: Optional[int] = None,
+    user=Depends(firebase_auth_required)
+):
+    """Get agent memory, optionally a single key or a single scope"""
+    default_scope = _memory_scope(agent_id, user["uid"])
+    if key:
+        memory = agent_memory.get(agent_id, key, scope or default_scope, scope_id)
+        if memory is None:
+            raise HTTPException(status_code=404, detail="Memory key not found")
+        return {"memory": memory}
+    if scope:
+        return {"memories": agent_memory.list_scope(agent_id, scope, scope_id)}
+    return {"memories": agent_memory.list_all(agent_id)}
 
 
 @router.post("/{agent_id}/memory")
@@ -235,29 +321,52 @@ def set_agent_memory(
     body: dict,
     user=Depends(firebase_auth_required)
 ):
-    """Set agent memory"""
-    with Session(engine) as session:
-        agent = session.get(Agent, agent_id)
-        if not agent or agent.user_id != user["uid"]:
-            raise HTTPException(status_code=404, detail="Agent not found")
-        
-        key = body.get("key")
-        value = body.get("value")
-        scope = body.get("scope", agent.memory_scope)
-        scope_id = body.get("scope_id")
-        
-        if not key or not value:
+    """Set agent memory (insert or overwrite the key)"""
+    default_scope = _memory_scope(agent_id, user["uid"])
+    key = body.get("key")
+    value = body.get("value")
+    if not key or not value:
+        raise HTTPException(status_code=400, detail="key and value required")
+
+    memory = agent_memory.set(agent_id, key, value, body.get("scope") or default_scope, body.get("scope_id"))
+    return {"memory": memory}
+
+
+class MemoryBulkGet(BaseModel):
+    keys: List[str]
+    scope: Optional[str] = None
+    scope_id: Optional[int] = None
+
+
+class MemoryItem(BaseModel):
+    key: str
+    value: Any
+    scope: Optional[str] = None
+    scope_id: Optional[int] = None
+
+
+class MemoryBulkSet(BaseModel):
+    items: List[MemoryItem]
+
+
+@router.post("/{agent_id}/memory/bulk-get")
+def bulk_get_agent_memory(agent_id: int, body: MemoryBulkGet, user=Depends(firebase_auth_required)):
+    """Get several keys of one scope; missing keys map to null"""
+    if len(body.keys) > MAX_MEMORY_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_MEMORY_BATCH} keys per request")
+    default_scope = _memory_scope(agent_id, user["uid"])
+    return {"memories": agent_memory.get_many(agent_id, body.keys, body.scope or default_scope, body.scope_id)}
+
+
+@router.post("/{agent_id}/memory/bulk")
+def bulk_set_agent_memory(agent_id: int, body: MemoryBulkSet, user=Depends(firebase_auth_required)):
+    """Upsert several keys in one statement"""
+    if len(body.items) > MAX_MEMORY_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_MEMORY_BATCH} items per request")
+    default_scope = _memory_scope(agent_id, user["uid"])
+    items = []
+    for item in body.items:
+        if not item.key or item.value is None or item.value == "":
             raise HTTPException(status_code=400, detail="key and value required")
-        
-        memory = AgentMemory(
-            agent_id=agent_id,
-            scope=scope,
-            scope_id=scope_id,
-            key=key,
-            value=json.dumps(value) if isinstance(value, (dict, list)) else str(value)
-        )
-        session.add(memory)
-        session.commit()
-        session.refresh(memory)
-        
-        return {"memory": memory.dict()}
+        items.append({"key": item.key, "value": item.value, "scope": item.scope or default_scope, "scope_id": item.scope_id})
+    return {"memories": agent_memory.set_many(agent_id, items)}
@@ -2,16 +2,20 @@
 import logging
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-from typing import Optional, List
-from datetime import datetime
-from beanie import PydanticObjectId
+from typing import List, Optional
 
-from ..models_agent import Agent
 from ..auth.firebase import firebase_auth_required
+from ..agents import stats as agent_stats
+from ..agents.repository import mongo_agents, STATUSES
 
 logger = logging.getLogger("backend.routes.agents_mongo")
 router = APIRouter(prefix="/agents-mongo", tags=["agents-mongo"])
 
+MAX_PAGE_SIZE = 200
+MAX_BULK_SIZE = 500
+# fields that may be cleared with an explicit null in a PATCH
+NULLABLE_FIELDS = ("description", "config")
+
 
 class AgentCreate(BaseModel):
     name: str
@@ -30,78 +34,141 @@ class AgentUpdate(BaseModel):
     public: Optional[bool] = None
 
 
+class AgentBulkCreate(BaseModel):
+    agents: List[AgentCreate]
+
+
+class AgentBulkUpdateItem(AgentUpdate):
+    id: str
+
+
+class AgentBulkUpdate(BaseModel):
+    agents: List[AgentBulkUpdateItem]
+
+
+class AgentBulkDelete(BaseModel):
+    ids: List[str]
+
+
+def _patch_fields(body: AgentUpdate) -> dict:
+    """Fields the client actually sent; null only clears nullable fields."""
+    fields = body.dict(exclude_unset=True)
+    return {k: v for k, v in fields.items() if v is not None or k in NULLABLE_FIELDS}
+
+
+def _check_bulk_size(n: int) -> None:
+    if n > MAX_BULK_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BULK_SIZE} agents per request")
+
+
 @router.get("/stats")
 async def get_stats(user=Depends(firebase_auth_required)):
     """Get dashboard statistics for the current user."""
     try:
-        # Count agents owned by user
-        agents_count = await Agent.find(Agent.owner_id == user["uid"]).count()
-        
-        # For now, use static values for runs and tools as they may not be in MongoDB yet
-        runs = 0
-        tools = 20
-        
-        # Calculate intelligence score based on activity
-        intelligence_score = min(100, 50 + (agents_count * 5))
-        
-        return {
-            "agents": agents_count,
-            "runs": runs,
-            "tools": tools,
-            "intelligence_score": intelligence_score
-        }
+        counts = await agent_stats.mongo_counts(user["uid"])
+        return agent_stats.build_stats(counts["agents"], counts["runs"])
     except Exception as e:
         logger.exception(f"Failed to get stats: {e}")
         raise HTTPException(status_code=500, detail={"ok": False, "error": "Failed to retrieve statistics"})
 
 
+def _object_id(agent_id: str):
+    obj_id = mongo_agents.object_id(agent_id)
+    if obj_id is None:
+        raise HTTPException(status_code=400, detail="Invalid agent ID format")
+    return obj_id
+
+
 @router.post("/")
 async def create_agent(body: AgentCreate, user=Depends(firebase_auth_required)):
     """Create a new agent."""
     try:
-        agent = Agent(
-            name=body.name,
-            description=body.description,
-            owner_id=user["uid"],
-            config=body.config,
-            memory_scope=body.memory_scope,
-            public=body.public,
-            status="idle"
-        )
-        await agent.insert()
+        agent = await mongo_agents.create(user["uid"], body.dict())
+        agent_stats.adjust("mongo", user["uid"], agents=1)
         
-        return {"agent": agent.model_dump()}
+        return {"agent": agent}
     except Exception as e:
         logger.exception(f"Failed to create agent: {e}")
         raise HTTPException(status_code=500, detail={"ok": False, "error": "Failed to create agent"})
 
 
 @router.get("/")
-async def list_agents(user=Depends(firebase_auth_required)):
-    """List all agents for the current user."""
+async def list_agents(
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    fields: Optional[str] = None,
+    user=Depends(firebase_auth_required)
+):
+    """List the current user's agents, one page at a time.
+
+    Pass ``next_cursor`` from the previous page as ``cursor``; ``fields``
+    (comma-separated) limits each agent to those fields plus ``id``.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    projection = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    if cursor:
+        _object_id(cursor)
     try:
-        agents = await Agent.find(Agent.owner_id == user["uid"]).to_list()
-        return {"agents": [agent.model_dump() for agent in agents]}
+        agents, next_cursor = await mongo_agents.list_page(user["uid"], cursor=cursor, limit=limit, fields=projection)
+        return {"agents": agents, "next_cursor": next_cursor}
     except Exception as e:
         logger.exception(f"Failed to list agents: {e}")
         raise HTTPException(status_code=500, detail={"ok": False, "error": "Failed to list agents"})
 
 
+@router.post("/bulk")
+async def bulk_create_agents(body: AgentBulkCreate, user=Depends(firebase_auth_required)):
+    """Create several agents in one bulk write."""
+    _check_bulk_size(len(body.agents))
+    try:
+        agents = await mongo_agents.bulk_create(user["uid"], [a.dict() for a in body.agents])
+        agent_stats.adjust("mongo", user["uid"], agents=len(agents))
+        return {"agents": agents}
+    except Exception as e:
+        logger.exception(f"Failed to create agents: {e}")
+        raise HTTPException(status_code=500, detail={"ok": False, "error": "Failed to create agents"})
+
+
+@router.patch("/bulk")
+async def bulk_update_agents(body: AgentBulkUpdate, user=Depends(firebase_auth_required)):
+    """Partially update several agents in one bulk write (only the fields sent)."""
+    _check_bulk_size(len(body.agents))
+    updates = []
+    for item in body.agents:
+        _object_id(item.id)
+        if item.status is not None and item.status not in STATUSES:
+            raise HTTPException(status_code=400, detail="Invalid status")
+        fields = _patch_fields(item)
+        fields.pop("id", None)
+        updates.append((item.id, fields))
+    try:
+        return await mongo_agents.bulk_update(user["uid"], updates)
+    except Exception as e:
+        logger.exception(f"Failed to update agents: {e}")
+        raise HTTPException(status_code=500, detail={"ok": False, "error": "Failed to update agents"})
+
+
+@router.post("/bulk/delete")
+async def bulk_delete_agents(body: AgentBulkDelete, user=Depends(firebase_auth_required)):
+    """Delete several agents in one bulk write."""
+    _check_bulk_size(len(body.ids))
+    for agent_id in body.ids:
+        _object_id(agent_id)
+    try:
+        deleted = await mongo_agents.bulk_delete(user["uid"], body.ids)
+        agent_stats.adjust("mongo", user["uid"], agents=-deleted)
+        return {"ok": True, "deleted": deleted}
+    except Exception as e:
+        logger.exception(f"Failed to delete agents: {e}")
+        raise HTTPException(status_code=500, detail={"ok": False, "error": "Failed to delete agents"})
+
+
 @router.get("/{agent_id}")
 async def get_agent(agent_id: str, user=Depends(firebase_auth_required)):
     """Get a specific agent by ID."""
     try:
-        # Validate ObjectId format
-        try:
-            obj_id = PydanticObjectId(agent_id)
-        except Exception:
-            raise HTTPException(status_code=400, detail="Invalid agent ID format")
-        
-        agent = await Agent.get(obj_id)
-        if not agent or agent.owner_id != user["uid"]:
-            raise HTTPException(status_code=404, detail="Agent not found")
-        
-        return {"agent": agent.model_dump()}
+        _object_id(agent_id)
+        return {"agent": await mongo_agents.get_owned(agent_id, user["uid"])}
     except HTTPException:
         raise
     except Exception as e:
@@ -113,36 +180,16 @@ async def get_agent(agent_id: str, user=Depends(firebase_auth_required)):
 async def update_agent(agent_id: str, body: AgentUpdate, user=Depends(firebase_auth_required)):
     """Update an agent."""
     try:
-        # Validate ObjectId format
-        try:
-            obj_id = PydanticObjectId(agent_id)
-        except Exception:
-            raise HTTPException(status_code=400, detail="Invalid agent ID format")
+        _object_id(agent_id)
+        if body.status is not None and body.status not in STATUSES:
+            raise HTTPException(status_code=400, detail="Invalid status")
         
-        agent = await Agent.get(obj_id)
-        if not agent or agent.owner_id != user["uid"]:
+        # ownership check and write in one round trip
+        agent = await mongo_agents.update(agent_id, user["uid"], body.dict(exclude_none=True))
+        if agent is None:
             raise HTTPException(status_code=404, detail="Agent not found")
         
-        # Update fields if provided
-        if body.name is not None:
-            agent.name = body.name
-        if body.description is not None:
-            agent.description = body.description
-        if body.config is not None:
-            agent.config = body.config
-        if body.memory_scope is not None:
-            agent.memory_scope = body.memory_scope
-        if body.status is not None:
-            if body.status not in ["idle", "running", "paused", "stopped", "error"]:
-                raise HTTPException(status_code=400, detail="Invalid status")
-            agent.status = body.status
-        if body.public is not None:
-            agent.public = body.public
-        
-        agent.updated_at = datetime.utcnow()
-        await agent.save()
-        
-        return {"agent": agent.model_dump()}
+        return {"agent": agent}
     except HTTPException:
         raise
     except Exception as e:
@@ -154,17 +201,11 @@ async def update_agent(agent_id: str, body: AgentUpdate, user=Depends(firebase_a
 async def delete_agent(agent_id: str, user=Depends(firebase_auth_required)):
     """Delete an agent."""
     try:
-        # Validate ObjectId format
-        try:
-            obj_id = PydanticObjectId(agent_id)
-        except Exception:
-            raise HTTPException(status_code=400, detail="Invalid agent ID format")
-        
-        agent = await Agent.get(obj_id)
-        if not agent or agent.owner_id != user["uid"]:
+        _object_id(agent_id)
+        if not await mongo_agents.delete(agent_id, user["uid"]):
             raise HTTPException(status_code=404, detail="Agent not found")
         
-        await agent.delete()
+        agent_stats.adjust("mongo", user["uid"], agents=-1)
         return {"ok": True}
     except HTTPException:
         raise
@@ -175,6 +216,19 @@ async def delete_agent(agent_id: str, user=Depends(firebase_auth_required)):
 
 @router.patch("/{agent_id}")
 async def patch_agent(agent_id: str, body: AgentUpdate, user=Depends(firebase_auth_required)):
-    """Partially update an agent (PATCH method)."""
-    # PATCH is identical to PUT for this implementation
-    return await update_agent(agent_id, body, user)
+    """Partially update an agent (PATCH method): only the fields sent are written."""
+    try:
+        _object_id(agent_id)
+        if body.status is not None and body.status not in STATUSES:
+            raise HTTPException(status_code=400, detail="Invalid status")
+        
+        agent = await mongo_agents.update(agent_id, user["uid"], _patch_fields(body))
+        if agent is None:
+            raise HTTPException(status_code=404, detail="Agent not found")
+        
+        return {"agent": agent}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception(f"Failed to update agent: {e}")
+        raise HTTPException(status_code=500, detail={"ok": False, "error": "Failed to update agent"})
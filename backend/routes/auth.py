@@ -9,6 +9,7 @@ import jwt
 import os
 from sqlmodel import Session, select
 from ..models import engine, Account
+from ..auth.principal import principals
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
 
@@ -70,6 +71,7 @@ def register(body: RegisterRequest):
         session.add(account)
         session.commit()
         session.refresh(account)
+        principals.invalidate_account(body.email)
         
         # Create token
         token = create_access_token({
@@ -92,36 +94,33 @@ def register(body: RegisterRequest):
 @router.post("/login", response_model=AuthResponse)
 def login(body: LoginRequest):
     """Login user - simple implementation for development"""
-    with Session(engine) as session:
-        # Check if account exists
-        account = session.exec(
-            select(Account).where(Account.user_id == body.email).limit(1)
-        ).first()
-        
-        if not account:
-            raise HTTPException(status_code=401, detail="Invalid email or password")
-        
-        # Verify password - in development, use DEV_PASSWORD
-        # In production, this should verify against a password hash
-        if body.password != DEV_PASSWORD:
-            raise HTTPException(status_code=401, detail="Invalid email or password")
-        
-        # Create token
-        token = create_access_token({
+    # Check if account exists (served from the principal cache's account snapshots)
+    account = principals.account(body.email)
+    
+    if not account:
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+    
+    # Verify password - in development, use DEV_PASSWORD
+    # In production, this should verify against a password hash
+    if body.password != DEV_PASSWORD:
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+    
+    # Create token
+    token = create_access_token({
+        "uid": body.email,
+        "email": body.email,
+        "name": body.email.split("@")[0]  # Simple name from email
+    })
+    
+    return {
+        "token": token,
+        "user": {
             "uid": body.email,
             "email": body.email,
-            "name": body.email.split("@")[0]  # Simple name from email
-        })
-        
-        return {
-            "token": token,
-            "user": {
-                "uid": body.email,
-                "email": body.email,
-                "name": body.email.split("@")[0],
-                "credits": account.credits
-            }
+            "name": body.email.split("@")[0],
+            "credits": account["credits"]
         }
+    }
 
 
 @router.post("/google", response_model=AuthResponse)
@@ -154,38 +153,24 @@ def google_auth(body: GoogleAuthRequest):
         google_email = "google.user@example.com"  # Placeholder - replace with verified email
         google_name = "Google User"  # Placeholder - replace with verified name
         
-        with Session(engine) as session:
-            # Check if user exists
-            account = session.exec(
-                select(Account).where(Account.user_id == google_email).limit(1)
-            ).first()
-            
-            # Create account if it doesn't exist
-            if not account:
-                account = Account(
-                    user_id=google_email,
-                    credits=100.0,
-                    role="member"
-                )
-                session.add(account)
-                session.commit()
-                session.refresh(account)
-            
-            # Create token
-            token = create_access_token({
+        # Look up the account, creating it if it doesn't exist
+        account = principals.account(google_email, create_with={"credits": 100.0, "role": "member"})
+        
+        # Create token
+        token = create_access_token({
+            "uid": google_email,
+            "email": google_email,
+            "name": google_name
+        })
+        
+        return {
+            "token": token,
+            "user": {
                 "uid": google_email,
                 "email": google_email,
-                "name": google_name
-            })
-            
-            return {
-                "token": token,
-                "user": {
-                    "uid": google_email,
-                    "email": google_email,
-                    "name": google_name,
-                    "credits": account.credits
-                }
+                "name": google_name,
+                "credits": account["credits"]
             }
+        }
     except Exception as e:
         raise HTTPException(status_code=401, detail="Google authentication failed")
@@ -1,5 +1,12 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Iterator, List, Tuple
+
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse
 from ..auth.firebase import firebase_auth_required
 from ..models import engine
 from sqlmodel import Session, select
@@ -9,9 +16,41 @@ from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
 import datetime
 from ..observability import logger
+from ..jobs import JobFailed, job, runner as job_runner, submit as submit_job
 
 router = APIRouter(prefix="/export", tags=["export"])
 
+EXPORT_DIR = os.getenv("EXPORT_DIR", "./exports")
+EXPORT_FILE_TTL = int(os.getenv("EXPORT_FILE_TTL", "86400"))
+# messages fetched from the cursor (and encoded into one chunk) at a time
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "500"))
+
+
+def _markdown_chunks(title: str, queries, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[bytes]:
+    """Yield the Markdown export as encoded chunks, one per batch of messages.
+
+    The heading goes out before anything is fetched. Each query in
+    ``queries`` selects (role, content) rows and is read through a
+    server-side cursor ``batch_size`` rows at a time, so memory stays flat
+    however long the conversation is.
+    """
+    yield f"# {title}\n\n".encode()
+    try:
+        with engine.connect() as conn:
+            for query in queries:
+                result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+                for rows in result.partitions(batch_size):
+                    yield "".join(f"**{role}**: {content}\n\n" for role, content in rows).encode()
+    except Exception:
+        # headers are already sent; the client sees a truncated download
+        logger.exception("markdown export failed")
+        raise
+
+
+def _markdown_response(chunks: Iterator[bytes], filename: str) -> StreamingResponse:
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+    return StreamingResponse(chunks, media_type="text/markdown", headers=headers)
+
 
 @router.get("/markdown/{conv_id}")
 def export_markdown(conv_id: int, user=Depends(firebase_auth_required)):
@@ -19,52 +58,112 @@ def export_markdown(conv_id: int, user=Depends(firebase_auth_required)):
         conv = session.get(Conversation, conv_id)
         if not conv or conv.user_id != user["uid"]:
             raise HTTPException(status_code=404, detail="Not found")
+        title = conv.title or "Conversation"
+    query = (
+        select(Message.role, Message.content)
+        .where(Message.conversation_id == conv_id)
+        .order_by(Message.id)
+    )
+    return _markdown_response(_markdown_chunks(title, [query]), f"conversation-{conv_id}.md")
+
+
+def render_pdf(title: str, messages: List[Tuple[str, str]]) -> bytes:
+    """Lay out (role, content) pairs as a PDF; CPU-bound, so jobs run it in the process pool."""
+    buf = BytesIO()
+    p = canvas.Canvas(buf, pagesize=letter)
+    width, height = letter
+    y = height - 72
+    p.setFont("Helvetica-Bold", 14)
+    p.drawString(72, y, title)
+    y -= 28
+    p.setFont("Helvetica", 10)
+    for role, content in messages:
+        lines = content.split('\n')
+        for ln in lines:
+            if y < 72:
+                p.showPage()
+                y = height - 72
+            p.drawString(72, y, f"[{role}] {ln}")
+            y -= 14
+        y -= 6
+    p.showPage()
+    p.save()
+    return buf.getvalue()
+
+
+def _load_conversation(conv_id: int, user_id: str) -> Tuple[str, List[Tuple[str, str]]]:
+    with Session(engine) as session:
+        conv = session.get(Conversation, conv_id)
+        if not conv or conv.user_id != user_id:
+            raise HTTPException(status_code=404, detail="Not found")
         msgs = session.exec(select(Message).where(Message.conversation_id == conv_id)).all()
-        try:
-            md = f"# {conv.title or 'Conversation'}\n\n"
-            for m in msgs:
-                role = m.role
-                md += f"**{role}**: {m.content}\n\n"
-            headers = {"Content-Disposition": f"attachment; filename=conversation-{conv_id}.md"}
-            return StreamingResponse(BytesIO(md.encode()), media_type="text/markdown", headers=headers)
-        except Exception as e:
-            logger.exception("export_markdown failed")
-            return JSONResponse(status_code=500, content={"error": "export_failed", "message": "Failed to export markdown"})
+        return conv.title or "Conversation", [(m.role, m.content) for m in msgs]
 
 
 @router.get("/pdf/{conv_id}")
 def export_pdf(conv_id: int, user=Depends(firebase_auth_required)):
+    title, messages = _load_conversation(conv_id, user["uid"])
+    buf = BytesIO(render_pdf(title, messages))
+    try:
+        filename = f"conversation-{conv_id}-{datetime.datetime.utcnow().isoformat()}.pdf"
+        return StreamingResponse(buf, media_type="application/pdf", headers={"Content-Disposition": f"attachment; filename=\"{filename}\""})
+    except Exception:
+        logger.exception("export_pdf failed")
+        return JSONResponse(status_code=500, content={"error": "export_failed", "message": "Failed to export pdf"})
+
+
+def _prune_exports() -> None:
+    cutoff = time.time() - EXPORT_FILE_TTL
+    for entry in os.scandir(EXPORT_DIR):
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            os.remove(entry.path)
+
+
+def _store_export(data: bytes) -> str:
+    """Write a rendered export under a fresh name, dropping expired ones first."""
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    _prune_exports()
+    name = f"{uuid.uuid4().hex}.pdf"
+    with open(os.path.join(EXPORT_DIR, name), "wb") as f:
+        f.write(data)
+    return name
+
+
+@job("export.pdf", queue="exports")
+async def export_pdf_job(conv_id: int, user_id: str) -> dict:
+    try:
+        title, messages = await asyncio.to_thread(_load_conversation, conv_id, user_id)
+    except HTTPException:
+        # deleted since it was queued; retrying will not bring it back
+        raise JobFailed(f"conversation {conv_id} not found")
+    data = await job_runner.run_cpu(render_pdf, title, messages)
+    name = await asyncio.to_thread(_store_export, data)
+    return {"file": name, "filename": f"conversation-{conv_id}.pdf", "size": len(data)}
+
+
+@router.post("/pdf/{conv_id}/jobs", status_code=202)
+def export_pdf_async(conv_id: int, user=Depends(firebase_auth_required)):
+    """Render the PDF in the background; poll /jobs/{id} and fetch it from /export/files/{id}"""
     with Session(engine) as session:
         conv = session.get(Conversation, conv_id)
         if not conv or conv.user_id != user["uid"]:
             raise HTTPException(status_code=404, detail="Not found")
-        msgs = session.exec(select(Message).where(Message.conversation_id == conv_id)).all()
-        buf = BytesIO()
-        p = canvas.Canvas(buf, pagesize=letter)
-        width, height = letter
-        y = height - 72
-        p.setFont("Helvetica-Bold", 14)
-        p.drawString(72, y, conv.title or "Conversation")
-        y -= 28
-        p.setFont("Helvetica", 10)
-        for m in msgs:
-            lines = m.content.split('\n')
-            for ln in lines:
-                if y < 72:
-                    p.showPage()
-                    y = height - 72
-                p.drawString(72, y, f"[{m.role}] {ln}")
-                y -= 14
-            y -= 6
-        p.showPage()
-        p.save()
-        buf.seek(0)
-        try:
-            filename = f"conversation-{conv_id}-{datetime.datetime.utcnow().isoformat()}.pdf"
-            return StreamingResponse(buf, media_type="application/pdf", headers={"Content-Disposition": f"attachment; filename=\"{filename}\""})
-        except Exception:
-            logger.exception("export_pdf failed")
-            return JSONResponse(status_code=500, content={"error": "export_failed", "message": "Failed to export pdf"})
+    job_id = submit_job("export.pdf", conv_id, user["uid"], user_id=user["uid"])
+    return {"ok": True, "job_id": job_id}
+
+
+@router.get("/files/{job_id}")
+def download_export(job_id: int, user=Depends(firebase_auth_required)):
+    record = job_runner.get(job_id)
+    if record is None or record.user_id != user["uid"] or record.name != "export.pdf":
+        raise HTTPException(status_code=404, detail="Not found")
+    if record.status != "succeeded":
+        return JSONResponse(status_code=202, content={"ok": True, "status": record.status})
+    result = json.loads(record.result)
+    path = os.path.join(EXPORT_DIR, result["file"])
+    if not os.path.exists(path):
+        raise HTTPException(status_code=410, detail="export expired")
+    return FileResponse(path, media_type="application/pdf", filename=result["filename"])
 
 
 @router.post("/messages")
@@ -72,14 +171,17 @@ def export_selected_messages(body: dict, user=Depends(firebase_auth_required)):
     ids = body.get("message_ids")
     if not ids or not isinstance(ids, list):
         raise HTTPException(status_code=400, detail="message_ids required")
-    with Session(engine) as session:
-        try:
-            msgs = session.exec(select(Message).where(Message.id.in_(ids))).all()
-            md = "# Selected Messages\n\n"
-            for m in msgs:
-                md += f"**{m.role}**: {m.content}\n\n"
-            headers = {"Content-Disposition": f"attachment; filename=selected-messages.md"}
-            return StreamingResponse(BytesIO(md.encode()), media_type="text/markdown", headers=headers)
-        except Exception:
-            logger.exception("export_selected_messages failed")
-            return JSONResponse(status_code=500, content={"error": "export_failed", "message": "Failed to export messages"})
+    try:
+        ids = sorted({int(i) for i in ids})
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="message_ids must be integers")
+    # one query per slice of ids keeps each IN list bounded; only the caller's messages
+    queries = (
+        select(Message.role, Message.content)
+        .join(Conversation, Conversation.id == Message.conversation_id)
+        .where(Message.id.in_(ids[i:i + EXPORT_BATCH_SIZE]))
+        .where(Conversation.user_id == user["uid"])
+        .order_by(Message.id)
+        for i in range(0, len(ids), EXPORT_BATCH_SIZE)
+    )
+    return _markdown_response(_markdown_chunks("Selected Messages", queries), "selected-messages.md")
@@ -0,0 +1,43 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import JSONResponse
+
+from ..auth.firebase import firebase_auth_required
+from ..jobs import FINISHED_STATUSES, job_view, runner
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+def _owned(job_id: int, uid: str):
+    record = runner.get(job_id)
+    if record is None or record.user_id != uid:
+        raise HTTPException(status_code=404, detail="job not found")
+    return record
+
+
+@router.get("/")
+def list_jobs(limit: int = 50, user=Depends(firebase_auth_required)):
+    """The caller's most recent jobs"""
+    limit = max(1, min(limit, 200))
+    return {"jobs": [job_view(j) for j in runner.list_for_user(user["uid"], limit)]}
+
+
+@router.get("/stats")
+def job_stats(user=Depends(firebase_auth_required)):
+    """Queue depth, concurrency and outcome counters for this worker"""
+    return runner.stats()
+
+
+@router.get("/{job_id}")
+def get_job(job_id: int, user=Depends(firebase_auth_required)):
+    return {"job": job_view(_owned(job_id, user["uid"]))}
+
+
+@router.get("/{job_id}/result")
+def get_job_result(job_id: int, user=Depends(firebase_auth_required)):
+    """200 with the result once succeeded, 202 while pending, 409 if it failed"""
+    view = job_view(_owned(job_id, user["uid"]))
+    if view["status"] == "succeeded":
+        return {"ok": True, "result": view["result"]}
+    if view["status"] not in FINISHED_STATUSES:
+        return JSONResponse(status_code=202, content={"ok": True, "status": view["status"], "attempts": view["attempts"]})
+    raise HTTPException(status_code=409, detail={"ok": False, "error": f"job_{view['status']}", "message": view["error"]})
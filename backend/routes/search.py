@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from datetime import datetime
+from ..auth.firebase import firebase_auth_required
+from ..chat.search import search_messages
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+
+def _parse_date(name: str, value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be an ISO-8601 date")
+
+
+@router.get("/messages")
+def search(
+    q: str,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    tag: Optional[str] = None,
+    conv_id: Optional[int] = None,
+    limit: int = 20,
+    offset: int = 0,
+    user=Depends(firebase_auth_required),
+):
+    """Full-text search over the user's messages and conversation titles"""
+    if not q or not q.strip():
+        raise HTTPException(status_code=400, detail="q required")
+    limit = min(max(limit, 1), 100)
+    offset = max(offset, 0)
+    return search_messages(
+        user["uid"],
+        q.strip(),
+        date_from=_parse_date("date_from", date_from),
+        date_to=_parse_date("date_to", date_to),
+        tag=tag,
+        conversation_id=conv_id,
+        limit=limit,
+        offset=offset,
+    )
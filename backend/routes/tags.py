@@ -0,0 +1,61 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlmodel import Session, select
+from typing import Optional
+from ..models import engine, Conversation, Memory
+from ..auth.firebase import firebase_auth_required
+from .. import tags as tag_index
+
+router = APIRouter(prefix="/tags", tags=["tags"])
+
+
+def _parse(tags: str, mode: str):
+    if mode not in ("and", "or"):
+        raise HTTPException(status_code=400, detail="mode must be 'and' or 'or'")
+    parsed = tag_index.normalize_tags(tags.split(","))
+    if not parsed:
+        raise HTTPException(status_code=400, detail="tags required")
+    return parsed
+
+
+@router.get("/")
+def list_tag_counts(type: Optional[str] = None, user=Depends(firebase_auth_required)):
+    """Tag facet counts for the current user, optionally for one target type"""
+    if type and type not in tag_index.TARGET_TYPES:
+        raise HTTPException(status_code=400, detail="type must be 'memory' or 'conversation'")
+    with Session(engine) as session:
+        return {"tags": tag_index.tag_counts(session, user["uid"], type)}
+
+
+@router.get("/memories")
+def memories_by_tags(tags: str, mode: str = "and", user=Depends(firebase_auth_required)):
+    """List memories carrying all (mode=and) or any (mode=or) of the comma-separated tags"""
+    wanted = _parse(tags, mode)
+    with Session(engine) as session:
+        ids = tag_index.find_targets(session, user["uid"], tag_index.MEMORY, wanted, mode)
+        if not ids:
+            return {"memories": []}
+        res = session.exec(
+            select(Memory)
+            .where(Memory.id.in_(ids))
+            .where(Memory.user_id == user["uid"])
+            .where(Memory.archived == False)
+            .order_by(Memory.created_at.desc())
+        ).all()
+        return {"memories": [r.dict() for r in res]}
+
+
+@router.get("/conversations")
+def conversations_by_tags(tags: str, mode: str = "and", user=Depends(firebase_auth_required)):
+    """List conversations carrying all (mode=and) or any (mode=or) of the comma-separated tags"""
+    wanted = _parse(tags, mode)
+    with Session(engine) as session:
+        ids = tag_index.find_targets(session, user["uid"], tag_index.CONVERSATION, wanted, mode)
+        if not ids:
+            return {"conversations": []}
+        res = session.exec(
+            select(Conversation)
+            .where(Conversation.id.in_(ids))
+            .where(Conversation.user_id == user["uid"])
+            .order_by(Conversation.last_message_at.desc(), Conversation.id.desc())
+        ).all()
+        return {"conversations": [c.dict() for c in res]}
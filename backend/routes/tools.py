@@ -2,10 +2,12 @@ from fastapi import APIRouter, HTTPException, Depends
 from sqlmodel import Session, select
 from pydantic import BaseModel
 from typing import Optional, List
-from datetime import datetime
 from ..models import engine, Tool, ToolPermission, ToolUsage
 from ..auth.firebase import firebase_auth_required
-import json
+from ..tools import catalog as tool_catalog
+from ..tools.health import tool_health
+from ..tools.runtime import TOOL_MAX_CALLS, TOOL_REQUEST_TIMEOUT, ToolError, tool_runtime
+import time
 
 router = APIRouter(prefix="/tools", tags=["tools"])
 
@@ -18,34 +20,35 @@ class ToolCreate(BaseModel):
 
 
 class ToolExecuteRequest(BaseModel):
-    input_data: dict
+    input_data: Optional[dict] = None
+    parameters: Optional[dict] = None  # accepted as an alias of input_data
     dry_run: bool = False
+    timeout_ms: Optional[int] = None
+    conversation_id: Optional[int] = None
+
+
+class ToolCall(BaseModel):
+    tool_id: int
+    input_data: dict = {}
+
+
+class ToolBatchRequest(BaseModel):
+    calls: List[ToolCall]
+    dry_run: bool = False
+    timeout_ms: Optional[int] = None
+
+
+def _timeout_seconds(timeout_ms: Optional[int]) -> float:
+    if timeout_ms is None:
+        return TOOL_REQUEST_TIMEOUT
+    return max(0.001, min(timeout_ms / 1000, TOOL_REQUEST_TIMEOUT))
 
 
 @router.get("/")
 def list_tools(category: Optional[str] = None, user=Depends(firebase_auth_required)):
     """List all available tools"""
-    with Session(engine) as session:
-        query = select(Tool).where(Tool.enabled == True)
-        if category:
-            query = query.where(Tool.category == category)
-        
-        tools = session.exec(query).all()
-        
-        # Check permissions for each tool
-        tool_list = []
-        for tool in tools:
-            perm = session.exec(
-                select(ToolPermission)
-                .where(ToolPermission.user_id == user["uid"])
-                .where(ToolPermission.tool_id == tool.id)
-            ).first()
-            
-            tool_dict = tool.dict()
-            tool_dict["has_permission"] = perm.granted if perm else False
-            tool_list.append(tool_dict)
-        
-        return {"tools": tool_list}
+    # catalog and permission bitmask are cached; at most one joined query when cold
+    return {"tools": tool_catalog.list_for_user(user["uid"], category=category)}
 
 
 @router.get("/categories")
@@ -66,25 +69,34 @@ def list_categories():
     return {"categories": categories}
 
 
+@router.get("/metrics")
+def tool_metrics(user=Depends(firebase_auth_required)):
+    """Per-tool latency histograms, result cache and usage writer counters for this worker"""
+    return tool_runtime.metrics()
+
+
+@router.post("/execute")
+async def execute_tools(body: ToolBatchRequest, user=Depends(firebase_auth_required)):
+    """Execute several tool calls concurrently under one deadline"""
+    if not body.calls:
+        raise HTTPException(status_code=400, detail="calls required")
+    if len(body.calls) > TOOL_MAX_CALLS:
+        raise HTTPException(status_code=400, detail=f"at most {TOOL_MAX_CALLS} calls per request")
+    started = time.perf_counter()
+    results = await tool_runtime.call_many(
+        [c.dict() for c in body.calls], user["uid"], timeout=_timeout_seconds(body.timeout_ms), dry_run=body.dry_run
+    )
+    return {"results": results, "duration_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+
 @router.get("/{tool_id}")
 def get_tool(tool_id: int, user=Depends(firebase_auth_required)):
     """Get tool details"""
-    with Session(engine) as session:
-        tool = session.get(Tool, tool_id)
-        if not tool:
-            raise HTTPException(status_code=404, detail="Tool not found")
-        
-        # Check permission
-        perm = session.exec(
-            select(ToolPermission)
-            .where(ToolPermission.user_id == user["uid"])
-            .where(ToolPermission.tool_id == tool_id)
-        ).first()
-        
-        tool_dict = tool.dict()
-        tool_dict["has_permission"] = perm.granted if perm else False
-        
-        return {"tool": tool_dict}
+    tool_dict, allowed = tool_catalog.get_tool(tool_id, user["uid"])
+    if not tool_dict:
+        raise HTTPException(status_code=404, detail="Tool not found")
+    tool_dict["has_permission"] = allowed
+    return {"tool": tool_dict}
 
 
 @router.post("/{tool_id}/execute")
@@ -94,58 +106,19 @@ async def execute_tool(
     user=Depends(firebase_auth_required)
 ):
     """Execute a tool"""
-    with Session(engine) as session:
-        tool = session.get(Tool, tool_id)
-        if not tool or not tool.enabled:
-            raise HTTPException(status_code=404, detail="Tool not found or disabled")
-        
-        # Check permission
-        perm = session.exec(
-            select(ToolPermission)
-            .where(ToolPermission.user_id == user["uid"])
-            .where(ToolPermission.tool_id == tool_id)
-        ).first()
-        
-        if not perm or not perm.granted:
-            raise HTTPException(status_code=403, detail="Permission denied for this tool")
-        
-        # Log the usage
-        usage = ToolUsage(
-            user_id=user["uid"],
-            tool_id=tool_id,
-            status="dry_run" if body.dry_run else "success",
-            input_data=json.dumps(body.input_data)
+    deadline = time.monotonic() + _timeout_seconds(body.timeout_ms)
+    try:
+        result = await tool_runtime.call(
+            tool_id,
+            user["uid"],
+            body.input_data if body.input_data is not None else body.parameters,
+            deadline=deadline,
+            dry_run=body.dry_run,
+            conversation_id=body.conversation_id,
         )
-        
-        try:
-            # Tool execution logic would go here
-            # For now, return a simulated response
-            if body.dry_run:
-                output = {
-                    "dry_run": True,
-                    "would_execute": tool.name,
-                    "input": body.input_data
-                }
-            else:
-                output = {
-                    "tool": tool.name,
-                    "category": tool.category,
-                    "result": "Tool execution placeholder",
-                    "input": body.input_data
-                }
-            
-            usage.output_data = json.dumps(output)
-            session.add(usage)
-            session.commit()
-            
-            return {"output": output, "usage_id": usage.id}
-            
-        except Exception as e:
-            usage.status = "failed"
-            usage.error = str(e)
-            session.add(usage)
-            session.commit()
-            raise HTTPException(status_code=500, detail=f"Tool execution failed: {str(e)}")
+    except ToolError as e:
+        raise HTTPException(status_code=e.status, detail=f"Tool execution failed: {e}" if e.status >= 500 else str(e))
+    return {"output": result["output"], "usage_id": result["usage_key"], "cached": result["cached"], "duration_ms": result["duration_ms"]}
 
 
 @router.post("/{tool_id}/permissions")
@@ -175,7 +148,8 @@ def grant_permission(tool_id: int, user=Depends(firebase_auth_required)):
             session.add(perm)
         
         session.commit()
-        return {"ok": True, "granted": True}
+    tool_catalog.invalidate_permissions(user["uid"])
+    return {"ok": True, "granted": True}
 
 
 @router.delete("/{tool_id}/permissions")
@@ -192,13 +166,15 @@ def revoke_permission(tool_id: int, user=Depends(firebase_auth_required)):
             perm.granted = False
             session.add(perm)
             session.commit()
-        
-        return {"ok": True, "granted": False}
+    tool_catalog.invalidate_permissions(user["uid"])
+    return {"ok": True, "granted": False}
 
 
 @router.get("/{tool_id}/usage")
 def get_tool_usage(tool_id: int, user=Depends(firebase_auth_required)):
     """Get usage history for a tool"""
+    # include rows still buffered in this worker's usage writer
+    tool_runtime.usage.flush()
     with Session(engine) as session:
         usages = session.exec(
             select(ToolUsage)
@@ -212,6 +188,7 @@ def get_tool_usage(tool_id: int, user=Depends(firebase_auth_required)):
 @router.get("/usage/all")
 def get_all_usage(user=Depends(firebase_auth_required)):
     """Get all tool usage for the current user"""
+    tool_runtime.usage.flush()
     with Session(engine) as session:
         usages = session.exec(
             select(ToolUsage).where(ToolUsage.user_id == user["uid"])
@@ -221,22 +198,19 @@ def get_all_usage(user=Depends(firebase_auth_required)):
 
 
 @router.get("/health/status")
-def tool_health():
-    """Get health status of all tools"""
-    with Session(engine) as session:
-        tools = session.exec(select(Tool)).all()
-        
-        health_status = []
-        for tool in tools:
-            # Simulate health check
-            status = {
-                "tool_id": tool.id,
-                "name": tool.name,
-                "category": tool.category,
-                "enabled": tool.enabled,
-                "status": "healthy" if tool.enabled else "disabled",
-                "last_check": datetime.utcnow().isoformat()
-            }
-            health_status.append(status)
-        
-        return {"health": health_status}
+def tool_health_status():
+    """Health of every tool, served from the background prober's cache"""
+    health_status = []
+    for tool in tool_catalog.all_tools():
+        implementation = tool_runtime.resolve(tool).name
+        state = tool_health.get(implementation) if tool["enabled"] else {"status": "disabled"}
+        health_status.append({
+            "tool_id": tool["id"],
+            "name": tool["name"],
+            "category": tool["category"],
+            "enabled": tool["enabled"],
+            "implementation": implementation,
+            **state,
+        })
+    
+    return {"health": health_status, "checked_seconds_ago": tool_health.age_seconds()}
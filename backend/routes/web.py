@@ -1,16 +1,33 @@
 from fastapi import APIRouter, HTTPException, Depends
+from sqlalchemy import delete, update
 from sqlmodel import Session, select
 from pydantic import BaseModel
-from typing import Optional, List
-from ..models import engine, CredibilityScore, Citation
+from typing import Any, Dict, List, Optional
+from ..models import engine, CredibilityScore, Citation, NewsCoverage
 from ..auth.firebase import firebase_auth_required
 from ..ai.service import ai_service
+from ..scheduler import scheduled
+from ..search.credibility import CREDIBILITY_MAX_AGE_DAYS, assess_credibility, save_credibility
 from ..search.tavily import tavily_search
+import asyncio
 import json
+import logging
+import os
+from datetime import datetime, timedelta
 from urllib.parse import urlparse
 
+logger = logging.getLogger("backend.routes.web")
+
 router = APIRouter(prefix="/web", tags=["web"])
 
+# coverage younger than this is served without searching again
+NEWS_COVERAGE_MAX_AGE = int(os.getenv("NEWS_COVERAGE_MAX_AGE", "3600"))
+# topics requested within this window are kept warm by the refresh schedule
+NEWS_TRACK_HOURS = int(os.getenv("NEWS_TRACK_HOURS", "24"))
+NEWS_REFRESH_BATCH = int(os.getenv("NEWS_REFRESH_BATCH", "100"))
+NEWS_REFRESH_CONCURRENCY = 4
+CREDIBILITY_RESCORE_BATCH = int(os.getenv("CREDIBILITY_RESCORE_BATCH", "50"))
+
 
 class WebSummarizeRequest(BaseModel):
     url: Optional[str] = None
@@ -82,12 +99,12 @@ async def check_credibility(body: BiasCheckRequest, user=Depends(firebase_auth_r
         if not body.url and not body.text:
             raise HTTPException(status_code=400, detail="url or text required")
         
-        target = body.url or body.text[:500]
-        
         # Check domain reputation if URL provided
         domain_score = 0.5
+        fresh = None
         if body.url:
             domain = urlparse(body.url).netloc
+            cutoff = datetime.utcnow() - timedelta(days=CREDIBILITY_MAX_AGE_DAYS)
             
             # Check if we have cached credibility score
             with Session(engine) as session:
@@ -97,71 +114,69 @@ async def check_credibility(body: BiasCheckRequest, user=Depends(firebase_auth_r
                 
                 if cached:
                     domain_score = cached.score
+                if not body.text:
+                    # stale rows are re-scored by the credibility.rescore_stale schedule
+                    fresh = session.exec(
+                        select(CredibilityScore)
+                        .where(CredibilityScore.url == body.url)
+                        .where(CredibilityScore.last_checked >= cutoff)
+                    ).first()
         
-        # AI-based credibility analysis
-        prompt = f"""Assess credibility:
-
-{'URL: ' + body.url if body.url else ''}
-{'Content: ' + body.text if body.text else ''}
-
-Evaluate:
-1. Source authority (expertise, reputation)
-2. Evidence quality (citations, data)
-3. Transparency (author, funding, conflicts)
-4. Consistency (with known facts)
-5. Recency (is information current?)
-6. Bias indicators
-
-Provide:
-- Overall credibility score (0-1)
-- Confidence in assessment
-- Key factors (positive and negative)
-- Red flags if any
-- Fact-check suggestions
-
-Respond in JSON format."""
-        
-        result = await ai_service.generate(prompt=prompt, mode="think")
+        if fresh is not None:
+            return {
+                "credibility_score": fresh.score,
+                "domain_score": domain_score,
+                "analysis": json.loads(fresh.factors or "{}"),
+                "last_checked": fresh.last_checked.isoformat(),
+            }
         
-        try:
-            analysis = json.loads(result.get("output", "{}"))
-            overall_score = float(analysis.get("credibility_score", 0.5))
-        except:
-            analysis = {}
-            overall_score = 0.5
+        # AI-based credibility analysis
+        overall_score, analysis = await assess_credibility(body.url, body.text)
         
-        # Cache domain score if URL
-        if body.url:
-            domain = urlparse(body.url).netloc
-            with Session(engine) as session:
-                # Update or create credibility score
-                existing = session.exec(
-                    select(CredibilityScore).where(CredibilityScore.url == body.url)
-                ).first()
-                
-                if existing:
-                    existing.score = overall_score
-                    existing.factors = json.dumps(analysis)
-                    session.add(existing)
-                else:
-                    cred = CredibilityScore(
-                        url=body.url,
-                        domain=domain,
-                        score=overall_score,
-                        factors=json.dumps(analysis)
-                    )
-                    session.add(cred)
-                session.commit()
+        # Cache score if URL (never a neutral fallback)
+        if body.url and overall_score is not None:
+            save_credibility(body.url, overall_score, analysis)
         
         return {
-            "credibility_score": overall_score,
+            "credibility_score": overall_score if overall_score is not None else 0.5,
             "domain_score": domain_score,
             "analysis": analysis
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Credibility check failed: {str(e)}")
 
 
+@scheduled("credibility.rescore_stale", os.getenv("CREDIBILITY_RESCORE_CRON", "0 2 * * *"), jitter=300)
+async def rescore_stale_credibility(limit: int = CREDIBILITY_RESCORE_BATCH) -> int:
+    """Re-score the oldest credibility rows past CREDIBILITY_MAX_AGE_DAYS.
+
+    Rows keep their old score when the model gives no usable one, and the
+    batch stops at the first model failure; returns the number re-scored.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=CREDIBILITY_MAX_AGE_DAYS)
+    with Session(engine) as session:
+        urls = session.exec(
+            select(CredibilityScore.url)
+            .where(CredibilityScore.last_checked < cutoff)
+            .order_by(CredibilityScore.last_checked)
+            .limit(limit)
+        ).all()
+    rescored = 0
+    for url in urls:
+        try:
+            score, analysis = await assess_credibility(url, None)
+        except HTTPException as e:
+            logger.warning("credibility rescore stopped after %d of %d: %s", rescored, len(urls), e.detail)
+            break
+        if score is None:
+            continue
+        await asyncio.to_thread(save_credibility, url, score, analysis)
+        rescored += 1
+    return rescored
+
+
 @router.post("/bias/detect")
 async def detect_web_bias(body: BiasCheckRequest, user=Depends(firebase_auth_required)):
     """Detect bias in web content or sources"""
@@ -202,18 +217,101 @@ Respond in JSON format."""
         raise HTTPException(status_code=500, detail=f"Bias detection failed: {str(e)}")
 
 
+def _topic_key(topic: str) -> str:
+    return " ".join(topic.split()).lower()
+
+
+async def fetch_coverage(topic: str) -> Dict[str, Any]:
+    """Search a topic and store its coverage.
+
+    Raises HTTPException(503) when the search fails, leaving any stored
+    coverage as it was.
+    """
+    results = await tavily_search(topic)
+    if results.get("error"):
+        raise HTTPException(status_code=503, detail=f"News search unavailable: {results['error']}")
+    items = results.get("items", [])
+    coverage = {
+        "result_count": len(items),
+        "sources": items[:5]
+    }
+    await asyncio.to_thread(_store_coverage, topic, coverage)
+    return coverage
+
+
+def _store_coverage(topic: str, coverage: Dict[str, Any]) -> None:
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        row = session.get(NewsCoverage, topic) or NewsCoverage(topic=topic, requested_at=now)
+        row.result_count = coverage["result_count"]
+        row.sources = json.dumps(coverage["sources"])
+        row.fetched_at = now
+        session.add(row)
+        session.commit()
+
+
+def _cached_coverage(topics: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Fresh stored coverage for ``topics``; marks them all as requested."""
+    now = datetime.utcnow()
+    cutoff = now - timedelta(seconds=NEWS_COVERAGE_MAX_AGE)
+    with Session(engine) as session:
+        rows = session.exec(
+            select(NewsCoverage).where(NewsCoverage.topic.in_(topics))
+        ).all()
+        session.execute(
+            update(NewsCoverage).where(NewsCoverage.topic.in_(topics)).values(requested_at=now)
+        )
+        session.commit()
+        return {
+            r.topic: {"result_count": r.result_count, "sources": json.loads(r.sources or "[]")}
+            for r in rows if r.fetched_at >= cutoff
+        }
+
+
+@scheduled("news.refresh_coverage", os.getenv("NEWS_REFRESH_CRON", "*/15 * * * *"), jitter=30, misfire="skip")
+async def refresh_news_coverage(limit: int = NEWS_REFRESH_BATCH) -> int:
+    """Re-search recently requested heatmap topics so requests are served from the table."""
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        session.execute(
+            delete(NewsCoverage).where(NewsCoverage.requested_at < now - timedelta(days=7))
+        )
+        session.commit()
+        topics = session.exec(
+            select(NewsCoverage.topic)
+            .where(NewsCoverage.requested_at >= now - timedelta(hours=NEWS_TRACK_HOURS))
+            .order_by(NewsCoverage.fetched_at)
+            .limit(limit)
+        ).all()
+
+    gate = asyncio.Semaphore(NEWS_REFRESH_CONCURRENCY)
+
+    async def refresh(topic: str) -> None:
+        async with gate:
+            await fetch_coverage(topic)
+
+    results = await asyncio.gather(*(refresh(t) for t in topics), return_exceptions=True)
+    failed = [t for t, r in zip(topics, results) if isinstance(r, Exception)]
+    if failed:
+        logger.warning("news coverage refresh failed for %d of %d topics", len(failed), len(topics))
+    return len(topics) - len(failed)
+
+
 @router.post("/news/heatmap")
 async def news_heatmap(body: NewsHeatmapRequest, user=Depends(firebase_auth_required)):
     """Generate news heatmap showing coverage intensity"""
     try:
-        # Search for each topic
-        topic_results = {}
-        for topic in body.topics:
-            results = await tavily_search(topic)
-            topic_results[topic] = {
-                "result_count": len(results.get("results", [])),
-                "sources": results.get("results", [])[:5]
-            }
+        # Stored coverage first; only topics missing or stale are searched now
+        keys = {topic: _topic_key(topic) for topic in body.topics}
+        stored = await asyncio.to_thread(_cached_coverage, list(set(keys.values())))
+        missing = [k for k in dict.fromkeys(keys.values()) if k not in stored]
+        fetched = await asyncio.gather(*(fetch_coverage(k) for k in missing), return_exceptions=True)
+        for key, coverage in zip(missing, fetched):
+            if isinstance(coverage, Exception):
+                logger.warning("news coverage for %r unavailable: %s", key, coverage)
+                coverage = {"result_count": 0, "sources": [], "error": "search unavailable"}
+            stored[key] = coverage
+        topic_results = {topic: stored[key] for topic, key in keys.items()}
         
         # Analyze coverage patterns
         prompt = f"""Analyze news coverage patterns:
@@ -0,0 +1,389 @@
+"""Recurring background jobs.
+
+Functions registered with ``@scheduled(name, cron)`` run on a cron
+schedule (five fields, UTC) instead of on a request path. Each schedule is
+a row in the SchedulerLease table holding its next due time, so every
+worker agrees on when it is due. Whichever worker first moves the row's
+``next_run_at`` forward with a conditional UPDATE holds the lease and runs
+that occurrence; the others see the row already moved and skip it. A lease
+that outlives its timeout (the worker died) is released so the next
+occurrence still runs.
+
+``jitter`` spreads a schedule's start over a few seconds so jobs sharing a
+cron minute don't all hit the database and upstream APIs at once. When a
+run is found more than SCHEDULER_MISFIRE_GRACE seconds late (for example
+after downtime) the missed occurrences are counted and, depending on
+``misfire``, the schedule runs once to catch up (``"run_once"``) or waits
+for the next occurrence (``"skip"``). Every run is recorded in
+ScheduledRun for /admin/schedules.
+"""
+import asyncio
+import logging
+import os
+import random
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from sqlalchemy import delete, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, select
+
+from .models import ScheduledRun, SchedulerLease, engine
+
+logger = logging.getLogger("backend.scheduler")
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+SCHEDULER_TICK = float(os.getenv("SCHEDULER_TICK", "5"))
+SCHEDULER_MISFIRE_GRACE = float(os.getenv("SCHEDULER_MISFIRE_GRACE", "60"))
+SCHEDULER_JOB_TIMEOUT = float(os.getenv("SCHEDULER_JOB_TIMEOUT", "900"))
+SCHEDULER_HISTORY_DAYS = int(os.getenv("SCHEDULER_HISTORY_DAYS", "14"))
+
+MISFIRE_POLICIES = ("run_once", "skip")
+# stop counting missed occurrences after this many (a per-minute job down for a week)
+MAX_MISSED_COUNT = 10000
+
+
+class CronError(ValueError):
+    pass
+
+
+class CronExpression:
+    """A standard five-field cron expression: minute hour day-of-month month day-of-week.
+
+    Fields accept ``*``, numbers, ranges ``a-b``, steps ``*/n`` or ``a-b/n``
+    and comma lists. Day of week is 0-6 with Sunday as 0 (7 is accepted too).
+    As in cron, when both day fields are restricted a day matching either runs.
+    """
+
+    ALIASES = {
+        "@yearly": "0 0 1 1 *",
+        "@annually": "0 0 1 1 *",
+        "@monthly": "0 0 1 * *",
+        "@weekly": "0 0 * * 0",
+        "@daily": "0 0 * * *",
+        "@hourly": "0 * * * *",
+    }
+    BOUNDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expr: str):
+        self.expr = expr.strip()
+        fields = self.ALIASES.get(self.expr, self.expr).split()
+        if len(fields) != 5:
+            raise CronError(f"expected 5 cron fields, got {len(fields)}: {expr!r}")
+        parsed = [self._parse(f, lo, hi) for f, (lo, hi) in zip(fields, self.BOUNDS)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        self.weekdays = {d % 7 for d in weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    @staticmethod
+    def _parse(field: str, lo: int, hi: int) -> Set[int]:
+        values: Set[int] = set()
+        for part in field.split(","):
+            rng, _, step_s = part.partition("/")
+            try:
+                step = int(step_s) if step_s else 1
+                if rng == "*":
+                    start, end = lo, hi
+                elif "-" in rng:
+                    start, end = (int(x) for x in rng.split("-", 1))
+                else:
+                    start = int(rng)
+                    end = hi if step_s else start
+            except ValueError:
+                raise CronError(f"invalid cron field {field!r}") from None
+            if step < 1 or not lo <= start <= end <= hi:
+                raise CronError(f"cron field {field!r} out of range {lo}-{hi}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, t: datetime) -> bool:
+        in_month = t.day in self.days
+        in_week = t.isoweekday() % 7 in self.weekdays
+        if self.any_day and self.any_weekday:
+            return True
+        if self.any_day:
+            return in_week
+        if self.any_weekday:
+            return in_month
+        return in_month or in_week
+
+    def next_after(self, after: datetime) -> datetime:
+        """The first matching minute strictly after ``after``."""
+        t = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise CronError(f"cron expression {self.expr!r} never matches")
+
+    def __repr__(self) -> str:
+        return f"CronExpression({self.expr!r})"
+
+
+class Schedule:
+    __slots__ = ("name", "cron", "func", "jitter", "misfire", "timeout")
+
+    def __init__(self, name: str, cron: CronExpression, func: Callable, jitter: float, misfire: str, timeout: float):
+        self.name = name
+        self.cron = cron
+        self.func = func
+        self.jitter = jitter
+        self.misfire = misfire
+        self.timeout = timeout
+
+    def next_run(self, after: datetime) -> datetime:
+        due = self.cron.next_after(after)
+        if self.jitter:
+            due += timedelta(seconds=random.uniform(0, self.jitter))
+        return due
+
+
+def _default_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+class Scheduler:
+    def __init__(self, tick: float = SCHEDULER_TICK, owner: Optional[str] = None):
+        self.tick = tick
+        self.owner = owner or _default_owner()
+        self.schedules: Dict[str, Schedule] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._running: Dict[str, asyncio.Task] = {}
+
+    def register(self, name: str, cron: str, func: Callable, jitter: float = 0, misfire: str = "run_once",
+                 timeout: float = SCHEDULER_JOB_TIMEOUT) -> Schedule:
+        if misfire not in MISFIRE_POLICIES:
+            raise ValueError(f"misfire must be one of {MISFIRE_POLICIES}")
+        schedule = Schedule(name, CronExpression(cron), func, jitter, misfire, timeout)
+        self.schedules[name] = schedule
+        return schedule
+
+    def scheduled(self, name: str, cron: str, **options) -> Callable[[Callable], Callable]:
+        def decorator(func: Callable) -> Callable:
+            self.register(name, cron, func, **options)
+            return func
+        return decorator
+
+    # --- lease rows -------------------------------------------------------
+
+    def sync(self, now: Optional[datetime] = None) -> None:
+        """Create rows for new schedules and reschedule ones whose cron changed."""
+        now = now or datetime.utcnow()
+        with Session(engine) as session:
+            rows = {r.name: r for r in session.exec(select(SchedulerLease)).all()}
+            for name, schedule in self.schedules.items():
+                row = rows.get(name)
+                if row is None:
+                    session.add(SchedulerLease(name=name, cron=schedule.cron.expr, next_run_at=schedule.next_run(now)))
+                elif row.cron != schedule.cron.expr:
+                    row.cron = schedule.cron.expr
+                    row.next_run_at = schedule.next_run(now)
+                    row.updated_at = now
+                    session.add(row)
+            try:
+                session.commit()
+            except IntegrityError:
+                # another worker inserted the same rows first
+                session.rollback()
+
+    def due(self, now: datetime) -> List[SchedulerLease]:
+        with Session(engine) as session:
+            return session.exec(
+                select(SchedulerLease)
+                .where(SchedulerLease.name.in_(list(self.schedules)))
+                .where(SchedulerLease.next_run_at <= now)
+                .where(or_(SchedulerLease.lease_expires_at == None, SchedulerLease.lease_expires_at < now))  # noqa: E711
+            ).all()
+
+    def missed(self, schedule: Schedule, scheduled_for: datetime, now: datetime) -> int:
+        """Occurrences after ``scheduled_for`` that were also due by ``now``."""
+        count = 0
+        t = schedule.cron.next_after(scheduled_for)
+        while t <= now and count < MAX_MISSED_COUNT:
+            count += 1
+            t = schedule.cron.next_after(t)
+        return count
+
+    def claim(self, row: SchedulerLease, now: datetime) -> bool:
+        """Take the lease for the occurrence ``row`` describes; False if another worker got it."""
+        schedule = self.schedules[row.name]
+        with Session(engine) as session:
+            result = session.execute(
+                update(SchedulerLease)
+                .where(SchedulerLease.name == row.name)
+                .where(SchedulerLease.next_run_at == row.next_run_at)
+                .where(or_(SchedulerLease.lease_expires_at == None, SchedulerLease.lease_expires_at < now))  # noqa: E711
+                .values(
+                    owner=self.owner,
+                    lease_expires_at=now + timedelta(seconds=schedule.timeout),
+                    next_run_at=schedule.next_run(now),
+                    updated_at=now,
+                )
+            )
+            session.commit()
+        return result.rowcount == 1
+
+    def _record_start(self, name: str, scheduled_for: datetime, missed: int, status: str = "running") -> int:
+        with Session(engine) as session:
+            run = ScheduledRun(name=name, owner=self.owner, scheduled_for=scheduled_for, missed=missed, status=status)
+            if status != "running":
+                run.finished_at = run.started_at
+            session.add(run)
+            session.commit()
+            return run.id
+
+    def _record_finish(self, name: str, run_id: Optional[int], status: str, error: Optional[str] = None) -> None:
+        now = datetime.utcnow()
+        with Session(engine) as session:
+            if run_id is not None:
+                session.execute(
+                    update(ScheduledRun).where(ScheduledRun.id == run_id).values(status=status, finished_at=now, error=error)
+                )
+            session.execute(
+                update(SchedulerLease)
+                .where(SchedulerLease.name == name)
+                .where(SchedulerLease.owner == self.owner)
+                .values(lease_expires_at=None, last_run_at=now, last_status=status, updated_at=now)
+            )
+            session.commit()
+
+    # --- running ------------------------------------------------------------
+
+    async def run_pending(self, now: Optional[datetime] = None) -> List[str]:
+        """Claim and start every due schedule; returns the names started here."""
+        now = now or datetime.utcnow()
+        started = []
+        for row in await asyncio.to_thread(self.due, now):
+            if row.name in self._running:
+                continue
+            if not await asyncio.to_thread(self.claim, row, now):
+                continue
+            schedule = self.schedules[row.name]
+            late = (now - row.next_run_at).total_seconds() > SCHEDULER_MISFIRE_GRACE + schedule.jitter
+            missed = self.missed(schedule, row.next_run_at, now) if late else 0
+            if late and schedule.misfire == "skip":
+                logger.warning("schedule %s missed %d runs; skipping to the next one", row.name, missed + 1)
+                run_id = await asyncio.to_thread(self._record_start, row.name, row.next_run_at, missed + 1, "skipped")
+                await asyncio.to_thread(self._record_finish, row.name, run_id, "skipped")
+                continue
+            if missed:
+                logger.warning("schedule %s missed %d runs; running once to catch up", row.name, missed)
+            task = asyncio.create_task(self._run(schedule, row.next_run_at, missed))
+            self._running[row.name] = task
+            task.add_done_callback(lambda _t, name=row.name: self._running.pop(name, None))
+            started.append(row.name)
+        return started
+
+    async def _run(self, schedule: Schedule, scheduled_for: datetime, missed: int) -> None:
+        run_id = None
+        status, error = "succeeded", None
+        try:
+            run_id = await asyncio.to_thread(self._record_start, schedule.name, scheduled_for, missed)
+            if asyncio.iscoroutinefunction(schedule.func):
+                await asyncio.wait_for(schedule.func(), timeout=schedule.timeout)
+            else:
+                await asyncio.wait_for(asyncio.to_thread(schedule.func), timeout=schedule.timeout)
+        except asyncio.CancelledError:
+            status, error = "failed", "cancelled"
+            raise
+        except asyncio.TimeoutError:
+            status, error = "failed", f"timed out after {schedule.timeout:g}s"
+            logger.error("schedule %s timed out", schedule.name)
+        except Exception as e:
+            status, error = "failed", f"{type(e).__name__}: {e}"
+            logger.exception("schedule %s failed", schedule.name)
+        finally:
+            try:
+                await asyncio.shield(asyncio.to_thread(self._record_finish, schedule.name, run_id, status, error))
+            except Exception:
+                logger.exception("could not record run of %s", schedule.name)
+
+    async def _loop(self) -> None:
+        await asyncio.to_thread(self.sync)
+        while True:
+            try:
+                await self.run_pending()
+            except Exception:
+                logger.exception("scheduler tick failed")
+            await asyncio.sleep(self.tick)
+
+    def start(self) -> Optional[asyncio.Task]:
+        if not SCHEDULER_ENABLED or not self.schedules:
+            return None
+        self._task = asyncio.create_task(self._loop())
+        return self._task
+
+    async def stop(self) -> None:
+        """Stop ticking and cancel runs in progress; their leases are released."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        running = list(self._running.values())
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+    # --- admin --------------------------------------------------------------
+
+    def trigger(self, name: str) -> bool:
+        """Make a schedule due now; the next tick on any worker runs it."""
+        if name not in self.schedules:
+            return False
+        self.sync()
+        now = datetime.utcnow()
+        with Session(engine) as session:
+            session.execute(
+                update(SchedulerLease).where(SchedulerLease.name == name).values(next_run_at=now, updated_at=now)
+            )
+            session.commit()
+        return True
+
+    def status(self) -> List[Dict[str, Any]]:
+        with Session(engine) as session:
+            rows = {r.name: r for r in session.exec(select(SchedulerLease)).all()}
+        now = datetime.utcnow()
+        out = []
+        for name, schedule in sorted(self.schedules.items()):
+            row = rows.get(name)
+            leased = bool(row and row.lease_expires_at and row.lease_expires_at > now)
+            out.append({
+                "name": name,
+                "cron": schedule.cron.expr,
+                "jitter": schedule.jitter,
+                "misfire": schedule.misfire,
+                "next_run_at": row.next_run_at.isoformat() if row else None,
+                "last_run_at": row.last_run_at.isoformat() if row and row.last_run_at else None,
+                "last_status": row.last_status if row else None,
+                "running_on": row.owner if leased else None,
+            })
+        return out
+
+    def history(self, name: Optional[str] = None, limit: int = 50) -> List[ScheduledRun]:
+        with Session(engine) as session:
+            query = select(ScheduledRun)
+            if name:
+                query = query.where(ScheduledRun.name == name)
+            return session.exec(query.order_by(ScheduledRun.started_at.desc(), ScheduledRun.id.desc()).limit(limit)).all()
+
+    def prune_history(self, older_than_days: int = SCHEDULER_HISTORY_DAYS) -> int:
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+        with Session(engine) as session:
+            result = session.execute(delete(ScheduledRun).where(ScheduledRun.started_at < cutoff))
+            session.commit()
+        return result.rowcount
+
+
+scheduler = Scheduler()
+scheduled = scheduler.scheduled
@@ -0,0 +1,80 @@
+"""Model-based credibility scoring of web sources.
+
+Shared by the /web/credibility routes, their re-score schedule and the
+Credibility Checker tool. Scores are stored per URL in CredibilityScore and
+treated as fresh for CREDIBILITY_MAX_AGE_DAYS.
+"""
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from fastapi import HTTPException
+from sqlmodel import Session, select
+
+from ..ai.service import ai_service
+from ..models import engine, CredibilityScore
+
+CREDIBILITY_MAX_AGE_DAYS = int(os.getenv("CREDIBILITY_MAX_AGE_DAYS", "30"))
+
+
+async def assess_credibility(url: Optional[str], text: Optional[str]) -> Tuple[Optional[float], Dict[str, Any]]:
+    """Model-based credibility assessment; returns ``(score, analysis)``.
+
+    Raises HTTPException(503) when the model call fails. ``score`` is None
+    when the reply has no usable score; callers must not store that.
+    """
+    prompt = f"""Assess credibility:
+
+{'URL: ' + url if url else ''}
+{'Content: ' + text if text else ''}
+
+Evaluate:
+1. Source authority (expertise, reputation)
+2. Evidence quality (citations, data)
+3. Transparency (author, funding, conflicts)
+4. Consistency (with known facts)
+5. Recency (is information current?)
+6. Bias indicators
+
+Provide:
+- Overall credibility score (0-1)
+- Confidence in assessment
+- Key factors (positive and negative)
+- Red flags if any
+- Fact-check suggestions
+
+Respond in JSON format."""
+
+    result = await ai_service.generate(prompt=prompt, mode="think")
+    if result.get("status") == "error":
+        raise HTTPException(status_code=503, detail=f"Credibility model unavailable: {result.get('error') or result.get('output')}")
+
+    try:
+        analysis = json.loads(result.get("output", "{}"))
+        score = float(analysis["credibility_score"])
+    except (TypeError, ValueError, AttributeError, KeyError):
+        return None, {}
+    return score, analysis
+
+
+def save_credibility(url: str, score: float, analysis: Dict[str, Any]) -> None:
+    with Session(engine) as session:
+        existing = session.exec(
+            select(CredibilityScore).where(CredibilityScore.url == url)
+        ).first()
+
+        if existing:
+            existing.score = score
+            existing.factors = json.dumps(analysis)
+            existing.last_checked = datetime.utcnow()
+            session.add(existing)
+        else:
+            session.add(CredibilityScore(
+                url=url,
+                domain=urlparse(url).netloc,
+                score=score,
+                factors=json.dumps(analysis)
+            ))
+        session.commit()
@@ -0,0 +1,142 @@
+"""Normalized tag index for memories and conversations.
+
+The comma-joined ``tags`` columns stay as the display value; Tag/TagLink
+mirror them so filtering and faceting are indexed lookups on
+(user_id, tag) and (tag_id, target_type, target_id) instead of LIKE scans.
+Writers call ``set_tags`` inside their own transaction; rows tagged before
+the index existed are picked up by ``backfill_tags`` from ``init_db``.
+"""
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from sqlalchemy import delete, exists, func
+from sqlmodel import Session, select
+
+from .models import engine, Conversation, Memory, Tag, TagLink
+
+MEMORY = "memory"
+CONVERSATION = "conversation"
+TARGET_TYPES = (MEMORY, CONVERSATION)
+MAX_TAG_LEN = 64
+
+
+def normalize_tags(tags: Optional[Iterable[str]]) -> List[str]:
+    """Trimmed, lower-cased, de-duplicated tags (order preserved)."""
+    out: List[str] = []
+    for t in tags or []:
+        if not isinstance(t, str):
+            continue
+        t = t.strip().lower()[:MAX_TAG_LEN]
+        if t and t not in out:
+            out.append(t)
+    return out
+
+
+def split_tags(tags: Optional[str]) -> List[str]:
+    return normalize_tags((tags or "").split(","))
+
+
+def _tag_ids(session: Session, user_id: str, tags: List[str], create: bool) -> Dict[str, int]:
+    if not tags:
+        return {}
+    existing = {
+        tag: tag_id
+        for tag_id, tag in session.exec(select(Tag.id, Tag.tag).where(Tag.user_id == user_id).where(Tag.tag.in_(tags))).all()
+    }
+    missing = [t for t in tags if t not in existing]
+    if create and missing:
+        new = [Tag(user_id=user_id, tag=t) for t in missing]
+        session.add_all(new)
+        session.flush()
+        existing.update({t.tag: t.id for t in new})
+    return existing
+
+
+def set_tags(session: Session, user_id: str, target_type: str, target_id: int, tags: Optional[Iterable[str]]) -> None:
+    """Replace the tag links of one target (flushes, does not commit)."""
+    tags = normalize_tags(tags)
+    wanted = set(_tag_ids(session, user_id, tags, create=True).values())
+    current = set(session.exec(
+        select(TagLink.tag_id).where(TagLink.target_type == target_type).where(TagLink.target_id == target_id)
+    ).all())
+    stale = current - wanted
+    if stale:
+        session.execute(
+            delete(TagLink)
+            .where(TagLink.target_type == target_type)
+            .where(TagLink.target_id == target_id)
+            .where(TagLink.tag_id.in_(stale))
+        )
+    session.add_all([TagLink(tag_id=tag_id, target_type=target_type, target_id=target_id) for tag_id in wanted - current])
+    session.flush()
+
+
+def clear_tags(session: Session, target_type: str, target_ids: Sequence[int]) -> None:
+    if target_ids:
+        session.execute(delete(TagLink).where(TagLink.target_type == target_type).where(TagLink.target_id.in_(list(target_ids))))
+
+
+def find_targets(session: Session, user_id: str, target_type: str, tags: Iterable[str], mode: str = "and") -> Optional[List[int]]:
+    """Ids of targets carrying all (``and``) or any (``or``) of ``tags``.
+
+    Returns None when no usable tags were given.
+    """
+    tags = normalize_tags(tags)
+    if not tags:
+        return None
+    tag_ids = list(_tag_ids(session, user_id, tags, create=False).values())
+    if mode == "and" and len(tag_ids) < len(tags):
+        return []
+    if not tag_ids:
+        return []
+    q = (
+        select(TagLink.target_id)
+        .where(TagLink.target_type == target_type)
+        .where(TagLink.tag_id.in_(tag_ids))
+        .group_by(TagLink.target_id)
+    )
+    if mode == "and":
+        q = q.having(func.count(TagLink.tag_id) == len(tag_ids))
+    return list(session.exec(q).all())
+
+
+def tag_counts(session: Session, user_id: str, target_type: Optional[str] = None) -> List[Dict]:
+    """Facet counts: [{tag, count}] for the user's tags, most used first."""
+    q = (
+        select(Tag.tag, func.count(TagLink.id))
+        .join(TagLink, TagLink.tag_id == Tag.id)
+        .where(Tag.user_id == user_id)
+        .group_by(Tag.tag)
+        .order_by(func.count(TagLink.id).desc(), Tag.tag)
+    )
+    if target_type:
+        q = q.where(TagLink.target_type == target_type)
+    return [{"tag": tag, "count": count} for tag, count in session.exec(q).all()]
+
+
+def backfill_tags(batch_size: int = 500, only_missing: bool = False) -> Dict[str, int]:
+    """Populate Tag/TagLink from the existing comma-joined tag columns.
+
+    With ``only_missing`` just the tagged rows that have no links yet are
+    indexed, which makes it cheap enough to run on every startup.
+    """
+    counts = {}
+    for model, target_type in ((Memory, MEMORY), (Conversation, CONVERSATION)):
+        done = 0
+        last_id = 0
+        with Session(engine) as session:
+            while True:
+                q = select(model).where(model.id > last_id).where(model.tags != None).where(model.tags != "").order_by(model.id).limit(batch_size)
+                if model is Memory:
+                    q = q.where(Memory.archived == False)
+                if only_missing:
+                    q = q.where(~exists().where(TagLink.target_type == target_type).where(TagLink.target_id == model.id))
+                rows = session.exec(q).all()
+                if not rows:
+                    break
+                for row in rows:
+                    set_tags(session, row.user_id, target_type, row.id, split_tags(row.tags))
+                session.commit()
+                done += len(rows)
+                last_id = rows[-1].id
+        counts[target_type] = done
+    return counts
@@ -0,0 +1,202 @@
+"""Implementations of the seeded catalog tools.
+
+Tools computed from their input alone (Portfolio Analyzer, Market Sizer)
+are marked deterministic so the runtime caches them; the rest call search
+or the model. Any seeded tool without its own implementation here runs
+through ``generic``, a model prompt built from the tool's description.
+Each implementation declares a cheap health probe: a self-test on a fixed
+input for the computed tools, a reachability or configuration check for
+the ones that depend on a service.
+"""
+import asyncio
+import json
+import math
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import httpx
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlmodel import Session, select
+
+from ..ai.service import ai_service
+from ..models import engine, CredibilityScore
+from ..search import tavily
+from ..search.credibility import CREDIBILITY_MAX_AGE_DAYS, assess_credibility, save_credibility
+from ..search.tavily import tavily_search
+from .runtime import GENERIC_IMPLEMENTATION, ToolError, ToolInputError, implementation
+
+MAX_HOLDINGS = 500
+
+
+def _require(input_data: Dict[str, Any], key: str) -> Any:
+    value = input_data.get(key)
+    if value in (None, ""):
+        raise ToolInputError(f"input_data.{key} is required")
+    return value
+
+
+def _number(value: Any, field: str) -> float:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ToolInputError(f"{field} must be a number") from None
+    if not math.isfinite(number):
+        raise ToolInputError(f"{field} must be finite")
+    return number
+
+
+def model_configured() -> Optional[bool]:
+    return True if ai_service.key else None
+
+
+async def search_reachable() -> Optional[bool]:
+    if not tavily.TAVILY_KEY:
+        return None
+    async with httpx.AsyncClient(timeout=5.0) as client:
+        r = await client.head(tavily.TAVILY_URL)
+    return r.status_code < 500
+
+
+def portfolio_selftest() -> bool:
+    result = portfolio_analyzer({"holdings": [{"symbol": "A", "value": 1}, {"symbol": "B", "value": 3}]}, {}, "")
+    return result["weights"] == {"B": 0.75, "A": 0.25}
+
+
+def market_selftest() -> bool:
+    result = market_sizer({"total_customers": 10, "annual_value": 10, "serviceable_share": 0.5}, {}, "")
+    return result["sam"] == 50 and math.isclose(result["som"], 5)
+
+
+def credibility_ready() -> Optional[bool]:
+    if not ai_service.key:
+        return None
+    with Session(engine) as session:
+        session.execute(text("SELECT 1"))
+    return True
+
+
+async def _model_json(prompt: str) -> Any:
+    res = await ai_service.generate(prompt=prompt, mode="think")
+    if res.get("status") == "error":
+        raise ToolError(res.get("error") or "ai_service_error", status=502)
+    output = res.get("output")
+    try:
+        return json.loads(output)
+    except (TypeError, ValueError):
+        return output
+
+
+@implementation("Web Search", timeout=20, probe=search_reachable)
+async def web_search(input_data: Dict[str, Any], tool: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+    query = str(_require(input_data, "query"))
+    limit = int(_number(input_data.get("max_results") or 5, "max_results"))
+    if limit < 1:
+        raise ToolInputError("max_results must be at least 1")
+    results = await tavily_search(query)
+    if results.get("error"):
+        raise ToolError(f"search failed: {results['error']}", status=502)
+    return {"query": query, "results": results.get("items", [])[:limit]}
+
+
+@implementation("Credibility Checker", timeout=60, probe=credibility_ready)
+async def credibility_checker(input_data: Dict[str, Any], tool: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+    url: Optional[str] = input_data.get("url")
+    text: Optional[str] = input_data.get("text")
+    if not url and not text:
+        raise ToolInputError("input_data.url or input_data.text is required")
+    if url and not text:
+        cutoff = datetime.utcnow() - timedelta(days=CREDIBILITY_MAX_AGE_DAYS)
+
+        def stored() -> Optional[CredibilityScore]:
+            with Session(engine) as session:
+                return session.exec(
+                    select(CredibilityScore)
+                    .where(CredibilityScore.url == url)
+                    .where(CredibilityScore.last_checked >= cutoff)
+                ).first()
+
+        fresh = await asyncio.to_thread(stored)
+        if fresh is not None:
+            return {"url": url, "credibility_score": fresh.score, "analysis": json.loads(fresh.factors or "{}"),
+                    "last_checked": fresh.last_checked.isoformat()}
+    try:
+        score, analysis = await assess_credibility(url, text)
+    except HTTPException as e:
+        raise ToolError(e.detail, status=e.status_code)
+    if url and score is not None:
+        await asyncio.to_thread(save_credibility, url, score, analysis)
+    return {"url": url, "credibility_score": score, "analysis": analysis}
+
+
+@implementation("Portfolio Analyzer", deterministic=True, probe=portfolio_selftest)
+def portfolio_analyzer(input_data: Dict[str, Any], tool: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+    """Weights, concentration and (given per-holding figures) expected return and volatility.
+
+    ``holdings``: ``[{"symbol", "value" or "weight", "expected_return"?, "volatility"?}]``.
+    Volatility assumes uncorrelated holdings unless ``correlation`` (one
+    coefficient for every pair) is given.
+    """
+    holdings: List[Dict[str, Any]] = _require(input_data, "holdings")
+    if not isinstance(holdings, list) or len(holdings) > MAX_HOLDINGS:
+        raise ToolInputError(f"holdings must be a list of at most {MAX_HOLDINGS} entries")
+    amounts = []
+    for i, h in enumerate(holdings):
+        if not isinstance(h, dict) or not h.get("symbol"):
+            raise ToolInputError(f"holdings[{i}].symbol is required")
+        amount = _number(h.get("value", h.get("weight")), f"holdings[{i}].value")
+        if amount < 0:
+            raise ToolInputError(f"holdings[{i}].value must not be negative")
+        amounts.append(amount)
+    total = sum(amounts)
+    if total <= 0:
+        raise ToolInputError("holdings must have a positive total value")
+
+    weights = [a / total for a in amounts]
+    hhi = sum(w * w for w in weights)
+    ranked = sorted(zip(holdings, weights), key=lambda hw: hw[1], reverse=True)
+    result: Dict[str, Any] = {
+        "total_value": total,
+        "weights": {h["symbol"]: round(w, 6) for h, w in ranked},
+        "largest_position": {"symbol": ranked[0][0]["symbol"], "weight": round(ranked[0][1], 6)},
+        "herfindahl_index": round(hhi, 6),
+        "effective_holdings": round(1 / hhi, 2),
+        "diversification": "low" if hhi > 0.25 else "moderate" if hhi > 0.1 else "high",
+    }
+    if all("expected_return" in h for h in holdings):
+        returns = [_number(h["expected_return"], "expected_return") for h in holdings]
+        result["expected_return"] = round(sum(w * r for w, r in zip(weights, returns)), 6)
+    if all("volatility" in h for h in holdings):
+        vols = [_number(h["volatility"], "volatility") for h in holdings]
+        rho = _number(input_data.get("correlation", 0), "correlation")
+        if not -1 <= rho <= 1:
+            raise ToolInputError("correlation must be between -1 and 1")
+        weighted = [w * v for w, v in zip(weights, vols)]
+        variance = sum(x * x for x in weighted) + rho * (sum(weighted) ** 2 - sum(x * x for x in weighted))
+        result["volatility"] = round(math.sqrt(max(variance, 0.0)), 6)
+    return result
+
+
+@implementation("Market Sizer", deterministic=True, probe=market_selftest)
+def market_sizer(input_data: Dict[str, Any], tool: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+    """TAM/SAM/SOM from customer count, annual value per customer and the two shares."""
+    customers = _number(_require(input_data, "total_customers"), "total_customers")
+    value = _number(_require(input_data, "annual_value"), "annual_value")
+    serviceable = _number(input_data.get("serviceable_share", 1), "serviceable_share")
+    obtainable = _number(input_data.get("obtainable_share", 0.1), "obtainable_share")
+    if customers < 0 or value < 0 or not 0 <= serviceable <= 1 or not 0 <= obtainable <= 1:
+        raise ToolInputError("counts must be non-negative and shares between 0 and 1")
+    tam = customers * value
+    sam = tam * serviceable
+    return {"tam": tam, "sam": sam, "som": sam * obtainable}
+
+
+@implementation(GENERIC_IMPLEMENTATION, timeout=90, probe=model_configured)
+async def generic(input_data: Dict[str, Any], tool: Dict[str, Any], user_id: str) -> Any:
+    prompt = f"""You are the "{tool['name']}" tool ({tool['category']}): {tool.get('description') or ''}
+
+Input:
+{json.dumps(input_data, indent=2, default=str)}
+
+Respond in JSON format."""
+    return await _model_json(prompt)
@@ -0,0 +1,157 @@
+"""In-memory tool catalog and per-user permission cache.
+
+The Tool table changes only on seed or enable/disable, so the whole catalog
+is held in memory and invalidated explicitly (with a TTL as a cross-worker
+safety net). Each user's granted tools are cached as an int bitmask keyed by
+tool id and invalidated on grant/revoke. A catalog request therefore costs
+zero queries when warm and at most one (joined) query when cold.
+"""
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_
+from sqlmodel import Session, select
+
+from ..models import engine, Tool, ToolPermission
+from ..utils import refdata
+from ..utils.cache import LRUCache
+
+TOOL_CATALOG_TTL = int(os.getenv("TOOL_CATALOG_TTL", "300"))
+TOOL_PERMISSION_TTL = int(os.getenv("TOOL_PERMISSION_TTL", "60"))
+
+_lock = threading.Lock()
+_catalog: Optional[Dict[int, dict]] = None
+_catalog_loaded_at = 0.0
+_generation = 0
+
+# uid -> bitmask of granted tool ids
+_PERMISSIONS = LRUCache(maxsize=int(os.getenv("TOOL_PERMISSION_CACHE_SIZE", "10000")), ttl=TOOL_PERMISSION_TTL)
+# uid -> number of grant/revoke invalidations, so a load that raced one is not cached
+_permission_generations: Dict[str, int] = {}
+
+
+def invalidate_catalog() -> None:
+    """Drop the cached catalog; call after seeding or enabling/disabling tools."""
+    global _catalog, _generation
+    with _lock:
+        _catalog = None
+        _generation += 1
+
+
+def sync_catalog(force: bool = False) -> refdata.SyncResult:
+    """Upsert the Tool table from refdata/tools.json; a no-op when the file is unchanged."""
+    result = refdata.sync("tools", Tool, force=force)
+    if result.inserted or result.updated:
+        invalidate_catalog()
+    return result
+
+
+def invalidate_permissions(uid: str) -> None:
+    """Drop a user's cached permission set; call after grant/revoke."""
+    with _lock:
+        _permission_generations[uid] = _permission_generations.get(uid, 0) + 1
+        _PERMISSIONS.pop(uid)
+
+
+def _cached_catalog() -> Optional[Dict[int, dict]]:
+    with _lock:
+        if _catalog is not None and time.time() - _catalog_loaded_at < TOOL_CATALOG_TTL:
+            return _catalog
+    return None
+
+
+def _store_catalog(tools: List[Tool], generation: int) -> Dict[int, dict]:
+    global _catalog, _catalog_loaded_at
+    catalog = {t.id: t.dict() for t in tools}
+    with _lock:
+        # an invalidation raced with this load; serve it but don't cache it
+        if generation == _generation:
+            _catalog = catalog
+            _catalog_loaded_at = time.time()
+    return catalog
+
+
+def _store_mask(uid: str, mask: int, generation: int) -> None:
+    with _lock:
+        # a grant/revoke raced with this load; serve the mask but don't cache it
+        if _permission_generations.get(uid, 0) == generation:
+            _PERMISSIONS.set(uid, mask)
+
+
+def _mask(tool_ids) -> int:
+    mask = 0
+    for tool_id in tool_ids:
+        mask |= 1 << tool_id
+    return mask
+
+
+def load(uid: Optional[str] = None) -> Tuple[Dict[int, dict], int]:
+    """Return ``(catalog, permission_mask)`` using at most one query."""
+    catalog = _cached_catalog()
+    mask = _PERMISSIONS.get(uid) if uid else 0
+    if catalog is not None and mask is not None:
+        return catalog, mask
+
+    generation = _generation
+    permission_generation = _permission_generations.get(uid, 0) if uid else 0
+    with Session(engine) as session:
+        if catalog is None and uid and mask is None:
+            rows = session.exec(
+                select(Tool, ToolPermission.granted).outerjoin(
+                    ToolPermission,
+                    and_(ToolPermission.tool_id == Tool.id, ToolPermission.user_id == uid, ToolPermission.granted == True),
+                ).order_by(Tool.id)
+            ).all()
+            tools = {}
+            granted = set()
+            for tool, perm_granted in rows:
+                tools[tool.id] = tool
+                if perm_granted:
+                    granted.add(tool.id)
+            catalog = _store_catalog(list(tools.values()), generation)
+            mask = _mask(granted)
+        elif catalog is None:
+            catalog = _store_catalog(session.exec(select(Tool).order_by(Tool.id)).all(), generation)
+        else:
+            mask = _mask(session.exec(
+                select(ToolPermission.tool_id)
+                .where(ToolPermission.user_id == uid)
+                .where(ToolPermission.granted == True)
+            ).all())
+    if uid:
+        _store_mask(uid, mask, permission_generation)
+    return catalog, mask or 0
+
+
+def has_permission(mask: int, tool_id: int) -> bool:
+    return bool(mask >> tool_id & 1)
+
+
+def get_tool(tool_id: int, uid: Optional[str] = None) -> Tuple[Optional[dict], bool]:
+    """Return ``(tool_dict_copy, has_permission)``; the tool is None if unknown."""
+    catalog, mask = load(uid)
+    tool = catalog.get(tool_id)
+    if tool is None:
+        return None, False
+    return dict(tool), has_permission(mask, tool_id)
+
+
+def list_for_user(uid: str, category: Optional[str] = None, enabled_only: bool = True) -> List[dict]:
+    catalog, mask = load(uid)
+    out = []
+    for tool_id, tool in catalog.items():
+        if enabled_only and not tool.get("enabled"):
+            continue
+        if category and tool.get("category") != category:
+            continue
+        tool_dict = dict(tool)
+        tool_dict["has_permission"] = has_permission(mask, tool_id)
+        out.append(tool_dict)
+    return out
+
+
+def all_tools() -> List[dict]:
+    catalog, _ = load()
+    return [dict(t) for t in catalog.values()]
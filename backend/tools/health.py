@@ -0,0 +1,117 @@
+"""Active health checks for tool implementations.
+
+Implementations declare a cheap probe with ``@implementation(..., probe=...)``.
+A background task runs every probe concurrently every TOOL_HEALTH_INTERVAL
+seconds, each under TOOL_HEALTH_TIMEOUT, and keeps per-implementation
+status, latency, last success and error streak in memory. /tools/health/status
+reads that cache, and the runtime fails fast on implementations marked down
+instead of letting calls run into their timeout.
+
+A probe returns True (working), False (failing) or None (not configured).
+One failure marks an implementation degraded; TOOL_HEALTH_DOWN_AFTER
+consecutive failures mark it down until a probe succeeds again.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+
+logger = logging.getLogger("backend.tools.health")
+
+TOOL_HEALTH_INTERVAL = float(os.getenv("TOOL_HEALTH_INTERVAL", "30"))
+TOOL_HEALTH_TIMEOUT = float(os.getenv("TOOL_HEALTH_TIMEOUT", "5"))
+TOOL_HEALTH_DOWN_AFTER = int(os.getenv("TOOL_HEALTH_DOWN_AFTER", "2"))
+TOOL_HEALTH_SLOW_MS = float(os.getenv("TOOL_HEALTH_SLOW_MS", "2000"))
+
+Probe = Callable[[], Union[Optional[bool], Awaitable[Optional[bool]]]]
+
+# statuses the runtime routes around
+UNAVAILABLE_STATUSES = ("down", "unconfigured")
+
+UNKNOWN = {"status": "unknown", "latency_ms": None, "error": None, "error_streak": 0, "last_success": None, "last_checked": None}
+
+
+class ToolHealth:
+    def __init__(self, interval: float = TOOL_HEALTH_INTERVAL, timeout: float = TOOL_HEALTH_TIMEOUT,
+                 down_after: int = TOOL_HEALTH_DOWN_AFTER, slow_ms: float = TOOL_HEALTH_SLOW_MS):
+        self.interval = interval
+        self.timeout = timeout
+        self.down_after = down_after
+        self.slow_ms = slow_ms
+        self.probes: Dict[str, Probe] = {}
+        self._state: Dict[str, Dict[str, Any]] = {}
+        self._probed_at = 0.0
+
+    def register(self, name: str, probe: Probe) -> None:
+        self.probes[name] = probe
+
+    async def _check(self, probe: Probe) -> Optional[bool]:
+        if asyncio.iscoroutinefunction(probe):
+            return await probe()
+        return await asyncio.to_thread(probe)
+
+    async def _run_probe(self, name: str, probe: Probe) -> Dict[str, Any]:
+        previous = self._state.get(name, UNKNOWN)
+        start = time.perf_counter()
+        error = None
+        try:
+            ok = await asyncio.wait_for(self._check(probe), self.timeout)
+        except asyncio.TimeoutError:
+            ok, error = False, f"probe timed out after {self.timeout:g}s"
+        except Exception as e:
+            ok, error = False, f"{type(e).__name__}: {e}"
+        latency_ms = round((time.perf_counter() - start) * 1000, 2)
+        now = datetime.utcnow().isoformat()
+
+        streak = 0 if ok or ok is None else previous["error_streak"] + 1
+        if ok is None:
+            status = "unconfigured"
+        elif ok:
+            status = "degraded" if latency_ms > self.slow_ms else "healthy"
+        else:
+            error = error or "probe failed"
+            status = "down" if streak >= self.down_after else "degraded"
+        if previous["status"] != status and previous["status"] != "unknown":
+            logger.warning("tool health: %s changed %s -> %s%s", name, previous["status"], status, f" ({error})" if error else "")
+        return {
+            "status": status,
+            "latency_ms": latency_ms if ok else None,
+            "error": error,
+            "error_streak": streak,
+            "last_success": now if ok else previous["last_success"],
+            "last_checked": now,
+        }
+
+    async def probe_all(self) -> Dict[str, Dict[str, Any]]:
+        probes = dict(self.probes)
+        results = await asyncio.gather(*(self._run_probe(name, probe) for name, probe in probes.items()))
+        self._state = {**self._state, **dict(zip(probes, results))}
+        self._probed_at = time.monotonic()
+        return self._state
+
+    def get(self, name: str) -> Dict[str, Any]:
+        return self._state.get(name, UNKNOWN)
+
+    def is_down(self, name: str) -> bool:
+        return self._state.get(name, UNKNOWN)["status"] in UNAVAILABLE_STATUSES
+
+    def age_seconds(self) -> Optional[float]:
+        return round(time.monotonic() - self._probed_at, 3) if self._probed_at else None
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.probe_all()
+            except Exception:
+                logger.exception("tool health probe round failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> Optional[asyncio.Task]:
+        if self.interval <= 0:
+            return None
+        return asyncio.create_task(self._loop())
+
+
+tool_health = ToolHealth()
@@ -0,0 +1,354 @@
+"""Tool runtime: executes catalog tools.
+
+Implementations are registered by tool name with ``@implementation(name)``
+(see ``builtin``); a Tool row may point at another implementation with
+``config = {"implementation": "<name>"}``, and tools without one fall back
+to a model-backed generic implementation. Every call runs under a deadline,
+``call_many`` runs several calls of one request concurrently, and results
+of deterministic tools are cached by a hash of tool and input, with
+concurrent identical calls sharing one execution. Usage rows go through a
+batched writer instead of one insert per call (each call returns the
+row's ``usage_key`` since its id is not known yet), and per-tool latency
+histograms are kept for /tools/metrics. Implementations marked down by
+their health probe (see ``health``) are failed fast with a 503.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlmodel import Session
+
+from ..models import engine, ToolUsage
+from ..utils.cache import LRUCache
+from . import catalog as tool_catalog
+from .health import Probe, ToolHealth, tool_health
+
+logger = logging.getLogger("backend.tools.runtime")
+
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "30"))
+TOOL_REQUEST_TIMEOUT = float(os.getenv("TOOL_REQUEST_TIMEOUT", "60"))
+TOOL_MAX_PARALLEL = int(os.getenv("TOOL_MAX_PARALLEL", "8"))
+TOOL_MAX_CALLS = int(os.getenv("TOOL_MAX_CALLS", "20"))
+TOOL_CACHE_TTL = int(os.getenv("TOOL_CACHE_TTL", "3600"))
+TOOL_USAGE_BATCH = int(os.getenv("TOOL_USAGE_BATCH", "100"))
+TOOL_USAGE_FLUSH_INTERVAL = float(os.getenv("TOOL_USAGE_FLUSH_INTERVAL", "2"))
+TOOL_USAGE_MAX_PENDING = int(os.getenv("TOOL_USAGE_MAX_PENDING", "10000"))
+
+GENERIC_IMPLEMENTATION = "generic"
+
+# upper bounds in milliseconds; the last bucket is unbounded
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class ToolError(Exception):
+    """A tool call that could not produce a result; ``status`` is the HTTP status to report."""
+
+    def __init__(self, message: str, status: int = 500):
+        super().__init__(message)
+        self.status = status
+
+
+class ToolInputError(ToolError):
+    def __init__(self, message: str):
+        super().__init__(message, status=400)
+
+
+class ToolSpec:
+    __slots__ = ("name", "func", "deterministic", "timeout", "cache_ttl")
+
+    def __init__(self, name: str, func: Callable, deterministic: bool, timeout: float, cache_ttl: int):
+        self.name = name
+        self.func = func
+        self.deterministic = deterministic
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+
+
+_IMPLEMENTATIONS: Dict[str, ToolSpec] = {}
+
+
+def implementation(name: str, deterministic: bool = False, timeout: float = TOOL_TIMEOUT, cache_ttl: int = TOOL_CACHE_TTL,
+                   probe: Optional[Probe] = None):
+    """Register ``func(input_data, tool, user_id)`` as the implementation of tool ``name``.
+
+    Only deterministic implementations (same input, same output) are cached.
+    ``probe`` is a cheap health check run in the background.
+    """
+    def decorator(func: Callable) -> Callable:
+        _IMPLEMENTATIONS[name] = ToolSpec(name, func, deterministic, timeout, cache_ttl)
+        if probe is not None:
+            tool_health.register(name, probe)
+        return func
+    return decorator
+
+
+def input_hash(name: str, input_data: Any) -> str:
+    canonical = json.dumps(input_data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(f"{name}\n{canonical}".encode()).hexdigest()
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram with outcome counters."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.outcomes: Dict[str, int] = {}
+
+    def observe(self, ms: float, outcome: str) -> None:
+        i = 0
+        while i < len(self.buckets) and ms > self.buckets[i]:
+            i += 1
+        self.counts[i] += 1
+        self.total += 1
+        self.sum_ms += ms
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation (None past the last bound)."""
+        if not self.total:
+            return None
+        rank = q * self.total
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.buckets[i] if i < len(self.buckets) else None
+        return None
+
+    def snapshot(self) -> Dict[str, Any]:
+        labels = [f"le_{b}" for b in self.buckets] + ["inf"]
+        return {
+            "count": self.total,
+            "mean_ms": round(self.sum_ms / self.total, 1) if self.total else None,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "buckets": dict(zip(labels, self.counts)),
+            "outcomes": dict(self.outcomes),
+        }
+
+
+class UsageWriter:
+    """Buffers ToolUsage rows and inserts them in batches."""
+
+    def __init__(self, batch_size: int = TOOL_USAGE_BATCH, interval: float = TOOL_USAGE_FLUSH_INTERVAL,
+                 max_pending: int = TOOL_USAGE_MAX_PENDING):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.dropped = 0
+
+    def record(self, **fields) -> None:
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self._pending.pop(0)
+                self.dropped += 1
+            self._pending.append(fields)
+            full = len(self._pending) >= self.batch_size
+        if full and self._wake is not None:
+            self._wake.set()
+
+    def flush(self) -> int:
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+        try:
+            with Session(engine) as session:
+                session.add_all([ToolUsage(**fields) for fields in batch])
+                session.commit()
+        except Exception:
+            logger.exception("could not write %d tool usage rows", len(batch))
+            with self._lock:
+                # keep them for the next flush, still bounded
+                self._pending[:0] = batch[: max(self.max_pending - len(self._pending), 0)]
+            return 0
+        self.written += len(batch)
+        return len(batch)
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await asyncio.to_thread(self.flush)
+
+    def start(self) -> asyncio.Task:
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._loop())
+        return self._task
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self._wake = None
+        await asyncio.to_thread(self.flush)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            pending = len(self._pending)
+        return {"pending": pending, "written": self.written, "dropped": self.dropped}
+
+
+class ToolRuntime:
+    def __init__(self, max_parallel: int = TOOL_MAX_PARALLEL, cache_size: int = 2048, health: ToolHealth = tool_health):
+        self.max_parallel = max_parallel
+        self.health = health
+        self.cache = LRUCache(maxsize=cache_size)
+        self.usage = UsageWriter()
+        self._histograms: Dict[int, LatencyHistogram] = {}
+        self._names: Dict[int, str] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def resolve(self, tool: Dict[str, Any]) -> ToolSpec:
+        name = tool["name"]
+        if tool.get("config"):
+            try:
+                name = json.loads(tool["config"]).get("implementation") or name
+            except (TypeError, ValueError, AttributeError):
+                pass
+        return _IMPLEMENTATIONS.get(name) or _IMPLEMENTATIONS[GENERIC_IMPLEMENTATION]
+
+    def _observe(self, tool: Dict[str, Any], ms: float, outcome: str) -> None:
+        hist = self._histograms.get(tool["id"])
+        if hist is None:
+            hist = self._histograms.setdefault(tool["id"], LatencyHistogram())
+        self._names[tool["id"]] = tool["name"]
+        hist.observe(ms, outcome)
+
+    def _lookup(self, tool_id: int, user_id: str) -> Dict[str, Any]:
+        tool, allowed = tool_catalog.get_tool(tool_id, user_id)
+        if not tool or not tool["enabled"]:
+            raise ToolError(f"Tool {tool_id} not found or disabled", status=404)
+        if not allowed:
+            raise ToolError(f"Permission denied for tool {tool_id}", status=403)
+        return tool
+
+    async def _invoke(self, spec: ToolSpec, tool: Dict[str, Any], input_data: Dict[str, Any], user_id: str, timeout: float) -> Any:
+        if asyncio.iscoroutinefunction(spec.func):
+            call = spec.func(input_data, tool, user_id)
+        else:
+            call = asyncio.to_thread(spec.func, input_data, tool, user_id)
+        try:
+            return await asyncio.wait_for(call, timeout=timeout)
+        except asyncio.TimeoutError:
+            raise ToolError(f"{tool['name']} timed out after {timeout:.1f}s", status=504) from None
+
+    async def _shared(self, key: str, make: Callable) -> Any:
+        """Run ``make()`` once for concurrent callers with the same key."""
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        task = asyncio.ensure_future(make())
+        self._inflight[key] = task
+        task.add_done_callback(lambda _t: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def call(self, tool_id: int, user_id: str, input_data: Optional[Dict[str, Any]] = None,
+                   deadline: Optional[float] = None, dry_run: bool = False,
+                   conversation_id: Optional[int] = None) -> Dict[str, Any]:
+        """Run one tool call; raises ToolError. ``deadline`` is a ``time.monotonic()`` value."""
+        input_data = input_data or {}
+        tool = await asyncio.to_thread(self._lookup, tool_id, user_id)
+        spec = self.resolve(tool)
+        usage_key = uuid.uuid4().hex
+        base = {"tool_id": tool_id, "tool": tool["name"], "implementation": spec.name, "usage_key": usage_key}
+        usage = dict(user_id=user_id, tool_id=tool_id, conversation_id=conversation_id, usage_key=usage_key,
+                     input_data=json.dumps(input_data, default=str))
+
+        if dry_run:
+            output = {"dry_run": True, "would_execute": tool["name"], "implementation": spec.name,
+                      "health": self.health.get(spec.name)["status"], "input": input_data}
+            self.usage.record(status="dry_run", output_data=json.dumps(output, default=str), **usage)
+            return {**base, "status": "dry_run", "output": output, "cached": False, "duration_ms": 0}
+
+        if self.health.is_down(spec.name):
+            state = self.health.get(spec.name)
+            error = f"{tool['name']} is unavailable: {state['error'] or state['status']}"
+            self._observe(tool, 0.0, "unavailable")
+            self.usage.record(status="failed", error=error, **usage)
+            raise ToolError(error, status=503)
+
+        key = input_hash(f"{tool_id}:{spec.name}", input_data) if spec.deterministic else None
+        if key is not None:
+            hit = self.cache.get(key)
+            if hit is not None:
+                self._observe(tool, 0.0, "cached")
+                self.usage.record(status="success", output_data=json.dumps(hit, default=str), **usage)
+                return {**base, "status": "success", "output": hit, "cached": True, "duration_ms": 0}
+
+        timeout = spec.timeout
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.monotonic())
+        started = time.perf_counter()
+        try:
+            if timeout <= 0:
+                raise ToolError(f"{tool['name']}: request deadline exceeded", status=504)
+            if key is not None:
+                output = await self._shared(key, lambda: self._invoke(spec, tool, input_data, user_id, timeout))
+                self.cache.set(key, output, ttl=spec.cache_ttl)
+            else:
+                output = await self._invoke(spec, tool, input_data, user_id, timeout)
+        except Exception as e:
+            ms = (time.perf_counter() - started) * 1000
+            error = e if isinstance(e, ToolError) else ToolError(f"{tool['name']} failed: {e}")
+            self._observe(tool, ms, "timeout" if error.status == 504 else "failed")
+            self.usage.record(status="failed", error=str(error), **usage)
+            raise error from e
+        ms = (time.perf_counter() - started) * 1000
+        self._observe(tool, ms, "success")
+        self.usage.record(status="success", output_data=json.dumps(output, default=str), **usage)
+        return {**base, "status": "success", "output": output, "cached": False, "duration_ms": round(ms, 1)}
+
+    async def call_many(self, calls: List[Dict[str, Any]], user_id: str, timeout: float = TOOL_REQUEST_TIMEOUT,
+                        dry_run: bool = False) -> List[Dict[str, Any]]:
+        """Run ``[{"tool_id", "input_data"}, ...]`` concurrently under one deadline.
+
+        Results come back in call order; a failed call is reported in its
+        slot (``status`` "failed", "timeout" or "unavailable") without
+        failing the others.
+        """
+        deadline = time.monotonic() + timeout
+        gate = asyncio.Semaphore(self.max_parallel)
+
+        async def one(c: Dict[str, Any]) -> Dict[str, Any]:
+            async with gate:
+                try:
+                    return await self.call(c["tool_id"], user_id, c.get("input_data"), deadline=deadline, dry_run=dry_run)
+                except ToolError as e:
+                    status = {504: "timeout", 503: "unavailable"}.get(e.status, "failed")
+                    return {"tool_id": c["tool_id"], "status": status,
+                            "error": str(e), "error_status": e.status}
+
+        return list(await asyncio.gather(*(one(c) for c in calls)))
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "tools": {
+                str(tool_id): {"name": self._names.get(tool_id), **hist.snapshot()}
+                for tool_id, hist in sorted(self._histograms.items())
+            },
+            "cache": self.cache.stats(),
+            "usage_writer": self.usage.stats(),
+        }
+
+
+tool_runtime = ToolRuntime()
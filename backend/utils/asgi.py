@@ -0,0 +1,99 @@
+"""Helpers shared by the pure-ASGI middlewares (rate limiting, idempotency)."""
+import asyncio
+import json
+import os
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from fastapi import HTTPException
+
+# largest request body the middlewares will buffer
+MAX_REQUEST_BODY = int(os.getenv("MAX_REQUEST_BODY", str(10 * 1024 * 1024)))
+
+BODY_TOO_LARGE = json.dumps({"ok": False, "error": "body_too_large", "message": "Request body is too large"}).encode()
+
+
+class RequestBodyTooLarge(Exception):
+    pass
+
+
+async def read_body(receive, limit: int = MAX_REQUEST_BODY) -> Tuple[bytes, Callable[[], Awaitable[Dict]]]:
+    """Drain the request body; returns it plus a ``receive`` that replays it to the app.
+
+    Raises RequestBodyTooLarge once more than ``limit`` bytes have arrived.
+    """
+    chunks: List[bytes] = []
+    size = 0
+    more = True
+    while more:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > limit:
+            raise RequestBodyTooLarge(f"request body exceeds {limit} bytes")
+        chunks.append(chunk)
+        more = message.get("more_body", False)
+    body = b"".join(chunks)
+
+    replayed = False
+
+    async def replay():
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return body, replay
+
+
+def header(scope, name: bytes) -> str:
+    for key, value in scope.get("headers") or ():
+        if key == name:
+            return value.decode("latin-1")
+    return ""
+
+
+async def request_principal(scope):
+    """The Principal for the request's bearer token, or None; resolved once per request.
+
+    The result is kept in ``scope["state"]`` (``request.state.principal``), so
+    both middlewares and the route's auth dependency share one lookup.
+    """
+    from ..auth.firebase import authenticate
+    from ..auth.principal import principals, token_hash
+
+    state = scope.setdefault("state", {})
+    if "principal" in state:
+        return state["principal"]
+    principal = None
+    auth = header(scope, b"authorization")
+    if auth.startswith("Bearer "):
+        token = auth.split(" ", 1)[1]
+        principal = principals.get(token_hash(token))
+        if principal is None:
+            try:
+                principal = await asyncio.to_thread(authenticate, token)
+            except HTTPException:
+                principal = None
+    state["principal"] = principal
+    return principal
+
+
+async def caller_key(scope) -> str:
+    """``user:<uid>`` when the bearer token verifies, else ``ip:<client address>``."""
+    principal = await request_principal(scope)
+    if principal is not None and principal.uid:
+        return f"user:{principal.uid}"
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+async def send_json(send, status: int, body: bytes, headers=()) -> None:
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())] + list(headers),
+    })
+    await send({"type": "http.response.body", "body": body})
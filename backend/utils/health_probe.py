@@ -0,0 +1,114 @@
+"""Background dependency prober behind /health.
+
+Load balancers hit /health every second or so; instead of pinging the
+databases on each request, a background task checks every dependency
+every HEALTH_PROBE_INTERVAL seconds and caches status and latency.
+Requests read the cache and only probe inline when it is cold or older
+than HEALTH_PROBE_MAX_AGE (e.g. the prober is not running).
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from sqlalchemy import text
+
+logger = logging.getLogger("backend.utils.health_probe")
+
+HEALTH_PROBE_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "5"))
+HEALTH_PROBE_MAX_AGE = float(os.getenv("HEALTH_PROBE_MAX_AGE", str(HEALTH_PROBE_INTERVAL * 3)))
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "3"))
+
+# a check returns True (connected), False (unreachable) or None (not configured)
+Check = Callable[[], Awaitable[Optional[bool]]]
+
+
+def _sql_ping() -> None:
+    from ..models import engine
+
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+async def check_sql() -> Optional[bool]:
+    await asyncio.to_thread(_sql_ping)
+    return True
+
+
+async def check_mongo() -> Optional[bool]:
+    if not os.getenv("MONGODB_URI"):
+        return None
+    from ..db_mongo import health_check
+
+    return await health_check()
+
+
+class HealthProber:
+    def __init__(self, checks: Dict[str, Check], interval: float = HEALTH_PROBE_INTERVAL, max_age: float = HEALTH_PROBE_MAX_AGE):
+        self.checks = checks
+        self.interval = interval
+        self.max_age = max_age
+        self._state: Dict[str, Dict[str, Any]] = {}
+        self._probed_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def _run_check(self, name: str, check: Check) -> Dict[str, Any]:
+        start = time.perf_counter()
+        error = None
+        try:
+            ok = await asyncio.wait_for(check(), HEALTH_PROBE_TIMEOUT)
+            status = "not_configured" if ok is None else ("connected" if ok else "unreachable")
+        except asyncio.TimeoutError:
+            status, error = "unreachable", "timeout"
+        except Exception as e:
+            status, error = "error", str(e)
+        latency_ms = round((time.perf_counter() - start) * 1000, 2)
+        previous = self._state.get(name, {}).get("status")
+        if previous is not None and previous != status:
+            logger.warning("health: %s changed %s -> %s", name, previous, status)
+        return {
+            "status": status,
+            "latency_ms": latency_ms if status == "connected" else None,
+            "error": error,
+            "checked_at": datetime.utcnow().isoformat(),
+        }
+
+    async def probe(self) -> Dict[str, Dict[str, Any]]:
+        results = await asyncio.gather(*(self._run_check(name, check) for name, check in self.checks.items()))
+        self._state = dict(zip(self.checks, results))
+        self._probed_at = time.monotonic()
+        return self._state
+
+    async def state(self) -> Dict[str, Dict[str, Any]]:
+        """Cached results, probing inline only when cold or stale."""
+        if self._probed_at and time.monotonic() - self._probed_at <= self.max_age:
+            return self._state
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # another request may have refreshed it while we waited
+            if not self._probed_at or time.monotonic() - self._probed_at > self.max_age:
+                await self.probe()
+        return self._state
+
+    def age_seconds(self) -> Optional[float]:
+        return round(time.monotonic() - self._probed_at, 3) if self._probed_at else None
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                await self.probe()
+            except Exception:
+                logger.exception("health probe failed")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> Optional[asyncio.Task]:
+        if self.interval <= 0:
+            return None
+        self._lock = None
+        return asyncio.create_task(self._loop())
+
+
+health_prober = HealthProber({"sql_db": check_sql, "mongo_db": check_mongo})
@@ -0,0 +1,272 @@
+"""Idempotency-Key support for POST endpoints.
+
+A POST carrying an ``Idempotency-Key`` header is claimed in a shared store
+before it reaches the route. The first request runs normally and its
+response is stored for IDEMPOTENCY_TTL seconds; a retry with the same key
+(same caller, path and body) gets that response replayed with
+``Idempotent-Replayed: true`` instead of running, and paying for, the
+model call again. A duplicate that arrives while the first is still in
+flight waits up to IDEMPOTENCY_WAIT seconds for its result. Server errors,
+transient rejections (408, 409, 425, 429) and oversized responses are not
+stored, so the client can retry them.
+
+Backends (IDEMPOTENCY_BACKEND): ``memory`` - a bounded per-process LRU -
+or ``sqlite``, a file shared by all workers on the host. Both evict
+expired entries; in-flight claims expire after IDEMPOTENCY_PENDING_TTL so
+a crashed worker cannot wedge a key.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+from .asgi import BODY_TOO_LARGE, RequestBodyTooLarge, caller_key, header, read_body, send_json
+from .cache import LRUCache
+
+logger = logging.getLogger("backend.utils.idempotency")
+
+IDEMPOTENCY_BACKEND = os.getenv("IDEMPOTENCY_BACKEND", "memory").lower()
+IDEMPOTENCY_SQLITE_PATH = os.getenv("IDEMPOTENCY_SQLITE_PATH", "./idempotency.db")
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "3600"))
+IDEMPOTENCY_PENDING_TTL = float(os.getenv("IDEMPOTENCY_PENDING_TTL", "300"))
+IDEMPOTENCY_WAIT = float(os.getenv("IDEMPOTENCY_WAIT", "120"))
+IDEMPOTENCY_POLL = float(os.getenv("IDEMPOTENCY_POLL", "0.05"))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+IDEMPOTENCY_MAX_BODY = int(os.getenv("IDEMPOTENCY_MAX_BODY", str(1024 * 1024)))
+IDEMPOTENCY_MAX_KEY_LENGTH = 255
+
+PENDING = "pending"
+DONE = "done"
+
+# client errors that say "try again later" rather than describing the request
+_RETRYABLE_STATUSES = {408, 409, 425, 429}
+
+# hop-by-hop or per-response headers that must not be replayed
+_SKIP_HEADERS = {"content-length", "date", "server", "connection", "transfer-encoding"}
+
+
+class Record(NamedTuple):
+    state: str
+    fingerprint: str
+    status: int = 0
+    headers: Tuple[Tuple[str, str], ...] = ()
+    body: bytes = b""
+
+
+class MemoryBackend:
+    """Per-process records in a bounded LRU with per-entry expiry."""
+
+    blocking = False
+
+    def __init__(self, maxsize: int = IDEMPOTENCY_MAX_ENTRIES):
+        self._records = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def claim(self, key: str, fingerprint: str, ttl: float) -> Optional[Record]:
+        """Mark ``key`` in flight; returns None if we got it, else the existing record."""
+        with self._lock:
+            existing = self._records.get(key)
+            if existing is None:
+                self._records.set(key, Record(PENDING, fingerprint), ttl=ttl)
+            return existing
+
+    def get(self, key: str) -> Optional[Record]:
+        return self._records.get(key)
+
+    def complete(self, key: str, record: Record, ttl: float) -> None:
+        self._records.set(key, record, ttl=ttl)
+
+    def release(self, key: str) -> None:
+        self._records.pop(key)
+
+    def clear(self) -> None:
+        self._records.clear()
+
+
+class SQLiteBackend:
+    """Records in a SQLite file, shared by all workers on one host."""
+
+    blocking = True
+    EVICT_EVERY = 500
+
+    def __init__(self, path: str = IDEMPOTENCY_SQLITE_PATH, maxsize: int = IDEMPOTENCY_MAX_ENTRIES):
+        self.path = path
+        self.maxsize = maxsize
+        self._local = threading.local()
+        self._ops = 0
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS idempotency_key ("
+            "key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, state TEXT NOT NULL, "
+            "status INTEGER NOT NULL DEFAULT 0, headers TEXT, body BLOB, expires_at REAL NOT NULL)"
+        )
+        self._conn().execute("CREATE INDEX IF NOT EXISTS ix_idempotency_key_expires ON idempotency_key (expires_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _record(row) -> Record:
+        state, fingerprint, status, headers, body = row
+        return Record(state, fingerprint, status, tuple(tuple(h) for h in json.loads(headers or "[]")), body or b"")
+
+    def claim(self, key: str, fingerprint: str, ttl: float) -> Optional[Record]:
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM idempotency_key WHERE key = ? AND expires_at <= ?", (key, now))
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO idempotency_key (key, fingerprint, state, expires_at) VALUES (?, ?, ?, ?)",
+                (key, fingerprint, PENDING, now + ttl),
+            ).rowcount
+            existing = None
+            if not inserted:
+                existing = self._record(conn.execute(
+                    "SELECT state, fingerprint, status, headers, body FROM idempotency_key WHERE key = ?", (key,)
+                ).fetchone())
+            self._ops += 1
+            if self._ops % self.EVICT_EVERY == 0:
+                self._evict(conn, now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return existing
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM idempotency_key WHERE expires_at <= ?", (now,))
+        excess = conn.execute("SELECT COUNT(*) FROM idempotency_key").fetchone()[0] - self.maxsize
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM idempotency_key WHERE key IN (SELECT key FROM idempotency_key ORDER BY expires_at LIMIT ?)",
+                (excess,),
+            )
+
+    def get(self, key: str) -> Optional[Record]:
+        row = self._conn().execute(
+            "SELECT state, fingerprint, status, headers, body FROM idempotency_key WHERE key = ? AND expires_at > ?",
+            (key, time.time()),
+        ).fetchone()
+        return self._record(row) if row is not None else None
+
+    def complete(self, key: str, record: Record, ttl: float) -> None:
+        self._conn().execute(
+            "UPDATE idempotency_key SET state = ?, status = ?, headers = ?, body = ?, expires_at = ? WHERE key = ?",
+            (record.state, record.status, json.dumps(record.headers), record.body, time.time() + ttl, key),
+        )
+
+    def release(self, key: str) -> None:
+        self._conn().execute("DELETE FROM idempotency_key WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        self._conn().execute("DELETE FROM idempotency_key")
+
+
+def make_backend(name: str = IDEMPOTENCY_BACKEND):
+    if name == "sqlite":
+        return SQLiteBackend()
+    return MemoryBackend()
+
+
+def _error(status: int, error: str, message: str) -> Tuple[int, bytes]:
+    return status, json.dumps({"ok": False, "error": error, "message": message}).encode()
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app, backend=None, ttl: float = IDEMPOTENCY_TTL, wait: float = IDEMPOTENCY_WAIT):
+        self.app = app
+        self.backend = backend or make_backend()
+        self.ttl = ttl
+        self.wait = wait
+
+    async def _call(self, fn, *args):
+        if self.backend.blocking:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    async def __call__(self, scope, receive, send):
+        idem_key = header(scope, b"idempotency-key") if scope["type"] == "http" and scope["method"] == "POST" else ""
+        if not idem_key:
+            await self.app(scope, receive, send)
+            return
+        if len(idem_key) > IDEMPOTENCY_MAX_KEY_LENGTH:
+            await send_json(send, *_error(400, "invalid_idempotency_key", "Idempotency-Key is too long"))
+            return
+
+        try:
+            body, replay = await read_body(receive)
+        except RequestBodyTooLarge:
+            await send_json(send, 413, BODY_TOO_LARGE)
+            return
+        fingerprint = hashlib.sha256(body).hexdigest()
+        caller = await caller_key(scope)
+        key = hashlib.sha256(f"{caller}\n{scope['path']}\n{idem_key}".encode()).hexdigest()
+
+        deadline = time.monotonic() + self.wait
+        while True:
+            existing = await self._call(self.backend.claim, key, fingerprint, IDEMPOTENCY_PENDING_TTL)
+            if existing is None:
+                await self._run(key, fingerprint, scope, replay, send)
+                return
+            if existing.fingerprint != fingerprint:
+                await send_json(send, *_error(422, "idempotency_key_reused", "Idempotency-Key was already used with a different request body"))
+                return
+            # wait for the first request to finish (or give up its claim)
+            while existing is not None and existing.state == PENDING and time.monotonic() < deadline:
+                await asyncio.sleep(IDEMPOTENCY_POLL)
+                existing = await self._call(self.backend.get, key)
+            if existing is None:
+                continue
+            if existing.state == DONE:
+                await self._replay(existing, send)
+                return
+            await send_json(send, *_error(409, "idempotency_key_in_progress", "A request with this Idempotency-Key is still in progress"))
+            return
+
+    async def _run(self, key: str, fingerprint: str, scope, receive, send) -> None:
+        start: dict = {}
+        chunks: List[bytes] = []
+        size = 0
+
+        async def capture(message):
+            nonlocal size
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+                if size <= IDEMPOTENCY_MAX_BODY:
+                    chunks.append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, capture)
+        except BaseException:
+            await self._call(self.backend.release, key)
+            raise
+        status = start.get("status", 500)
+        if status >= 500 or status in _RETRYABLE_STATUSES or size > IDEMPOTENCY_MAX_BODY:
+            await self._call(self.backend.release, key)
+            return
+        headers = tuple(
+            (k.decode("latin-1"), v.decode("latin-1"))
+            for k, v in start.get("headers", ())
+            if k.decode("latin-1").lower() not in _SKIP_HEADERS
+        )
+        record = Record(DONE, fingerprint, status, headers, b"".join(chunks))
+        await self._call(self.backend.complete, key, record, self.ttl)
+
+    async def _replay(self, record: Record, send) -> None:
+        headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in record.headers]
+        headers += [(b"content-length", str(len(record.body)).encode()), (b"idempotent-replayed", b"true")]
+        await send({"type": "http.response.start", "status": record.status, "headers": headers})
+        await send({"type": "http.response.body", "body": record.body})
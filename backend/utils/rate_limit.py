@@ -1,29 +1,307 @@
+"""Token-bucket rate limiting shared across workers.
+
+Each caller has a bucket of RATE_LIMIT_BURST units refilled at
+RATE_LIMIT_PER_MIN units per minute. A request costs one unit plus one per
+RATE_LIMIT_TOKENS_PER_UNIT estimated model tokens in its body, so a 20k
+character prompt drains the bucket faster than a one-liner.
+
+Buckets live in a pluggable backend chosen by RATE_LIMIT_BACKEND:
+
+* ``memory`` - per process (limits multiply with the worker count); fine
+  for a single worker and tests.
+* ``sqlite`` - a SQLite file shared by every worker on the host.
+* ``redis`` - any Redis-compatible server (needs the ``redis`` package);
+  the bucket update runs as one Lua script, so it is atomic across hosts.
+
+A bucket idle for longer than it takes to refill completely is
+indistinguishable from a new one, so every backend evicts those.
+RateLimitMiddleware applies the limiter to the expensive routes and sets
+X-RateLimit-* headers.
+"""
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
 import time
-from typing import Dict
-from fastapi import HTTPException, Request
-
-# simple in-memory token-bucket rate limiter per user
-_BUCKETS: Dict[str, Dict] = {}
-
-RATE_LIMIT = int(__import__("os").environ.get("RATE_LIMIT_PER_MIN", "60"))
-BURST = int(__import__("os").environ.get("RATE_LIMIT_BURST", "20"))
-
-def allow_request(uid: str) -> bool:
-    now = time.time()
-    bucket = _BUCKETS.get(uid)
-    if not bucket:
-        _BUCKETS[uid] = {"tokens": RATE_LIMIT, "last": now}
-        return True
-    # refill
-    elapsed = now - bucket["last"]
-    refill = elapsed * (RATE_LIMIT / 60.0)
-    bucket["tokens"] = min(BURST, bucket["tokens"] + refill)
-    bucket["last"] = now
-    if bucket["tokens"] >= 1:
-        bucket["tokens"] -= 1
-        return True
-    return False
-
-def require_rate_limit(request: Request, uid: str):
-    if not allow_request(uid):
-        raise HTTPException(status_code=429, detail="Rate limit exceeded")
+from typing import Iterable, List, NamedTuple, Optional, Pattern, Tuple
+
+from .asgi import BODY_TOO_LARGE, RequestBodyTooLarge, caller_key, read_body, send_json
+from .cache import LRUCache
+
+try:
+    import redis
+except Exception:  # pragma: no cover - only needed for RATE_LIMIT_BACKEND=redis
+    redis = None
+
+logger = logging.getLogger("backend.utils.rate_limit")
+
+RATE_LIMIT = int(os.getenv("RATE_LIMIT_PER_MIN", "60"))
+BURST = int(os.getenv("RATE_LIMIT_BURST", "20"))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+RATE_LIMIT_SQLITE_PATH = os.getenv("RATE_LIMIT_SQLITE_PATH", "./rate_limit.db")
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+RATE_LIMIT_TOKENS_PER_UNIT = int(os.getenv("RATE_LIMIT_TOKENS_PER_UNIT", "1000"))
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "100000"))
+# POST routes that reach a model, one regex per entry
+RATE_LIMIT_PATHS = os.getenv(
+    "RATE_LIMIT_PATHS",
+    r"^/ai/,^/(chains|agents)/\d+/run$,^/(education|intelligence|business|personal|markets|health|web|research|security)/",
+)
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: float
+    # seconds until the bucket is full again / until ``cost`` units are available
+    reset_after: float
+    retry_after: float
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough model token count (~4 characters per token)."""
+    return math.ceil(len(text) / 4)
+
+
+def request_cost(body: bytes) -> int:
+    """Units charged for a request: one plus one per RATE_LIMIT_TOKENS_PER_UNIT prompt tokens."""
+    if not body:
+        return 1
+    try:
+        payload = json.loads(body)
+        text = " ".join(_strings(payload))
+    except ValueError:
+        text = body.decode("utf-8", "ignore")
+    return 1 + estimate_tokens(text) // RATE_LIMIT_TOKENS_PER_UNIT
+
+
+def _strings(value) -> Iterable[str]:
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for v in value.values():
+            yield from _strings(v)
+    elif isinstance(value, list):
+        for v in value:
+            yield from _strings(v)
+
+
+def _take(tokens: Optional[float], last: float, now: float, cost: float, rate: float, burst: float) -> Tuple[bool, float]:
+    """Refill then try to take ``cost``; returns (allowed, tokens left)."""
+    tokens = burst if tokens is None else min(burst, tokens + max(now - last, 0.0) * rate)
+    if tokens >= cost:
+        return True, tokens - cost
+    return False, tokens
+
+
+class MemoryBackend:
+    """Per-process buckets in a bounded LRU; idle buckets expire."""
+
+    blocking = False
+
+    def __init__(self, maxsize: int = RATE_LIMIT_MAX_BUCKETS):
+        self._buckets = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, cost: float, rate: float, burst: float, idle: float) -> Tuple[bool, float]:
+        now = time.time()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            tokens, last = bucket if bucket is not None else (None, now)
+            allowed, tokens = _take(tokens, last, now, cost, rate, burst)
+            self._buckets.set(key, (tokens, now), ttl=idle)
+        return allowed, tokens
+
+    def clear(self) -> None:
+        self._buckets.clear()
+
+
+class SQLiteBackend:
+    """Buckets in a SQLite file, shared by all workers on one host."""
+
+    blocking = True
+    EVICT_EVERY = 1000
+
+    def __init__(self, path: str = RATE_LIMIT_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._ops = 0
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS rate_bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_rate_bucket_updated ON rate_bucket (updated)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key: str, cost: float, rate: float, burst: float, idle: float) -> Tuple[bool, float]:
+        conn = self._conn()
+        now = time.time()
+        # IMMEDIATE takes the write lock up front so read-modify-write is atomic across processes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM rate_bucket WHERE key = ?", (key,)).fetchone()
+            tokens, last = row if row is not None else (None, now)
+            allowed, tokens = _take(tokens, last, now, cost, rate, burst)
+            conn.execute(
+                "INSERT INTO rate_bucket (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (key, tokens, now),
+            )
+            self._ops += 1
+            if self._ops % self.EVICT_EVERY == 0:
+                conn.execute("DELETE FROM rate_bucket WHERE updated < ?", (now - idle,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, tokens
+
+    def clear(self) -> None:
+        self._conn().execute("DELETE FROM rate_bucket")
+
+
+_REDIS_TAKE = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local cost, rate, burst, idle = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1])
+if tokens == nil then
+  tokens = burst
+else
+  tokens = math.min(burst, tokens + math.max(now - tonumber(bucket[2]), 0) * rate)
+end
+local allowed = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], idle)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBackend:
+    """Buckets in Redis (or a compatible server), updated by one Lua script."""
+
+    blocking = True
+
+    def __init__(self, url: str = RATE_LIMIT_REDIS_URL, prefix: str = "ratelimit:"):
+        if redis is None:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the redis package")
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(_REDIS_TAKE)
+
+    def take(self, key: str, cost: float, rate: float, burst: float, idle: float) -> Tuple[bool, float]:
+        allowed, tokens = self._script(keys=[self.prefix + key], args=[cost, rate, burst, math.ceil(idle)])
+        return bool(allowed), float(tokens)
+
+    def clear(self) -> None:
+        for key in self._client.scan_iter(self.prefix + "*"):
+            self._client.delete(key)
+
+
+def make_backend(name: str = RATE_LIMIT_BACKEND):
+    if name == "redis":
+        return RedisBackend()
+    if name == "sqlite":
+        return SQLiteBackend()
+    return MemoryBackend()
+
+
+class RateLimiter:
+    def __init__(self, backend=None, per_minute: int = RATE_LIMIT, burst: int = BURST):
+        self.backend = backend or make_backend()
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        # after this long a bucket has refilled completely, so forgetting it changes nothing
+        self.idle = max(burst / self.rate, 1.0)
+
+    def check(self, key: str, cost: float = 1) -> Decision:
+        # a request bigger than the whole bucket would never pass; charge it a full bucket
+        cost = min(cost, self.burst)
+        try:
+            allowed, tokens = self.backend.take(key, cost, self.rate, self.burst, self.idle)
+        except Exception:
+            # a broken shared store should not take the API down with it
+            logger.exception("rate limit backend failed; allowing request")
+            return Decision(True, self.burst, self.burst, 0.0, 0.0)
+        reset_after = (self.burst - tokens) / self.rate
+        retry_after = 0.0 if allowed else (cost - tokens) / self.rate
+        return Decision(allowed, self.burst, tokens, reset_after, retry_after)
+
+    async def acheck(self, key: str, cost: float = 1) -> Decision:
+        if self.backend.blocking:
+            return await asyncio.to_thread(self.check, key, cost)
+        return self.check(key, cost)
+
+
+rate_limiter = RateLimiter()
+
+
+def rate_limit_headers(decision: Decision, cost: float) -> List[Tuple[bytes, bytes]]:
+    headers = {
+        "X-RateLimit-Limit": str(decision.limit),
+        "X-RateLimit-Remaining": str(int(decision.remaining)),
+        "X-RateLimit-Reset": str(math.ceil(decision.reset_after)),
+        "X-RateLimit-Cost": str(int(min(cost, decision.limit))),
+    }
+    if not decision.allowed:
+        headers["Retry-After"] = str(math.ceil(decision.retry_after))
+    return [(k.lower().encode(), v.encode()) for k, v in headers.items()]
+
+
+class RateLimitMiddleware:
+    """ASGI middleware charging POSTs to the expensive routes against the caller's bucket.
+
+    The caller is the authenticated user when the bearer token verifies,
+    otherwise the client address; the route itself still enforces auth.
+    """
+
+    def __init__(self, app, limiter: Optional[RateLimiter] = None, paths: Optional[Iterable[str]] = None):
+        self.app = app
+        self.limiter = limiter
+        patterns = paths if paths is not None else [p for p in RATE_LIMIT_PATHS.split(",") if p.strip()]
+        self.paths: List[Pattern] = [re.compile(p.strip()) for p in patterns]
+
+    def _matches(self, scope) -> bool:
+        return scope["type"] == "http" and scope["method"] == "POST" and any(p.search(scope["path"]) for p in self.paths)
+
+    async def __call__(self, scope, receive, send):
+        if not self._matches(scope):
+            await self.app(scope, receive, send)
+            return
+        limiter = self.limiter or rate_limiter
+
+        try:
+            body, replay = await read_body(receive)
+        except RequestBodyTooLarge:
+            await send_json(send, 413, BODY_TOO_LARGE)
+            return
+        cost = request_cost(body)
+        decision = await limiter.acheck(await caller_key(scope), cost)
+        headers = rate_limit_headers(decision, cost)
+
+        if not decision.allowed:
+            payload = json.dumps({"ok": False, "error": "rate_limited", "message": "Rate limit exceeded, please slow down"}).encode()
+            await send_json(send, 429, payload, headers)
+            return
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message = dict(message, headers=list(message.get("headers", [])) + headers)
+            await send(message)
+
+        await self.app(scope, replay, send_with_headers)
+
@@ -0,0 +1,183 @@
+"""Declarative reference data synced into SQL tables.
+
+A dataset is a JSON file in ``backend/refdata``::
+
+    {"name": "tools", "version": 1, "key": "name", "insert_only": ["enabled"], "rows": [...]}
+
+``sync(name, Model)`` upserts its rows by ``key``: one SELECT of the
+existing rows, one multi-row INSERT for new keys and one executemany UPDATE
+for rows whose managed fields changed. Fields listed in ``insert_only`` are
+set on insert and never overwritten, so values changed at runtime (an
+admin disabling a tool) survive a re-sync; rows missing from the file are
+left alone. The SHA-256 of the file's canonical content is recorded in
+RefDataVersion, so syncing an unchanged file costs one primary-key read,
+and nothing at all once this process has applied it.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Type
+
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import Session, SQLModel
+
+from ..models import engine, RefDataVersion
+
+logger = logging.getLogger("backend.utils.refdata")
+
+REFDATA_DIR = os.getenv("REFDATA_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "refdata"))
+
+
+class RefDataError(ValueError):
+    pass
+
+
+class Dataset(NamedTuple):
+    name: str
+    version: int
+    key: str
+    insert_only: List[str]
+    rows: List[Dict[str, Any]]
+    sha256: str
+
+
+class SyncResult(NamedTuple):
+    name: str
+    version: int
+    skipped: bool
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+
+
+# dataset name -> sha256 applied by this process
+_applied: Dict[str, str] = {}
+_lock = threading.Lock()
+
+
+def load(name: str, path: Optional[str] = None) -> Dataset:
+    path = path or os.path.join(REFDATA_DIR, f"{name}.json")
+    with open(path, encoding="utf-8") as f:
+        doc = json.load(f)
+    key = doc.get("key", "name")
+    rows = doc.get("rows")
+    if doc.get("name", name) != name or not isinstance(doc.get("version"), int) or not isinstance(rows, list):
+        raise RefDataError(f"{path}: expected name {name!r}, an integer version and a rows list")
+    seen = set()
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict) or row.get(key) in (None, ""):
+            raise RefDataError(f"{path}: rows[{i}] has no {key!r}")
+        if row[key] in seen:
+            raise RefDataError(f"{path}: duplicate {key} {row[key]!r}")
+        seen.add(row[key])
+    canonical = json.dumps(doc, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return Dataset(name, doc["version"], key, list(doc.get("insert_only", [])), rows,
+                   hashlib.sha256(canonical.encode()).hexdigest())
+
+
+def _upsert(session: Session, model: Type[SQLModel], data: Dataset) -> SyncResult:
+    table = model.__table__
+    key_col = table.c[data.key]
+    fields = sorted({f for row in data.rows for f in row} - {data.key, "id"})
+    managed = [f for f in fields if f not in data.insert_only]
+    unknown = [f for f in fields + [data.key] if f not in table.c]
+    if unknown:
+        raise RefDataError(f"{data.name}: {model.__name__} has no columns {unknown}")
+
+    existing = {
+        row[data.key]: row
+        for row in session.execute(select(table.c.id, key_col, *(table.c[f] for f in managed))).mappings()
+    }
+    new_rows, changes = [], []
+    for row in data.rows:
+        current = existing.get(row[data.key])
+        if current is None:
+            # build through the model so column defaults (created_at, ...) apply
+            values = model(**row).dict(exclude={"id"})
+            new_rows.append(values)
+            continue
+        changed = {f: row[f] for f in managed if f in row and current[f] != row[f]}
+        if changed:
+            changes.append({"_id": current["id"], **{f: row.get(f, current[f]) for f in managed}})
+
+    if new_rows:
+        session.execute(insert(table), new_rows)
+    if changes:
+        session.execute(
+            update(table).where(table.c.id == bindparam("_id")).values({f: bindparam(f) for f in managed}),
+            changes,
+        )
+    return SyncResult(data.name, data.version, False, len(new_rows), len(changes),
+                      len(data.rows) - len(new_rows) - len(changes))
+
+
+def _lock_state(session: Session, data: Dataset) -> RefDataVersion:
+    """Lock (creating if needed) the dataset's RefDataVersion row for this transaction.
+
+    Syncs of one dataset from several workers then run one after another:
+    the UPDATE takes the row lock on Postgres and the database write lock on
+    SQLite, so the later sync sees the earlier one's rows instead of
+    inserting the same new keys again. Of two workers creating the row for
+    the first time, the loser gets an IntegrityError and retries.
+    """
+    retried = False
+    while True:
+        session.execute(update(RefDataVersion).where(RefDataVersion.name == data.name).values(name=data.name))
+        state = session.get(RefDataVersion, data.name, populate_existing=True)
+        if state is not None:
+            return state
+        state = RefDataVersion(name=data.name, version=data.version, sha256="")
+        session.add(state)
+        try:
+            session.flush()
+            return state
+        except IntegrityError:
+            session.rollback()
+            if retried:
+                raise
+            retried = True
+
+
+def sync(name: str, model: Type[SQLModel], path: Optional[str] = None, force: bool = False) -> SyncResult:
+    """Apply dataset ``name`` to ``model``'s table unless this exact file was applied already."""
+    data = load(name, path)
+    with _lock:
+        if not force and _applied.get(name) == data.sha256:
+            return SyncResult(name, data.version, True)
+        with Session(engine) as session:
+            state = session.get(RefDataVersion, name)
+            if not force and state is not None and state.sha256 == data.sha256:
+                _applied[name] = data.sha256
+                return SyncResult(name, data.version, True)
+            state = _lock_state(session, data)
+            if not force and state.sha256 == data.sha256:
+                # another worker applied it while we waited for the lock
+                session.rollback()
+                _applied[name] = data.sha256
+                return SyncResult(name, data.version, True)
+            if state.sha256 and data.version < state.version:
+                logger.warning("refdata %s: file version %d is older than applied version %d", name, data.version, state.version)
+            result = _upsert(session, model, data)
+            state.version = data.version
+            state.sha256 = data.sha256
+            state.row_count = len(data.rows)
+            state.applied_at = datetime.utcnow()
+            session.add(state)
+            session.commit()
+        _applied[name] = data.sha256
+    logger.info("refdata %s v%d: %d inserted, %d updated, %d unchanged",
+                name, data.version, result.inserted, result.updated, result.unchanged)
+    return result
+
+
+def forget(name: Optional[str] = None) -> None:
+    """Drop this process's memo of applied datasets (all of them if ``name`` is None)."""
+    with _lock:
+        if name is None:
+            _applied.clear()
+        else:
+            _applied.pop(name, None)
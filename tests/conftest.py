@@ -0,0 +1,64 @@
+"""Shared test fixtures.
+
+Points the SQL engine at a throwaway SQLite file before any backend module is
+imported so tests never touch ./backend_data.db.
+"""
+import os
+import tempfile
+
+_TMP_DIR = tempfile.mkdtemp(prefix="vaelis-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_TMP_DIR, 'test.db')}")
+
+import pytest
+
+
+@pytest.fixture
+def db():
+    """Create all tables and return the engine."""
+    from backend.models import engine, init_db
+
+    init_db()
+    return engine
+
+
+@pytest.fixture
+def auth_headers():
+    """Bearer headers for a dev JWT user."""
+    from backend.routes.auth import create_access_token
+
+    token = create_access_token({"uid": "tester@example.com", "email": "tester@example.com", "name": "tester"})
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def admin_headers(db):
+    """Bearer headers for a dev JWT user whose Account has the admin role."""
+    from sqlmodel import Session, select
+
+    from backend.auth.principal import principals
+    from backend.models import Account
+    from backend.routes.auth import create_access_token
+
+    uid = "admin@example.com"
+    with Session(db) as session:
+        if session.exec(select(Account).where(Account.user_id == uid)).first() is None:
+            session.add(Account(user_id=uid, role="admin"))
+            session.commit()
+    principals.invalidate_account(uid)
+    token = create_access_token({"uid": uid, "email": uid, "name": "admin"})
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def mongo():
+    """Beanie documents bound to a fresh in-memory Mongo stand-in."""
+    import asyncio
+
+    from beanie import init_beanie
+    from mongomock_motor import AsyncMongoMockClient
+
+    from backend.models_agent import Agent as MongoAgent
+
+    client = AsyncMongoMockClient()
+    asyncio.run(init_beanie(database=client["vaelis_test"], document_models=[MongoAgent]))
+    yield client["vaelis_test"]
@@ -0,0 +1,65 @@
+"""Test the agent event bus and its SSE stream"""
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.app import app
+from backend.agents.events import AgentEventBus, sse_stream
+
+
+@pytest.mark.asyncio
+async def test_resume_from_last_event_id_and_snapshot_fallback():
+    bus = AgentEventBus(history=3)
+    first = bus.publish(1, "status", {"status": "running"})
+    bus.publish(2, "status", {"status": "idle"})
+    bus.publish(1, "step", {"index": 0})
+    bus.publish(1, "step", {"index": 1})
+
+    sub, missed = bus.subscribe(1, first.id)
+    assert [e.data.get("index") for e in missed] == [0, 1]
+    bus.unsubscribe(sub)
+
+    for i in range(2, 5):
+        bus.publish(1, "step", {"index": i})
+    # events after first.id were evicted from the ring buffer: not resumable
+    sub, missed = bus.subscribe(1, first.id)
+    assert missed is None
+    bus.unsubscribe(sub)
+    # an id from before a restart (larger than anything issued) is not resumable either
+    sub, missed = bus.subscribe(1, 10_000)
+    assert missed is None
+    bus.unsubscribe(sub)
+    assert bus.subscriber_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_slow_subscriber_buffer_is_bounded():
+    bus = AgentEventBus(queue_size=2)
+    sub, _ = bus.subscribe(7)
+    for i in range(5):
+        bus.publish(7, "step", {"index": i})
+    assert sub.queue.qsize() == 2
+    assert sub.dropped == 3
+    assert sub.queue.get_nowait().data["index"] == 3
+
+
+@pytest.mark.asyncio
+async def test_sse_stream_snapshot_live_events_and_heartbeat():
+    bus = AgentEventBus()
+    stream = sse_stream(bus, 3, lambda: {"status": "idle"}, heartbeat=0.05)
+    snapshot = await stream.__anext__()
+    assert "event: snapshot" in snapshot and '"status": "idle"' in snapshot
+
+    event = bus.publish(3, "status", {"status": "running"})
+    chunk = await asyncio.wait_for(stream.__anext__(), 1)
+    assert chunk.startswith(f"id: {event.id}\nevent: status\n")
+    assert await asyncio.wait_for(stream.__anext__(), 1) == ": heartbeat\n\n"
+
+    await stream.aclose()
+    assert bus.subscriber_count(3) == 0
+
+
+def test_event_stream_requires_owned_agent(db, auth_headers):
+    client = TestClient(app)
+    assert client.get("/agents/999999/events", headers=auth_headers).status_code == 404
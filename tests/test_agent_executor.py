@@ -0,0 +1,157 @@
+"""Test the agent run executor against a local mock model"""
+import asyncio
+import json
+import time
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+from sqlmodel import Session
+
+from backend.app import app
+from backend.agents.executor import run_executor, AGENT_MAX_RUNS_PER_USER, AGENT_RUN_HEARTBEAT_SECONDS
+from backend.models import engine, AgentRun
+
+
+class MockModel:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def generate(self, prompt, mode="chat"):
+        self.calls.append(prompt)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        return {"output": f"echo: {prompt}", "status": "ok"}
+
+
+@pytest.fixture
+def model():
+    mock = MockModel()
+    run_executor.model = mock
+    yield mock
+    run_executor.model = None
+    run_executor.max_per_user = AGENT_MAX_RUNS_PER_USER
+    run_executor.heartbeat = AGENT_RUN_HEARTBEAT_SECONDS
+
+
+def _run(run_id):
+    with Session(engine) as session:
+        return session.get(AgentRun, run_id)
+
+
+def _wait_for(run_id, statuses, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        run = _run(run_id)
+        if run.status in statuses:
+            return run
+        time.sleep(0.02)
+    raise AssertionError(f"run {run_id} stuck in {_run(run_id).status}")
+
+
+def _agent(client, headers, steps):
+    body = {"name": "exec-agent", "config": {"steps": steps}, "memory_scope": "global"}
+    return client.post("/agents/", json=body, headers=headers).json()["agent"]
+
+
+def test_run_executes_model_and_memory_steps(db, auth_headers, model):
+    steps = [
+        {"type": "memory_write", "key": "topic", "value": "{input.topic}"},
+        {"type": "memory_read", "key": "topic"},
+        {"type": "model", "prompt": "Write about {memory.topic}", "name": "draft"},
+        {"type": "model", "prompt": "Polish: {steps.draft}"},
+    ]
+    with TestClient(app) as client:
+        agent = _agent(client, auth_headers, steps)
+        run = client.post(f"/agents/{agent['id']}/run", json={"input_data": {"topic": "tides"}}, headers=auth_headers).json()["run"]
+        done = _wait_for(run["id"], ("completed", "failed"))
+        assert done.status == "completed", done.error
+        assert json.loads(done.output_data)["output"] == "echo: Polish: echo: Write about tides"
+        assert json.loads(done.checkpoint)["step"] == 4
+        memory = client.get(f"/agents/{agent['id']}/memory", params={"key": "topic", "scope": "global"}, headers=auth_headers).json()
+        assert memory["memory"]["value"] == "tides"
+        assert client.get(f"/agents/{agent['id']}", headers=auth_headers).json()["agent"]["status"] == "idle"
+
+
+def test_pause_and_resume_continue_from_checkpoint(db, auth_headers, model):
+    model.delay = 0.2
+    steps = [{"type": "model", "prompt": f"step {i}"} for i in range(3)]
+    with TestClient(app) as client:
+        agent = _agent(client, auth_headers, steps)
+        run = client.post(f"/agents/{agent['id']}/run", json={"input_data": {}}, headers=auth_headers).json()["run"]
+        _wait_for(run["id"], ("running",))
+        assert client.post(f"/agents/{agent['id']}/pause", headers=auth_headers).json()["status"] == "paused"
+        paused = _wait_for(run["id"], ("paused",))
+        done_steps = json.loads(paused.checkpoint)["step"]
+        assert 1 <= done_steps < 3
+
+        client.post(f"/agents/{agent['id']}/resume", headers=auth_headers)
+        done = _wait_for(run["id"], ("completed",))
+        assert json.loads(done.checkpoint)["step"] == 3
+        # steps finished before the pause are not executed again
+        assert model.calls == ["step 0", "step 1", "step 2"]
+
+
+def test_per_user_concurrency_limit_and_stop(db, auth_headers, model):
+    model.delay = 0.3
+    run_executor.max_per_user = 2
+    with TestClient(app) as client:
+        agent = _agent(client, auth_headers, [{"type": "model", "prompt": "x"}])
+        run_ids = [
+            client.post(f"/agents/{agent['id']}/run", json={"input_data": {}}, headers=auth_headers).json()["run"]["id"]
+            for _ in range(4)
+        ]
+        metrics = client.get("/agents/executor/metrics", headers=auth_headers).json()
+        assert metrics["running"] <= 2
+        assert metrics["running"] + metrics["queued"] == 4
+        for run_id in run_ids:
+            _wait_for(run_id, ("completed",))
+        assert model.max_in_flight == 2
+
+        model.delay = 5
+        run_id = client.post(f"/agents/{agent['id']}/run", json={"input_data": {}}, headers=auth_headers).json()["run"]["id"]
+        _wait_for(run_id, ("running",))
+        client.post(f"/agents/{agent['id']}/stop", headers=auth_headers)
+        assert _wait_for(run_id, ("stopped",), timeout=2).status == "stopped"
+
+
+def test_queued_runs_heartbeat_while_waiting_for_a_slot(db, auth_headers, model):
+    model.delay = 0.8
+    run_executor.max_per_user = 1
+    run_executor.heartbeat = 0.1
+    with TestClient(app) as client:
+        agent = _agent(client, auth_headers, [{"type": "model", "prompt": "x"}])
+        first, second = (
+            client.post(f"/agents/{agent['id']}/run", json={"input_data": {}}, headers=auth_headers).json()["run"]["id"]
+            for _ in range(2)
+        )
+        _wait_for(first, ("running",))
+        queued_at = _run(second).updated_at
+        time.sleep(0.4)
+        waiting = _run(second)
+        # still waiting behind the per-user limit, but not stale to other workers
+        assert waiting.status == "queued" and waiting.updated_at > queued_at
+        _wait_for(second, ("completed",))
+
+
+def test_legacy_running_runs_are_retired_not_resumed(db):
+    from backend.models import init_db
+
+    # as left by the additive migration: no updated_at, no checkpoint
+    with engine.begin() as conn:
+        legacy_id = conn.execute(insert(AgentRun.__table__).values(
+            agent_id=999, user_id="legacy@example.com", status="running", started_at=datetime.utcnow(), updated_at=None,
+        )).inserted_primary_key[0]
+    init_db()
+    run = _run(legacy_id)
+    assert (run.status, run.error) == ("failed", "interrupted_legacy")
+    assert run.updated_at == run.started_at
+    assert legacy_id not in [run_id for run_id, _ in run_executor.claim_orphaned_runs()]
@@ -0,0 +1,49 @@
+"""Test upsert semantics and the read cache of the agent memory store"""
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from backend.app import app
+from backend.models import engine, AgentMemory
+
+
+def test_memory_upsert_overwrites_key(db, auth_headers):
+    client = TestClient(app)
+    agent = client.post("/agents/", json={"name": "kv-agent"}, headers=auth_headers).json()["agent"]
+    base = f"/agents/{agent['id']}/memory"
+
+    client.post(base, json={"key": "goal", "value": "draft"}, headers=auth_headers)
+    first = client.get(base, params={"key": "goal"}, headers=auth_headers).json()["memory"]
+    assert first["value"] == "draft" and first["scope_id"] is None
+
+    client.post(base, json={"key": "goal", "value": {"v": 2}}, headers=auth_headers)
+    latest = client.get(base, params={"key": "goal"}, headers=auth_headers).json()["memory"]
+    assert latest["value"] == '{"v": 2}'
+    assert latest["id"] == first["id"]
+
+    with Session(engine) as session:
+        rows = session.exec(select(AgentMemory).where(AgentMemory.agent_id == agent["id"])).all()
+    assert len(rows) == 1
+
+    missing = client.get(base, params={"key": "nope"}, headers=auth_headers)
+    assert missing.status_code == 404
+
+
+def test_memory_bulk_endpoints(db, auth_headers):
+    client = TestClient(app)
+    agent = client.post("/agents/", json={"name": "bulk-agent"}, headers=auth_headers).json()["agent"]
+    base = f"/agents/{agent['id']}/memory"
+
+    items = [{"key": f"k{i}", "value": i, "scope": "project", "scope_id": 7} for i in range(5)]
+    saved = client.post(f"{base}/bulk", json={"items": items}, headers=auth_headers).json()["memories"]
+    assert [m["key"] for m in saved] == [f"k{i}" for i in range(5)]
+
+    client.post(f"{base}/bulk", json={"items": [{"key": "k1", "value": "one", "scope": "project", "scope_id": 7}]}, headers=auth_headers)
+    got = client.post(
+        f"{base}/bulk-get", json={"keys": ["k0", "k1", "zz"], "scope": "project", "scope_id": 7}, headers=auth_headers
+    ).json()["memories"]
+    assert got["k0"]["value"] == "0"
+    assert got["k1"]["value"] == "one"
+    assert got["zz"] is None
+
+    scoped = client.get(base, params={"scope": "project", "scope_id": 7}, headers=auth_headers).json()["memories"]
+    assert len(scoped) == 5
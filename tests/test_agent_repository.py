@@ -0,0 +1,80 @@
+"""Test the cached agent repository and SQL <-> Mongo sync"""
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from backend.app import app
+from backend.agents.repository import AgentRepository, sql_agents, mongo_agents, sync_agents
+
+
+class QueryCounter:
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def __enter__(self):
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+
+def test_agent_lookup_is_cached_and_refreshed_on_write(db, auth_headers):
+    client = TestClient(app)
+    agent = client.post("/agents/", json={"name": "cached", "config": {"k": 1}}, headers=auth_headers).json()["agent"]
+    assert agent["config"] == '{"k": 1}' and agent["user_id"] == "tester@example.com"
+
+    with QueryCounter(db) as queries:
+        for _ in range(3):
+            assert client.get(f"/agents/{agent['id']}", headers=auth_headers).json()["agent"]["name"] == "cached"
+        client.get(f"/agents/{agent['id']}/memory", headers=auth_headers)
+    # the agent row was cached on create; only the memory listing hits the database
+    assert queries.count == 1
+
+    client.put(f"/agents/{agent['id']}", json={"name": "renamed"}, headers=auth_headers)
+    with QueryCounter(db) as queries:
+        assert client.get(f"/agents/{agent['id']}", headers=auth_headers).json()["agent"]["name"] == "renamed"
+    assert queries.count == 0
+
+    other = {"Authorization": auth_headers["Authorization"] + "x"}
+    assert client.get(f"/agents/{agent['id']}", headers=other).status_code in (401, 403, 404)
+
+
+def test_sync_round_trip_updates_instead_of_duplicating(db, mongo):
+    async def scenario():
+        created = [await sql_agents.create("sync-user", {"name": f"a{i}", "config": {"i": i}}) for i in range(3)]
+        first = await sync_agents("sql", "mongo", batch_size=2)
+        assert first["copied"] >= 3
+        assert first["inserted"] == first["copied"] and first["updated"] == 0
+
+        await sql_agents.update(created[0]["id"], "sync-user", {"name": "a0-renamed"})
+        again = await sync_agents("sql", "mongo", batch_size=2)
+        assert again["inserted"] == 0 and again["updated"] == first["copied"]
+
+        copies = await mongo_agents.list_by_owner("sync-user")
+        assert sorted(c["name"] for c in copies) == ["a0-renamed", "a1", "a2"]
+        assert {c["external_id"] for c in copies} == {str(a["id"]) for a in created}
+
+        # copying back matches the original SQL rows through external_id
+        back = await sync_agents("mongo", "sql")
+        assert back["inserted"] == 0 and back["updated"] == first["copied"]
+        rows = await sql_agents.list_by_owner("sync-user")
+        assert len(rows) == 3
+        assert {r["external_id"] for r in rows} == {c["id"] for c in copies}
+
+    asyncio.run(scenario())
+
+
+def test_backends_must_implement_every_hook():
+    class Partial(AgentRepository):
+        async def _fetch(self, agent_id):
+            return None
+
+    with pytest.raises(TypeError, match="_upsert_external"):
+        Partial()
@@ -0,0 +1,42 @@
+"""Test aggregate-based dashboard stats and the counter cache"""
+from fastapi.testclient import TestClient
+
+from backend.app import app
+
+
+def test_stats_track_creates_runs_and_deletes(db, auth_headers):
+    client = TestClient(app)
+    before = client.get("/agents/stats", headers=auth_headers).json()
+
+    agent = client.post("/agents/", json={"name": "stats-agent"}, headers=auth_headers).json()["agent"]
+    client.post(f"/agents/{agent['id']}/run", json={"input_data": {}}, headers=auth_headers)
+    after = client.get("/agents/stats", headers=auth_headers).json()
+    assert after["agents"] == before["agents"] + 1
+    assert after["runs"] == before["runs"] + 1
+    assert set(after) == {"agents", "runs", "tools", "intelligence_score"}
+
+    client.delete(f"/agents/{agent['id']}", headers=auth_headers)
+    final = client.get("/agents/stats", headers=auth_headers).json()
+    assert final["agents"] == before["agents"]
+
+
+def test_adjust_is_atomic_and_keeps_the_entry_expiry():
+    import threading
+    import time
+
+    from backend.agents import stats
+
+    stats._COUNTERS.set(("sql", "busy@example.com"), {"agents": 0, "runs": 0}, ttl=30)
+    threads = [threading.Thread(target=lambda: [stats.adjust("sql", "busy@example.com", runs=1) for _ in range(200)]) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert stats._COUNTERS.get(("sql", "busy@example.com"))["runs"] == 1600
+
+    # constant activity does not keep approximate counters alive forever
+    stats._COUNTERS.set(("sql", "busy@example.com"), {"agents": 0, "runs": 0}, ttl=0.3)
+    deadline = time.time() + 0.5
+    while time.time() < deadline:
+        stats.adjust("sql", "busy@example.com", runs=1)
+    assert stats._COUNTERS.get(("sql", "busy@example.com")) is None
@@ -0,0 +1,56 @@
+"""Test pagination, projection and bulk writes of the Mongo agents API"""
+from fastapi.testclient import TestClient
+
+from backend.app import app
+
+
+def test_cursor_pagination_with_projection(db, mongo, auth_headers):
+    client = TestClient(app)
+    body = {"agents": [{"name": f"agent-{i}", "config": {"i": i}} for i in range(5)]}
+    created = client.post("/agents-mongo/bulk", json=body, headers=auth_headers).json()["agents"]
+    assert len(created) == 5
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, "fields": "name,status"}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get("/agents-mongo/", params=params, headers=auth_headers).json()
+        seen.extend(page["agents"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert [a["name"] for a in seen] == [f"agent-{i}" for i in range(5)]
+    assert set(seen[0]) == {"id", "name", "status"}
+
+    full = client.get("/agents-mongo/", params={"limit": 1}, headers=auth_headers).json()
+    assert full["agents"][0]["config"] == {"i": 0}
+    assert client.get("/agents-mongo/", params={"cursor": "bogus"}, headers=auth_headers).status_code == 400
+
+
+def test_patch_and_bulk_update_delete(db, mongo, auth_headers):
+    client = TestClient(app)
+    created = client.post(
+        "/agents-mongo/bulk",
+        json={"agents": [{"name": "a", "description": "keep"}, {"name": "b"}]},
+        headers=auth_headers,
+    ).json()["agents"]
+    a, b = created
+
+    patched = client.patch(f"/agents-mongo/{a['id']}", json={"status": "paused"}, headers=auth_headers).json()["agent"]
+    assert patched["status"] == "paused" and patched["description"] == "keep" and patched["name"] == "a"
+    cleared = client.patch(f"/agents-mongo/{a['id']}", json={"description": None}, headers=auth_headers).json()["agent"]
+    assert cleared["description"] is None
+
+    result = client.patch(
+        "/agents-mongo/bulk",
+        json={"agents": [{"id": a["id"], "name": "a2"}, {"id": b["id"], "public": True}]},
+        headers=auth_headers,
+    ).json()
+    assert result == {"matched": 2, "modified": 2}
+    assert client.get(f"/agents-mongo/{a['id']}", headers=auth_headers).json()["agent"]["name"] == "a2"
+    assert client.get(f"/agents-mongo/{b['id']}", headers=auth_headers).json()["agent"]["public"] is True
+
+    deleted = client.post("/agents-mongo/bulk/delete", json={"ids": [a["id"], b["id"]]}, headers=auth_headers).json()
+    assert deleted["deleted"] == 2
+    assert client.get(f"/agents-mongo/{a['id']}", headers=auth_headers).status_code == 404
@@ -0,0 +1,117 @@
+"""Test the prompt chain DAG engine against a local mock model"""
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.app import app
+from backend.chains.engine import ChainDefinitionError, ChainEngine, chain_engine, parse_definition
+
+
+class MockModel:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+
+    async def generate(self, prompt, mode="chat"):
+        self.calls.append(prompt)
+        await asyncio.sleep(self.delay)
+        return {"output": f"<{prompt}>", "status": "ok"}
+
+
+FAN_IN = json.dumps({
+    "steps": [
+        {"id": "a", "type": "model", "prompt": "a {input.topic}"},
+        {"id": "b", "type": "model", "prompt": "b {input.topic}"},
+        {"id": "c", "type": "model", "prompt": "c {input.topic}"},
+        {"id": "all", "type": "transform", "op": "join", "inputs": ["a", "b", "c"],
+         "values": ["{steps.a}", "{steps.b}", "{steps.c}"], "separator": "|"},
+    ],
+    "output": "all",
+})
+
+
+@pytest.mark.asyncio
+async def test_independent_steps_run_concurrently_and_rerun_hits_memo():
+    model = MockModel(delay=0.2)
+    engine = ChainEngine(model=model, max_parallel=4)
+    dag = parse_definition(FAN_IN)
+
+    result = await engine.run(dag, {"topic": "owls"}, "chain@example.com")
+    assert result["output"] == "<a owls>|<b owls>|<c owls>"
+    assert result["sum_ms"] >= 600
+    assert result["wall_ms"] < 450
+    assert result["critical_path_ms"] <= result["wall_ms"]
+
+    again = await engine.run(dag, {"topic": "owls"}, "chain@example.com")
+    assert len(model.calls) == 3
+    assert all(t["cached"] for t in again["steps"].values())
+
+    # a changed input only re-runs the steps whose content changed
+    await engine.run(dag, {"topic": "cats"}, "chain@example.com")
+    assert len(model.calls) == 6
+
+
+@pytest.mark.asyncio
+async def test_concurrency_budget_and_events():
+    model = MockModel(delay=0.1)
+    engine = ChainEngine(model=model, max_parallel=1)
+    events = []
+    result = await engine.run(parse_definition(FAN_IN), {"topic": "x"}, "u", emit=lambda e, d: events.append((e, d["step"])))
+    assert result["wall_ms"] >= 300
+    assert [e for e, _ in events].count("step_finished") == 4
+    assert events[-1] == ("step_finished", "all")
+
+
+@pytest.mark.asyncio
+async def test_search_errors_are_not_memoized():
+    replies = [{"items": [], "error": "search unavailable"}, {"items": [{"title": "owls"}]}]
+    calls = []
+
+    async def search(query):
+        calls.append(query)
+        return replies[len(calls) - 1]
+
+    engine = ChainEngine(model=MockModel(), search=search)
+    dag = parse_definition(json.dumps({"steps": [{"id": "s", "type": "search", "query": "{input.topic}"}]}))
+
+    assert (await engine.run(dag, {"topic": "owls"}, "u"))["output"]["error"]
+    result = await engine.run(dag, {"topic": "owls"}, "u")
+    assert result["output"] == replies[1] and not result["steps"]["s"]["cached"]
+    assert (await engine.run(dag, {"topic": "owls"}, "u"))["steps"]["s"]["cached"]
+    assert len(calls) == 2
+
+
+def test_invalid_definitions_are_rejected():
+    with pytest.raises(ChainDefinitionError, match="cycle"):
+        parse_definition(json.dumps({"steps": [
+            {"id": "a", "type": "model", "prompt": "{steps.b}", "inputs": ["b"]},
+            {"id": "b", "type": "model", "prompt": "{steps.a}", "inputs": ["a"]},
+        ]}))
+    with pytest.raises(ChainDefinitionError, match="undeclared"):
+        parse_definition(json.dumps({"steps": [
+            {"id": "a", "type": "model", "prompt": "x"},
+            {"id": "b", "type": "model", "prompt": "{steps.a}"},
+        ]}))
+    # free text stays usable as a single prompt
+    assert list(parse_definition("Summarise {input.text}").steps) == ["prompt"]
+
+
+def test_run_endpoint_streams_step_events(db, auth_headers):
+    chain_engine.model = MockModel()
+    try:
+        client = TestClient(app)
+        chain = client.post("/chains", json={"name": "fan-in", "definition": FAN_IN}, headers=auth_headers).json()["chain"]
+        assert client.post("/chains", json={"name": "bad", "definition": {"steps": []}}, headers=auth_headers).status_code == 400
+
+        resp = client.post(f"/chains/{chain['id']}/run", json={"input": {"topic": "sse"}}, headers=auth_headers)
+        assert resp.headers["content-type"].startswith("text/event-stream")
+        events = [line[len("event: "):] for line in resp.text.splitlines() if line.startswith("event: ")]
+        assert events.count("step_finished") == 4 and events[-1] == "done"
+
+        plain = client.post(f"/chains/{chain['id']}/run", json={"input": {"topic": "sse"}, "stream": False}, headers=auth_headers).json()
+        assert plain["status"] == "completed" and plain["output"] == "<a sse>|<b sse>|<c sse>"
+    finally:
+        chain_engine.model = None
+        chain_engine.clear_cache()
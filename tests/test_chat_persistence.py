@@ -0,0 +1,145 @@
+"""Test single-transaction chat turn persistence"""
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from backend.app import app
+from backend.ai.service import ai_service
+from backend.models import Message
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    async def generate(prompt, mode="chat", sources=None, max_retries=2):
+        return {"output": f"echo: {prompt}", "sources": [], "raw": None}
+
+    monkeypatch.setattr(ai_service, "generate", generate)
+
+
+@pytest.fixture
+def commits(db):
+    seen = []
+
+    def on_commit(conn):
+        seen.append(conn)
+
+    event.listen(db, "commit", on_commit)
+    yield seen
+    event.remove(db, "commit", on_commit)
+
+
+def test_generate_commits_once_per_turn(db, fake_model, commits, auth_headers):
+    client = TestClient(app)
+    r = client.post("/ai/generate", json={"prompt": "hello"}, headers=auth_headers)
+    assert r.status_code == 200
+    conv_id = r.json()["conv_id"]
+    assert len(commits) == 1
+
+    commits.clear()
+    r = client.post("/ai/generate", json={"prompt": "again", "conv_id": conv_id}, headers=auth_headers)
+    assert r.status_code == 200
+    assert r.json()["conv_id"] == conv_id
+    assert len(commits) == 1
+
+    with Session(db) as session:
+        msgs = session.exec(select(Message).where(Message.conversation_id == conv_id).order_by(Message.id)).all()
+    assert [m.role for m in msgs] == ["user", "assistant", "user", "assistant"]
+    assert msgs[-1].content == "echo: again"
+
+
+def test_generate_unknown_conversation_is_404(db, fake_model, auth_headers):
+    client = TestClient(app)
+    r = client.post("/ai/generate", json={"prompt": "hello", "conv_id": 999999}, headers=auth_headers)
+    assert r.status_code == 404
+
+
+def test_conversation_summary_counters(db, fake_model, auth_headers):
+    from backend.chat.persistence import backfill_conversation_summaries
+    from backend.models import Conversation
+
+    client = TestClient(app)
+    conv_id = client.post("/ai/generate", json={"prompt": "first"}, headers=auth_headers).json()["conv_id"]
+    client.post("/ai/generate", json={"prompt": "second", "conv_id": conv_id}, headers=auth_headers)
+
+    convs = client.get("/conversations", headers=auth_headers).json()["conversations"]
+    assert convs[0]["id"] == conv_id
+    assert convs[0]["message_count"] == 4
+    assert convs[0]["last_message_preview"] == "echo: second"
+
+    with Session(db) as session:
+        conv = session.get(Conversation, conv_id)
+        conv.message_count = 0
+        conv.last_message_preview = None
+        session.add(conv)
+        session.commit()
+    assert backfill_conversation_summaries() >= 1
+    with Session(db) as session:
+        conv = session.get(Conversation, conv_id)
+        assert conv.message_count == 4
+        assert conv.last_message_preview == "echo: second"
+
+
+class _BrokenStream(httpx.AsyncByteStream):
+    async def __aiter__(self):
+        yield b'data: {"choices": [{"delta": {"content": "partial "}}]}\n\n'
+        raise httpx.ReadError("upstream reset")
+
+
+def test_stream_failure_keeps_prompt_and_partial_answer(db, auth_headers, monkeypatch):
+    import backend.app as app_module
+    from backend.models import Conversation
+
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, stream=_BrokenStream()))
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(app_module.httpx, "AsyncClient", lambda **kw: real_client(transport=transport, **kw))
+    monkeypatch.setattr(ai_service, "key", "test-key")
+    monkeypatch.setattr(ai_service, "url", "http://model.test")
+
+    client = TestClient(app)
+    resp = client.post("/ai/stream", json={"prompt": "tell me a story"}, headers=auth_headers)
+    events = [json.loads(line[6:]) for line in resp.text.splitlines() if line.startswith("data: ")]
+    error = next(e for e in events if "error" in e)
+    assert error["error"] == "model_error" and error["conv_id"]
+
+    with Session(db) as session:
+        assert session.get(Conversation, error["conv_id"]).user_id == "tester@example.com"
+        msgs = session.exec(select(Message).where(Message.conversation_id == error["conv_id"]).order_by(Message.id)).all()
+    assert [(m.role, m.content) for m in msgs] == [("user", "tell me a story"), ("assistant", "partial ")]
+    assert json.loads(msgs[1].meta)["error"] == "model_error"
+
+
+def test_conversations_without_messages_are_listed_by_creation_time(db, auth_headers):
+    from datetime import datetime, timedelta
+
+    from sqlalchemy import insert
+
+    from backend.models import Conversation, init_db
+
+    old = datetime.utcnow() - timedelta(days=30)
+    with db.begin() as conn:
+        # as left by the additive migration: no last_message_at
+        legacy_id = conn.execute(insert(Conversation.__table__).values(
+            user_id="tester@example.com", title="legacy", created_at=old, message_count=0, pinned=False, last_message_at=None,
+        )).inserted_primary_key[0]
+    init_db()
+    with Session(db) as session:
+        assert session.get(Conversation, legacy_id).last_message_at == old
+    convs = TestClient(app).get("/conversations", headers=auth_headers).json()["conversations"]
+    stamps = [c["last_message_at"] for c in convs]
+    assert legacy_id in [c["id"] for c in convs]
+    assert None not in stamps and stamps == sorted(stamps, reverse=True)
+
+
+def test_migration_defaults_render_per_dialect():
+    from sqlalchemy import Boolean, String
+    from sqlalchemy.dialects import postgresql, sqlite
+
+    from backend.models import _default_sql
+
+    assert _default_sql(False, Boolean(), postgresql.dialect()) == "false"
+    assert _default_sql(True, Boolean(), sqlite.dialect()) == "1"
+    assert _default_sql("it's", String(), postgresql.dialect()) == "'it''s'"
@@ -0,0 +1,63 @@
+"""Test streaming Markdown exports"""
+from fastapi.testclient import TestClient
+from sqlalchemy import event, insert
+from sqlmodel import Session, select
+
+from backend.app import app
+from backend.models import Conversation, Message, engine
+from backend.routes.export import _markdown_chunks
+
+
+def _conversation(user_id, n):
+    with Session(engine) as session:
+        conv = Conversation(user_id=user_id, title="Long chat")
+        session.add(conv)
+        session.commit()
+        session.refresh(conv)
+        session.execute(insert(Message.__table__), [
+            {"conversation_id": conv.id, "role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}"}
+            for i in range(n)
+        ])
+        session.commit()
+        ids = session.exec(select(Message.id).where(Message.conversation_id == conv.id).order_by(Message.id)).all()
+    return conv.id, ids
+
+
+def test_chunks_stream_in_batches_after_an_immediate_heading(db):
+    conv_id, _ = _conversation("export@example.com", 250)
+    seen = []
+
+    def before_execute(*args):
+        seen.append(1)
+
+    event.listen(engine, "before_cursor_execute", before_execute)
+    try:
+        query = select(Message.role, Message.content).where(Message.conversation_id == conv_id).order_by(Message.id)
+        chunks = _markdown_chunks("Long chat", [query], batch_size=100)
+        assert next(chunks) == b"# Long chat\n\n"
+        assert seen == []  # nothing fetched before the first byte
+        rest = list(chunks)
+    finally:
+        event.remove(engine, "before_cursor_execute", before_execute)
+    assert len(rest) == 3
+    text = b"".join(rest).decode()
+    assert text.startswith("**user**: message 0\n\n") and text.endswith("**assistant**: message 249\n\n")
+
+
+def test_export_endpoints(db, auth_headers):
+    client = TestClient(app)
+    conv_id, ids = _conversation("tester@example.com", 40)
+    _, others = _conversation("someone-else@example.com", 2)
+
+    with client.stream("GET", f"/export/markdown/{conv_id}", headers=auth_headers) as resp:
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("text/markdown")
+        body = b"".join(resp.iter_bytes()).decode()
+    assert body.count("**user**") == 20 and body.index("message 9\n") < body.index("message 10\n")
+
+    resp = client.post("/export/messages", json={"message_ids": [ids[3], ids[1], others[0]]}, headers=auth_headers)
+    assert resp.text == "# Selected Messages\n\n**assistant**: message 1\n\n**assistant**: message 3\n\n"
+    assert client.post("/export/messages", json={"message_ids": ["x"]}, headers=auth_headers).status_code == 400
+
+    other_conv, _ = _conversation("someone-else@example.com", 1)
+    assert client.get(f"/export/markdown/{other_conv}", headers=auth_headers).status_code == 404
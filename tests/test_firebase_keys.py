@@ -0,0 +1,133 @@
+import datetime
+import time
+
+import jwt
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+from fastapi import HTTPException
+
+from backend.auth import firebase
+from backend.auth.firebase_keys import FirebaseKeyStore, max_age, verify_id_token
+
+PROJECT = "vaelis-test"
+
+
+def _keypair():
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "securetoken")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    return key, cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+KEY, CERT = _keypair()
+
+
+def _token(kid="k1", **claims):
+    now = int(time.time())
+    payload = {
+        "iss": f"https://securetoken.google.com/{PROJECT}",
+        "aud": PROJECT,
+        "sub": "user-1",
+        "iat": now,
+        "auth_time": now,
+        "exp": now + 3600,
+    }
+    payload.update(claims)
+    return jwt.encode(payload, KEY, algorithm="RS256", headers={"kid": kid})
+
+
+class Fetcher:
+    def __init__(self, certs, ttl=3600):
+        self.certs = certs
+        self.ttl = ttl
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.certs, self.ttl
+
+
+def test_max_age_parsing():
+    assert max_age("public, max-age=19302, must-revalidate, no-transform") == 19302
+    assert max_age("no-cache") is None
+    assert max_age(None) is None
+
+
+def test_verify_caches_keys_until_max_age():
+    fetch = Fetcher({"k1": CERT}, ttl=3600)
+    keys = FirebaseKeyStore(fetch=fetch)
+    claims = verify_id_token(_token(), PROJECT, keys)
+    assert claims["uid"] == "user-1"
+    verify_id_token(_token(sub="user-2"), PROJECT, keys)
+    assert fetch.calls == 1
+    assert 3500 < keys.refresh_in() + keys.refresh_margin <= 3600
+
+    keys._expires_at = time.time() - 1
+    verify_id_token(_token(), PROJECT, keys)
+    assert fetch.calls == 2
+
+
+def test_rejects_wrong_audience_expired_and_unknown_kid():
+    fetch = Fetcher({"k1": CERT})
+    keys = FirebaseKeyStore(fetch=fetch)
+    with pytest.raises(jwt.InvalidAudienceError):
+        verify_id_token(_token(aud="other"), PROJECT, keys)
+    with pytest.raises(jwt.ExpiredSignatureError):
+        verify_id_token(_token(exp=int(time.time()) - 600), PROJECT, keys)
+    with pytest.raises(jwt.InvalidTokenError):
+        verify_id_token(_token(kid="rotated"), PROJECT, keys)
+    # an unknown kid right after a fetch does not hammer the endpoint
+    assert fetch.calls == 1
+
+    keys._fetched_at -= 3600
+    fetch.certs = {"rotated": CERT}
+    assert verify_id_token(_token(kid="rotated"), PROJECT, keys)["uid"] == "user-1"
+    assert fetch.calls == 2
+
+
+def test_stale_keys_survive_failed_refresh():
+    fetch = Fetcher({"k1": CERT})
+    keys = FirebaseKeyStore(fetch=fetch)
+    keys.refresh()
+    keys._expires_at = time.time() - 1
+
+    def broken():
+        raise OSError("network down")
+
+    keys._fetch = broken
+    assert verify_id_token(_token(), PROJECT, keys)["uid"] == "user-1"
+
+
+def test_verify_firebase_token_caches_until_exp(monkeypatch):
+    fetch = Fetcher({"k1": CERT})
+    monkeypatch.setenv("FIREBASE_PROJECT_ID", PROJECT)
+    monkeypatch.setattr(firebase, "firebase_keys", FirebaseKeyStore(fetch=fetch))
+    firebase._TOKEN_CACHE.clear()
+
+    exp = int(time.time()) + 120
+    token = _token(exp=exp)
+    assert firebase.verify_firebase_token(token)["uid"] == "user-1"
+    hits = firebase._TOKEN_CACHE.hits
+    firebase.verify_firebase_token(token)
+    assert firebase._TOKEN_CACHE.hits == hits + 1
+    # the cached entry dies with the token
+    (_, expires_at), = firebase._TOKEN_CACHE._data.values()
+    assert expires_at == exp
+
+    with pytest.raises(HTTPException) as err:
+        firebase.verify_firebase_token(_token(exp=int(time.time()) - 600))
+    assert err.value.status_code == 401
+    assert fetch.calls == 1
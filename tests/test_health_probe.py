@@ -0,0 +1,60 @@
+"""Test the cached health prober and the liveness/readiness endpoints"""
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.app import app
+from backend.db_mongo import PoolMetrics
+from backend.utils.health_probe import HealthProber
+
+
+@pytest.mark.asyncio
+async def test_prober_serves_cached_state_until_stale():
+    calls = {"n": 0}
+
+    async def flaky():
+        calls["n"] += 1
+        return calls["n"] == 1
+
+    async def absent():
+        return None
+
+    async def broken():
+        raise RuntimeError("boom")
+
+    prober = HealthProber({"db": flaky, "other": absent, "bad": broken}, interval=0, max_age=0.05)
+    first = await prober.state()
+    assert first["db"]["status"] == "connected" and first["db"]["latency_ms"] is not None
+    assert first["other"]["status"] == "not_configured"
+    assert first["bad"]["status"] == "error" and first["bad"]["error"] == "boom"
+
+    await prober.state()
+    assert calls["n"] == 1
+    await asyncio.sleep(0.06)
+    assert (await prober.state())["db"]["status"] == "unreachable"
+    assert calls["n"] == 2
+
+
+def test_liveness_readiness_and_pool_metrics(db):
+    client = TestClient(app)
+    assert client.get("/health/live").json() == {"status": "ok"}
+    # readiness needs the startup hooks to have run
+    assert client.get("/health/ready").status_code == 503
+    with TestClient(app) as started:
+        ready = started.get("/health/ready")
+        assert ready.status_code == 200 and ready.json()["checks"]["sql_db"] == "connected"
+        metrics = started.get("/health/metrics").json()
+        assert metrics["mongo_pool"]["settings"]["maxPoolSize"] > 0
+
+
+def test_pool_metrics_track_checkouts():
+    metrics = PoolMetrics()
+    for _ in range(3):
+        metrics.connection_created(None)
+        metrics.connection_checked_out(None)
+    metrics.connection_checked_in(None)
+    metrics.connection_check_out_failed(None)
+    snap = metrics.snapshot()
+    assert snap["checkouts"] == 3 and snap["in_use"] == 2 and snap["max_in_use"] == 3
+    assert snap["open_connections"] == 3 and snap["checkout_failures"] == 1
@@ -0,0 +1,94 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+
+from backend.utils.asgi import RequestBodyTooLarge, read_body
+from backend.utils.idempotency import PENDING, IdempotencyMiddleware, MemoryBackend, SQLiteBackend
+
+
+def _app(backend):
+    app = FastAPI()
+    app.add_middleware(IdempotencyMiddleware, backend=backend)
+    app.state.calls = 0
+
+    @app.post("/work")
+    async def work(body: dict):
+        app.state.calls += 1
+        await asyncio.sleep(0.05)
+        if body.get("fail"):
+            raise HTTPException(status_code=503, detail="upstream down")
+        if body.get("throttle") and app.state.calls == 1:
+            raise HTTPException(status_code=429, detail="slow down")
+        return {"call": app.state.calls, "echo": body}
+
+    return app
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("kind", ["memory", "sqlite"])
+async def test_concurrent_duplicates_share_one_result(kind, tmp_path):
+    backend = MemoryBackend() if kind == "memory" else SQLiteBackend(str(tmp_path / "idem.db"))
+    app = _app(backend)
+    headers = {"Idempotency-Key": "abc"}
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        first, second = await asyncio.gather(
+            client.post("/work", json={"x": 1}, headers=headers),
+            client.post("/work", json={"x": 1}, headers=headers),
+        )
+        later = await client.post("/work", json={"x": 1}, headers=headers)
+
+    assert app.state.calls == 1
+    assert first.json() == second.json() == later.json() == {"call": 1, "echo": {"x": 1}}
+    assert later.headers["Idempotent-Replayed"] == "true"
+    assert later.headers["content-type"] == "application/json"
+
+
+@pytest.mark.asyncio
+async def test_reused_key_with_other_body_is_rejected_and_errors_are_retryable():
+    app = _app(MemoryBackend())
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        await client.post("/work", json={"x": 1}, headers={"Idempotency-Key": "k1"})
+        resp = await client.post("/work", json={"x": 2}, headers={"Idempotency-Key": "k1"})
+        assert resp.status_code == 422
+
+        assert (await client.post("/work", json={"fail": True}, headers={"Idempotency-Key": "k2"})).status_code == 503
+        assert (await client.post("/work", json={"fail": True}, headers={"Idempotency-Key": "k2"})).status_code == 503
+        # requests without a key are never deduplicated
+        await client.post("/work", json={"x": 1})
+    assert app.state.calls == 4
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_response_is_not_replayed():
+    app = _app(MemoryBackend())
+    headers = {"Idempotency-Key": "k3"}
+    async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+        assert (await client.post("/work", json={"throttle": True}, headers=headers)).status_code == 429
+        retry = await client.post("/work", json={"throttle": True}, headers=headers)
+    assert retry.status_code == 200 and "Idempotent-Replayed" not in retry.headers
+    assert app.state.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_read_body_joins_chunks_up_to_the_limit():
+    def receiver(chunks):
+        messages = iter([{"type": "http.request", "body": c, "more_body": i < len(chunks) - 1} for i, c in enumerate(chunks)])
+
+        async def receive():
+            return next(messages)
+        return receive
+
+    body, replay = await read_body(receiver([b"ab", b"cd", b"e"]), limit=5)
+    assert body == b"abcde" and (await replay())["body"] == b"abcde"
+    with pytest.raises(RequestBodyTooLarge):
+        await read_body(receiver([b"abc", b"def"]), limit=5)
+
+
+def test_sqlite_claims_expire(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / "idem.db"))
+    assert backend.claim("k", "f", ttl=-1) is None
+    # an expired in-flight claim (e.g. a crashed worker) does not block the key
+    assert backend.claim("k", "f", ttl=60) is None
+    assert backend.claim("k", "f", ttl=60).state == PENDING
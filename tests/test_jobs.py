@@ -0,0 +1,142 @@
+import asyncio
+import time
+
+import pytest
+from sqlmodel import Session
+
+from backend import jobs
+from backend.jobs import JobFailed, JobRunner, job
+from backend.models import Job, engine
+
+CALLS = {"flaky": 0}
+
+
+@job("test.add", queue="t-add")
+def add(a, b):
+    return a + b
+
+
+@job("test.flaky", queue="t-flaky", max_attempts=3)
+async def flaky(fail_times):
+    CALLS["flaky"] += 1
+    if CALLS["flaky"] <= fail_times:
+        raise RuntimeError("boom")
+    return {"calls": CALLS["flaky"]}
+
+
+@job("test.gone", queue="t-flaky", max_attempts=3)
+async def gone():
+    raise JobFailed("nothing to do")
+
+
+@job("test.slow", queue="t-slow")
+async def slow(seconds):
+    await asyncio.sleep(seconds)
+    return "done"
+
+
+job("test.pow", queue="t-cpu", cpu=True)(pow)
+
+
+@job("test.stuck", queue="t-stuck", max_attempts=3, timeout=0.1)
+def stuck(seconds):
+    CALLS["stuck"] = CALLS.get("stuck", 0) + 1
+    time.sleep(seconds)
+
+
+def _runner(*queues, process_workers=0):
+    return JobRunner(queues={q: 2 for q in queues}, poll_interval=0.05, process_workers=process_workers)
+
+
+@pytest.mark.asyncio
+async def test_persisted_jobs_run_after_start(db):
+    runner = _runner("t-add")
+    # submitted while no worker is running: the row waits in the table
+    job_id = runner.submit("test.add", 2, 3, user_id="jobs@example.com")
+    assert runner.get(job_id).status == "queued"
+
+    await runner.start()
+    try:
+        record = await runner.wait(job_id, timeout=5)
+    finally:
+        await runner.drain()
+    assert record.status == "succeeded"
+    assert jobs.job_view(record)["result"] == 5
+    assert runner.list_for_user("jobs@example.com")[0].id == job_id
+
+
+@pytest.mark.asyncio
+async def test_failures_retry_with_backoff_then_fail(db, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_RETRY_BASE", 0.01)
+    CALLS["flaky"] = 0
+    runner = _runner("t-flaky")
+    await runner.start()
+    try:
+        ok = await runner.wait(runner.submit("test.flaky", 2), timeout=5)
+        assert ok.status == "succeeded" and ok.attempts == 3
+
+        CALLS["flaky"] = 0
+        bad = await runner.wait(runner.submit("test.flaky", 10), timeout=5)
+        permanent = await runner.wait(runner.submit("test.gone"), timeout=5)
+    finally:
+        await runner.drain()
+    assert bad.status == "failed" and bad.attempts == 3
+    assert "boom" in bad.error
+    # JobFailed is not retried
+    assert permanent.status == "failed" and permanent.attempts == 1
+
+
+@pytest.mark.asyncio
+async def test_drain_requeues_unfinished_and_dedupes(db):
+    runner = _runner("t-slow")
+    await runner.start()
+    job_id = runner.submit("test.slow", 30, dedupe_key="slow-1")
+    assert runner.submit("test.slow", 30, dedupe_key="slow-1") == job_id
+    for _ in range(100):
+        if runner.get(job_id).status == "running":
+            break
+        await asyncio.sleep(0.02)
+    assert await runner.drain(timeout=0.05) == 1
+
+    record = runner.get(job_id)
+    assert record.status == "queued" and record.attempts == 0
+
+    # a fresh worker picks it up again
+    quick = _runner("t-slow")
+    await quick.start()
+    try:
+        # shorten the job so the test does not wait 30s
+        with Session(engine) as session:
+            row = session.get(Job, job_id)
+            row.args = '{"args": [0], "kwargs": {}}'
+            session.add(row)
+            session.commit()
+        assert (await quick.wait(job_id, timeout=5)).status == "succeeded"
+    finally:
+        await quick.drain()
+
+
+@pytest.mark.asyncio
+async def test_cpu_jobs_use_the_process_pool(db):
+    runner = _runner("t-cpu", process_workers=1)
+    await runner.start()
+    try:
+        record = await runner.wait(runner.submit("test.pow", 2, 10), timeout=20)
+    finally:
+        await runner.drain()
+    assert record.status == "succeeded" and jobs.job_view(record)["result"] == 1024
+
+
+@pytest.mark.asyncio
+async def test_timed_out_thread_jobs_are_not_retried(db, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_RETRY_BASE", 0.01)
+    CALLS["stuck"] = 0
+    runner = _runner("t-stuck")
+    await runner.start()
+    try:
+        record = await runner.wait(runner.submit("test.stuck", 0.5), timeout=5)
+    finally:
+        await runner.drain()
+    # the first attempt's thread is still sleeping; a retry would have run beside it
+    assert record.status == "failed" and record.error == "timeout"
+    assert record.attempts == 1 and CALLS["stuck"] == 1
@@ -0,0 +1,49 @@
+"""Test short-term memory consolidation"""
+from fastapi.testclient import TestClient
+
+from backend.app import app
+from backend.memory.consolidation import consolidate_user
+from backend.routes.auth import create_access_token
+
+
+def test_consolidation_merges_related_and_keeps_provenance(db):
+    uid = "consolidate@example.com"
+    headers = {"Authorization": f"Bearer {create_access_token({'uid': uid})}"}
+    client = TestClient(app)
+    for content in ["Trip to Lisbon in June", "Book flights for Lisbon", "Book flights for Lisbon"]:
+        client.post("/memories", json={"content": content, "tags": ["travel"]}, headers=headers)
+    client.post("/memories", json={"content": "Dentist appointment on Tuesday"}, headers=headers)
+
+    report = consolidate_user(uid, min_age_seconds=0)
+    assert report["active_before"] == 4
+    assert report["active_after"] == 2
+    assert report["groups_merged"] == 1
+
+    merged_id = report["consolidated_ids"][0]
+    long_term = client.get("/memories", params={"long_term": True}, headers=headers).json()["memories"]
+    merged = next(m for m in long_term if m["id"] == merged_id)
+    assert merged["content"].count("Book flights for Lisbon") == 1
+    assert merged["tags"] == "travel"
+
+    short_term = client.get("/memories", headers=headers).json()["memories"]
+    assert [m["content"] for m in short_term] == ["Dentist appointment on Tuesday"]
+
+    sources = client.get(f"/memories/{merged_id}/sources", headers=headers).json()["sources"]
+    assert len(sources) == 3 and all(s["archived"] for s in sources)
+
+
+def test_consolidate_endpoint_runs_as_the_deduplicated_job(db, monkeypatch):
+    from backend import jobs
+
+    uid = "consolidate-endpoint@example.com"
+    headers = {"Authorization": f"Bearer {create_access_token({'uid': uid})}"}
+    submitted = []
+    submit = jobs.runner.submit
+    monkeypatch.setattr(jobs, "submit", lambda *a, **kw: submitted.append(kw["dedupe_key"]) or submit(*a, **kw))
+    with TestClient(app) as client:
+        for content in ["Water the ferns", "Water the ferns"]:
+            client.post("/memories", json={"content": content}, headers=headers)
+        r = client.post("/memories/consolidate", headers=headers)
+    assert r.status_code == 200, r.text
+    assert submitted == [f"consolidate:{uid}"]
+    assert r.json()["report"]["user_id"] == uid
@@ -0,0 +1,39 @@
+"""Test the per-user memory vector index"""
+from fastapi.testclient import TestClient
+
+from backend.app import app
+from backend.memory.embedding import embed
+from backend.memory.index import UserMemoryIndex
+
+
+def test_index_upsert_remove_and_rank():
+    index = UserMemoryIndex()
+    for i in range(40):
+        index.upsert(i, f"filler note number {i} about groceries")
+    index.upsert(100, "my sister's birthday is on the ninth of may")
+    index.upsert(101, "I prefer answers formatted as bullet points")
+    hits = index.search(embed("when is my sister's birthday"), k=3)
+    assert hits[0][0] == 100
+
+    index.remove(100)
+    index.remove(5)
+    assert index.size == 40
+    assert all(mem_id not in (100, 5) for mem_id, _, _ in index.search(embed("sister birthday"), k=40))
+    assert index.search(embed("bullet points please"), k=1)[0][0] == 101
+
+
+def test_memory_search_endpoint_tracks_updates(db, auth_headers):
+    client = TestClient(app)
+    a = client.post("/memories", json={"content": "I am allergic to peanuts"}, headers=auth_headers).json()["memory"]
+    client.post("/memories", json={"content": "My favourite colour is green"}, headers=auth_headers)
+
+    r = client.get("/memories/search", params={"q": "peanuts allergy"}, headers=auth_headers)
+    assert r.json()["memories"][0]["id"] == a["id"]
+
+    client.put(f"/memories/{a['id']}", json={"content": "I love hiking"}, headers=auth_headers)
+    r = client.get("/memories/search", params={"q": "hiking"}, headers=auth_headers)
+    assert r.json()["memories"][0]["id"] == a["id"]
+
+    client.delete(f"/memories/{a['id']}", headers=auth_headers)
+    r = client.get("/memories/search", params={"q": "hiking"}, headers=auth_headers)
+    assert all(m["id"] != a["id"] for m in r.json()["memories"])
@@ -0,0 +1,37 @@
+"""Test full-text message search"""
+from fastapi.testclient import TestClient
+
+from backend.app import app
+from backend.chat.persistence import persist_turn
+from backend.routes.auth import create_access_token
+
+
+def _headers(uid):
+    return {"Authorization": f"Bearer {create_access_token({'uid': uid})}"}
+
+
+def test_search_ranks_highlights_and_scopes_by_user(db):
+    conv_id = persist_turn("alice@example.com", user_content="How do volcanoes form?", assistant_content="Volcanoes form where magma reaches the surface.", title="Geology chat")
+    persist_turn("alice@example.com", user_content="Best pasta recipe", assistant_content="Boil the pasta in salted water.")
+    persist_turn("bob@example.com", user_content="volcanoes are cool", assistant_content="Indeed.")
+
+    client = TestClient(app)
+    r = client.get("/search/messages", params={"q": "volcano"}, headers=_headers("alice@example.com"))
+    assert r.status_code == 200
+    results = r.json()["results"]
+    assert len(results) == 2
+    assert all(res["conversation_id"] == conv_id for res in results)
+    assert "<mark>" in results[0]["snippet"]
+
+    r = client.get("/search/messages", params={"q": "geology"}, headers=_headers("alice@example.com"))
+    assert "<mark>Geology</mark>" in r.json()["results"][0]["conversation_title"]
+
+    r = client.get("/search/messages", params={"q": "volcano", "limit": 1}, headers=_headers("alice@example.com"))
+    assert len(r.json()["results"]) == 1 and r.json()["has_more"] is True
+
+    r = client.get("/search/messages", params={"q": "volcano", "date_from": "2999-01-01"}, headers=_headers("alice@example.com"))
+    assert r.json()["results"] == []
+
+    # bob's title matches too, but alice's messages never leak into his results
+    r = client.get("/search/messages", params={"q": "volcanoes"}, headers=_headers("bob@example.com"))
+    assert r.json()["results"] and all(res["conversation_id"] != conv_id for res in r.json()["results"])
@@ -0,0 +1,62 @@
+import uuid
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from backend.app import app
+from backend.auth.principal import principals
+from backend.routes.auth import create_access_token
+
+
+def _headers(uid):
+    token = create_access_token({"uid": uid, "email": uid, "name": "p"})
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _count_queries(engine):
+    statements = []
+
+    def before(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before)
+    return statements, lambda: event.remove(engine, "before_cursor_execute", before)
+
+
+def test_principal_and_account_are_cached(db):
+    client = TestClient(app)
+    uid = f"{uuid.uuid4().hex}@example.com"
+    headers = _headers(uid)
+
+    me = client.get("/account/me", headers=headers).json()["account"]
+    assert me["user_id"] == uid and me["credits"] == 0.0
+
+    statements, stop = _count_queries(db)
+    try:
+        again = client.get("/account/me", headers=headers).json()["account"]
+    finally:
+        stop()
+    assert again["id"] == me["id"]
+    assert not [s for s in statements if "account" in s.lower()]
+
+
+def test_account_mutation_invalidates_snapshot(db):
+    client = TestClient(app)
+    uid = f"{uuid.uuid4().hex}@example.com"
+    headers = _headers(uid)
+
+    client.get("/account/me", headers=headers)
+    assert client.post("/account/credits/add", json={"amount": 5}, headers=headers).json()["credits"] == 5.0
+    assert client.get("/account/me", headers=headers).json()["account"]["credits"] == 5.0
+    assert len(client.get("/account/transactions", headers=headers).json()["transactions"]) == 1
+
+
+def test_principal_reads_like_claims(db):
+    uid = f"{uuid.uuid4().hex}@example.com"
+    principal = principals.remember("k-" + uid, {"uid": uid, "email": uid, "exp": 9999999999})
+    assert principal["uid"] == uid
+    assert principal.get("email_verified", False) is False
+    assert principal.account is None and principal.role is None
+    principal.ensure_account()
+    assert principal.role == "member"
+    assert principals.get("k-" + uid) is principal
@@ -0,0 +1,108 @@
+import json
+import os
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.routes.auth import create_access_token
+from backend.utils.rate_limit import (
+    MemoryBackend,
+    RateLimiter,
+    RateLimitMiddleware,
+    SQLiteBackend,
+    request_cost,
+)
+
+
+def _app(limiter):
+    app = FastAPI()
+    app.add_middleware(RateLimitMiddleware, limiter=limiter, paths=[r"^/ai/"])
+
+    @app.post("/ai/echo")
+    async def echo(body: dict):
+        return body
+
+    @app.post("/cheap")
+    async def cheap():
+        return {"ok": True}
+
+    return app
+
+
+def test_request_cost_weights_by_prompt_size():
+    assert request_cost(b"") == 1
+    assert request_cost(json.dumps({"prompt": "hi"}).encode()) == 1
+    assert request_cost(json.dumps({"prompt": "x" * 8000, "meta": ["y" * 4000]}).encode()) == 4
+
+
+def test_buckets_refill_and_evict_when_idle():
+    limiter = RateLimiter(MemoryBackend(), per_minute=60, burst=3)
+    assert [limiter.check("a").allowed for _ in range(4)] == [True, True, True, False]
+    denied = limiter.check("a")
+    assert 0 < denied.retry_after <= 1
+    assert limiter.check("b").allowed
+    assert limiter.idle == 3
+
+    # oversized requests are charged a full bucket instead of being refused forever
+    assert limiter.check("c", cost=50).allowed
+    assert not limiter.check("c").allowed
+
+
+def test_sqlite_backend_is_shared_between_limiters(tmp_path):
+    path = str(tmp_path / "buckets.db")
+    first = RateLimiter(SQLiteBackend(path), per_minute=60, burst=2)
+    second = RateLimiter(SQLiteBackend(path), per_minute=60, burst=2)
+    assert first.check("u").allowed
+    assert second.check("u").allowed
+    assert not first.check("u").allowed
+
+
+def test_middleware_sets_headers_and_rejects(db):
+    client = TestClient(_app(RateLimiter(MemoryBackend(), per_minute=60, burst=5)))
+    token = create_access_token({"uid": f"rl-{time.time()}", "email": "rl@example.com"})
+    headers = {"Authorization": f"Bearer {token}"}
+
+    resp = client.post("/ai/echo", json={"prompt": "hello"}, headers=headers)
+    assert resp.status_code == 200 and resp.json() == {"prompt": "hello"}
+    assert resp.headers["X-RateLimit-Limit"] == "5"
+    assert resp.headers["X-RateLimit-Remaining"] == "4"
+    assert resp.headers["X-RateLimit-Cost"] == "1"
+
+    resp = client.post("/ai/echo", json={"prompt": "x" * 12000}, headers=headers)
+    assert resp.headers["X-RateLimit-Cost"] == "4"
+    assert resp.headers["X-RateLimit-Remaining"] == "0"
+
+    resp = client.post("/ai/echo", json={"prompt": "again"}, headers=headers)
+    assert resp.status_code == 429
+    assert resp.json()["error"] == "rate_limited"
+    assert int(resp.headers["Retry-After"]) >= 1
+
+    # other callers and unmatched routes are unaffected
+    assert client.post("/ai/echo", json={}).status_code == 200
+    assert "X-RateLimit-Limit" not in client.post("/cheap").headers
+
+
+def test_principal_is_resolved_once_per_request(db, monkeypatch):
+    from fastapi import Depends
+
+    from backend.auth import firebase
+    from backend.utils.idempotency import IdempotencyMiddleware, MemoryBackend as IdempotencyBackend
+
+    app = FastAPI()
+    app.add_middleware(RateLimitMiddleware, limiter=RateLimiter(MemoryBackend(), per_minute=60, burst=5), paths=[r"^/ai/"])
+    app.add_middleware(IdempotencyMiddleware, backend=IdempotencyBackend())
+
+    @app.post("/ai/whoami")
+    async def whoami(user=Depends(firebase.firebase_auth_required)):
+        return {"uid": user.uid}
+
+    calls = []
+    authenticate = firebase.authenticate
+    monkeypatch.setattr(firebase, "authenticate", lambda token: calls.append(token) or authenticate(token))
+    uid = f"once-{time.time()}"
+    headers = {"Authorization": f"Bearer {create_access_token({'uid': uid})}", "Idempotency-Key": "k1"}
+
+    resp = TestClient(app).post("/ai/whoami", json={}, headers=headers)
+    assert resp.status_code == 200 and resp.json() == {"uid": uid}
+    assert len(calls) == 1
@@ -0,0 +1,102 @@
+"""Test declarative reference data sync (bulk upsert, hash skip)"""
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from backend.app import app
+from backend.models import Tool, engine
+from backend.utils import refdata
+
+
+@pytest.fixture
+def statements(db):
+    seen = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        seen.append(statement.split()[0].upper())
+
+    event.listen(db, "before_cursor_execute", before_execute)
+    yield seen
+    event.remove(db, "before_cursor_execute", before_execute)
+
+
+def _write(path, rows, version=1):
+    path.write_text(json.dumps({"name": "reftest", "version": version, "key": "name", "insert_only": ["enabled"], "rows": rows}))
+    return str(path)
+
+
+def _tools(prefix):
+    with Session(engine) as session:
+        return {t.name: t for t in session.exec(select(Tool).where(Tool.name.startswith(prefix))).all()}
+
+
+def test_bulk_upsert_and_hash_skip(tmp_path, statements):
+    rows = [{"name": f"RefTest {i}", "category": "test", "description": f"tool {i}", "enabled": True} for i in range(30)]
+    path = _write(tmp_path / "reftest.json", rows)
+
+    result = refdata.sync("reftest", Tool, path=path)
+    assert (result.inserted, result.updated, result.skipped) == (30, 0, False)
+    # state read, state row lock (+ re-read, create), one select of existing rows, one multi-row insert, state write
+    assert statements == ["SELECT", "UPDATE", "SELECT", "INSERT", "SELECT", "INSERT", "UPDATE"]
+    assert len(_tools("RefTest ")) == 30
+
+    statements.clear()
+    assert refdata.sync("reftest", Tool, path=path).skipped
+    assert statements == []
+    refdata.forget("reftest")
+    assert refdata.sync("reftest", Tool, path=path).skipped
+    assert statements == ["SELECT"]
+
+    # an admin disables a tool; a changed file updates descriptions but keeps that
+    with Session(engine) as session:
+        tool = session.exec(select(Tool).where(Tool.name == "RefTest 0")).first()
+        tool.enabled = False
+        session.add(tool)
+        session.commit()
+    rows[0]["description"] = "renamed"
+    rows[0]["enabled"] = True
+    rows.append({"name": "RefTest new", "category": "test"})
+    statements.clear()
+    result = refdata.sync("reftest", Tool, path=_write(tmp_path / "reftest.json", rows, version=2))
+    assert (result.inserted, result.updated, result.unchanged) == (1, 1, 29)
+    assert statements.count("UPDATE") == 3  # the version row lock, the changed rows in one executemany, the version row
+    tools = _tools("RefTest ")
+    assert tools["RefTest 0"].description == "renamed" and tools["RefTest 0"].enabled is False
+    assert tools["RefTest new"].enabled is True and tools["RefTest new"].created_at is not None
+
+
+def test_invalid_files_are_rejected(tmp_path):
+    with pytest.raises(refdata.RefDataError, match="duplicate"):
+        refdata.load("reftest", _write(tmp_path / "dup.json", [{"name": "a"}, {"name": "a"}]))
+    with pytest.raises(refdata.RefDataError, match="no columns"):
+        refdata.sync("reftest", Tool, path=_write(tmp_path / "bad.json", [{"name": "RefTest bad", "colour": "red"}]), force=True)
+
+
+def test_seed_endpoint_uses_the_tools_file(db):
+    client = TestClient(app)
+    refdata.forget("tools")
+    first = client.post("/admin/seed/tools").json()
+    assert first["status"] == "ok"
+    assert client.post("/admin/seed/tools").json()["skipped"] is True
+    assert len(_tools("")) >= len(refdata.load("tools").rows)
+
+
+def test_concurrent_syncs_do_not_duplicate_new_rows(tmp_path, db, monkeypatch):
+    import contextlib
+    import threading
+
+    # two workers: no shared in-process lock or memo, only the database
+    monkeypatch.setattr(refdata, "_lock", contextlib.nullcontext())
+    path = _write(tmp_path / "reftest.json", [{"name": "RefRace 0", "category": "test"}], version=7)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(refdata.sync("reftest", Tool, path=path))) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    refdata.forget("reftest")
+    assert sorted(r.inserted for r in results) == [0, 1]
+    assert len(_tools("RefRace ")) == 1
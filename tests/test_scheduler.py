@@ -0,0 +1,180 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from backend.app import app
+from backend.models import SchedulerLease, engine
+from backend.scheduler import CronError, CronExpression, Scheduler
+
+
+def test_cron_next_after():
+    at = datetime(2026, 3, 6, 10, 7, 30)  # a Friday
+    assert CronExpression("*/15 * * * *").next_after(at) == datetime(2026, 3, 6, 10, 15)
+    assert CronExpression("0 9 * * 1-5").next_after(at) == datetime(2026, 3, 9, 9, 0)
+    assert CronExpression("@daily").next_after(at) == datetime(2026, 3, 7, 0, 0)
+    assert CronExpression("30 4 1 */3 *").next_after(at) == datetime(2026, 4, 1, 4, 30)
+    # both day fields restricted: either one matches
+    assert CronExpression("0 0 13 * 5").next_after(at) == datetime(2026, 3, 13, 0, 0)
+    assert CronExpression("0 0 13 * 0,7").next_after(at) == datetime(2026, 3, 8, 0, 0)
+    for bad in ("* * * *", "61 * * * *", "*/0 * * * *", "a * * * *", "0 0 31 2 *"):
+        with pytest.raises(CronError):
+            CronExpression(bad).next_after(at)
+
+
+def _make_due(name: str, ago: timedelta) -> None:
+    with Session(engine) as session:
+        row = session.get(SchedulerLease, name)
+        row.next_run_at = datetime.utcnow() - ago
+        row.lease_expires_at = None
+        session.add(row)
+        session.commit()
+
+
+def _workers(name: str, func, **options):
+    workers = [Scheduler(owner=f"worker-{i}") for i in range(2)]
+    for w in workers:
+        w.register(name, "0 * * * *", func, **options)
+    workers[0].sync()
+    return workers
+
+
+async def _settle(*workers):
+    for w in workers:
+        await asyncio.gather(*w._running.values())
+
+
+@pytest.mark.asyncio
+async def test_only_one_worker_runs_each_occurrence(db):
+    calls = []
+    workers = _workers("test.leader", lambda: calls.append(1))
+    _make_due("test.leader", timedelta(seconds=1))
+
+    now = datetime.utcnow()
+    rows = [w.due(now)[0] for w in workers]
+    assert [w.claim(row, now) for w, row in zip(workers, rows)] == [True, False]
+
+    _make_due("test.leader", timedelta(seconds=1))
+    started = await asyncio.gather(*(w.run_pending() for w in workers))
+    await _settle(*workers)
+    assert sorted(len(s) for s in started) == [0, 1]
+    assert calls == [1]
+
+    [status] = [s for s in workers[0].status() if s["name"] == "test.leader"]
+    assert status["last_status"] == "succeeded" and status["running_on"] is None
+    assert datetime.fromisoformat(status["next_run_at"]) > datetime.utcnow()
+
+
+@pytest.mark.asyncio
+async def test_missed_runs_are_coalesced_or_skipped(db):
+    calls = []
+
+    async def work():
+        calls.append(1)
+
+    catch_up, _ = _workers("test.catch_up", work)
+    skip, _ = _workers("test.skip", work, misfire="skip")
+    _make_due("test.catch_up", timedelta(hours=3))
+    _make_due("test.skip", timedelta(hours=3))
+
+    await catch_up.run_pending()
+    await skip.run_pending()
+    await _settle(catch_up, skip)
+
+    assert calls == [1]
+    [ran] = catch_up.history("test.catch_up")
+    assert ran.status == "succeeded" and ran.missed == 3
+    [skipped] = skip.history("test.skip")
+    assert skipped.status == "skipped" and skipped.missed == 4
+
+
+@pytest.mark.asyncio
+async def test_failures_and_timeouts_are_recorded(db):
+    def boom():
+        raise RuntimeError("upstream down")
+
+    async def hang():
+        await asyncio.sleep(5)
+
+    failing, _ = _workers("test.boom", boom)
+    slow, _ = _workers("test.hang", hang, timeout=0.05)
+    _make_due("test.boom", timedelta(seconds=1))
+    _make_due("test.hang", timedelta(seconds=1))
+    await failing.run_pending()
+    await slow.run_pending()
+    await _settle(failing, slow)
+
+    assert "upstream down" in failing.history("test.boom")[0].error
+    assert "timed out" in slow.history("test.hang")[0].error
+    # the lease is released so the next occurrence can run
+    with Session(engine) as session:
+        assert session.get(SchedulerLease, "test.boom").lease_expires_at is None
+
+
+def test_admin_schedules_endpoint(db, auth_headers, admin_headers):
+    client = TestClient(app)
+    assert client.get("/admin/schedules").status_code == 401
+    assert client.post("/admin/schedules/audit.prune/run", headers=auth_headers).status_code == 403
+
+    body = client.get("/admin/schedules", headers=admin_headers).json()
+    names = {s["name"] for s in body["schedules"]}
+    assert {"news.refresh_coverage", "credibility.rescore_stale", "audit.prune", "memory.consolidation"} <= names
+
+    assert client.post("/admin/schedules/audit.prune/run", headers=admin_headers).json()["ok"] is True
+    with Session(engine) as session:
+        assert session.get(SchedulerLease, "audit.prune").next_run_at <= datetime.utcnow()
+    assert client.post("/admin/schedules/nope/run", headers=admin_headers).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_credibility_rescore_keeps_scores_when_the_model_fails(db, monkeypatch):
+    from backend.ai.service import ai_service
+    from backend.models import CredibilityScore
+    from backend.routes.web import rescore_stale_credibility
+
+    old = datetime.utcnow() - timedelta(days=365)
+    with Session(engine) as session:
+        for i, score in enumerate((0.9, 0.2)):
+            session.add(CredibilityScore(url=f"https://stale{i}.example/a", domain=f"stale{i}.example", score=score, last_checked=old))
+        session.commit()
+
+    async def down(prompt, mode="chat", **kwargs):
+        return {"output": "model unavailable", "status": "error"}
+
+    monkeypatch.setattr(ai_service, "generate", down)
+    assert await rescore_stale_credibility(limit=2) == 0
+    with Session(engine) as session:
+        rows = session.exec(select(CredibilityScore).where(CredibilityScore.url.startswith("https://stale"))).all()
+    assert sorted((r.score, r.last_checked) for r in rows) == [(0.2, old), (0.9, old)]
+
+
+@pytest.mark.asyncio
+async def test_news_refresh_stores_items_and_keeps_rows_on_search_errors(db, monkeypatch):
+    from backend.models import NewsCoverage
+    from backend.routes import web
+
+    now = datetime.utcnow()
+    with Session(engine) as session:
+        for topic in ("cov-ok", "cov-down"):
+            row = session.get(NewsCoverage, topic) or NewsCoverage(topic=topic)
+            row.requested_at, row.fetched_at, row.result_count, row.sources = now, now - timedelta(days=2), 7, "[]"
+            session.add(row)
+        session.commit()
+
+    async def search(topic):
+        if topic == "cov-down":
+            return {"items": [], "error": "quota exceeded"}
+        return {"items": [{"url": f"https://news.example/{i}"} for i in range(3)]}
+
+    monkeypatch.setattr(web, "tavily_search", search)
+    with Session(engine) as session:
+        tracked = len(session.exec(select(NewsCoverage.topic)).all())
+    refreshed = await web.refresh_news_coverage(limit=tracked)
+    with Session(engine) as session:
+        ok, down = session.get(NewsCoverage, "cov-ok"), session.get(NewsCoverage, "cov-down")
+    assert ok.result_count == 3 and ok.fetched_at > now
+    # the failed search neither overwrote the row nor counted as refreshed
+    assert down.result_count == 7 and down.fetched_at < now
+    assert refreshed == tracked - 1
@@ -0,0 +1,54 @@
+"""Test the normalized tag index"""
+from fastapi.testclient import TestClient
+
+from backend.app import app
+from backend.chat.persistence import persist_turn
+from backend.routes.auth import create_access_token
+
+
+def test_tag_filters_and_facets(db):
+    uid = "tags@example.com"
+    headers = {"Authorization": f"Bearer {create_access_token({'uid': uid})}"}
+    client = TestClient(app)
+    a = client.post("/memories", json={"content": "a", "tags": ["work", "urgent"]}, headers=headers).json()["memory"]
+    b = client.post("/memories", json={"content": "b", "tags": ["Work"]}, headers=headers).json()["memory"]
+    client.post("/memories", json={"content": "c", "tags": ["home"]}, headers=headers)
+
+    r = client.get("/tags/memories", params={"tags": "work,urgent"}, headers=headers)
+    assert [m["id"] for m in r.json()["memories"]] == [a["id"]]
+    r = client.get("/tags/memories", params={"tags": "urgent,home", "mode": "or"}, headers=headers)
+    assert len(r.json()["memories"]) == 2
+
+    client.put(f"/memories/{b['id']}", json={"tags": ["home"]}, headers=headers)
+    facets = {t["tag"]: t["count"] for t in client.get("/tags/", params={"type": "memory"}, headers=headers).json()["tags"]}
+    assert facets == {"home": 2, "work": 1, "urgent": 1}
+
+    conv_id = persist_turn(uid, user_content="tagged chat", assistant_content="ok")
+    client.post(f"/conversations/{conv_id}/tags", json={"tags": ["work"]}, headers=headers)
+    r = client.get("/tags/conversations", params={"tags": "work"}, headers=headers)
+    assert [c["id"] for c in r.json()["conversations"]] == [conv_id]
+    r = client.get("/search/messages", params={"q": "tagged", "tag": "work"}, headers=headers)
+    assert {res["conversation_id"] for res in r.json()["results"]} == {conv_id}
+    r = client.get("/search/messages", params={"q": "tagged", "tag": "home"}, headers=headers)
+    assert r.json()["results"] == []
+
+
+def test_init_db_indexes_rows_tagged_before_the_index(db):
+    from sqlmodel import Session
+
+    from backend import tags
+    from backend.models import Memory, init_db
+
+    uid = "legacy-tags@example.com"
+    with Session(db) as session:
+        legacy = Memory(user_id=uid, content="from before the tag index", tags="Garden, seeds")
+        session.add(legacy)
+        session.commit()
+        legacy_id = legacy.id
+        assert tags.find_targets(session, uid, tags.MEMORY, ["garden"]) == []
+
+    init_db()
+    init_db()
+    with Session(db) as session:
+        assert tags.find_targets(session, uid, tags.MEMORY, ["garden", "seeds"]) == [legacy_id]
+        assert tags.tag_counts(session, uid) == [{"tag": "garden", "count": 1}, {"tag": "seeds", "count": 1}]
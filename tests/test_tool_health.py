@@ -0,0 +1,89 @@
+"""Test tool health probing and routing around tools marked down"""
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from backend.app import app
+from backend.models import Tool, engine
+from backend.tools import catalog as tool_catalog
+from backend.tools.health import ToolHealth, tool_health
+from backend.tools.runtime import implementation
+
+FLAKY = {"up": True, "calls": 0}
+
+
+def flaky_probe():
+    return FLAKY["up"]
+
+
+@implementation("test.flaky", probe=flaky_probe)
+def flaky_tool(input_data, tool, user_id):
+    FLAKY["calls"] += 1
+    return {"ok": True}
+
+
+@pytest.mark.asyncio
+async def test_probe_states_streaks_and_recovery():
+    state = {"ok": True}
+
+    async def hang():
+        await asyncio.sleep(1)
+
+    health = ToolHealth(timeout=0.05, down_after=2)
+    health.register("flip", lambda: state["ok"])
+    health.register("hang", hang)
+    health.register("unset", lambda: None)
+    health.register("boom", lambda: 1 / 0)
+
+    await health.probe_all()
+    assert health.get("flip")["status"] == "healthy" and health.get("flip")["last_success"]
+    assert health.get("hang")["status"] == "degraded" and "timed out" in health.get("hang")["error"]
+    assert health.get("unset")["status"] == "unconfigured" and health.is_down("unset")
+    assert "ZeroDivisionError" in health.get("boom")["error"]
+    assert health.get("missing")["status"] == "unknown" and not health.is_down("missing")
+
+    state["ok"] = False
+    await health.probe_all()
+    assert health.get("flip")["status"] == "degraded" and not health.is_down("flip")
+    await health.probe_all()
+    flip = health.get("flip")
+    assert flip["status"] == "down" and flip["error_streak"] == 2 and flip["last_success"]
+    assert health.is_down("hang")
+
+    state["ok"] = True
+    await health.probe_all()
+    assert health.get("flip")["status"] == "healthy" and health.get("flip")["error_streak"] == 0
+
+
+def test_runtime_routes_around_down_tools(db, auth_headers):
+    client = TestClient(app)
+    client.post("/admin/seed/tools")
+    with Session(engine) as session:
+        tool = session.exec(select(Tool).where(Tool.name == "Flaky Probe")).first()
+        if tool is None:
+            tool = Tool(name="Flaky Probe", category="test", config=json.dumps({"implementation": "test.flaky"}))
+            session.add(tool)
+            session.commit()
+            session.refresh(tool)
+    tool_catalog.invalidate_catalog()
+    client.post(f"/tools/{tool.id}/permissions", headers=auth_headers)
+
+    try:
+        FLAKY.update(up=False, calls=0)
+        for _ in range(tool_health.down_after):
+            asyncio.run(tool_health.probe_all())
+        resp = client.post(f"/tools/{tool.id}/execute", json={"input_data": {}}, headers=auth_headers)
+        assert resp.status_code == 503 and "unavailable" in resp.json()["message"]
+        assert FLAKY["calls"] == 0
+
+        health = {h["tool_id"]: h for h in client.get("/tools/health/status").json()["health"]}
+        assert health[tool.id]["status"] == "down" and health[tool.id]["error_streak"] >= 2
+
+        FLAKY["up"] = True
+        asyncio.run(tool_health.probe_all())
+        assert client.post(f"/tools/{tool.id}/execute", json={"input_data": {}}, headers=auth_headers).json()["output"] == {"ok": True}
+    finally:
+        FLAKY["up"] = True
@@ -0,0 +1,140 @@
+"""Test the tool runtime: implementations, deadlines, parallel calls, caching and batched usage"""
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from backend.app import app
+from backend.models import Tool, ToolPermission, ToolUsage, engine
+from backend.tools import catalog as tool_catalog
+from backend.tools.runtime import implementation, tool_runtime
+
+CALLS = {"sleep": 0}
+
+
+@implementation("test.sleep", deterministic=True, timeout=5)
+async def sleep_tool(input_data, tool, user_id):
+    CALLS["sleep"] += 1
+    await asyncio.sleep(input_data.get("seconds", 0))
+    return {"slept": input_data.get("seconds", 0)}
+
+
+def _tool(name, implementation=None):
+    with Session(engine) as session:
+        tool = session.exec(select(Tool).where(Tool.name == name)).first()
+        if tool is None:
+            config = json.dumps({"implementation": implementation}) if implementation else None
+            tool = Tool(name=name, category="test", description="test tool", config=config)
+            session.add(tool)
+            session.commit()
+            session.refresh(tool)
+    tool_catalog.invalidate_catalog()
+    return tool.id
+
+
+def _usage_count(uid):
+    with Session(engine) as session:
+        return len(session.exec(select(ToolUsage.id).where(ToolUsage.user_id == uid)).all())
+
+
+@pytest.fixture
+def client(db, auth_headers):
+    client = TestClient(app)
+    client.post("/admin/seed/tools")
+    return client
+
+
+def test_portfolio_analyzer_is_cached_and_usage_is_batched(client, auth_headers):
+    tool_id = next(t["id"] for t in client.get("/tools/", headers=auth_headers).json()["tools"] if t["name"] == "Portfolio Analyzer")
+    assert client.post(f"/tools/{tool_id}/execute", json={"input_data": {}}, headers=auth_headers).status_code == 403
+    client.post(f"/tools/{tool_id}/permissions", headers=auth_headers)
+
+    holdings = [
+        {"symbol": "AAA", "value": 600, "expected_return": 0.1, "volatility": 0.2},
+        {"symbol": "BBB", "value": 400, "expected_return": 0.05, "volatility": 0.1},
+    ]
+    tool_runtime.usage.flush()
+    before = _usage_count("tester@example.com")
+    first = client.post(f"/tools/{tool_id}/execute", json={"input_data": {"holdings": holdings}}, headers=auth_headers).json()
+    assert first["cached"] is False
+    assert first["output"]["weights"] == {"AAA": 0.6, "BBB": 0.4}
+    assert first["output"]["expected_return"] == pytest.approx(0.08)
+    assert first["output"]["volatility"] == pytest.approx((0.12 ** 2 + 0.04 ** 2) ** 0.5, abs=1e-6)
+
+    # the frontend sends "parameters"; same input, so a cache hit
+    again = client.post(f"/tools/{tool_id}/execute", json={"parameters": {"holdings": holdings}}, headers=auth_headers).json()
+    assert again["cached"] is True and again["output"] == first["output"]
+
+    bad = client.post(f"/tools/{tool_id}/execute", json={"input_data": {"holdings": "x"}}, headers=auth_headers)
+    assert bad.status_code == 400
+
+    # rows are buffered until the writer flushes
+    assert _usage_count("tester@example.com") == before
+    usages = client.get(f"/tools/{tool_id}/usage", headers=auth_headers).json()["usages"]
+    assert [u["status"] for u in usages[-3:]] == ["success", "success", "failed"]
+    assert [u["usage_key"] for u in usages[-3:-1]] == [first["usage_id"], again["usage_id"]]
+
+    metrics = client.get("/tools/metrics", headers=auth_headers).json()["tools"][str(tool_id)]
+    assert metrics["outcomes"] == {"success": 1, "cached": 1, "failed": 1}
+    assert metrics["count"] == 3 and sum(metrics["buckets"].values()) == 3
+
+
+def test_batch_runs_in_parallel_under_one_deadline(client, auth_headers):
+    tool_id = _tool("Sleeper", implementation="test.sleep")
+    client.post(f"/tools/{tool_id}/permissions", headers=auth_headers)
+    CALLS["sleep"] = 0
+
+    calls = [{"tool_id": tool_id, "input_data": {"seconds": 0.3, "n": i}} for i in range(3)]
+    body = client.post("/tools/execute", json={"calls": calls}, headers=auth_headers).json()
+    assert [r["status"] for r in body["results"]] == ["success"] * 3
+    assert body["duration_ms"] < 800
+
+    calls = [{"tool_id": tool_id, "input_data": {"seconds": 0.01}}, {"tool_id": tool_id, "input_data": {"seconds": 2}},
+             {"tool_id": 999999, "input_data": {}}]
+    body = client.post("/tools/execute", json={"calls": calls, "timeout_ms": 200}, headers=auth_headers).json()
+    assert [r["status"] for r in body["results"]] == ["success", "timeout", "failed"]
+    assert body["results"][2]["error_status"] == 404
+
+    dry = client.post(f"/tools/{tool_id}/execute", json={"input_data": {"seconds": 9}, "dry_run": True}, headers=auth_headers).json()
+    assert dry["output"]["would_execute"] == "Sleeper"
+    assert CALLS["sleep"] == 5
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_calls_share_one_execution(db):
+    tool_id = _tool("Sleeper", implementation="test.sleep")
+    with Session(engine) as session:
+        session.add(ToolPermission(user_id="shared@example.com", tool_id=tool_id, granted=True))
+        session.commit()
+    CALLS["sleep"] = 0
+    results = await asyncio.gather(*(
+        tool_runtime.call(tool_id, "shared@example.com", {"seconds": 0.1, "shared": True}) for _ in range(5)
+    ))
+    assert CALLS["sleep"] == 1
+    assert all(r["output"] == {"slept": 0.1} for r in results)
+
+
+def test_web_search_rejects_a_bad_max_results_before_searching(client, auth_headers, monkeypatch):
+    from backend.routes.auth import create_access_token
+    from backend.tools import builtin
+
+    searches = []
+
+    async def search(query):
+        searches.append(query)
+        return {"items": [{"url": f"https://example.com/{i}"} for i in range(5)]}
+
+    monkeypatch.setattr(builtin, "tavily_search", search)
+    # without a search key an earlier probe may have marked the tool down
+    monkeypatch.setattr(tool_runtime.health, "is_down", lambda name: False)
+    headers = {"Authorization": f"Bearer {create_access_token({'uid': 'web-search@example.com'})}"}
+    tool_id = next(t["id"] for t in client.get("/tools/", headers=auth_headers).json()["tools"] if t["name"] == "Web Search")
+    client.post(f"/tools/{tool_id}/permissions", headers=headers)
+
+    bad = client.post(f"/tools/{tool_id}/execute", json={"input_data": {"query": "owls", "max_results": "lots"}}, headers=headers)
+    assert bad.status_code == 400 and "max_results" in bad.json()["message"]
+    assert searches == []
+    ok = client.post(f"/tools/{tool_id}/execute", json={"input_data": {"query": "owls", "max_results": "2"}}, headers=headers)
+    assert len(ok.json()["output"]["results"]) == 2
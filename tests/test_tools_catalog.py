@@ -0,0 +1,68 @@
+"""Test the cached tool catalog and permission lookups"""
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from backend.app import app
+
+
+@pytest.fixture
+def queries(db):
+    seen = []
+
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        seen.append(statement)
+
+    event.listen(db, "before_cursor_execute", before_execute)
+    yield seen
+    event.remove(db, "before_cursor_execute", before_execute)
+
+
+def test_catalog_query_count_and_invalidation(db, queries, auth_headers, admin_headers):
+    client = TestClient(app)
+    client.post("/admin/seed/tools")
+    tools = client.get("/tools/", headers=auth_headers).json()["tools"]
+    assert len(tools) >= 40
+    tool_id = tools[0]["id"]
+    assert tools[0]["has_permission"] is False
+
+    client.post(f"/tools/{tool_id}/permissions", headers=auth_headers)
+    queries.clear()
+    tools = client.get("/tools/", headers=auth_headers).json()["tools"]
+    assert len(queries) <= 1
+    assert next(t for t in tools if t["id"] == tool_id)["has_permission"] is True
+
+    queries.clear()
+    client.get("/tools/", headers=auth_headers)
+    client.get(f"/tools/{tool_id}", headers=auth_headers)
+    assert queries == []
+
+    # a global switch: members may not flip it
+    assert client.post(f"/admin/tools/{tool_id}/enabled", json={"enabled": False}).status_code == 401
+    assert client.post(f"/admin/tools/{tool_id}/enabled", json={"enabled": False}, headers=auth_headers).status_code == 403
+    client.post(f"/admin/tools/{tool_id}/enabled", json={"enabled": False}, headers=admin_headers)
+    tools = client.get("/tools/", headers=auth_headers).json()["tools"]
+    assert tool_id not in [t["id"] for t in tools]
+    client.post(f"/admin/tools/{tool_id}/enabled", json={"enabled": True}, headers=admin_headers)
+
+
+def test_permission_load_racing_a_grant_is_not_cached(db):
+    from backend.tools import catalog
+
+    uid = "race@example.com"
+    catalog.invalidate_permissions(uid)
+    fired = []
+
+    def grant_lands_mid_query(*args):
+        if not fired:
+            fired.append(1)
+            catalog.invalidate_permissions(uid)
+
+    event.listen(db, "before_cursor_execute", grant_lands_mid_query)
+    try:
+        catalog.load(uid)
+    finally:
+        event.remove(db, "before_cursor_execute", grant_lands_mid_query)
+    assert fired and catalog._PERMISSIONS.get(uid) is None
+    catalog.load(uid)
+    assert catalog._PERMISSIONS.get(uid) is not None